@@ -6,12 +6,15 @@ from fastapi import APIRouter
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Any
-import json
 import asyncio
 from datetime import datetime
 from langchain_core.messages import HumanMessage
 
 from app.state import state_manager
+from app.core.codec import sse_event
+from app.core.run_context import new_run_id
+from app.core.tracing import tracer, traced_stream, tracing_config
+from app.core.metrics import track_graph_stream
 from app.config import MAX_CONTEXT_LENGTH, COMPRESSION_TRIGGER_TOKENS
 
 router = APIRouter()
@@ -29,7 +32,10 @@ async def chat_stream(request: ChatRequest):
     """
     SSE流式聊天端点
     前端通过EventSource连接此端点
+    run_id随start/end/error事件与X-Run-Id响应头返回,可据此查询 /api/monitoring/traces/{run_id}
     """
+    run_id = new_run_id()
+    
     async def event_generator():
         try:
             # 从全局状态获取app_graph
@@ -37,11 +43,12 @@ async def chat_stream(request: ChatRequest):
             
             if not app_graph:
                 # 如果workflow未初始化,返回错误
-                yield f"data: {json.dumps({'type': 'error', 'message': 'Agent未初始化,请等待启动完成'})}\n\n"
+                tracer.fail(run_id, "Agent未初始化")
+                yield sse_event({'type': 'error', 'run_id': run_id, 'message': 'Agent未初始化,请等待启动完成'})
                 return
             
             # 发送开始事件
-            yield f"data: {json.dumps({'type': 'start', 'timestamp': datetime.now().isoformat()})}\n\n"
+            yield sse_event({'type': 'start', 'run_id': run_id, 'timestamp': datetime.now().isoformat()})
             
             # 构造输入
             input_data = {
@@ -52,11 +59,12 @@ async def chat_stream(request: ChatRequest):
             config = {
                 "configurable": {
                     "thread_id": request.thread_id
-                }
+                },
+                **tracing_config(run_id)
             }
             
             # 流式执行workflow
-            async for event in app_graph.astream(input_data, config=config):
+            async for event in track_graph_stream("chat", app_graph.astream(input_data, config=config)):
                 # 发送中间结果
                 if "agent" in event:
                     messages = event["agent"].get("messages", [])
@@ -65,12 +73,12 @@ async def chat_stream(request: ChatRequest):
                         
                         # 如果是AI消息
                         if hasattr(last_message, "content") and last_message.content:
-                            yield f"data: {json.dumps({'type': 'message', 'content': last_message.content})}\n\n"
+                            yield sse_event({'type': 'message', 'content': last_message.content})
                         
                         # 如果有工具调用
                         if hasattr(last_message, "tool_calls") and last_message.tool_calls:
                             for tool_call in last_message.tool_calls:
-                                yield f"data: {json.dumps({'type': 'tool_call', 'tool': tool_call.get('name'), 'args': tool_call.get('args')})}\n\n"
+                                yield sse_event({'type': 'tool_call', 'tool': tool_call.get('name'), 'args': tool_call.get('args')})
                 
                 # 如果有工具结果
                 if "tools" in event:
@@ -78,27 +86,29 @@ async def chat_stream(request: ChatRequest):
                     if messages:
                         for msg in messages:
                             if hasattr(msg, "content"):
-                                yield f"data: {json.dumps({'type': 'tool_result', 'content': str(msg.content)[:500]})}\n\n"  # 限制长度
+                                yield sse_event({'type': 'tool_result', 'content': str(msg.content)[:500]})  # 限制长度
                 
                 # 短暂延迟,避免过快
                 await asyncio.sleep(0.01)
             
             # 发送结束事件
-            yield f"data: {json.dumps({'type': 'end', 'timestamp': datetime.now().isoformat()})}\n\n"
+            yield sse_event({'type': 'end', 'run_id': run_id, 'timestamp': datetime.now().isoformat()})
             
         except Exception as e:
             # 发送错误事件
             error_msg = f"聊天处理错误: {str(e)}"
             print(f"ERROR: {error_msg}")
-            yield f"data: {json.dumps({'type': 'error', 'message': error_msg})}\n\n"
+            tracer.fail(run_id, e)
+            yield sse_event({'type': 'error', 'run_id': run_id, 'message': error_msg})
     
     return StreamingResponse(
-        event_generator(),
+        traced_stream(run_id, request.thread_id, "chat", event_generator()),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"  # 禁用nginx缓冲
+            "X-Accel-Buffering": "no",  # 禁用nginx缓冲
+            "X-Run-Id": run_id
         }
     )
 
@@ -2,13 +2,31 @@
 管理面板API
 提供系统状态、工具池状态、性能数据等信息
 """
-from fastapi import APIRouter
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
 from datetime import datetime
 from app.state import state_manager
 from app.config import AGENT_VERSION, MAX_CONTEXT_LENGTH, COMPRESSION_TRIGGER_TOKENS
+from app.services.llm_benchmark import llm_benchmark
 
 router = APIRouter()
 
+# 后台运行中的基准测试任务(保留引用,避免任务被回收)
+_benchmark_task: Optional[asyncio.Task] = None
+
+
+def _on_benchmark_done(task: asyncio.Task):
+    """后台基准测试结束回调: 异常退出时记录日志并写入历史,避免失败被静默丢弃"""
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        print(f"❌ 后台LLM基准测试异常退出: {error}")
+        # 回调在事件循环中执行,历史文件写入放到线程池
+        asyncio.get_running_loop().run_in_executor(None, llm_benchmark.record_failure, error, "manual")
+
 
 @router.get("/api/dashboard/system_status")
 async def get_system_status():
@@ -170,21 +188,31 @@ async def trigger_health_check():
 
 
 @router.post("/api/dashboard/trigger-performance-test")
-async def trigger_performance_test():
+async def trigger_performance_test(
+    wait: bool = Query(False, description="是否等待基准测试完成再返回"),
+    concurrency: Optional[str] = Query(None, description="并发档位,逗号分隔(默认1,2,4,8)"),
+    max_tokens: Optional[int] = Query(None, ge=1, le=4096, description="每个请求的最大输出tokens")
+):
     """
     手动触发性能测试
     
     测试项:
-    - LLM响应速度(TTFT, tokens/s)
+    - LLM响应速度(TTFT, 解码tokens/s, 端到端延迟),按提示词长度分档 × 并发档位扫描
     - 内存使用情况
-    - API响应时间
+    
+    基准测试耗时较长,默认在后台运行,结果通过 /api/dashboard/performance_data
+    与 /api/dashboard/performance_history 查看
     """
+    global _benchmark_task
     try:
         import psutil
-        import time
         
-        # 测试开始时间
-        test_start = time.time()
+        if llm_benchmark.running:
+            return {
+                "success": False,
+                "message": "已有基准测试在运行,请稍后查看结果",
+                "current": llm_benchmark.current
+            }
         
         # 获取内存使用情况
         try:
@@ -198,34 +226,60 @@ async def trigger_performance_test():
         except Exception as e:
             memory_result = {"error": str(e)}
         
-        # 模拟LLM性能测试(实际应该调用LLM)
-        model_performance = {
-            "tokens_per_second": 0,  # 需要实际测试
-            "ttft_ms": 0,  # 需要实际测试
-            "total_latency_ms": 0  # 需要实际测试
+        state_manager.performance_data = {
+            **state_manager.performance_data,
+            "memory_status": memory_result
         }
         
-        test_duration = round((time.time() - test_start) * 1000, 2)
+        run_kwargs = {"trigger": "manual"}
+        if concurrency:
+            try:
+                run_kwargs["concurrency_levels"] = [int(c) for c in concurrency.split(",") if c.strip()]
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"无法解析的并发档位: {concurrency}")
+        if max_tokens:
+            run_kwargs["max_tokens"] = max_tokens
         
-        # 保存到状态管理器
-        state_manager.performance_data = {
-            "model_performance": model_performance,
-            "memory_status": memory_result,
-            "test_duration_ms": test_duration
-        }
-        state_manager.performance_last_check = datetime.now()
+        if wait:
+            result = await llm_benchmark.run(**run_kwargs)
+            return {
+                "success": result["status"] == "completed",
+                "message": "性能测试已完成" if result["status"] == "completed" else f"性能测试失败: {result.get('error')}",
+                "result": {
+                    "triggered_at": result["started_at"],
+                    "test_duration_ms": result["duration_ms"],
+                    "benchmark": result,
+                    "data": state_manager.performance_data
+                }
+            }
         
+        _benchmark_task = asyncio.create_task(llm_benchmark.run(**run_kwargs))
+        _benchmark_task.add_done_callback(_on_benchmark_done)
         return {
             "success": True,
-            "message": "性能测试已完成",
+            "message": "性能测试已在后台启动",
             "result": {
                 "triggered_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "test_duration_ms": test_duration,
                 "data": state_manager.performance_data
             }
         }
+    except HTTPException:
+        raise
     except Exception as e:
         return {
             "success": False,
             "message": f"性能测试失败: {str(e)}"
         }
+
+
+@router.get("/api/dashboard/performance_history")
+async def get_performance_history(
+    limit: int = Query(20, ge=1, le=100, description="返回的记录数"),
+    include_results: bool = Query(False, description="是否包含每个档位的详细结果")
+):
+    """获取LLM基准测试历史(最新在前)"""
+    return {
+        "running": llm_benchmark.running,
+        "current": llm_benchmark.current,
+        "history": llm_benchmark.get_history(limit=limit, include_results=include_results)
+    }
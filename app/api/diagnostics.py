@@ -0,0 +1,176 @@
+"""
+运行时诊断API
+在不重启容器、不挂外部工具的情况下对线上进程做采样分析与内存增长诊断
+"""
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.config import PROFILER_DEFAULT_RATE, PROFILER_MAX_RATE, PROFILER_MAX_SECONDS, TRACEMALLOC_FRAMES
+from app.core.profiler import sampling_profiler
+from app.core.memory_diagnostics import memory_diagnostics, structure_report
+
+router = APIRouter()
+
+
+def _profile_response(result, format: str):
+    if format == "collapsed":
+        return PlainTextResponse(
+            sampling_profiler.collapsed(result),
+            headers={
+                "X-Profile-Samples": str(result["samples"]),
+                "X-Profile-Effective-Rate": str(result["effective_rate"]),
+                "X-Profile-Overhead-Percent": str(result["overhead_percent"])
+            }
+        )
+    return {
+        **{k: v for k, v in result.items() if k != "stacks"},
+        "top_frames": sampling_profiler.top_frames(result),
+        "collapsed": sampling_profiler.collapsed(result)
+    }
+
+
+@router.post("/api/diagnostics/profile")
+async def run_profile(
+    seconds: float = Query(10, gt=0, le=PROFILER_MAX_SECONDS, description="采样时长(秒)"),
+    rate: int = Query(PROFILER_DEFAULT_RATE, ge=1, le=PROFILER_MAX_RATE, description="目标采样频率(Hz)"),
+    include_idle: bool = Query(False, description="是否包含空闲等待的线程栈"),
+    include_lines: bool = Query(False, description="帧标签是否带行号"),
+    group_threads: bool = Query(True, description="是否合并同一线程池的线程"),
+    format: str = Query("collapsed", description="collapsed: 折叠栈文本, json: 统计与热点函数")
+):
+    """
+    采样分析所有线程N秒
+
+    collapsed格式可直接用于火焰图:
+        curl -X POST 'http://host/api/diagnostics/profile?seconds=30' > out.folded
+        flamegraph.pl out.folded > out.svg   (或拖入 speedscope.app)
+
+    每个栈以线程名开头(事件循环MainThread、Playwright、工具线程池等),
+    采样耗时超过开销预算时自动降频,实际频率见 X-Profile-Effective-Rate
+    """
+    if format not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {format},可选: collapsed, json")
+    try:
+        result = await asyncio.to_thread(
+            sampling_profiler.profile,
+            seconds,
+            rate,
+            include_idle,
+            include_lines,
+            group_threads
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _profile_response(result, format)
+
+
+@router.get("/api/diagnostics/profile/status")
+async def get_profile_status():
+    """采样分析器状态(是否在采样、进度与上次结果概要)"""
+    return sampling_profiler.get_status()
+
+
+@router.get("/api/diagnostics/profile/last")
+async def get_last_profile(
+    format: str = Query("collapsed", description="collapsed: 折叠栈文本, json: 统计与热点函数")
+):
+    """上一次采样的结果"""
+    if format not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {format},可选: collapsed, json")
+    if sampling_profiler.last_result is None:
+        raise HTTPException(status_code=404, detail="尚未进行过采样")
+    return _profile_response(sampling_profiler.last_result, format)
+
+
+# ==================== 内存诊断 ====================
+
+@router.post("/api/diagnostics/memory/tracemalloc/start")
+async def start_tracemalloc(
+    frames: int = Query(TRACEMALLOC_FRAMES, ge=1, le=100, description="记录的调用栈深度(traceback分组需要>1)")
+):
+    """开始追踪内存分配(会增加内存占用与分配开销,诊断完成后请停止)"""
+    return memory_diagnostics.start(frames)
+
+
+@router.post("/api/diagnostics/memory/tracemalloc/stop")
+async def stop_tracemalloc():
+    """停止追踪内存分配(已有快照保留)"""
+    return memory_diagnostics.stop()
+
+
+@router.get("/api/diagnostics/memory/tracemalloc/status")
+async def get_tracemalloc_status():
+    """tracemalloc状态与已保存的快照"""
+    return memory_diagnostics.get_status()
+
+
+@router.post("/api/diagnostics/memory/snapshots")
+async def take_memory_snapshot(
+    label: Optional[str] = Query(None, description="快照标签,默认自动编号")
+):
+    """打一个带标签的快照,之后可用 /api/diagnostics/memory/diff 比较增长"""
+    try:
+        return await asyncio.to_thread(memory_diagnostics.take_snapshot, label)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.delete("/api/diagnostics/memory/snapshots/{label}")
+async def delete_memory_snapshot(label: str):
+    """删除快照"""
+    if not memory_diagnostics.delete_snapshot(label):
+        raise HTTPException(status_code=404, detail=f"快照不存在: {label}")
+    return {"success": True, "message": f"快照已删除: {label}"}
+
+
+@router.get("/api/diagnostics/memory/diff")
+async def diff_memory_snapshots(
+    base: str = Query(..., description="基准快照标签"),
+    target: Optional[str] = Query(None, description="目标快照标签,默认与当前内存比较"),
+    group_by: str = Query("lineno", description="filename / lineno / traceback"),
+    limit: int = Query(20, ge=1, le=200, description="返回条数")
+):
+    """
+    比较两个快照,按增长量降序返回前N个分配点
+    
+    典型用法: 打快照A → 运行一段时间/压测 → 打快照B → diff?base=A&target=B
+    """
+    try:
+        return await asyncio.to_thread(memory_diagnostics.diff, base, target, group_by, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/api/diagnostics/memory/top")
+async def top_memory_allocations(
+    label: Optional[str] = Query(None, description="快照标签,默认当前内存"),
+    group_by: str = Query("lineno", description="filename / lineno / traceback"),
+    limit: int = Query(20, ge=1, le=200, description="返回条数")
+):
+    """快照中占用最多的分配点"""
+    try:
+        return await asyncio.to_thread(memory_diagnostics.top, label, group_by, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/api/diagnostics/memory/structures")
+async def get_structure_report(
+    include_bytes: bool = Query(True, description="是否遍历计算近似字节数(大结构较慢)")
+):
+    """
+    已知全局容器的条目数与近似字节数
+    
+    覆盖checkpointer、消息历史、聊天会话(含temp_线程)、工具统计、日志/追踪/采样缓冲区等,
+    无需开启tracemalloc
+    """
+    return await asyncio.to_thread(structure_report, include_bytes)
@@ -1,10 +1,13 @@
 """
 Fleet记忆统计API
 """
-from fastapi import APIRouter
+import asyncio
+
+from fastapi import APIRouter, HTTPException
 from typing import Dict, Any
 
-from app.core.fleet_memory_db import FleetMemoryDB
+from app.core.fleet_memory_db import fleet_memory_db
+from app.services.fleet_sync import fleet_sync_service, FleetSyncError
 
 router = APIRouter()
 
@@ -18,9 +21,7 @@ async def get_fleet_stats() -> Dict[str, Any]:
         统计信息
     """
     try:
-        fleet_db = FleetMemoryDB()
-        stats = fleet_db.get_stats()
-        return stats
+        return await asyncio.to_thread(fleet_memory_db.get_stats)
     except Exception as e:
         return {
             "total_memories": 0,
@@ -37,3 +38,83 @@ async def get_fleet_stats() -> Dict[str, Any]:
             "storage_is_full": False,
             "error": str(e)
         }
+
+
+@router.post("/api/monitoring/fleet/maintenance")
+async def run_fleet_maintenance(full_vacuum: bool = False) -> Dict[str, Any]:
+    """
+    立即整理Fleet记忆库(冷层压缩、回收空闲页、截断WAL)
+    
+    Args:
+        full_vacuum: 执行完整VACUUM(重写整个数据库,期间阻塞写入)
+    
+    Returns:
+        整理结果
+    """
+    try:
+        return await asyncio.to_thread(fleet_memory_db.run_maintenance, full_vacuum=full_vacuum)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/api/monitoring/fleet/sync")
+async def get_fleet_sync_stats() -> Dict[str, Any]:
+    """外发同步状态: 积压(未同步记忆数)、吞吐、请求与重试计数、最近一轮结果"""
+    stats = fleet_sync_service.get_stats()
+    stats["backlog"] = await asyncio.to_thread(fleet_memory_db.get_unsynced_count)
+    return stats
+
+
+@router.post("/api/monitoring/fleet/sync")
+async def run_fleet_sync(limit: int = 0) -> Dict[str, Any]:
+    """
+    立即同步到Fleet API: 后台同步运行中时唤醒它,否则在本请求中执行一轮
+    
+    Args:
+        limit: 本轮最多同步的条数(0为默认的每轮条数)
+    """
+    if fleet_sync_service.running:
+        fleet_sync_service.wake()
+        return {"scheduled": True, **fleet_sync_service.get_stats()}
+    try:
+        return await fleet_sync_service.sync_once(limit or None)
+    except FleetSyncError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+def _partitioned():
+    if not hasattr(fleet_memory_db, "list_partitions"):
+        raise HTTPException(status_code=400, detail="Fleet记忆库未启用分区(FLEET_DB_PARTITION=none)")
+    return fleet_memory_db
+
+
+@router.get("/api/monitoring/fleet/partitions")
+async def list_fleet_partitions() -> Dict[str, Any]:
+    """分区列表"""
+    db = _partitioned()
+    return {"scheme": db.scheme, "partitions": db.list_partitions()}
+
+
+@router.post("/api/monitoring/fleet/partitions/{name}/{action}")
+async def manage_fleet_partition(name: str, action: str) -> Dict[str, Any]:
+    """
+    分区管理
+    
+    Args:
+        name: 分区名(如 2025-01、bucket-03、legacy)
+        action: detach(分离) / attach(重新挂载) / archive(压实并移入归档目录)
+    """
+    db = _partitioned()
+    handler = {
+        "detach": db.detach_partition,
+        "attach": db.attach_partition,
+        "archive": db.archive_partition
+    }.get(action)
+    if handler is None:
+        raise HTTPException(status_code=400, detail=f"未知的分区操作: {action}")
+    try:
+        return await asyncio.to_thread(handler, name)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (ValueError, FileNotFoundError, RuntimeError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
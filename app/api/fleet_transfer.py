@@ -0,0 +1,122 @@
+"""
+Fleet记忆批量导出/导入API
+导出以流式响应分块输出,导入按批在线程中写入,内存占用与总行数无关
+"""
+import asyncio
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from app.core.fleet_memory_db import fleet_memory_db
+from app.core.memory_transfer import (
+    FORMAT_NDJSON,
+    FORMAT_PARQUET,
+    MemoryImporter,
+    export_ndjson,
+    export_parquet,
+    import_memories,
+    parquet_available,
+    read_parquet,
+)
+from app.core.codec import loads
+
+router = APIRouter()
+
+# 上传的Parquet文件在内存中缓存的上限,超出后写入临时文件(Parquet需要读到文件尾的元数据)
+_SPOOL_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _check_format(file_format: str):
+    if file_format not in (FORMAT_NDJSON, FORMAT_PARQUET):
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {file_format}")
+    if file_format == FORMAT_PARQUET and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet格式需要安装pyarrow")
+
+
+@router.get("/api/monitoring/fleet/export")
+async def export_fleet_memories(format: str = FORMAT_NDJSON, session_id: Optional[str] = None):
+    """
+    流式导出Fleet记忆(最新在前)
+    
+    Args:
+        format: ndjson / parquet
+        session_id: 只导出指定会话(可选)
+    """
+    _check_format(format)
+    filename = f"fleet_memories_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    # 同步生成器由StreamingResponse在线程池中迭代,数据库读取不阻塞事件循环
+    if format == FORMAT_PARQUET:
+        chunks = export_parquet(fleet_memory_db, session_id)
+        media_type = "application/vnd.apache.parquet"
+    else:
+        chunks = export_ndjson(fleet_memory_db, session_id)
+        media_type = "application/x-ndjson"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.post("/api/monitoring/fleet/import")
+async def import_fleet_memories(request: Request, format: str = FORMAT_NDJSON, on_conflict: str = "skip") -> Dict[str, Any]:
+    """
+    批量导入Fleet记忆(请求体为NDJSON或Parquet文件),按id去重
+    
+    Args:
+        format: ndjson / parquet
+        on_conflict: skip(id已存在时跳过) / replace(覆盖)
+    
+    Returns:
+        导入结果(读取、写入、跳过、无效的行数与吞吐)
+    """
+    _check_format(format)
+    if on_conflict not in ("skip", "replace"):
+        raise HTTPException(status_code=400, detail=f"on_conflict必须为skip或replace: {on_conflict}")
+    replace = on_conflict == "replace"
+    
+    try:
+        if format == FORMAT_PARQUET:
+            with tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_BYTES) as spool:
+                async for chunk in request.stream():
+                    # 超出上限后写入磁盘,在线程中执行以免阻塞事件循环
+                    await asyncio.to_thread(spool.write, chunk)
+                spool.seek(0)
+                return await asyncio.to_thread(
+                    lambda: import_memories(fleet_memory_db, read_parquet(spool), replace=replace)
+                )
+        
+        importer = MemoryImporter(fleet_memory_db, replace=replace)
+        # 尚未遇到换行的数据块(长行跨越多个块时只暂存,遇到换行再一次拼接,避免反复拼接)
+        pending: List[bytes] = []
+        async for chunk in request.stream():
+            pending.append(chunk)
+            if b"\n" not in chunk:
+                continue
+            lines = b"".join(pending).split(b"\n")
+            pending = [lines.pop()]
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    record = loads(line)
+                except ValueError:
+                    record = None
+                batch = importer.feed(record)
+                if batch:
+                    await asyncio.to_thread(importer.write, batch)
+        tail = b"".join(pending)
+        if tail.strip():
+            try:
+                importer.feed(loads(tail))
+            except ValueError:
+                importer.feed(None)
+        await asyncio.to_thread(importer.write, importer.take())
+        return importer.get_result()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"导入失败: {e}")
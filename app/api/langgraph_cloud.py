@@ -6,10 +6,13 @@ from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel
-import json
 import asyncio
 from datetime import datetime
 from app.state import state_manager
+from app.core.codec import sse_event
+from app.core.run_context import new_run_id
+from app.core.tracing import tracer, traced_stream, tracing_config
+from app.core.metrics import track_graph_stream
 
 router = APIRouter()
 
@@ -98,19 +101,19 @@ async def stream_run(assistant_id: str, thread_id: str, data: StreamInput):
             "state": {}
         }
     
+    run_id = new_run_id()
+    
     async def event_stream():
         """生成SSE事件流"""
         try:
-             # 1. 发送metadata事件
-            run_id = f"run_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            yield f"event: metadata\n"
-            yield f"data: {json.dumps({'run_id': run_id, 'thread_id': thread_id})}\n\n"
+            # 1. 发送metadata事件
+            yield sse_event({'run_id': run_id, 'thread_id': thread_id}, event="metadata")
             
             # 2. 获取LangGraph工作流
             app_graph = state_manager.get_app_graph()
             if not app_graph:
-                yield f"event: error\n"
-                yield f"data: {json.dumps({'error': 'LangGraph工作流未初始化'})}\n\n"
+                tracer.fail(run_id, "LangGraph工作流未初始化")
+                yield sse_event({'error': 'LangGraph工作流未初始化', 'run_id': run_id}, event="error")
                 return
             
             # 3. 转换消息格式
@@ -123,50 +126,47 @@ async def stream_run(assistant_id: str, thread_id: str, data: StreamInput):
                     messages.append(AIMessage(content=msg.content))
             
             # 4. 流式执行工作流
-            config = {"configurable": {"thread_id": thread_id}}
+            config = {"configurable": {"thread_id": thread_id}, **tracing_config(run_id)}
             
-            async for event in app_graph.astream_events(
+            async for event in track_graph_stream("langgraph_cloud", app_graph.astream_events(
                 {"messages": messages},
                 config=config,
                 version="v2"
-            ):
+            )):
                 event_type = event.get("event")
                 
                 # 发送消息更新事件
                 if event_type == "on_chat_model_stream":
                     chunk = event.get("data", {}).get("chunk")
                     if chunk and hasattr(chunk, "content"):
-                        yield f"event: messages/partial\n"
-                        yield f"data: {json.dumps([{'role': 'assistant', 'content': chunk.content}])}\n\n"
+                        yield sse_event([{'role': 'assistant', 'content': chunk.content}], event="messages/partial")
                 
                 # 发送工具调用事件
                 elif event_type == "on_tool_start":
                     tool_name = event.get("name", "unknown")
-                    yield f"event: updates\n"
-                    yield f"data: {json.dumps({'type': 'tool_start', 'tool': tool_name})}\n\n"
+                    yield sse_event({'type': 'tool_start', 'tool': tool_name}, event="updates")
                 
                 # 发送工具结果事件
                 elif event_type == "on_tool_end":
                     tool_name = event.get("name", "unknown")
                     output = event.get("data", {}).get("output", "")
-                    yield f"event: updates\n"
-                    yield f"data: {json.dumps({'type': 'tool_end', 'tool': tool_name, 'output': str(output)[:200]})}\n\n"
+                    yield sse_event({'type': 'tool_end', 'tool': tool_name, 'output': str(output)[:200]}, event="updates")
             
             # 5. 发送完成事件
-            yield f"event: end\n"
-            yield f"data: {json.dumps({'status': 'completed'})}\n\n"
+            yield sse_event({'status': 'completed', 'run_id': run_id}, event="end")
             
         except Exception as e:
-            yield f"event: error\n"
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            tracer.fail(run_id, e)
+            yield sse_event({'error': str(e), 'run_id': run_id}, event="error")
     
     return StreamingResponse(
-        event_stream(),
+        traced_stream(run_id, thread_id, "langgraph_cloud", event_stream(), assistant_id=assistant_id),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
+            "X-Accel-Buffering": "no",
+            "X-Run-Id": run_id
         }
     )
 
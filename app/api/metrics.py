@@ -0,0 +1,237 @@
+"""
+Prometheus/OpenMetrics指标API
+GET /metrics 以OpenMetrics文本格式输出Agent内部指标,供标准监控栈抓取
+
+- 热路径指标(HTTP请求、LangGraph运行、LLM、FleetMemoryDB)在发生时直接累加
+- 其余指标(连接数、队列深度、checkpointer大小、资源池占用、工具延迟)在抓取时从现有数据结构读取
+"""
+import sys
+import time
+from typing import Iterable, List
+
+from fastapi import APIRouter, Request
+from fastapi.responses import Response
+
+from app.core.metrics import (
+    MetricFamily,
+    registry,
+    http_requests_total,
+    http_request_duration_seconds,
+    http_requests_in_flight,
+)
+
+router = APIRouter()
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """输出指标(按Accept头协商OpenMetrics或Prometheus文本格式)"""
+    openmetrics = "application/openmetrics-text" in request.headers.get("accept", "")
+    return Response(
+        content=registry.render(openmetrics=openmetrics),
+        media_type=OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE
+    )
+
+
+# ==================== HTTP请求中间件 ====================
+
+class MetricsMiddleware:
+    """
+    按路由模板统计HTTP请求数与耗时(纯ASGI中间件,不包装响应体)
+
+    路由取FastAPI匹配后写入scope的route.path(如 /api/langgraph/threads/{thread_id}),
+    避免以原始URL作为标签导致基数爆炸;未匹配的请求统一记为"unmatched"
+    """
+
+    # 不统计的路径(抓取自身与静态资源)
+    EXCLUDED_PREFIXES = ("/metrics", "/dashboard/static", "/chatroom/assets", "/chatroom/static")
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.EXCLUDED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "GET")
+            http_requests_total.labels(method=method, route=route_path, status=status_holder[0]).inc()
+            http_request_duration_seconds.labels(method=method, route=route_path).observe(
+                time.perf_counter() - start
+            )
+
+
+# ==================== 抓取时采集 ====================
+
+def _collect_messenger() -> Iterable[MetricFamily]:
+    from app.core.unified_messenger import unified_messenger
+
+    connections = MetricFamily("messenger_connections", "gauge", "消息总线WebSocket连接数(按帧编码)")
+    encodings = {}
+    for encoding in list(unified_messenger.connection_encodings.values()):
+        encodings[encoding] = encodings.get(encoding, 0) + 1
+    for encoding, count in encodings.items():
+        connections.add(count, encoding=encoding)
+
+    threads = MetricFamily("messenger_active_threads", "gauge", "有WebSocket连接的线程数")
+    threads.add(len(unified_messenger.connections))
+
+    history = MetricFamily("messenger_history_messages", "gauge", "消息总线缓冲的历史消息数")
+    history.add(sum(len(h) for h in list(unified_messenger.message_history.values())))
+    return [connections, threads, history]
+
+
+def _collect_sessions() -> Iterable[MetricFamily]:
+    from app.core.session_manager import session_manager
+
+    active = MetricFamily("sessions_active", "gauge", "会话生命周期管理器跟踪的会话数")
+    active.add(session_manager.active_count())
+
+    evicted = MetricFamily("sessions_evicted", "counter", "被淘汰的会话数(按原因)")
+    for reason, count in session_manager.evicted_by_reason.items():
+        evicted.add(count, suffix="_total", reason=reason)
+
+    estimated = MetricFamily("sessions_estimated_bytes", "gauge", "上次清理时估算的会话状态字节数")
+    last_sweep = session_manager.last_sweep
+    if last_sweep:
+        estimated.add(last_sweep["estimated_bytes"])
+    return [active, evicted, estimated]
+
+
+def _collect_log_pipeline() -> Iterable[MetricFamily]:
+    from app.core.log_store import log_store
+    from app.core.log_stream import log_ring
+
+    queue_depth = MetricFamily("log_store_queue_depth", "gauge", "日志持久化队列中待写入的记录数")
+    queue_depth.add(log_store.queue.qsize())
+
+    dropped = MetricFamily("log_store_dropped", "counter", "因队列已满丢弃的日志数")
+    dropped.add(log_store.dropped, suffix="_total")
+
+    subscribers = MetricFamily("log_stream_subscribers", "gauge", "实时日志流订阅者数")
+    subscribers.add(log_ring.subscriber_count)
+    return [queue_depth, dropped, subscribers]
+
+
+def _collect_checkpointer() -> Iterable[MetricFamily]:
+    from app.state import state_manager
+
+    graph = state_manager.app_graph
+    saver = getattr(graph, "checkpointer", None)
+    storage = getattr(saver, "storage", None)
+    if storage is None:
+        return []
+
+    checkpoints = 0
+    approx_bytes = 0
+    for namespaces in list(storage.values()):
+        for checkpoints_by_id in list(namespaces.values()):
+            checkpoints += len(checkpoints_by_id)
+            for saved in list(checkpoints_by_id.values()):
+                # 值为 ((type, bytes), (type, bytes), parent_id) 形式的序列化结果
+                for part in saved[:2]:
+                    if isinstance(part, tuple) and len(part) == 2 and isinstance(part[1], (bytes, bytearray)):
+                        approx_bytes += len(part[1])
+
+    threads = MetricFamily("checkpointer_threads", "gauge", "checkpointer中保存的线程数")
+    threads.add(len(storage))
+    count = MetricFamily("checkpointer_checkpoints", "gauge", "checkpointer中保存的checkpoint数")
+    count.add(checkpoints)
+    size = MetricFamily("checkpointer_bytes", "gauge", "checkpointer中序列化checkpoint的近似字节数")
+    size.add(approx_bytes)
+    writes = MetricFamily("checkpointer_pending_writes", "gauge", "checkpointer中的pending writes数")
+    writes.add(sum(len(w) for w in list(getattr(saver, "writes", {}).values())))
+    return [threads, count, size, writes]
+
+
+def _collect_pools() -> Iterable[MetricFamily]:
+    from app.core.model_pool import model_pool
+
+    families: List[MetricFamily] = []
+    models = MetricFamily("model_pool_loaded", "gauge", "模型池中已加载的模型")
+    models.add(1 if model_pool.ocr_model is not None else 0, model="ocr")
+    models.add(1 if model_pool.whisper_model is not None else 0, model="whisper")
+    families.append(models)
+
+    # 只读取已导入的浏览器池,避免抓取时触发playwright导入
+    browser_module = sys.modules.get("app.core.browser_pool")
+    pool = browser_module.peek_browser_pool() if browser_module else None
+    if pool is not None:
+        stats = pool.get_stats()
+        started = MetricFamily("browser_pool_started", "gauge", "浏览器池是否已启动")
+        started.add(1 if stats["started"] else 0)
+        pages = MetricFamily("browser_pool_open_pages", "gauge", "浏览器池中打开的页面数")
+        pages.add(stats["open_pages"])
+        created = MetricFamily("browser_pool_pages_created", "counter", "浏览器池累计创建的页面数")
+        created.add(stats["pages_created"], suffix="_total")
+        families.extend([started, pages, created])
+    return families
+
+
+def _collect_tools() -> Iterable[MetricFamily]:
+    from app.core.tool_metrics import tool_metrics
+
+    calls = MetricFamily("tool_calls", "counter", "工具调用次数")
+    errors = MetricFamily("tool_errors", "counter", "工具调用错误次数")
+    in_flight = MetricFamily("tool_calls_in_flight", "gauge", "执行中的工具调用数")
+    latency = MetricFamily("tool_latency_seconds", "histogram", "工具调用耗时")
+    for stats in list(tool_metrics.tools.values()):
+        with stats.lock:
+            calls.add(stats.calls, suffix="_total", tool=stats.tool_name)
+            errors.add(stats.errors, suffix="_total", tool=stats.tool_name)
+            in_flight.add(stats.in_flight, tool=stats.tool_name)
+            # 工具直方图以毫秒记录,输出时换算为秒
+            latency.add_histogram(stats.latency, scale=0.001, tool=stats.tool_name)
+    return [calls, errors, in_flight, latency]
+
+
+def _collect_process() -> Iterable[MetricFamily]:
+    from app.state import state_manager
+    from app.services.resource_sampler import resource_sampler
+
+    start_time = MetricFamily("process_start_time_seconds", "gauge", "进程启动时间(Unix时间戳)")
+    start_time.add(state_manager.system_start_time.timestamp())
+    families = [start_time]
+
+    # 取后台采样器的最新样本,抓取时不做阻塞采样
+    sample = resource_sampler.latest()
+    if sample:
+        for field, name, documentation in (
+            ("cpu_percent", "process_cpu_percent", "进程CPU占用(%)"),
+            ("rss_mb", "process_resident_memory_megabytes", "进程常驻内存(MB)"),
+            ("threads", "process_threads", "进程线程数"),
+            ("open_fds", "process_open_fds", "进程打开的文件描述符数"),
+            ("loop_lag_ms", "event_loop_lag_milliseconds", "事件循环调度延迟(ms)"),
+        ):
+            families.append(MetricFamily(name, "gauge", documentation).add(sample[field]))
+    return families
+
+
+for _collector in (
+    _collect_messenger,
+    _collect_log_pipeline,
+    _collect_checkpointer,
+    _collect_sessions,
+    _collect_pools,
+    _collect_tools,
+    _collect_process,
+):
+    registry.add_collector(_collector)
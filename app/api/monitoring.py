@@ -2,31 +2,40 @@
 增强型监控API (Enhanced Monitoring API)
 提供实时日志流、工具使用统计、配置查看器等高级监控功能
 """
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 import json
 import asyncio
-from collections import defaultdict, deque
 import os
 
+import psutil
+
 from app.state import state_manager
 from app.config import *
+from app.core.log_stream import log_ring, LogFilter, LEVEL_ORDER
+from app.core.log_store import log_store
+from app.core.codec import dumps
+from app.core.tool_metrics import tool_metrics
+from app.core.loop_watchdog import loop_watchdog
+from app.core.tracing import tracer, to_otlp
+from app.core.session_manager import session_manager
+from app.services.resource_sampler import resource_sampler
 
 router = APIRouter()
 
-# 日志缓冲区(最多保留1000条)
-log_buffer = deque(maxlen=1000)
+# 日志缓冲区(带序号的环形缓冲区,由logging/print输出自动填充)
+log_buffer = log_ring
 
-# 工具使用统计
-tool_usage_stats: Dict[str, int] = defaultdict(int)
-tool_last_used: Dict[str, str] = {}
+# 工具使用统计(由load_all_tools挂载到每个工具上的回调自动记录)
+tool_usage_stats = tool_metrics
 
 
 class LogEntry(BaseModel):
     """日志条目"""
+    seq: Optional[int] = None
     timestamp: str
     level: str
     message: str
@@ -38,130 +47,285 @@ class ToolUsageStat(BaseModel):
     tool_name: str
     usage_count: int
     last_used: Optional[str] = None
+    error_count: int = 0
+    error_rate: float = 0
+    in_flight: int = 0
+    last_error: Optional[str] = None
+    latency_ms: Dict[str, Optional[float]] = {}
+    cold_latency_ms: Dict[str, Optional[float]] = {}
+    warm_latency_ms: Dict[str, Optional[float]] = {}
+    cold_calls: int = 0
+    input_bytes_total: int = 0
+    output_bytes_total: int = 0
+    input_bytes_avg: int = 0
+    output_bytes_avg: int = 0
 
 
 def add_log(level: str, message: str, source: str = "system"):
     """添加日志到缓冲区"""
-    log_entry = LogEntry(
-        timestamp=datetime.now().isoformat(),
-        level=level,
-        message=message,
+    log_buffer.append(level.upper(), message, source=source)
+
+
+def _build_log_filter(
+    level: Optional[str] = None,
+    min_level: Optional[str] = None,
+    source: Optional[str] = None
+) -> Optional[LogFilter]:
+    """根据查询参数构造日志过滤器(level支持逗号分隔的多个级别)"""
+    if not (level or min_level or source):
+        return None
+    return LogFilter(
+        levels=level.split(",") if level else None,
+        min_level=min_level,
         source=source
     )
-    log_buffer.append(log_entry.dict())
 
 
-def record_tool_usage(tool_name: str):
-    """记录工具使用"""
-    tool_usage_stats[tool_name] += 1
-    tool_last_used[tool_name] = datetime.now().isoformat()
+def record_tool_usage(
+    tool_name: str,
+    duration_ms: float = 0,
+    error: Optional[str] = None,
+    thread_id: Optional[str] = None
+):
+    """记录工具使用(供未经load_all_tools加载的调用方手动上报)"""
+    tool_usage_stats.record(tool_name, duration_ms, error=error, thread_id=thread_id)
+
+
+# 无新日志时的心跳间隔(秒),同时用于发现已断开的客户端
+LOG_STREAM_HEARTBEAT_SECONDS = 30
 
 
 @router.websocket("/api/monitoring/logs/stream")
-async def websocket_logs_stream(websocket: WebSocket):
+async def websocket_logs_stream(
+    websocket: WebSocket,
+    level: Optional[str] = Query(default=None, description="精确匹配的级别,逗号分隔,如 ERROR,WARNING"),
+    min_level: Optional[str] = Query(default=None, description="最低级别,如 WARNING 表示WARNING及以上"),
+    source: Optional[str] = Query(default=None, description="来源前缀,如 app.api"),
+    since_seq: Optional[int] = Query(default=None, description="断线续传: 从该序号之后开始推送")
+):
     """
     WebSocket实时日志流
     
     客户端连接后，会收到：
-    1. 历史日志（最近100条）
-    2. 实时新日志
+    1. 历史日志（since_seq之后的全部日志,未指定时为最近100条）
+    2. 实时新日志（有新日志时立即推送,不再轮询）
+    
+    过滤在服务端完成;每条日志带seq序号,断线重连时传入最后收到的seq即可续传,
+    若期间日志已被环形缓冲区覆盖,会先收到一条gap消息
     """
     await websocket.accept()
     
+    log_filter = _build_log_filter(level, min_level, source)
+    notify = log_buffer.subscribe()
+    
     try:
         # 发送历史日志
-        history = list(log_buffer)[-100:]  # 最近100条
+        if since_seq is not None:
+            history, missed, last_seq = log_buffer.since(since_seq, log_filter)
+            if missed:
+                await websocket.send_json({
+                    "type": "gap",
+                    "missed": missed,
+                    "first_available_seq": log_buffer.first_seq
+                })
+        else:
+            history, _, last_seq = log_buffer.since(0, log_filter, limit=100)
+        
         await websocket.send_json({
             "type": "history",
             "logs": history,
-            "count": len(history)
+            "count": len(history),
+            "last_seq": last_seq
         })
         
-        # 持续发送新日志
-        last_sent_index = len(log_buffer)
-        
+        # 等待新日志通知并推送
         while True:
-            # 检查是否有新日志
-            current_index = len(log_buffer)
-            if current_index > last_sent_index:
-                # 发送新日志
-                new_logs = list(log_buffer)[last_sent_index:current_index]
-                for log in new_logs:
-                    await websocket.send_json({
-                        "type": "new_log",
-                        "log": log
-                    })
-                last_sent_index = current_index
+            try:
+                await asyncio.wait_for(notify.wait(), timeout=LOG_STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                await websocket.send_json({"type": "heartbeat", "last_seq": last_seq})
+                continue
+            notify.clear()
+            
+            new_logs, missed, last_seq = log_buffer.since(last_seq, log_filter)
+            if missed:
+                await websocket.send_json({
+                    "type": "gap",
+                    "missed": missed,
+                    "first_available_seq": log_buffer.first_seq
+                })
             
-            # 短暂休眠
-            await asyncio.sleep(0.5)
+            for log in new_logs:
+                await websocket.send_json({
+                    "type": "new_log",
+                    "log": log
+                })
             
     except WebSocketDisconnect:
         print("WebSocket客户端断开连接")
     except Exception as e:
         print(f"WebSocket错误: {e}")
+    finally:
+        log_buffer.unsubscribe(notify)
 
 
 @router.get("/api/monitoring/logs/recent")
-async def get_recent_logs(limit: int = 100, level: Optional[str] = None):
+async def get_recent_logs(
+    limit: int = 100,
+    level: Optional[str] = None,
+    min_level: Optional[str] = None,
+    source: Optional[str] = None,
+    since_seq: Optional[int] = None
+):
     """
     获取最近的日志
     
     Args:
         limit: 返回的日志条数
-        level: 过滤日志级别 (INFO, WARNING, ERROR)
+        level: 过滤日志级别 (INFO, WARNING, ERROR),支持逗号分隔
+        min_level: 最低日志级别
+        source: 来源前缀
+        since_seq: 只返回该序号之后的日志
     """
-    logs = list(log_buffer)[-limit:]
+    log_filter = _build_log_filter(level, min_level, source)
     
-    # 如果指定了级别，进行过滤
-    if level:
-        logs = [log for log in logs if log.get("level") == level.upper()]
+    # 先过滤再截取,避免过滤后条数不足
+    if since_seq is not None:
+        logs, _, _ = log_buffer.since(since_seq, log_filter, limit=limit)
+    else:
+        logs = log_buffer.recent(limit, log_filter)
     
     return {
         "logs": logs,
         "count": len(logs),
-        "total_in_buffer": len(log_buffer)
+        "total_in_buffer": len(log_buffer),
+        "last_seq": log_buffer.last_seq
     }
 
 
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    """解析时间参数: 支持Unix时间戳或ISO格式(如 2025-12-12T02:00:00)"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无法解析的时间: {value}")
+
+
+@router.get("/api/monitoring/logs/query")
+async def query_stored_logs(
+    start: Optional[str] = Query(default=None, description="开始时间(ISO格式或Unix时间戳)"),
+    end: Optional[str] = Query(default=None, description="结束时间(ISO格式或Unix时间戳)"),
+    level: Optional[str] = Query(default=None, description="精确匹配的级别,逗号分隔"),
+    min_level: Optional[str] = Query(default=None, description="最低级别"),
+    source: Optional[str] = Query(default=None, description="来源前缀"),
+    thread_id: Optional[str] = Query(default=None, description="线程ID"),
+    run_id: Optional[str] = Query(default=None, description="运行ID"),
+    contains: Optional[str] = Query(default=None, description="消息包含的文本"),
+    limit: int = Query(default=1000, ge=1, le=1000000, description="最多返回条数"),
+    order: str = Query(default="desc", description="排序: desc(最新在前)或asc")
+):
+    """
+    检索持久化日志
+    
+    数据来自本地SQLite日志库(不受内存缓冲区1000条的限制,按保留策略保存数天),
+    结果以NDJSON(每行一条日志)流式返回,大结果集不会一次性加载到内存
+    """
+    rows = log_store.query(
+        start=_parse_time(start),
+        end=_parse_time(end),
+        level=level.split(",") if level else None,
+        min_level_no=LEVEL_ORDER.get(min_level.upper()) if min_level else None,
+        source=source,
+        thread_id=thread_id,
+        run_id=run_id,
+        contains=contains,
+        limit=limit,
+        newest_first=order.lower() != "asc"
+    )
+    
+    def ndjson():
+        for row in rows:
+            yield dumps(row) + "\n"
+    
+    # 同步生成器由Starlette在线程池中迭代,不阻塞事件循环
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@router.get("/api/monitoring/logs/store/stats")
+async def get_log_store_stats():
+    """获取持久化日志库统计信息"""
+    return log_store.get_stats()
+
+
 @router.get("/api/monitoring/tools/usage", response_model=List[ToolUsageStat])
 async def get_tool_usage_stats():
-    """获取工具使用统计"""
-    stats = []
-    
-    for tool_name, count in tool_usage_stats.items():
-        stats.append(ToolUsageStat(
-            tool_name=tool_name,
-            usage_count=count,
-            last_used=tool_last_used.get(tool_name)
-        ))
+    """
+    获取工具使用统计
     
-    # 按使用次数降序排序
-    stats.sort(key=lambda x: x.usage_count, reverse=True)
+    每个工具包含调用次数、错误数、p50/p95/p99延迟(毫秒)、冷/热启动延迟、输入输出字节数
+    """
+    # 已按使用次数降序排序
+    return [ToolUsageStat(**stat) for stat in tool_usage_stats.get_all()]
+
+
+@router.get("/api/monitoring/tools/usage/threads")
+async def get_tool_usage_by_thread(
+    thread_id: Optional[str] = Query(default=None, description="线程ID,不指定时返回最近活跃的线程"),
+    limit: int = Query(default=50, ge=1, le=1000, description="返回的线程数量")
+):
+    """
+    按线程查看工具耗时分布
     
-    return stats
+    用于定位慢回复: dominant_tool为该线程中累计耗时最多的工具
+    """
+    return {
+        "threads": tool_usage_stats.get_thread_breakdown(thread_id, limit=limit),
+        "stats_since": tool_usage_stats.since.isoformat()
+    }
 
 
 @router.get("/api/monitoring/tools/usage/summary")
 async def get_tool_usage_summary():
     """获取工具使用统计摘要"""
-    total_usage = sum(tool_usage_stats.values())
+    stats = tool_usage_stats.get_all()
+    total_usage = sum(s["usage_count"] for s in stats)
+    total_errors = sum(s["error_count"] for s in stats)
     
     # 找出最常用的工具
     most_used = None
-    if tool_usage_stats:
-        most_used_tool = max(tool_usage_stats.items(), key=lambda x: x[1])
+    if stats:
+        most_used_tool = stats[0]
         most_used = {
-            "tool_name": most_used_tool[0],
-            "usage_count": most_used_tool[1],
-            "percentage": round(most_used_tool[1] / total_usage * 100, 2) if total_usage > 0 else 0
+            "tool_name": most_used_tool["tool_name"],
+            "usage_count": most_used_tool["usage_count"],
+            "percentage": round(most_used_tool["usage_count"] / total_usage * 100, 2) if total_usage > 0 else 0
+        }
+    
+    # 找出p95延迟最高的工具
+    slowest = None
+    timed = [s for s in stats if s["latency_ms"]["p95"] is not None]
+    if timed:
+        slowest_tool = max(timed, key=lambda s: s["latency_ms"]["p95"])
+        slowest = {
+            "tool_name": slowest_tool["tool_name"],
+            "p95_ms": slowest_tool["latency_ms"]["p95"],
+            "p99_ms": slowest_tool["latency_ms"]["p99"]
         }
     
     return {
         "total_usage": total_usage,
-        "unique_tools_used": len(tool_usage_stats),
+        "total_errors": total_errors,
+        "error_rate": round(total_errors / total_usage * 100, 2) if total_usage > 0 else 0,
+        "unique_tools_used": len(stats),
         "most_used_tool": most_used,
-        "stats_since": state_manager.system_start_time.isoformat()
+        "slowest_tool": slowest,
+        "stats_since": tool_usage_stats.since.isoformat()
     }
 
 
@@ -222,12 +386,13 @@ async def get_system_health():
     - 浏览器池状态
     - 内存使用情况（如果可用）
     """
-    import psutil
-    
     # 计算运行时间
     uptime = datetime.now() - state_manager.system_start_time
     uptime_str = str(uptime).split('.')[0]  # 去掉微秒
     
+    # 进程资源取自后台采样器的最新样本(CPU占用需要采样区间,不能在请求中同步测量)
+    sample = resource_sampler.latest()
+    
     # 获取内存使用情况
     try:
         memory = psutil.virtual_memory()
@@ -240,11 +405,7 @@ async def get_system_health():
     except Exception:
         memory_info = {"error": "无法获取内存信息"}
     
-    # 获取CPU使用情况
-    try:
-        cpu_percent = psutil.cpu_percent(interval=1)
-    except Exception:
-        cpu_percent = None
+    cpu_percent = sample["system_cpu_percent"] if sample else None
     
     # 构建完整的数据结构(兼容前端期望)
     return {
@@ -270,7 +431,8 @@ async def get_system_health():
         },
         "resources": {
             "memory": memory_info,
-            "cpu_percent": cpu_percent
+            "cpu_percent": cpu_percent,
+            "process": sample
         },
         "timestamp": datetime.now().isoformat(),
         
@@ -292,6 +454,132 @@ async def get_system_health():
     }
 
 
+@router.get("/api/monitoring/system/timeseries")
+async def get_system_timeseries(
+    resolution: str = Query("1s", description="分辨率: 1s / 1m / 1h"),
+    start: Optional[str] = Query(None, description="开始时间(ISO格式或Unix时间戳)"),
+    end: Optional[str] = Query(None, description="结束时间(ISO格式或Unix时间戳)"),
+    fields: Optional[str] = Query(None, description="字段,逗号分隔(默认全部)"),
+    limit: Optional[int] = Query(None, ge=1, le=3600, description="最多返回最近的点数")
+):
+    """
+    获取进程资源时间序列(供管理面板绘图)
+    
+    返回列式数据: timestamps为Unix时间戳,series为 {字段: 数值列表}
+    """
+    try:
+        return resource_sampler.series(
+            resolution=resolution,
+            start=_parse_time(start),
+            end=_parse_time(end),
+            fields=[f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+            limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/api/monitoring/loop/stalls")
+async def get_loop_stalls(
+    limit: int = Query(50, ge=1, le=500, description="返回的记录数"),
+    include_stack: bool = Query(True, description="是否包含完整调用栈")
+):
+    """
+    获取事件循环阻塞记录(最新在前)
+    
+    每条记录包含阻塞时长、所属thread_id/run_id、正在执行的工具、
+    事件循环线程的调用栈以及定位到的项目代码位置(culprit)
+    """
+    return {
+        "status": loop_watchdog.get_status(),
+        "stalls": loop_watchdog.get_stalls(limit=limit, include_stack=include_stack)
+    }
+
+
+@router.post("/api/monitoring/loop/stalls/clear")
+async def clear_loop_stalls():
+    """清空事件循环阻塞记录"""
+    loop_watchdog.clear()
+    add_log("INFO", "事件循环阻塞记录已清空", "monitoring_api")
+    
+    return {
+        "success": True,
+        "message": "事件循环阻塞记录已清空"
+    }
+
+
+@router.get("/api/monitoring/traces")
+async def list_traces(
+    thread_id: Optional[str] = Query(None, description="按会话线程过滤"),
+    limit: int = Query(50, ge=1, le=500, description="返回的运行数")
+):
+    """
+    最近运行的追踪概要(最新在前)
+    
+    每条包含总耗时与按类型(llm/tool/checkpoint/messenger)的耗时分解,
+    以及LLM的token数、预填充与生成耗时
+    """
+    return {
+        "status": tracer.get_status(),
+        "threads": tracer.get_threads() if thread_id is None else None,
+        "traces": tracer.list_traces(thread_id=thread_id, limit=limit)
+    }
+
+
+@router.get("/api/monitoring/traces/{run_id}")
+async def get_trace(
+    run_id: str,
+    format: str = Query("tree", description="tree: 嵌套span树, flat: 扁平列表, otlp: OTLP JSON")
+):
+    """获取单次运行的完整追踪(run_id来自SSE事件或X-Run-Id响应头)"""
+    if format not in ("tree", "flat", "otlp"):
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {format},可选: tree, flat, otlp")
+    trace = tracer.get_trace(run_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"追踪不存在或已淘汰: {run_id}")
+    if format == "otlp":
+        return to_otlp(trace)
+    return trace.to_dict(tree=format == "tree")
+
+
+@router.get("/api/monitoring/sessions")
+async def get_sessions(
+    limit: int = Query(100, ge=1, le=1000, description="返回的会话数")
+):
+    """
+    会话生命周期状态
+    
+    包含活跃/被淘汰会话数、上次清理结果,以及最近活动的会话列表
+    (空闲时长、checkpoint数、历史消息数、估算内存)
+    """
+    return {
+        "stats": session_manager.get_stats(),
+        "sessions": await asyncio.to_thread(session_manager.list_sessions, limit)
+    }
+
+
+@router.post("/api/monitoring/sessions/sweep")
+async def sweep_sessions():
+    """立即执行一次会话清理"""
+    result = await session_manager.sweep_async()
+    add_log("INFO", f"手动会话清理: {result['evicted']}", "monitoring_api")
+    return result
+
+
+@router.post("/api/monitoring/sessions/{thread_id}/evict")
+async def evict_session(thread_id: str):
+    """从checkpointer、消息总线与会话表中清除指定会话(运行中或有连接的会话不可清除)"""
+    if session_manager.is_pinned(thread_id):
+        raise HTTPException(status_code=409, detail=f"会话正在运行或有WebSocket连接: {thread_id}")
+    removed = session_manager.evict(thread_id, "manual")
+    add_log("INFO", f"会话已清除: {thread_id}", "monitoring_api")
+    return {
+        "success": True,
+        "thread_id": thread_id,
+        "removed": removed
+    }
+
+
 @router.post("/api/monitoring/logs/clear")
 async def clear_logs():
     """清空日志缓冲区"""
@@ -307,8 +595,7 @@ async def clear_logs():
 @router.post("/api/monitoring/tools/usage/reset")
 async def reset_tool_usage_stats():
     """重置工具使用统计"""
-    tool_usage_stats.clear()
-    tool_last_used.clear()
+    tool_usage_stats.reset()
     add_log("INFO", "工具使用统计已重置", "monitoring_api")
     
     return {
@@ -5,7 +5,7 @@
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple, AsyncGenerator
 from datetime import datetime
 import json
 import asyncio
@@ -13,6 +13,12 @@ from langchain_core.messages import HumanMessage
 
 from app.state import state_manager
 from app.config import MAX_CONTEXT_LENGTH, COMPRESSION_TRIGGER_TOKENS
+from app.core.unified_messenger import unified_messenger
+from app.core.codec import sse_event
+from app.core.run_context import new_run_id
+from app.core.tracing import tracer, traced_stream, tracing_config
+from app.core.metrics import track_graph_stream
+from app.core.run_serializer import ThreadRunSerializer, QueueFullError
 
 router = APIRouter()
 
@@ -41,6 +47,212 @@ class MultidimensionalChatRequest(BaseModel):
     metadata: Optional[Dict[str, Any]] = Field(default=None, description="元数据")
 
 
+async def run_chat_events(
+    request: MultidimensionalChatRequest,
+    run_id: Optional[str] = None
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    提交一条多维对话消息,逐个产出事件字典
+    
+    SSE端点与WebSocket端点共用此生成器,事件类型:
+    queued / start / message / tool_call / tool_result / end / error
+    
+    同一thread_id同时只有一个运行: 运行期间到达的消息先收到queued事件,
+    运行结束后与上下文相同的相邻排队消息合并为一轮(保留各自的角色),该轮事件发送给所有被合并的请求方。
+    每个事件都带本请求的run_id;被合并时turn_run_id为实际执行的运行,
+    整轮对话记录为一条追踪(/api/monitoring/traces/{turn_run_id})
+    """
+    run_id = run_id or new_run_id()
+    
+    if not state_manager.get_app_graph():
+        yield {'type': 'error', 'message': 'Agent未初始化,请等待启动完成', 'run_id': run_id}
+        return
+    
+    # 权限检查
+    if not _check_permissions(request.role, request.message):
+        yield {'type': 'error', 'message': f'角色 {request.role.type} 无权执行此操作', 'run_id': run_id}
+        return
+    
+    # 用户消息到达即发送到统一消息总线(排队期间聊天室也能看到)
+    await unified_messenger.send_user_message(
+        content=request.message,
+        role_type=request.role.type,
+        role_id=request.role.id,
+        role_name=request.role.name,
+        thread_id=request.thread_id,
+        metadata={
+            "weight": request.role.weight,
+            "permissions": request.role.permissions,
+            "context": request.context
+        }
+    )
+    
+    try:
+        async for event in chat_serializer.submit(request.thread_id, (request, run_id)):
+            # 同一事件会分发给多个请求方,复制后再加本请求的字段
+            event = {**event, 'run_id': run_id}
+            if event.get('turn_run_id') == run_id:
+                event.pop('turn_run_id')
+            yield event
+    except QueueFullError as e:
+        yield {'type': 'error', 'message': str(e), 'run_id': run_id}
+
+
+async def _run_turn(items: List[Tuple[MultidimensionalChatRequest, str]]) -> AsyncGenerator[Dict[str, Any], None]:
+    """执行合并后的一轮对话(由串行化器调用),以第一条消息的run_id记录追踪"""
+    requests = [request for request, _ in items]
+    turn_run_id = items[0][1]
+    events = traced_stream(
+        turn_run_id, requests[0].thread_id, "multidimensional_chat", _chat_events(requests, turn_run_id),
+        role_type=requests[0].role.type,
+        merged_messages=len(items),
+        merged_run_ids=[run_id for _, run_id in items[1:]]
+    )
+    async for event in events:
+        event['turn_run_id'] = turn_run_id
+        if event['type'] == 'error':
+            tracer.fail(turn_run_id, event.get('message'))
+        yield event
+
+
+def _turn_message(request: MultidimensionalChatRequest, merged: bool) -> HumanMessage:
+    """构造一轮中的用户消息,合并多条消息时在内容前标注发言角色"""
+    if not merged:
+        return HumanMessage(content=request.message)
+    return HumanMessage(content=f"[{request.role.name}({request.role.type})] {request.message}")
+
+
+async def _chat_events(
+    requests: List[MultidimensionalChatRequest],
+    run_id: str
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    一轮多维对话的事件(不含追踪包装),requests为本轮合并的消息(按到达顺序)
+
+    合并的消息上下文相同(见_merge_key);各消息的发言角色标注在消息内容中,
+    role_info为首条消息的角色,merged_roles列出本轮全部不同的角色
+    """
+    request = requests[0]
+    merged = len(requests) > 1
+    try:
+        # 从全局状态获取app_graph
+        app_graph = state_manager.get_app_graph()
+        
+        if not app_graph:
+            yield {'type': 'error', 'message': 'Agent未初始化,请等待启动完成'}
+            return
+        
+        # 发送开始事件（包含角色信息）
+        start_event = {
+            'type': 'start',
+            'timestamp': datetime.now().isoformat(),
+            'role': request.role.dict(),
+            'message': request.message
+        }
+        if merged:
+            start_event['merged'] = [
+                {'role': r.role.dict(), 'message': r.message} for r in requests
+            ]
+        yield start_event
+        
+        # 构造输入（注入角色信息到上下文）
+        input_data = {
+            "messages": [_turn_message(r, merged) for r in requests],
+            "role_info": request.role.dict(),
+            "context": request.context or {}
+        }
+        if merged:
+            roles = {}
+            for r in requests:
+                roles.setdefault((r.role.type, r.role.id), r.role.dict())
+            input_data["merged_roles"] = list(roles.values())
+        
+        # 配置(包含thread_id用于会话管理)
+        config = {
+            "configurable": {
+                "thread_id": request.thread_id
+            },
+            **tracing_config(run_id)
+        }
+        
+        # 流式执行workflow
+        async for event in track_graph_stream("multidimensional_chat", app_graph.astream(input_data, config=config)):
+            # 发送中间结果
+            if "agent" in event:
+                messages = event["agent"].get("messages", [])
+                if messages:
+                    last_message = messages[-1]
+                    
+                    # 如果是AI消息
+                    if hasattr(last_message, "content") and last_message.content:
+                        # 推送到消息总线
+                        await unified_messenger.send_user_message(
+                            content=last_message.content,
+                            role_type="assistant",
+                            role_id="agent",
+                            role_name="AI助手",
+                            thread_id=request.thread_id
+                        )
+                        
+                        yield {
+                            'type': 'message',
+                            'content': last_message.content,
+                            'role': 'assistant'
+                        }
+                    
+                    # 如果有工具调用
+                    if hasattr(last_message, "tool_calls") and last_message.tool_calls:
+                        for tool_call in last_message.tool_calls:
+                            # 推送到消息总线
+                            await unified_messenger.send_tool_call_message(
+                                tool_name=tool_call.get('name'),
+                                tool_args=tool_call.get('args'),
+                                thread_id=request.thread_id
+                            )
+                            
+                            yield {
+                                'type': 'tool_call',
+                                'tool': tool_call.get('name'),
+                                'args': tool_call.get('args')
+                            }
+            
+            # 如果有工具结果
+            if "tools" in event:
+                messages = event["tools"].get("messages", [])
+                if messages:
+                    for msg in messages:
+                        if hasattr(msg, "content"):
+                            # 推送到消息总线
+                            tool_name = getattr(msg, 'name', 'unknown_tool')
+                            await unified_messenger.send_tool_result_message(
+                                tool_name=tool_name,
+                                result=str(msg.content),
+                                thread_id=request.thread_id
+                            )
+                            
+                            yield {
+                                'type': 'tool_result',
+                                'content': str(msg.content)[:500]
+                            }
+            
+            # 短暂延迟,避免过快
+            await asyncio.sleep(0.01)
+        
+        # 发送结束事件
+        yield {
+            'type': 'end',
+            'timestamp': datetime.now().isoformat()
+        }
+        
+    except asyncio.CancelledError:
+        # 取消由调用方处理(WebSocket的cancel/interrupt命令)
+        raise
+    except Exception as e:
+        error_msg = f"多维聊天处理错误: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        yield {'type': 'error', 'message': error_msg}
+
+
 @router.post("/api/multidimensional/chat/stream")
 async def multidimensional_chat_stream(request: MultidimensionalChatRequest):
     """
@@ -52,135 +264,15 @@ async def multidimensional_chat_stream(request: MultidimensionalChatRequest):
     - 权限控制
     - 上下文信息
     - 统一消息推送到多维聊天室
+    
+    高频调用方可改用WebSocket端点 /api/multidimensional/chat/ws 的chat命令,
+    在同一长连接上完成多轮对话
     """
+    run_id = new_run_id()
+    
     async def event_generator():
-        try:
-            # 从全局状态获取app_graph
-            app_graph = state_manager.get_app_graph()
-            
-            if not app_graph:
-                yield f"data: {json.dumps({'type': 'error', 'message': 'Agent未初始化,请等待启动完成'})}\n\n"
-                return
-            
-            # 权限检查
-            if not _check_permissions(request.role, request.message):
-                yield f"data: {json.dumps({'type': 'error', 'message': f'角色 {request.role.type} 无权执行此操作'})}\n\n"
-                return
-            
-            # 发送用户消息到统一消息总线
-            await unified_messenger.send_user_message(
-                content=request.message,
-                role_type=request.role.type,
-                role_id=request.role.id,
-                role_name=request.role.name,
-                thread_id=request.thread_id,
-                metadata={
-                    "weight": request.role.weight,
-                    "permissions": request.role.permissions,
-                    "context": request.context
-                }
-            )
-            
-            # 发送开始事件（包含角色信息）
-            start_event = {
-                'type': 'start',
-                'timestamp': datetime.now().isoformat(),
-                'role': request.role.dict(),
-                'message': request.message
-            }
-            yield f"data: {json.dumps(start_event)}\n\n"
-            
-            # 构造输入（注入角色信息到上下文）
-            input_data = {
-                "messages": [HumanMessage(content=request.message)],
-                "role_info": request.role.dict(),
-                "context": request.context or {}
-            }
-            
-            # 配置(包含thread_id用于会话管理)
-            config = {
-                "configurable": {
-                    "thread_id": request.thread_id
-                }
-            }
-            
-            # 流式执行workflow
-            async for event in app_graph.astream(input_data, config=config):
-                # 发送中间结果
-                if "agent" in event:
-                    messages = event["agent"].get("messages", [])
-                    if messages:
-                        last_message = messages[-1]
-                        
-                        # 如果是AI消息
-                        if hasattr(last_message, "content") and last_message.content:
-                            # 推送到消息总线
-                            await unified_messenger.send_user_message(
-                                content=last_message.content,
-                                role_type="assistant",
-                                role_id="agent",
-                                role_name="AI助手",
-                                thread_id=request.thread_id
-                            )
-                            
-                            msg_event = {
-                                'type': 'message',
-                                'content': last_message.content,
-                                'role': 'assistant'
-                            }
-                            yield f"data: {json.dumps(msg_event)}\n\n"
-                        
-                        # 如果有工具调用
-                        if hasattr(last_message, "tool_calls") and last_message.tool_calls:
-                            for tool_call in last_message.tool_calls:
-                                # 推送到消息总线
-                                await unified_messenger.send_tool_call_message(
-                                    tool_name=tool_call.get('name'),
-                                    tool_args=tool_call.get('args'),
-                                    thread_id=request.thread_id
-                                )
-                                
-                                tool_call_event = {
-                                    'type': 'tool_call',
-                                    'tool': tool_call.get('name'),
-                                    'args': tool_call.get('args')
-                                }
-                                yield f"data: {json.dumps(tool_call_event)}\n\n"
-                
-                # 如果有工具结果
-                if "tools" in event:
-                    messages = event["tools"].get("messages", [])
-                    if messages:
-                        for msg in messages:
-                            if hasattr(msg, "content"):
-                                # 推送到消息总线
-                                tool_name = getattr(msg, 'name', 'unknown_tool')
-                                await unified_messenger.send_tool_result_message(
-                                    tool_name=tool_name,
-                                    result=str(msg.content),
-                                    thread_id=request.thread_id
-                                )
-                                
-                                tool_result_event = {
-                                    'type': 'tool_result',
-                                    'content': str(msg.content)[:500]
-                                }
-                                yield f"data: {json.dumps(tool_result_event)}\n\n"
-                
-                # 短暂延迟,避免过快
-                await asyncio.sleep(0.01)
-            
-            # 发送结束事件
-            end_event = {
-                'type': 'end',
-                'timestamp': datetime.now().isoformat()
-            }
-            yield f"data: {json.dumps(end_event)}\n\n"
-            
-        except Exception as e:
-            error_msg = f"多维聊天处理错误: {str(e)}"
-            print(f"ERROR: {error_msg}")
-            yield f"data: {json.dumps({'type': 'error', 'message': error_msg})}\n\n"
+        async for event in run_chat_events(request, run_id):
+            yield sse_event(event)
     
     return StreamingResponse(
         event_generator(),
@@ -188,7 +280,8 @@ async def multidimensional_chat_stream(request: MultidimensionalChatRequest):
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
+            "X-Accel-Buffering": "no",
+            "X-Run-Id": run_id
         }
     )
 
@@ -200,6 +293,7 @@ async def multidimensional_chat_health():
         "status": "healthy",
         "tools_loaded": state_manager.tool_pool_loaded,
         "app_graph_loaded": state_manager.app_graph is not None,
+        "run_serializer": chat_serializer.get_stats(),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -290,3 +384,12 @@ def _build_role_aware_prompt(role: RoleInfo, context: Optional[Dict]) -> str:
         prompt += f"\n## 当前上下文\n{json.dumps(context, ensure_ascii=False, indent=2)}\n"
     
     return prompt
+
+
+def _merge_key(item: Tuple[MultidimensionalChatRequest, str]) -> str:
+    """只有上下文(房间、平台来源等)相同的消息才合并为一轮"""
+    return json.dumps(item[0].context or {}, sort_keys=True, ensure_ascii=False, default=str)
+
+
+# 多维聊天的按线程串行化器
+chat_serializer = ThreadRunSerializer(_run_turn, merge_key=_merge_key)
@@ -6,12 +6,15 @@ from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, AsyncGenerator
-import json
 import asyncio
 from datetime import datetime
 
 from app.workflow.graph import create_agent_graph
 from app.core.unified_messenger import unified_messenger
+from app.core.codec import sse_event
+from app.core.run_context import new_run_id
+from app.core.tracing import tracer, traced_stream, tracing_config
+from app.core.metrics import track_graph_stream
 
 router = APIRouter()
 
@@ -32,6 +35,7 @@ async def multidimensional_chat_stream(request: ChatRequest):
     
     支持任意角色类型,通过SSE推送消息到前端
     """
+    run_id = new_run_id()
     
     async def event_generator() -> AsyncGenerator[str, None]:
         """SSE事件生成器"""
@@ -45,32 +49,33 @@ async def multidimensional_chat_stream(request: ChatRequest):
             )
             
             # 2. 推送用户消息事件到前端
-            yield f"event: message\n"
-            user_msg_data = json.dumps({
+            user_msg_data = {
                 'type': 'message',
                 'role': 'user',
                 'role_type': request.role_type,
                 'source': request.role_type,
                 'content': request.message,
                 'timestamp': datetime.now().isoformat(),
-                'metadata': request.metadata
-            }, ensure_ascii=False)
-            yield f"data: {user_msg_data}\n\n"
+                'metadata': request.metadata,
+                'run_id': run_id
+            }
+            yield sse_event(user_msg_data, event="message")
             
             # 3. 调用Agent处理
             graph = create_agent_graph()
             config = {
                 "configurable": {
                     "thread_id": request.thread_id
-                }
+                },
+                **tracing_config(run_id)
             }
             
             # 4. 流式处理Agent响应
-            async for event in graph.astream_events(
+            async for event in track_graph_stream("multidimensional_chat_sse", graph.astream_events(
                 {"messages": [("user", request.message)]},
                 config=config,
                 version="v2"
-            ):
+            )):
                 event_type = event.get("event")
                 
                 # 处理不同类型的事件
@@ -87,16 +92,15 @@ async def multidimensional_chat_stream(request: ChatRequest):
                         )
                         
                         # 推送到前端
-                        yield f"event: message\n"
-                        ai_msg_data = json.dumps({
+                        ai_msg_data = {
                             'type': 'message',
                             'role': 'assistant',
                             'role_type': 'assistant',
                             'source': 'assistant',
                             'content': chunk.content,
                             'timestamp': datetime.now().isoformat()
-                        }, ensure_ascii=False)
-                        yield f"data: {ai_msg_data}\n\n"
+                        }
+                        yield sse_event(ai_msg_data, event="message")
                 
                 elif event_type == "on_tool_start":
                     # 工具调用开始
@@ -112,16 +116,15 @@ async def multidimensional_chat_stream(request: ChatRequest):
                     )
                     
                     # 推送到前端
-                    yield f"event: tool\n"
-                    tool_call_data = json.dumps({
+                    tool_call_data = {
                         'type': 'tool_call',
                         'id': tool_id,
                         'tool_name': tool_name,
                         'status': 'calling',
                         'input': tool_input,
                         'timestamp': datetime.now().isoformat()
-                    }, ensure_ascii=False)
-                    yield f"data: {tool_call_data}\n\n"
+                    }
+                    yield sse_event(tool_call_data, event="tool")
                 
                 elif event_type == "on_tool_end":
                     # 工具调用结束
@@ -137,41 +140,41 @@ async def multidimensional_chat_stream(request: ChatRequest):
                     )
                     
                     # 推送到前端
-                    yield f"event: tool\n"
-                    tool_result_data = json.dumps({
+                    tool_result_data = {
                         'type': 'tool_result',
                         'id': tool_id,
                         'tool_name': tool_name,
                         'status': 'success',
                         'output': tool_output,
                         'timestamp': datetime.now().isoformat()
-                    }, ensure_ascii=False)
-                    yield f"data: {tool_result_data}\n\n"
+                    }
+                    yield sse_event(tool_result_data, event="tool")
                 
                 # 避免事件过快
                 await asyncio.sleep(0.01)
             
             # 5. 推送完成事件
-            yield f"event: done\n"
-            yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+            yield sse_event({'type': 'done', 'run_id': run_id}, event="done")
             
         except Exception as e:
             # 推送错误事件
-            yield f"event: error\n"
-            error_data = json.dumps({
+            tracer.fail(run_id, e)
+            error_data = {
                 'type': 'error',
                 'error': str(e),
+                'run_id': run_id,
                 'timestamp': datetime.now().isoformat()
-            }, ensure_ascii=False)
-            yield f"data: {error_data}\n\n"
+            }
+            yield sse_event(error_data, event="error")
     
     # 返回SSE响应
     return StreamingResponse(
-        event_generator(),
+        traced_stream(run_id, request.thread_id, "multidimensional_chat_sse", event_generator(), role_type=request.role_type),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"  # 禁用nginx缓冲
+            "X-Accel-Buffering": "no",  # 禁用nginx缓冲
+            "X-Run-Id": run_id
         }
     )
@@ -3,19 +3,110 @@
 提供实时消息流订阅功能
 """
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
-from typing import Optional
+from pydantic import ValidationError
+from typing import Optional, Dict, Any
+from datetime import datetime
+import asyncio
 import logging
 
 from app.core.unified_messenger import unified_messenger
+from app.core.codec import ENCODING_JSON, negotiate_encoding, decode_frame, send_obj
+from app.core.run_context import new_run_id
+from app.api.multidimensional_chat import MultidimensionalChatRequest, run_chat_events
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+class _ChatSession:
+    """
+    单个WebSocket连接上的对话会话
+    
+    同一连接同时最多只有一个运行中的run,
+    cancel/interrupt命令通过取消该run对应的任务实现
+    """
+    
+    def __init__(self, websocket: WebSocket, thread_id: str, encoding: str = ENCODING_JSON):
+        self.websocket = websocket
+        self.thread_id = thread_id
+        self.encoding = encoding
+        self.run_id: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+    
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+    
+    def start(self, command: Dict[str, Any]) -> str:
+        """根据chat命令启动一次run,返回run_id"""
+        request = MultidimensionalChatRequest(
+            message=command.get("message"),
+            thread_id=self.thread_id,
+            role=command.get("role") or {"type": "user", "id": "anonymous", "name": "匿名用户"},
+            context=command.get("context"),
+            metadata=command.get("metadata")
+        )
+        run_id = new_run_id()
+        self.run_id = run_id
+        self.task = asyncio.create_task(self._stream_run(run_id, request, command.get("request_id")))
+        return run_id
+    
+    async def cancel(self, reason: str = "cancelled") -> Optional[str]:
+        """取消当前run并等待其退出,返回被取消的run_id"""
+        if not self.running:
+            return None
+        
+        run_id = self.run_id
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        
+        await self._send_run_event(run_id, {
+            'type': reason,
+            'timestamp': datetime.now().isoformat()
+        })
+        return run_id
+    
+    async def _stream_run(self, run_id: str, request: MultidimensionalChatRequest, request_id: Optional[str]):
+        """把run事件推送到当前连接"""
+        try:
+            async for event in run_chat_events(request, run_id):
+                if request_id is not None:
+                    event["request_id"] = request_id
+                await self._send_run_event(run_id, event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ WebSocket run失败: run_id={run_id}, {e}")
+            # 通知客户端本次run已失败并结束,避免其一直等待结束帧
+            timestamp = datetime.now().isoformat()
+            try:
+                for event in (
+                    {'type': 'error', 'message': f"run失败: {e}", 'timestamp': timestamp},
+                    {'type': 'end', 'timestamp': timestamp}
+                ):
+                    if request_id is not None:
+                        event["request_id"] = request_id
+                    await self._send_run_event(run_id, event)
+            except Exception:
+                # 连接已断开
+                pass
+    
+    async def _send_run_event(self, run_id: str, event: Dict[str, Any]):
+        await send_obj(self.websocket, {
+            "type": "run_event",
+            "run_id": run_id,
+            "data": event
+        }, self.encoding)
+
+
 @router.websocket("/api/multidimensional/chat/ws")
 async def multidimensional_chat_websocket(
     websocket: WebSocket,
-    thread_id: str = Query(default="default", description="线程ID")
+    thread_id: str = Query(default="default", description="线程ID"),
+    encoding: Optional[str] = Query(default=None, description="帧编码: json(默认)或msgpack")
 ):
     """
     多维聊天室WebSocket端点
@@ -39,64 +130,126 @@ async def multidimensional_chat_websocket(
             "timestamp": "2025-01-01T00:00:00"
         }
     }
+    
+    客户端可发送的命令：
+    - {"command": "chat", "message": "...", "role": {...}, "context": {...}, "request_id": "可选"}
+      在本连接上启动一轮对话,run事件以 {"type": "run_event", "run_id": ..., "data": {...}} 推送,
+      data与SSE端点 /api/multidimensional/chat/stream 的事件格式一致
+    - {"command": "cancel"} 取消当前run
+    - {"command": "interrupt", "message": "...", ...} 取消当前run并以新消息开始下一轮
+    - {"command": "clear_history"} / {"command": "get_stats"}
+    
+    帧编码：
+    默认收发JSON文本帧;通过 ?encoding=msgpack 或子协议 "msgpack" 可协商MessagePack二进制帧
+    (服务端与客户端均使用二进制帧),服务端不支持时回退到JSON,欢迎消息中的encoding字段给出最终结果
     """
-    await websocket.accept()
-    logger.info(f"📡 新WebSocket连接: thread_id={thread_id}")
+    subprotocols = websocket.scope.get("subprotocols", [])
+    frame_encoding = negotiate_encoding(encoding, subprotocols)
+    await websocket.accept(subprotocol=frame_encoding if frame_encoding in subprotocols else None)
+    logger.info(f"📡 新WebSocket连接: thread_id={thread_id}, encoding={frame_encoding}")
+    session: Optional[_ChatSession] = None
     
     try:
         # 注册连接
-        unified_messenger.register_connection(thread_id, websocket)
+        unified_messenger.register_connection(thread_id, websocket, frame_encoding)
         
         # 发送历史消息
         history = unified_messenger.get_history(thread_id, limit=100)
         if history:
-            await websocket.send_json({
+            await send_obj(websocket, {
                 "type": "history",
                 "data": {
                     "messages": history,
                     "count": len(history)
                 }
-            })
+            }, frame_encoding)
         
         # 发送欢迎消息
-        await websocket.send_json({
+        await send_obj(websocket, {
             "type": "system",
             "data": {
                 "message": f"✅ 已连接到多维聊天室 (线程: {thread_id})",
+                "encoding": frame_encoding,
                 "timestamp": unified_messenger.get_stats()
             }
-        })
+        }, frame_encoding)
+        
+        session = _ChatSession(websocket, thread_id, frame_encoding)
         
-        # 保持连接，等待客户端断开
+        # 接收客户端命令,直到连接断开
         while True:
-            # 接收客户端消息（如果有的话）
-            data = await websocket.receive_text()
+            raw = await websocket.receive()
+            if raw["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(raw.get("code", 1000))
             
-            # 这里可以处理客户端发送的控制命令
-            # 例如：{"command": "clear_history"}
-            import json
             try:
-                command = json.loads(data)
-                if command.get("command") == "clear_history":
-                    unified_messenger.clear_history(thread_id)
-                    await websocket.send_json({
+                command = decode_frame(raw)
+            except ValueError:
+                continue
+            if not isinstance(command, dict):
+                continue
+            
+            name = command.get("command")
+            if name == "clear_history":
+                unified_messenger.clear_history(thread_id)
+                await send_obj(websocket, {
+                    "type": "system",
+                    "data": {"message": "✅ 历史消息已清空"}
+                }, frame_encoding)
+            elif name == "get_stats":
+                stats = unified_messenger.get_stats()
+                await send_obj(websocket, {
+                    "type": "stats",
+                    "data": stats
+                }, frame_encoding)
+            elif name in ("chat", "interrupt"):
+                # interrupt = 取消当前run后立即以新消息开始下一轮
+                if session.running:
+                    if name == "chat":
+                        await send_obj(websocket, {
+                            "type": "error",
+                            "data": {
+                                "message": "当前已有运行中的对话,请先发送cancel或使用interrupt",
+                                "run_id": session.run_id,
+                                "request_id": command.get("request_id")
+                            }
+                        }, frame_encoding)
+                        continue
+                    await session.cancel(reason="interrupted")
+                
+                try:
+                    run_id = session.start(command)
+                except ValidationError as e:
+                    await send_obj(websocket, {
+                        "type": "error",
+                        "data": {
+                            "message": f"chat命令参数错误: {e.errors()}",
+                            "request_id": command.get("request_id")
+                        }
+                    }, frame_encoding)
+                    continue
+                
+                await send_obj(websocket, {
+                    "type": "run_started",
+                    "run_id": run_id,
+                    "data": {"request_id": command.get("request_id")}
+                }, frame_encoding)
+            elif name == "cancel":
+                run_id = await session.cancel()
+                if run_id is None:
+                    await send_obj(websocket, {
                         "type": "system",
-                        "data": {"message": "✅ 历史消息已清空"}
-                    })
-                elif command.get("command") == "get_stats":
-                    stats = unified_messenger.get_stats()
-                    await websocket.send_json({
-                        "type": "stats",
-                        "data": stats
-                    })
-            except json.JSONDecodeError:
-                pass
+                        "data": {"message": "没有运行中的对话"}
+                    }, frame_encoding)
             
     except WebSocketDisconnect:
         logger.info(f"📡 WebSocket连接断开: thread_id={thread_id}")
     except Exception as e:
         logger.error(f"❌ WebSocket错误: {e}")
     finally:
+        # 连接断开时终止未完成的run
+        if session is not None and session.running:
+            session.task.cancel()
         # 注销连接
         unified_messenger.unregister_connection(thread_id, websocket)
 
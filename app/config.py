@@ -53,17 +53,170 @@ BROWSER_POOL_CHECK_INTERVAL = 1800  # 秒
 PERFORMANCE_CHECK_DELAY = 1200  # 秒
 # 性能检测间隔(每30分钟)
 PERFORMANCE_CHECK_INTERVAL = 1800  # 秒
+# LLM基准测试: 并发扫描档位与提示词长度分档(约tokens)
+BENCHMARK_CONCURRENCY_LEVELS = (1, 2, 4, 8)
+BENCHMARK_PROMPT_BUCKETS = {"short": 64, "medium": 512, "long": 2048}
+# 每个请求的最大输出tokens
+BENCHMARK_MAX_TOKENS = int(os.getenv("BENCHMARK_MAX_TOKENS", "128"))
+# 每个并发worker连续发送的请求数
+BENCHMARK_REQUESTS_PER_WORKER = 2
+# 定时性能检测是否运行完整并发扫描(默认关闭,只发送一次并发1、短提示词的轻量探测;完整扫描按需手动触发)
+BENCHMARK_SCHEDULED_SWEEP = os.getenv("BENCHMARK_SCHEDULED_SWEEP", "0") == "1"
+# 单个请求超时(秒)
+BENCHMARK_REQUEST_TIMEOUT = 120
+# 基准测试历史(保留条数与持久化文件)
+BENCHMARK_HISTORY_SIZE = 100
+BENCHMARK_HISTORY_PATH = DATA_DIR / "llm_benchmarks.jsonl"
 
 # ==================== 模型监控配置 ====================
 # 模型状态获取间隔(每1分钟)
 MODEL_STATUS_CHECK_INTERVAL = 60  # 秒
 
+# ==================== 资源采样配置 ====================
+# 进程资源采样间隔(秒)
+RESOURCE_SAMPLE_INTERVAL = float(os.getenv("RESOURCE_SAMPLE_INTERVAL", "1"))
+# 各分辨率环形缓冲区容量(点): 1秒×3600=1小时, 1分钟×1440=1天, 1小时×720=30天
+RESOURCE_SAMPLES_1S = 3600
+RESOURCE_SAMPLES_1M = 1440
+RESOURCE_SAMPLES_1H = 720
+# 事件循环阻塞检测: 心跳延迟超过阈值(毫秒)即记录阻塞并抓取事件循环线程的调用栈
+LOOP_STALL_THRESHOLD_MS = int(os.getenv("LOOP_STALL_THRESHOLD_MS", "500"))
+# 保留的阻塞记录数
+LOOP_STALL_BUFFER_SIZE = 200
+# 按需采样分析器: 默认/最大采样频率(Hz)、最长采样时长(秒)
+PROFILER_DEFAULT_RATE = 100
+PROFILER_MAX_RATE = 1000
+PROFILER_MAX_SECONDS = 300
+# 采样开销上限(占单核CPU时间的比例),超出时自动降低采样频率
+PROFILER_MAX_OVERHEAD = float(os.getenv("PROFILER_MAX_OVERHEAD", "0.05"))
+# 内存诊断: tracemalloc记录的调用栈深度(越深开销越大)、保留的快照数、
+# 结构体大小统计时每个结构最多遍历的对象数
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "1"))
+MEMORY_SNAPSHOT_LIMIT = 10
+MEMORY_WALK_MAX_OBJECTS = 200000
+
 # ==================== LangGraph配置 ====================
 LANGGRAPH_RECURSION_LIMIT = 50
 
+# ==================== 会话生命周期配置 ====================
+# 会话空闲超过此时长(秒)后从checkpointer、消息总线与会话表中统一清除
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", "3600"))
+# /runs/stream等创建的一次性会话(temp_前缀)的空闲时长(秒)
+SESSION_TEMP_TTL = int(os.getenv("SESSION_TEMP_TTL", "300"))
+SESSION_TEMP_PREFIX = "temp_"
+# 全部会话状态的内存预算(MB),超出时按最久未活动淘汰
+SESSION_MEMORY_BUDGET_MB = int(os.getenv("SESSION_MEMORY_BUDGET_MB", "512"))
+# 会话数上限
+SESSION_MAX_THREADS = int(os.getenv("SESSION_MAX_THREADS", "5000"))
+# 清理间隔(秒)
+SESSION_SWEEP_INTERVAL = 60
+
+# ==================== 运行串行化配置 ====================
+# 同一线程运行期间到达的消息排队,运行结束后合并为一轮;每轮最多合并的消息数
+RUN_MERGE_MAX_MESSAGES = int(os.getenv("RUN_MERGE_MAX_MESSAGES", "20"))
+# 每个线程最多排队的消息数,超出时拒绝
+RUN_QUEUE_MAX_PER_THREAD = int(os.getenv("RUN_QUEUE_MAX_PER_THREAD", "100"))
+
 # ==================== 日志配置 ====================
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# 内存日志环形缓冲区容量(条)
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", "1000"))
+# 持久化日志存储(SQLite)
+LOG_STORE_PATH = LOGS_DIR / "agent6_logs.db"
+LOG_STORE_RETENTION_DAYS = int(os.getenv("LOG_STORE_RETENTION_DAYS", "7"))  # 保留天数
+LOG_STORE_MAX_ROWS = int(os.getenv("LOG_STORE_MAX_ROWS", "5000000"))  # 最大行数
+
+# ==================== 链路追踪配置 ====================
+# 内存中保留的运行(run)追踪数,超出后淘汰最早的
+TRACE_MAX_RUNS = int(os.getenv("TRACE_MAX_RUNS", "500"))
+# 单次运行最多记录的span数(超出的只计数不保存)
+TRACE_MAX_SPANS_PER_RUN = 2000
+# 每个会话线程索引的最近运行数
+TRACE_RUNS_PER_THREAD = 50
+# 追踪导出文件(为空则不导出),格式: jsonl(本服务的span树) / otlp(OTLP JSON,每行一个ExportTraceServiceRequest)
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_EXPORT_FORMAT = os.getenv("TRACE_EXPORT_FORMAT", "jsonl")
+
+# ==================== Fleet记忆库配置 ====================
+FLEET_DB_PATH = os.getenv("FLEET_DB_PATH", "/app/data/fleet_memories.db")
+# 每个连接的页缓存(MB)
+FLEET_DB_CACHE_SIZE_MB = int(os.getenv("FLEET_DB_CACHE_SIZE_MB", "64"))
+# 内存映射读取的上限(MB),0为关闭
+FLEET_DB_MMAP_SIZE_MB = int(os.getenv("FLEET_DB_MMAP_SIZE_MB", "256"))
+# 等待写锁的超时(秒)
+FLEET_DB_BUSY_TIMEOUT = 10
+# 每个连接缓存的预编译语句数
+FLEET_DB_STATEMENT_CACHE = 256
+# add_memory批量提交: 首条写入后最多等待的时间窗口(毫秒)与每批最大行数
+FLEET_DB_COMMIT_WINDOW_MS = int(os.getenv("FLEET_DB_COMMIT_WINDOW_MS", "10"))
+FLEET_DB_COMMIT_BATCH = 500
+# 写入队列容量,满时add_memory最多阻塞FLEET_DB_BUSY_TIMEOUT秒
+FLEET_DB_WRITE_QUEUE_MAX = 100000
+# 存储用量估算值以实际文件大小校准的间隔(秒)
+FLEET_DB_SIZE_REFRESH_SECONDS = 30
+# 以全表扫描校准触发器统计计数的间隔(秒)
+FLEET_DB_STATS_RECONCILE_INTERVAL = int(os.getenv("FLEET_DB_STATS_RECONCILE_INTERVAL", "21600"))
+# 语义检索向量索引(需要numpy): 嵌入模型为hashing(特征哈希,零依赖)或st:<sentence-transformers模型名/本地路径>
+FLEET_VECTOR_ENABLED = os.getenv("FLEET_VECTOR_ENABLED", "1") == "1"
+FLEET_EMBEDDING_MODEL = os.getenv("FLEET_EMBEDDING_MODEL", "hashing")
+# 特征哈希模型的维度
+FLEET_EMBEDDING_DIM = 256
+# 后台每批计算向量的记忆数
+FLEET_EMBEDDING_BATCH = 64
+# 向量数超过此值后构建IVF近似索引,检索时扫描最接近的NPROBE个桶
+FLEET_VECTOR_ANN_THRESHOLD = int(os.getenv("FLEET_VECTOR_ANN_THRESHOLD", "200000"))
+FLEET_VECTOR_ANN_NPROBE = 8
+# 分区: none(单个数据库文件) / month(每月一个文件) / session(按会话ID哈希分桶)
+# 启用分区前的单文件数据库(FLEET_DB_PATH)作为legacy分区继续参与查询,新写入进入分区文件
+FLEET_DB_PARTITION = os.getenv("FLEET_DB_PARTITION", "none")
+FLEET_DB_PARTITION_DIR = os.getenv("FLEET_DB_PARTITION_DIR", str(Path(FLEET_DB_PATH).parent / "fleet_partitions"))
+FLEET_DB_SESSION_BUCKETS = int(os.getenv("FLEET_DB_SESSION_BUCKETS", "16"))
+# 分区归档目录(归档的分区压实为单个文件后移至此处)
+FLEET_DB_ARCHIVE_DIR = os.getenv("FLEET_DB_ARCHIVE_DIR", str(Path(FLEET_DB_PARTITION_DIR) / "archive"))
+# 跨分区查询的并行线程数
+FLEET_DB_PARTITION_WORKERS = 8
+# 批量导出每块的行数(NDJSON每块合并输出,Parquet每块为一个row group)与导入每个事务的行数
+FLEET_EXPORT_CHUNK_ROWS = 5000
+FLEET_IMPORT_BATCH_ROWS = int(os.getenv("FLEET_IMPORT_BATCH_ROWS", "5000"))
+# 内容压缩(zstd,未安装zstandard时用zlib): 达到此字节数的内容压缩存储,压缩后节省不足此比例则保留原文
+FLEET_DB_COMPRESS_MIN_BYTES = int(os.getenv("FLEET_DB_COMPRESS_MIN_BYTES", "1024"))
+FLEET_DB_COMPRESS_MIN_SAVING = 0.1
+# 已同步且早于此天数的记忆转入冷层(以高压缩级别重新压缩)
+FLEET_DB_COLD_AFTER_DAYS = int(os.getenv("FLEET_DB_COLD_AFTER_DAYS", "30"))
+# 已同步并从本地删除的记忆保留内容哈希的天数(期间再次写入相同内容视为重复,不再推送)
+FLEET_DB_SYNCED_HASH_DAYS = int(os.getenv("FLEET_DB_SYNCED_HASH_DAYS", "30"))
+# 后台整理(冷层压缩、增量VACUUM、WAL截断)的间隔(秒)、每次最长耗时(秒)与I/O预算(MB/秒)
+FLEET_DB_MAINTENANCE_INTERVAL = int(os.getenv("FLEET_DB_MAINTENANCE_INTERVAL", "3600"))
+FLEET_DB_MAINTENANCE_MAX_SECONDS = 300
+FLEET_DB_MAINTENANCE_IO_MB = int(os.getenv("FLEET_DB_MAINTENANCE_IO_MB", "20"))
+# 冷层压缩每个事务处理的行数(事务越短,对写入线程的阻塞越少)
+FLEET_DB_COLD_BATCH = 200
+
+# ==================== Fleet同步配置 ====================
+FLEET_API_BASE_URL = os.getenv("FLEET_API_BASE_URL", "")
+FLEET_API_KEY = os.getenv("FLEET_API_KEY", "")
+# 后台外发同步: 未配置FLEET_API_BASE_URL/FLEET_API_KEY时不启动
+FLEET_SYNC_ENABLED = os.getenv("FLEET_SYNC_ENABLED", "1") == "1"
+# bulk: 每个请求上传一批(/memory/sync/bulk,服务端不支持时自动回退);single: 每条一个请求(/memory/sync)
+FLEET_SYNC_MODE = os.getenv("FLEET_SYNC_MODE", "bulk")
+# 积压清空后的轮询间隔(秒),新记忆写入会提前唤醒
+FLEET_SYNC_INTERVAL = int(os.getenv("FLEET_SYNC_INTERVAL", "30"))
+# 每个bulk请求的条数、同时进行的请求数与每轮读取的条数
+FLEET_SYNC_BATCH_SIZE = int(os.getenv("FLEET_SYNC_BATCH_SIZE", "100"))
+FLEET_SYNC_CONCURRENCY = int(os.getenv("FLEET_SYNC_CONCURRENCY", "4"))
+FLEET_SYNC_ROUND_ROWS = 2000
+# 单个请求的超时(秒)、最大重试次数与退避(指数退避加全抖动,秒)
+FLEET_SYNC_TIMEOUT = 30
+FLEET_SYNC_MAX_RETRIES = 4
+FLEET_SYNC_BACKOFF_BASE = 0.5
+FLEET_SYNC_BACKOFF_MAX = 30
+# 整轮失败(服务端不可用等)后的轮间等待: 从轮询间隔起按连续失败次数翻倍,不超过该上限(秒)
+FLEET_SYNC_FAILURE_BACKOFF_MAX = int(os.getenv("FLEET_SYNC_FAILURE_BACKOFF_MAX", "900"))
+# 被服务端拒绝(4xx)的记忆暂停重传的时长(秒),再次被拒绝时翻倍,不超过一天
+FLEET_SYNC_REJECT_PARK_SECONDS = int(os.getenv("FLEET_SYNC_REJECT_PARK_SECONDS", "3600"))
+# 同步成功后删除本地记忆(节省存储空间);否则只标记为已同步
+FLEET_SYNC_DELETE_SYNCED = os.getenv("FLEET_SYNC_DELETE_SYNCED", "1") == "1"
 
 # ==================== API配置 ====================
 # 是否启用CORS
@@ -35,6 +35,9 @@ class BrowserPool:
         self.context: Optional[BrowserContext] = None
         self._started = False
         self._lock = threading.Lock()
+        # Page occupancy counters (read by /metrics without touching Playwright objects)
+        self.open_pages = 0
+        self.pages_created = 0
         
     def start(self):
         """Start the browser pool (synchronous)."""
@@ -73,11 +76,25 @@ class BrowserPool:
         
         try:
             page = self.context.new_page()
+            self.pages_created += 1
+            self.open_pages += 1
+            page.once("close", self._on_page_closed)
             return page
         except Exception as e:
             logger.error(f"Failed to create new page: {e}")
             raise
     
+    def _on_page_closed(self, page: Page):
+        self.open_pages = max(0, self.open_pages - 1)
+    
+    def get_stats(self) -> dict:
+        """Pool occupancy snapshot (safe to call from any thread)."""
+        return {
+            "started": self._started,
+            "open_pages": self.open_pages,
+            "pages_created": self.pages_created
+        }
+    
     def close(self):
         """Close the browser pool."""
         with self._lock:
@@ -92,6 +109,7 @@ class BrowserPool:
                 if self.playwright:
                     self.playwright.stop()
                 self._started = False
+                self.open_pages = 0
                 logger.info("Browser pool closed")
             except Exception as e:
                 logger.error(f"Error closing browser pool: {e}")
@@ -117,6 +135,11 @@ def get_browser_pool(headless: bool = True) -> BrowserPool:
     return _global_browser_pool
 
 
+def peek_browser_pool() -> Optional[BrowserPool]:
+    """Return the global browser pool without creating it."""
+    return _global_browser_pool
+
+
 def shutdown_browser_pool():
     """Shutdown global browser pool (called on application exit)."""
     global _global_browser_pool
@@ -126,4 +149,4 @@ def shutdown_browser_pool():
         _global_browser_pool = None
 
 
-__all__ = ['BrowserPool', 'get_browser_pool', 'shutdown_browser_pool']
+__all__ = ['BrowserPool', 'get_browser_pool', 'peek_browser_pool', 'shutdown_browser_pool']
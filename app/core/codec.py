@@ -0,0 +1,219 @@
+"""
+流式消息编解码模块
+SSE与WebSocket共用的序列化层:
+- JSON: 优先使用orjson,未安装时回退到标准库json
+- MessagePack: 可选的二进制帧,需客户端协商(未安装msgpack时自动回退到JSON)
+
+基准测试:
+    python -m app.core.codec
+"""
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+
+# 支持的WebSocket帧编码
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def dumps(obj: Any) -> str:
+    """序列化为JSON字符串(非ASCII字符原样输出,无法序列化的对象转为str)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=_ORJSON_OPTIONS).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """序列化为UTF-8编码的JSON字节串"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=_ORJSON_OPTIONS)
+    return json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """解析JSON"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def sse_event(data: Any, event: Optional[str] = None) -> str:
+    """
+    构造一条SSE事件
+
+    Args:
+        data: 事件数据(将被序列化为JSON)
+        event: 可选的事件名(对应SSE的event:行)
+
+    Returns:
+        以空行结尾的SSE文本
+    """
+    if event:
+        return f"event: {event}\ndata: {dumps(data)}\n\n"
+    return f"data: {dumps(data)}\n\n"
+
+
+def msgpack_available() -> bool:
+    """是否可用MessagePack编码"""
+    return msgpack is not None
+
+
+def negotiate_encoding(requested: Optional[str] = None, subprotocols: Iterable[str] = ()) -> str:
+    """
+    协商WebSocket帧编码
+
+    客户端可通过查询参数 ?encoding=msgpack 或 Sec-WebSocket-Protocol: msgpack 请求二进制编码,
+    服务端缺少msgpack时回退到JSON,保证旧客户端与新客户端都能工作
+    """
+    wants_msgpack = (requested or "").lower() == ENCODING_MSGPACK or ENCODING_MSGPACK in subprotocols
+    if wants_msgpack and msgpack_available():
+        return ENCODING_MSGPACK
+    return ENCODING_JSON
+
+
+def encode_frame(obj: Any, encoding: str = ENCODING_JSON) -> Union[str, bytes]:
+    """按编码生成WebSocket帧: JSON为文本帧(str),MessagePack为二进制帧(bytes)"""
+    if encoding == ENCODING_MSGPACK:
+        return msgpack.packb(obj, default=str, use_bin_type=True)
+    return dumps(obj)
+
+
+def decode_frame(message: Dict[str, Any]) -> Any:
+    """
+    解析websocket.receive()返回的原始消息
+
+    文本帧按JSON解析,二进制帧按MessagePack解析;无法解析时抛出ValueError
+    """
+    text = message.get("text")
+    if text is not None:
+        try:
+            return loads(text)
+        except ValueError as e:
+            raise ValueError(f"无效的JSON帧: {e}")
+
+    data = message.get("bytes")
+    if data is not None:
+        if msgpack is None:
+            raise ValueError("服务端未安装msgpack,无法解析二进制帧")
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except Exception as e:
+            raise ValueError(f"无效的MessagePack帧: {e}")
+
+    return None
+
+
+async def send_frame(websocket, frame: Union[str, bytes]):
+    """发送已编码的帧"""
+    if isinstance(frame, bytes):
+        await websocket.send_bytes(frame)
+    else:
+        await websocket.send_text(frame)
+
+
+async def send_obj(websocket, obj: Any, encoding: str = ENCODING_JSON):
+    """编码并发送一个对象"""
+    await send_frame(websocket, encode_frame(obj, encoding))
+
+
+# ==================== 基准测试 ====================
+
+def _benchmark_payloads() -> Dict[str, Any]:
+    """构造代表性负载:普通聊天消息与工具密集线程的历史快照"""
+    message = {
+        "type": "message",
+        "data": {
+            "message_id": "msg_1734000000000",
+            "content": "好的,我已经为你找到了相关信息。" * 4,
+            "role_type": "assistant",
+            "role_id": "agent",
+            "role_name": "AI助手",
+            "thread_id": "default",
+            "message_type": "text",
+            "metadata": {},
+            "timestamp": "2025-12-12T10:00:00.000000"
+        }
+    }
+    tool_result = {
+        "type": "message",
+        "data": {
+            "message_id": "msg_1734000000001",
+            "content": "x" * 500,
+            "role_type": "tool",
+            "role_id": "web_scraper",
+            "role_name": "工具:web_scraper",
+            "thread_id": "default",
+            "message_type": "tool_result",
+            "metadata": {
+                "tool_name": "web_scraper",
+                "full_result": ("<div class=\"result\">搜索结果 search result 12345</div>\n" * 400)
+            },
+            "timestamp": "2025-12-12T10:00:01.000000"
+        }
+    }
+    history = {
+        "type": "history",
+        "data": {
+            "messages": [message["data"], tool_result["data"]] * 50,
+            "count": 100
+        }
+    }
+    return {"chat_message": message, "tool_result": tool_result, "history_100": history}
+
+
+def run_benchmark(iterations: int = 2000) -> List[Dict[str, Any]]:
+    """
+    对比各编码方式的编码耗时与传输字节数
+
+    Args:
+        iterations: 每种负载的编码次数(history负载自动缩减为1/10)
+
+    Returns:
+        结果列表,每项包含 payload / encoder / us_per_op / bytes
+    """
+    encoders = {
+        "json.dumps": lambda o: json.dumps(o).encode("utf-8"),
+        "json.dumps(ensure_ascii=False)": lambda o: json.dumps(o, ensure_ascii=False).encode("utf-8"),
+    }
+    if orjson is not None:
+        encoders["orjson"] = lambda o: orjson.dumps(o, default=str, option=_ORJSON_OPTIONS)
+    if msgpack is not None:
+        encoders["msgpack"] = lambda o: msgpack.packb(o, default=str, use_bin_type=True)
+
+    results = []
+    for payload_name, payload in _benchmark_payloads().items():
+        n = max(1, iterations // 10) if payload_name.startswith("history") else iterations
+        for encoder_name, encode in encoders.items():
+            size = len(encode(payload))
+            start = time.perf_counter()
+            for _ in range(n):
+                encode(payload)
+            elapsed = time.perf_counter() - start
+            results.append({
+                "payload": payload_name,
+                "encoder": encoder_name,
+                "us_per_op": round(elapsed / n * 1e6, 2),
+                "bytes": size
+            })
+    return results
+
+
+if __name__ == "__main__":
+    print(f"orjson: {'可用' if orjson is not None else '未安装'}, msgpack: {'可用' if msgpack is not None else '未安装'}")
+    print(f"{'payload':<14} {'encoder':<32} {'us/op':>10} {'bytes':>10}")
+    for row in run_benchmark():
+        print(f"{row['payload']:<14} {row['encoder']:<32} {row['us_per_op']:>10} {row['bytes']:>10}")
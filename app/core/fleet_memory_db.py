@@ -1,14 +1,119 @@
 """
 Fleet记忆本地数据库
 使用SQLite存储Fleet API记忆,支持降级和离线使用
+
+连接按线程复用(sqlite3连接不能跨线程使用): 每个线程首次访问时建立连接并设置WAL与缓存参数,
+之后的操作复用该连接及其预编译语句缓存。WAL模式下读不阻塞写,写事务只在提交时落盘一次
+
+add_memory只入队,由后台写入线程按时间窗口或批量大小合并为一次事务提交(group commit);
+需要确认落盘的调用方传durable=True等待提交结果。其他读写操作执行前会等待已入队的写入提交,
+保证读到自己的写入
+
+同一会话内容相同的记忆只保留一行(按原文哈希去重),重复写入只增加occurrences计数并更新updated_at
+
+超过阈值的内容压缩存储(content为BLOB,content_codec记录编码),读取与向量计算经由
+SQL函数fleet_text()透明解压;全文索引保存原文副本,触发器只使用纯SQL(不依赖fleet_text,
+未注册该函数的普通sqlite3连接也能增删改),压缩内容的索引由写入路径补充;
+已同步的旧记忆由定时整理转入冷层(高压缩级别),
+整理任务同时以增量VACUUM归还空闲页并截断WAL,按I/O预算限速
 """
 import sqlite3
+import base64
+import hashlib
 import json
 import os
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from functools import wraps
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from datetime import datetime, timedelta
 from pathlib import Path
 
+from app.config import (
+    FLEET_DB_PATH,
+    FLEET_DB_CACHE_SIZE_MB,
+    FLEET_DB_MMAP_SIZE_MB,
+    FLEET_DB_BUSY_TIMEOUT,
+    FLEET_DB_STATEMENT_CACHE,
+    FLEET_DB_COMMIT_WINDOW_MS,
+    FLEET_DB_COMMIT_BATCH,
+    FLEET_DB_WRITE_QUEUE_MAX,
+    FLEET_DB_SIZE_REFRESH_SECONDS,
+    FLEET_VECTOR_ENABLED,
+    FLEET_DB_COLD_AFTER_DAYS,
+    FLEET_DB_COLD_BATCH,
+    FLEET_DB_SYNCED_HASH_DAYS,
+    FLEET_DB_MAINTENANCE_MAX_SECONDS,
+    FLEET_DB_MAINTENANCE_IO_MB,
+    FLEET_DB_PARTITION,
+)
+from app.core.metrics import fleet_db_operations_total, fleet_db_operation_duration_seconds
+from app.core.memory_vectors import VectorIndex, VECTORS_AVAILABLE
+from app.core.memory_compression import compress_text, decompress_text, stored_size, DEFAULT_CODEC
+
+
+def _instrumented(op: str):
+    """记录操作次数与耗时到/metrics"""
+    ok = fleet_db_operations_total.labels(op=op, status="ok")
+    failed = fleet_db_operations_total.labels(op=op, status="error")
+    duration = fleet_db_operation_duration_seconds.labels(op=op)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                failed.inc()
+                raise
+            finally:
+                duration.observe(time.perf_counter() - start)
+            ok.inc()
+            return result
+        return wrapper
+    return decorator
+
+
+class _PendingInsert:
+    """等待写入线程提交的一条记忆"""
+
+    __slots__ = ("seq", "row", "raw_bytes", "text", "future")
+
+    def __init__(self, seq: int, row: tuple, raw_bytes: int, text: Optional[str] = None):
+        self.seq = seq
+        self.row = row
+        # 压缩前的内容字节数
+        self.raw_bytes = raw_bytes
+        # 压缩存储时的原文(写入全文索引用,未压缩的由触发器索引)
+        self.text = text
+        self.future: Future = Future()
+
+
+# 单行记忆除内容与元数据外的估算开销(索引、行头、时间戳等)
+_ROW_OVERHEAD = 200
+
+# 数据库结构版本(PRAGMA user_version)
+# 1: 内容压缩(content_codec、tier列),全文索引与触发器经由fleet_text()读取内容
+# 2: 内容去重(content_hash、occurrences列),旧数据由整理任务回填哈希并合并重复
+# 3: 全文索引改为保存原文副本,触发器与视图不再调用fleet_text()
+_SCHEMA_VERSION = 3
+
+_AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+def _fleet_text(value, codec):
+    """SQL函数fleet_text(content, content_codec): 还原记忆原文"""
+    return decompress_text(value, codec)
+
+
+def content_hash(content: str) -> str:
+    """记忆原文的哈希(去重键,与会话ID组成唯一索引)"""
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
 
 class FleetMemoryDB:
     """Fleet记忆数据库管理器"""
@@ -16,7 +121,7 @@ class FleetMemoryDB:
     # 存储限制: 500GB
     MAX_STORAGE_BYTES = 500 * 1024 * 1024 * 1024  # 500GB
     
-    def __init__(self, db_path: str = "/app/data/fleet_memories.db"):
+    def __init__(self, db_path: str = FLEET_DB_PATH):
         """
         初始化数据库
         
@@ -25,15 +130,128 @@ class FleetMemoryDB:
         """
         self.db_path = db_path
         
+        # 每个线程一个连接
+        self._local = threading.local()
+        # {线程ident: 连接},用于关闭与清理已退出线程的连接
+        self._connections: Dict[int, sqlite3.Connection] = {}
+        self._connections_lock = threading.Lock()
+        self.connections_opened = 0
+        
+        # 写入队列与写入线程(首次add_memory时启动)
+        self.write_queue: queue.Queue = queue.Queue(maxsize=FLEET_DB_WRITE_QUEUE_MAX)
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._stop = threading.Event()
+        # 入队/已处理的写入序号,读操作据此等待之前入队的写入提交
+        self._seq_lock = threading.Lock()
+        self._enqueued_seq = 0
+        self._committed_seq = 0
+        self._committed = threading.Condition()
+        
+        # 写入统计
+        self.group_commits = 0
+        self.rows_committed = 0
+        self.write_errors = 0
+        self.largest_batch = 0
+        # 写入时命中已有相同内容(只增加计数)的次数
+        self.dedup_hits = 0
+        
+        # 压缩与整理统计
+        self.compressed_rows = 0
+        self.content_raw_bytes = 0
+        self.content_stored_bytes = 0
+        self.cold_rows_total = 0
+        self.cold_bytes_saved = 0
+        self.dedup_merged_total = 0
+        self.last_maintenance: Optional[Dict[str, Any]] = None
+        self._maintenance_lock = threading.Lock()
+        
         # 确保数据目录存在
         Path(db_path).parent.mkdir(parents=True, exist_ok=True)
         
         # 初始化数据库表
         self._init_database()
+        
+        # 语义检索向量索引(需要numpy,首次写入或检索时启动后台计算)
+        self.vectors: Optional[VectorIndex] = VectorIndex(self) if FLEET_VECTOR_ENABLED and VECTORS_AVAILABLE else None
+        
+        # 存储用量: 写入时按行累加估算值,定期以实际文件大小校准
+        # (写线程、批量导入线程与校准都会更新,需持锁)
+        self._storage_lock = threading.Lock()
+        self._storage_bytes = self.get_storage_size()
+        self._storage_refreshed = time.monotonic()
+    
+    # ==================== 连接管理 ====================
+    
+    def _open_connection(self) -> sqlite3.Connection:
+        """建立连接并设置PRAGMA"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=FLEET_DB_BUSY_TIMEOUT,
+            cached_statements=FLEET_DB_STATEMENT_CACHE,
+            # 连接只在所属线程使用,关闭时可能在其他线程
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        # 只对新建的数据库立即生效(必须在建表与切换WAL之前),已有数据库在下次VACUUM时转换
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL下NORMAL只在检查点时fsync,崩溃不会损坏数据库(可能丢失最后几个事务)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # 负值单位为KB
+        conn.execute(f"PRAGMA cache_size=-{FLEET_DB_CACHE_SIZE_MB * 1024}")
+        conn.execute(f"PRAGMA mmap_size={FLEET_DB_MMAP_SIZE_MB * 1024 * 1024}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        # 检索与向量计算通过该函数读取原文(触发器不使用,外部连接无需注册)
+        conn.create_function("fleet_text", 2, _fleet_text, deterministic=True)
+        return conn
+    
+    def _conn(self) -> sqlite3.Connection:
+        """当前线程的连接(首次访问时建立)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._prune_connections()
+                self._connections[threading.get_ident()] = conn
+                self.connections_opened += 1
+        return conn
+    
+    def _prune_connections(self):
+        """关闭已退出线程留下的连接(调用方持有_connections_lock)"""
+        alive = {t.ident for t in threading.enumerate()}
+        for ident in [i for i in self._connections if i not in alive]:
+            try:
+                self._connections.pop(ident).close()
+            except sqlite3.Error:
+                pass
+    
+    def close(self):
+        """写完队列中剩余的记忆并关闭所有线程的连接(关闭服务时调用),之后的访问会重新建立连接"""
+        self.stop_writer()
+        if self.vectors is not None:
+            self.vectors.stop()
+        with self._connections_lock:
+            for conn in self._connections.values():
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+    
+    def get_connection_stats(self) -> Dict[str, Any]:
+        """连接复用情况"""
+        return {
+            "open_connections": len(self._connections),
+            "connections_opened": self.connections_opened,
+            "journal_mode": self._conn().execute("PRAGMA journal_mode").fetchone()[0]
+        }
     
     def _init_database(self):
         """初始化数据库表结构"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._conn()
         cursor = conn.cursor()
         
         # 创建记忆表
@@ -42,20 +260,32 @@ class FleetMemoryDB:
                 id TEXT PRIMARY KEY,
                 session_id TEXT NOT NULL,
                 content TEXT NOT NULL,
+                content_codec TEXT,
                 metadata TEXT,
                 timestamp TEXT NOT NULL,
                 source TEXT DEFAULT 'agent6',
                 synced_to_fleet INTEGER DEFAULT 0,
                 fleet_memory_id TEXT,
                 created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL
+                updated_at TEXT NOT NULL,
+                tier INTEGER DEFAULT 0,
+                content_hash TEXT,
+                occurrences INTEGER NOT NULL DEFAULT 1
             )
         """)
         
-        # 创建索引
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            self._migrate_compression(cursor)
+        if version < 2:
+            self._migrate_dedup(cursor)
+        if version < 3:
+            self._migrate_fts_text(cursor)
+        
+        # 创建索引(列表按(timestamp, id)倒序做键集分页,复合索引同时覆盖按会话过滤)
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_session_id 
-            ON memories(session_id)
+            CREATE INDEX IF NOT EXISTS idx_session_timestamp_id 
+            ON memories(session_id, timestamp DESC, id DESC)
         """)
         
         cursor.execute("""
@@ -64,19 +294,494 @@ class FleetMemoryDB:
         """)
         
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_timestamp 
-            ON memories(timestamp DESC)
+            CREATE INDEX IF NOT EXISTS idx_timestamp_id 
+            ON memories(timestamp DESC, id DESC)
+        """)
+        
+        # 外发同步按(timestamp, id)顺序分页读取未同步的记忆(部分索引,只包含未同步的行)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_unsynced 
+            ON memories(timestamp, id) WHERE synced_to_fleet = 0
+        """)
+        
+        # 待转入冷层的记忆(部分索引,只包含热层中已同步的行)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_cold_candidates 
+            ON memories(timestamp) WHERE tier = 0 AND synced_to_fleet = 1
+        """)
+        
+        # 同一会话内容唯一(旧数据回填前哈希为NULL,不参与唯一约束)
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_session_content_hash 
+            ON memories(session_id, content_hash)
+        """)
+        # 待回填哈希的旧数据(部分索引,回填完成后为空)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_unhashed 
+            ON memories(content_hash) WHERE content_hash IS NULL
+        """)
+        
+        # 已同步并从本地删除的记忆的内容哈希: 删除模式下再次写入相同内容时仍能识别为重复
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS synced_hashes (
+                session_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                memory_id TEXT NOT NULL,
+                fleet_memory_id TEXT,
+                occurrences INTEGER NOT NULL DEFAULT 1,
+                synced_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (session_id, content_hash)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_synced_hashes_synced_at 
+            ON synced_hashes(synced_at)
         """)
         
+        # 已被上面的复合索引覆盖
+        cursor.execute("DROP INDEX IF EXISTS idx_session_id")
+        cursor.execute("DROP INDEX IF EXISTS idx_timestamp")
+        
+        self._init_fts(cursor)
+        
+        # 记忆内容的嵌入向量(float16),rowid与memories一致;内容变更或删除时清除,由后台重新计算
+        # (原文是否变化以content_hash判断,冷层重新压缩不改变哈希)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS memory_embeddings (
+                rowid INTEGER PRIMARY KEY,
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_embeddings_delete AFTER DELETE ON memories BEGIN
+                DELETE FROM memory_embeddings WHERE rowid = old.rowid;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_embeddings_update AFTER UPDATE OF content ON memories
+            WHEN old.content_hash IS NOT new.content_hash BEGIN
+                DELETE FROM memory_embeddings WHERE rowid = old.rowid;
+            END
+        """)
+        
+        needs_reconcile = self._init_stats(cursor)
+        
+        cursor.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
         conn.commit()
-        conn.close()
+        
+        if needs_reconcile:
+            self.reconcile_stats()
+    
+    def _migrate_compression(self, cursor: sqlite3.Cursor):
+        """
+        升级到支持内容压缩的结构: 补充content_codec与tier列,删除直接读取content的
+        全文索引与触发器(随后按新定义重建,全文索引重建一次)
+        """
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(memories)")}
+        if "content_codec" not in columns:
+            cursor.execute("ALTER TABLE memories ADD COLUMN content_codec TEXT")
+        if "tier" not in columns:
+            cursor.execute("ALTER TABLE memories ADD COLUMN tier INTEGER DEFAULT 0")
+        for trigger in ("memories_fts_insert", "memories_fts_delete", "memories_fts_update", "memory_embeddings_update"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute("DROP TABLE IF EXISTS memories_fts")
     
+    def _migrate_dedup(self, cursor: sqlite3.Cursor):
+        """升级到支持内容去重的结构: 补充content_hash与occurrences列(已有数据的哈希由deduplicate回填)"""
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(memories)")}
+        if "content_hash" not in columns:
+            cursor.execute("ALTER TABLE memories ADD COLUMN content_hash TEXT")
+        if "occurrences" not in columns:
+            cursor.execute("ALTER TABLE memories ADD COLUMN occurrences INTEGER NOT NULL DEFAULT 1")
+    
+    def _migrate_fts_text(self, cursor: sqlite3.Cursor):
+        """
+        升级到不依赖fleet_text()的全文索引: 删除解压视图、外部内容索引及调用该函数的触发器
+        (随后按新定义重建,已有数据的原文在Python中解压后写入索引)
+        """
+        for trigger in ("memories_fts_insert", "memories_fts_delete", "memories_fts_update", "memory_embeddings_update"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute("DROP TABLE IF EXISTS memories_fts")
+        cursor.execute("DROP VIEW IF EXISTS memories_text")
+    
+    def _init_stats(self, cursor: sqlite3.Cursor) -> bool:
+        """
+        统计计数表(由触发器随增删改维护,get_stats只读一行)
+        
+        Returns:
+            是否为首次创建(需要以全表扫描初始化计数)
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS memory_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total INTEGER NOT NULL DEFAULT 0,
+                synced INTEGER NOT NULL DEFAULT 0,
+                sessions INTEGER NOT NULL DEFAULT 0,
+                latest_timestamp TEXT,
+                reconciled_at TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS memory_session_counts (
+                session_id TEXT PRIMARY KEY,
+                count INTEGER NOT NULL
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_stats_insert AFTER INSERT ON memories BEGIN
+                UPDATE memory_stats SET sessions = sessions + 1
+                WHERE id = 1 AND NOT EXISTS (SELECT 1 FROM memory_session_counts WHERE session_id = new.session_id);
+                INSERT INTO memory_session_counts (session_id, count) VALUES (new.session_id, 1)
+                ON CONFLICT(session_id) DO UPDATE SET count = count + 1;
+                UPDATE memory_stats SET
+                    total = total + 1,
+                    synced = synced + (new.synced_to_fleet != 0),
+                    latest_timestamp = CASE
+                        WHEN latest_timestamp IS NULL OR new.timestamp > latest_timestamp THEN new.timestamp
+                        ELSE latest_timestamp
+                    END
+                WHERE id = 1;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_stats_delete AFTER DELETE ON memories BEGIN
+                UPDATE memory_session_counts SET count = count - 1 WHERE session_id = old.session_id;
+                UPDATE memory_stats SET sessions = sessions - 1
+                WHERE id = 1 AND EXISTS (
+                    SELECT 1 FROM memory_session_counts WHERE session_id = old.session_id AND count <= 0
+                );
+                DELETE FROM memory_session_counts WHERE session_id = old.session_id AND count <= 0;
+                UPDATE memory_stats SET
+                    total = total - 1,
+                    synced = synced - (old.synced_to_fleet != 0)
+                WHERE id = 1;
+                -- 删除的是最新记忆时沿timestamp索引重新取最大值
+                UPDATE memory_stats SET latest_timestamp = (SELECT MAX(timestamp) FROM memories)
+                WHERE id = 1 AND old.timestamp >= latest_timestamp;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_stats_synced AFTER UPDATE OF synced_to_fleet ON memories
+            WHEN (old.synced_to_fleet != 0) != (new.synced_to_fleet != 0) BEGIN
+                UPDATE memory_stats SET synced = synced - (old.synced_to_fleet != 0) + (new.synced_to_fleet != 0)
+                WHERE id = 1;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_stats_session AFTER UPDATE OF session_id ON memories
+            WHEN old.session_id != new.session_id BEGIN
+                UPDATE memory_session_counts SET count = count - 1 WHERE session_id = old.session_id;
+                UPDATE memory_stats SET sessions = sessions - 1
+                WHERE id = 1 AND EXISTS (
+                    SELECT 1 FROM memory_session_counts WHERE session_id = old.session_id AND count <= 0
+                );
+                DELETE FROM memory_session_counts WHERE session_id = old.session_id AND count <= 0;
+                UPDATE memory_stats SET sessions = sessions + 1
+                WHERE id = 1 AND NOT EXISTS (SELECT 1 FROM memory_session_counts WHERE session_id = new.session_id);
+                INSERT INTO memory_session_counts (session_id, count) VALUES (new.session_id, 1)
+                ON CONFLICT(session_id) DO UPDATE SET count = count + 1;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_stats_timestamp AFTER UPDATE OF timestamp ON memories
+            WHEN old.timestamp != new.timestamp BEGIN
+                UPDATE memory_stats SET latest_timestamp = (SELECT MAX(timestamp) FROM memories) WHERE id = 1;
+            END
+        """)
+        
+        return cursor.execute("SELECT 1 FROM memory_stats WHERE id = 1").fetchone() is None
+    
+    @_instrumented("reconcile_stats")
+    def reconcile_stats(self) -> Dict[str, Any]:
+        """
+        以全表扫描重新计算统计计数,校正触发器计数的漂移(由定时任务定期执行)
+        
+        扫描期间持有写锁,保证计数与数据一致
+        
+        Returns:
+            校准前后的差异(drift为0表示无漂移)
+        """
+        self.flush()
+        conn = self._conn()
+        started = time.perf_counter()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.execute(
+                "SELECT total, synced, sessions, latest_timestamp FROM memory_stats WHERE id = 1"
+            ).fetchone()
+            total, synced, latest = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(synced_to_fleet != 0), 0), MAX(timestamp) FROM memories"
+            ).fetchone()
+            conn.execute("DELETE FROM memory_session_counts")
+            conn.execute("""
+                INSERT INTO memory_session_counts (session_id, count)
+                SELECT session_id, COUNT(*) FROM memories GROUP BY session_id
+            """)
+            sessions = conn.execute("SELECT COUNT(*) FROM memory_session_counts").fetchone()[0]
+            conn.execute("""
+                INSERT OR REPLACE INTO memory_stats (id, total, synced, sessions, latest_timestamp, reconciled_at)
+                VALUES (1, ?, ?, ?, ?, ?)
+            """, (total, synced, sessions, latest, datetime.now().isoformat()))
+        
+        drift = {
+            "total": total - before["total"] if before else total,
+            "synced": synced - before["synced"] if before else synced,
+            "sessions": sessions - before["sessions"] if before else sessions
+        }
+        if before and any(drift.values()):
+            print(f"⚠️  Fleet记忆统计存在漂移,已校准: {drift}")
+        return {
+            "total_memories": total,
+            "synced_memories": synced,
+            "total_sessions": sessions,
+            "latest_memory_timestamp": latest,
+            "drift": drift,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+    
+    def _init_fts(self, cursor: sqlite3.Cursor):
+        """
+        全文索引(FTS5,保存原文副本,snippet/highlight读取的是原文而非压缩数据)
+        
+        触发器只使用纯SQL: 删除与原文变化(content_hash不同)时移除索引行,未压缩的内容直接索引;
+        压缩存储的内容需要解压,由写入路径调用_index_compressed补充。
+        SQLite 3.34+使用trigram分词,中文等无空格文本也能按子串匹配;
+        更早的版本退回unicode61(按空格与标点分词)
+        """
+        row = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'memories_fts'"
+        ).fetchone()
+        if row:
+            self.fts_tokenizer = "trigram" if "trigram" in row[0] else "unicode61"
+        else:
+            self.fts_tokenizer = "trigram" if sqlite3.sqlite_version_info >= (3, 34, 0) else "unicode61"
+            cursor.execute(f"""
+                CREATE VIRTUAL TABLE memories_fts USING fts5(
+                    content,
+                    tokenize='{self.fts_tokenizer}'
+                )
+            """)
+            # 为已有数据建立索引
+            self._rebuild_fts(cursor)
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memories_fts_insert AFTER INSERT ON memories
+            WHEN new.content_codec IS NULL BEGIN
+                INSERT INTO memories_fts(rowid, content) VALUES (new.rowid, new.content);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memories_fts_delete AFTER DELETE ON memories BEGIN
+                DELETE FROM memories_fts WHERE rowid = old.rowid;
+            END
+        """)
+        # 冷层重新压缩只改变存储形式(哈希不变),不重建索引
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memories_fts_update AFTER UPDATE OF content ON memories
+            WHEN old.content_hash IS NOT new.content_hash BEGIN
+                DELETE FROM memories_fts WHERE rowid = old.rowid;
+                INSERT INTO memories_fts(rowid, content)
+                SELECT new.rowid, new.content WHERE new.content_codec IS NULL;
+            END
+        """)
+    
+    def _rebuild_fts(self, cursor: sqlite3.Cursor):
+        """按rowid分批解压全部记忆并写入全文索引"""
+        cursor.execute("DELETE FROM memories_fts")
+        last_rowid = 0
+        while True:
+            rows = cursor.execute(
+                "SELECT rowid, content, content_codec FROM memories WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, FLEET_DB_COLD_BATCH)
+            ).fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                "INSERT INTO memories_fts(rowid, content) VALUES (?, ?)",
+                [(rowid, decompress_text(value, codec)) for rowid, value, codec in rows]
+            )
+            last_rowid = rows[-1][0]
+    
+    @staticmethod
+    def _index_compressed(conn: sqlite3.Connection, entries: List[Tuple[str, str, str]]):
+        """
+        为压缩存储的记忆写入全文索引(触发器无法解压,只索引未压缩的内容)
+        
+        Args:
+            entries: (原文, 记忆ID, 内容哈希)列表;ID与哈希都匹配且尚未索引时才写入,
+                因而合并到已有记忆、因ID重复跳过或原文未变的覆盖都不会重复索引
+        """
+        if entries:
+            conn.executemany("""
+                INSERT INTO memories_fts(rowid, content)
+                SELECT m.rowid, ? FROM memories m
+                WHERE m.id = ? AND m.content_hash = ?
+                  AND NOT EXISTS (SELECT 1 FROM memories_fts f WHERE f.rowid = m.rowid)
+            """, entries)
+    
+    # ==================== 批量写入 ====================
+    
+    def _ensure_writer(self):
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._writer_lock:
+            if self._writer is not None and self._writer.is_alive():
+                return
+            self._stop.clear()
+            self._writer = threading.Thread(target=self._writer_loop, name="fleet-db-writer", daemon=True)
+            self._writer.start()
+        if self.vectors is not None:
+            self.vectors.start()
+    
+    def stop_writer(self, timeout: float = 10.0):
+        """停止写入线程(退出前提交队列中剩余的记忆)"""
+        self._stop.set()
+        if self._writer:
+            self._writer.join(timeout=timeout)
+            self._writer = None
+    
+    def flush(self, timeout: Optional[float] = FLEET_DB_BUSY_TIMEOUT) -> bool:
+        """等待调用前已入队的写入全部提交,超时返回False"""
+        target = self._enqueued_seq
+        if self._committed_seq >= target:
+            return True
+        with self._committed:
+            return self._committed.wait_for(lambda: self._committed_seq >= target, timeout=timeout)
+    
+    def _writer_loop(self):
+        while not (self._stop.is_set() and self.write_queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._commit_batch(batch)
+            if time.monotonic() - self._storage_refreshed >= FLEET_DB_SIZE_REFRESH_SECONDS:
+                self._refresh_storage_size()
+    
+    def _next_batch(self) -> List[_PendingInsert]:
+        """收集一批写入: 首条到达后攒满FLEET_DB_COMMIT_BATCH或等待满提交窗口即返回"""
+        try:
+            batch = [self.write_queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + FLEET_DB_COMMIT_WINDOW_MS / 1000
+        while len(batch) < FLEET_DB_COMMIT_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.write_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    @_instrumented("commit_batch")
+    def _commit_batch(self, batch: List[_PendingInsert]):
+        """
+        一个事务写入一批记忆,单条失败(如ID重复)只影响该条
+        
+        同一会话已有相同内容时不插入,只增加已有记忆的occurrences并更新updated_at,
+        该条的结果为已有记忆的ID;相同内容已同步并从本地删除时累加到其内容哈希记录上,
+        结果为被删除记忆的ID
+        """
+        conn = self._conn()
+        failed: Dict[int, Exception] = {}
+        # {序号: 实际写入或合并到的记忆ID}
+        stored_ids: Dict[int, str] = {}
+        try:
+            with conn:
+                for item in batch:
+                    synced = conn.execute("""
+                        UPDATE synced_hashes SET occurrences = occurrences + 1, updated_at = ?
+                        WHERE session_id = ? AND content_hash = ?
+                        RETURNING memory_id
+                    """, (item.row[9], item.row[1], item.row[10])).fetchone()
+                    if synced is not None:
+                        stored_ids[item.seq] = synced[0]
+                        continue
+                    try:
+                        stored_ids[item.seq] = conn.execute("""
+                            INSERT INTO memories (
+                                id, session_id, content, content_codec, metadata, timestamp, 
+                                source, synced_to_fleet, created_at, updated_at, content_hash
+                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            ON CONFLICT(session_id, content_hash) DO UPDATE SET
+                                occurrences = occurrences + 1,
+                                updated_at = excluded.updated_at
+                            RETURNING id
+                        """, item.row).fetchone()[0]
+                    except sqlite3.IntegrityError as e:
+                        failed[item.seq] = e
+                self._index_compressed(conn, [
+                    (item.text, item.row[0], item.row[10]) for item in batch
+                    if item.text is not None and stored_ids.get(item.seq) == item.row[0]
+                ])
+        except Exception as e:
+            # 整个事务失败(磁盘满、数据库锁超时等),本批全部失败
+            failed = {item.seq: e for item in batch}
+        
+        self.group_commits += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for item in batch:
+            error = failed.get(item.seq)
+            if error is None and stored_ids[item.seq] != item.row[0]:
+                self.dedup_hits += 1
+                item.future.set_result(stored_ids[item.seq])
+            elif error is None:
+                self.rows_committed += 1
+                content_bytes = stored_size(item.row[2])
+                self.content_raw_bytes += item.raw_bytes
+                self.content_stored_bytes += content_bytes
+                if item.row[3] is not None:
+                    self.compressed_rows += 1
+                self._add_storage_bytes(content_bytes + len(item.row[4]) + _ROW_OVERHEAD)
+                item.future.set_result(item.row[0])
+            else:
+                self.write_errors += 1
+                item.future.set_exception(error)
+        
+        with self._committed:
+            self._committed_seq = batch[-1].seq
+            self._committed.notify_all()
+        
+        if self.vectors is not None and len(failed) < len(batch):
+            self.vectors.notify()
+    
+    def _add_storage_bytes(self, delta: int):
+        with self._storage_lock:
+            self._storage_bytes += delta
+    
+    def _refresh_storage_size(self):
+        size = self.get_storage_size()
+        with self._storage_lock:
+            self._storage_bytes = size
+            self._storage_refreshed = time.monotonic()
+    
+    def get_write_stats(self) -> Dict[str, Any]:
+        """批量写入情况"""
+        return {
+            "queued": self.write_queue.qsize(),
+            "group_commits": self.group_commits,
+            "rows_committed": self.rows_committed,
+            "rows_per_commit": round(self.rows_committed / self.group_commits, 2) if self.group_commits else 0,
+            "largest_batch": self.largest_batch,
+            "write_errors": self.write_errors,
+            "dedup_hits": self.dedup_hits,
+            "commit_window_ms": FLEET_DB_COMMIT_WINDOW_MS
+        }
+    
+    # ==================== 记忆操作 ====================
+    
+    @_instrumented("add_memory")
     def add_memory(
         self,
         session_id: str,
         content: str,
         metadata: Optional[Dict[str, Any]] = None,
-        memory_id: Optional[str] = None
+        memory_id: Optional[str] = None,
+        durable: bool = False
     ) -> str:
         """
         添加记忆
@@ -86,55 +791,146 @@ class FleetMemoryDB:
             content: 记忆内容
             metadata: 元数据
             memory_id: 记忆ID(可选,不提供则自动生成)
+            durable: 是否等待提交完成(否则入队即返回,写入失败只计入write_errors)
             
         Returns:
-            记忆ID
+            记忆ID(durable=True且同一会话已有相同内容时为已有记忆的ID;
+            非durable时入队即返回新生成的ID,内容重复的不会写入)
             
         Raises:
-            Exception: 存储已满
+            Exception: 存储已满或写入队列已满
+            sqlite3.Error: durable=True且写入失败
         """
         # 检查存储限制
         if self.is_storage_full():
             raise Exception(
                 f"Fleet记忆库存储已满! "
-                f"当前大小: {self.get_storage_size() / 1024 / 1024 / 1024:.2f}GB, "
+                f"当前大小: {self._storage_bytes / 1024 / 1024 / 1024:.2f}GB, "
                 f"限制: {self.MAX_STORAGE_BYTES / 1024 / 1024 / 1024:.0f}GB. "
                 f"请同步到Fleet API后删除本地数据。"
             )
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 生成ID
+        # 生成ID(随机后缀,同一毫秒内的多次写入也不会因ID冲突被丢弃)
         if not memory_id:
-            memory_id = f"mem_{session_id}_{int(datetime.now().timestamp() * 1000)}"
+            memory_id = f"mem_{session_id}_{uuid.uuid4().hex}"
         
         # 当前时间
         now = datetime.now().isoformat()
         
-        # 插入记忆
-        cursor.execute("""
-            INSERT INTO memories (
-                id, session_id, content, metadata, timestamp, 
-                source, synced_to_fleet, created_at, updated_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        # 在调用方线程压缩,不占用写入线程
+        stored, codec = compress_text(content)
+        
+        row = (
             memory_id,
             session_id,
-            content,
+            stored,
+            codec,
             json.dumps(metadata or {}, ensure_ascii=False),
             now,
             "agent6",
             0,  # 未同步
             now,
-            now
-        ))
+            now,
+            content_hash(content)
+        )
         
-        conn.commit()
-        conn.close()
+        self._ensure_writer()
+        # 序号与入队顺序一致,写入线程按序号推进已提交位置
+        with self._seq_lock:
+            self._enqueued_seq += 1
+            item = _PendingInsert(self._enqueued_seq, row, stored_size(content), content if codec is not None else None)
+            try:
+                self.write_queue.put(item, timeout=FLEET_DB_BUSY_TIMEOUT)
+            except queue.Full:
+                self._enqueued_seq -= 1
+                raise Exception(f"Fleet记忆库写入队列已满 ({FLEET_DB_WRITE_QUEUE_MAX})")
         
+        if durable:
+            return item.future.result()
         return memory_id
     
+    @_instrumented("bulk_import")
+    def bulk_import(self, rows: List[tuple], replace: bool = False) -> int:
+        """
+        在一个事务中批量写入一批记忆(批量导入、回填用),按id去重
+        
+        不经过写入队列;内容在调用方线程压缩,统计计数由触发器维护,向量由后台补算
+        
+        Args:
+            rows: (id, session_id, content, metadata_json, timestamp, source,
+                synced_to_fleet, fleet_memory_id, created_at, updated_at, occurrences)元组列表
+            replace: id已存在时以导入的记录覆盖(否则跳过)
+            
+        同一会话已有相同内容(id不同)时合并到已有记忆: 累加occurrences,updated_at取较新者
+            
+        Returns:
+            插入、覆盖或合并的行数(id已存在而跳过的不计)
+            
+        Raises:
+            Exception: 存储已满
+        """
+        if not rows:
+            return 0
+        if self.is_storage_full():
+            raise Exception(f"Fleet记忆库存储已满 ({self._storage_bytes / 1024 / 1024 / 1024:.2f}GB)")
+        self.flush()
+        
+        prepared = []
+        # 压缩存储的行: (原文, 记忆ID, 内容哈希),写入后补充全文索引
+        compressed = []
+        for row in rows:
+            stored, codec = compress_text(row[2])
+            digest = content_hash(row[2])
+            prepared.append((row[0], row[1], stored, codec) + tuple(row[3:]) + (digest,))
+            if codec is not None:
+                compressed.append((row[2], row[0], digest))
+        
+        if replace:
+            conflict = """DO UPDATE SET
+                session_id = excluded.session_id, content = excluded.content, content_codec = excluded.content_codec,
+                metadata = excluded.metadata, timestamp = excluded.timestamp, source = excluded.source,
+                synced_to_fleet = excluded.synced_to_fleet, fleet_memory_id = excluded.fleet_memory_id,
+                created_at = excluded.created_at, updated_at = excluded.updated_at,
+                occurrences = excluded.occurrences, content_hash = excluded.content_hash, tier = 0"""
+        else:
+            conflict = "DO NOTHING"
+        # id冲突先于内容冲突处理(重复导入同一批数据不会累加计数)
+        sql = f"""
+            INSERT INTO memories (
+                id, session_id, content, content_codec, metadata, timestamp, source,
+                synced_to_fleet, fleet_memory_id, created_at, updated_at, occurrences, content_hash
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) {conflict}
+            ON CONFLICT(session_id, content_hash) DO UPDATE SET
+                occurrences = occurrences + excluded.occurrences,
+                updated_at = MAX(updated_at, excluded.updated_at)
+        """
+        conn = self._conn()
+        try:
+            with conn:
+                written = conn.executemany(sql, prepared).rowcount
+                self._index_compressed(conn, compressed)
+        except sqlite3.IntegrityError:
+            # 覆盖后的内容与同会话另一条记忆重复等: 逐条重试,跳过冲突的行
+            written = 0
+            with conn:
+                for row in prepared:
+                    try:
+                        written += conn.execute(sql, row).rowcount
+                    except sqlite3.IntegrityError:
+                        pass
+                self._index_compressed(conn, compressed)
+        
+        self._add_storage_bytes(sum(stored_size(row[2]) + len(row[4]) + _ROW_OVERHEAD for row in prepared))
+        if self.vectors is not None and written:
+            self.vectors.start()
+            if replace:
+                # 覆盖导入会在原rowid上替换内容
+                self.vectors.rescan()
+            self.vectors.notify()
+        return written
+    
+    @_instrumented("get_memory")
     def get_memory(self, memory_id: str) -> Optional[Dict[str, Any]]:
         """
         获取指定记忆
@@ -145,22 +941,139 @@ class FleetMemoryDB:
         Returns:
             记忆字典,不存在则返回None
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
+        self.flush()
+        row = self._conn().execute("""
             SELECT * FROM memories WHERE id = ?
-        """, (memory_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
+        """, (memory_id,)).fetchone()
         
         if not row:
             return None
         
         return self._row_to_dict(row)
     
+    def get_synced_hash(self, session_id: str, content: str) -> Optional[Dict[str, Any]]:
+        """
+        相同内容已同步并从本地删除时的记录
+        
+        Returns:
+            {memory_id, fleet_memory_id, occurrences, synced_at, updated_at},没有则返回None
+        """
+        self.flush()
+        row = self._conn().execute("""
+            SELECT memory_id, fleet_memory_id, occurrences, synced_at, updated_at
+            FROM synced_hashes WHERE session_id = ? AND content_hash = ?
+        """, (session_id, content_hash(content))).fetchone()
+        return dict(row) if row else None
+    
+    @staticmethod
+    def encode_cursor(timestamp: str, memory_id: str) -> str:
+        """生成分页游标(不透明字符串,指向该条记忆之后)"""
+        raw = json.dumps([timestamp, memory_id], ensure_ascii=False).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[str, str]:
+        """
+        解析分页游标
+        
+        Raises:
+            ValueError: 游标格式无效
+        """
+        try:
+            timestamp, memory_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return str(timestamp), str(memory_id)
+        except Exception:
+            raise ValueError(f"无效的分页游标: {cursor}")
+    
+    def _fetch_page(
+        self,
+        limit: int,
+        after: Optional[Tuple[str, str]] = None,
+        session_id: Optional[str] = None,
+        offset: int = 0
+    ) -> List[sqlite3.Row]:
+        """按(timestamp, id)倒序取一页,after为上一页最后一条的(timestamp, id)"""
+        conditions = []
+        params: List[Any] = []
+        if session_id is not None:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        if after is not None:
+            # 行值比较可直接沿(timestamp, id)索引定位,与页深无关
+            conditions.append("(timestamp, id) < (?, ?)")
+            params.extend(after)
+        
+        sql = "SELECT * FROM memories"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit)
+        if offset:
+            sql += " OFFSET ?"
+            params.append(offset)
+        return self._conn().execute(sql, params).fetchall()
+    
+    @_instrumented("list_memories_page")
+    def list_memories_page(
+        self,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        session_id: Optional[str] = None,
+        decode_metadata: bool = True
+    ) -> Dict[str, Any]:
+        """
+        键集分页列出记忆(最新在前)
+        
+        Args:
+            limit: 每页数量
+            cursor: 上一页返回的next_cursor,不提供则从第一页开始
+            session_id: 只列出指定会话(可选)
+            decode_metadata: 是否解析元数据JSON(否则以原始字符串放在metadata_json中)
+            
+        Returns:
+            {"items": 记忆列表, "next_cursor": 下一页游标(没有更多时为None)}
+            
+        Raises:
+            ValueError: 游标格式无效
+        """
+        self.flush()
+        after = self.decode_cursor(cursor) if cursor else None
+        rows = self._fetch_page(limit, after=after, session_id=session_id)
+        items = [self._row_to_dict(row, decode_metadata) for row in rows]
+        next_cursor = None
+        if len(rows) == limit:
+            next_cursor = self.encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+        return {"items": items, "next_cursor": next_cursor}
+    
+    def iter_memories(
+        self,
+        session_id: Optional[str] = None,
+        chunk_size: int = 1000,
+        cursor: Optional[str] = None,
+        decode_metadata: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式遍历记忆(最新在前),每次从数据库读取一块,内存占用与总行数无关
+        
+        每块是独立的查询,遍历期间不持有读事务,不阻塞WAL检查点
+        
+        Args:
+            session_id: 只遍历指定会话(可选)
+            chunk_size: 每次读取的行数
+            cursor: 从该游标之后开始(可选)
+            decode_metadata: 是否解析元数据JSON(默认不解析,原始字符串放在metadata_json中)
+        """
+        self.flush()
+        after = self.decode_cursor(cursor) if cursor else None
+        while True:
+            rows = self._fetch_page(chunk_size, after=after, session_id=session_id)
+            for row in rows:
+                yield self._row_to_dict(row, decode_metadata)
+            if len(rows) < chunk_size:
+                return
+            after = (rows[-1]["timestamp"], rows[-1]["id"])
+    
+    @_instrumented("get_session_memories")
     def get_session_memories(
         self,
         session_id: str,
@@ -170,6 +1083,8 @@ class FleetMemoryDB:
         """
         获取指定会话的所有记忆
         
+        深分页请使用list_memories_page(session_id=...)的游标,避免OFFSET逐行跳过
+        
         Args:
             session_id: 会话ID
             limit: 返回数量限制
@@ -178,22 +1093,12 @@ class FleetMemoryDB:
         Returns:
             记忆列表
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT * FROM memories 
-            WHERE session_id = ?
-            ORDER BY timestamp DESC
-            LIMIT ? OFFSET ?
-        """, (session_id, limit, offset))
-        
-        rows = cursor.fetchall()
-        conn.close()
+        self.flush()
+        rows = self._fetch_page(limit, session_id=session_id, offset=offset)
         
         return [self._row_to_dict(row) for row in rows]
     
+    @_instrumented("list_all_memories")
     def list_all_memories(
         self,
         limit: int = 100,
@@ -202,6 +1107,8 @@ class FleetMemoryDB:
         """
         列出所有记忆
         
+        深分页请使用list_memories_page的游标,避免OFFSET逐行跳过
+        
         Args:
             limit: 返回数量限制
             offset: 偏移量
@@ -209,47 +1116,300 @@ class FleetMemoryDB:
         Returns:
             记忆列表
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        self.flush()
+        rows = self._fetch_page(limit, offset=offset)
         
-        cursor.execute("""
-            SELECT * FROM memories 
-            ORDER BY timestamp DESC
-            LIMIT ? OFFSET ?
-        """, (limit, offset))
+        return [self._row_to_dict(row) for row in rows]
+    
+    def _fts_query(self, query: str) -> Optional[str]:
+        """
+        把自然语言查询转换为FTS5表达式: 各词加引号转义后以OR连接,由BM25排序相关度
         
-        rows = cursor.fetchall()
-        conn.close()
+        trigram分词下少于3个字符的词无法匹配,全部过短时返回None(改用LIKE)
+        """
+        terms = query.split()
+        if self.fts_tokenizer == "trigram":
+            terms = [t for t in terms if len(t) >= 3]
+        if not terms:
+            return None
+        return " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+    
+    @_instrumented("search_memories")
+    def search_memories(
+        self,
+        query: str,
+        session_id: Optional[str] = None,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """
+        全文检索记忆,按BM25相关度排序
         
-        return [self._row_to_dict(row) for row in rows]
+        Args:
+            query: 查询文本(空格分隔多个词,任一词命中即可,命中越多越靠前)
+            session_id: 只检索指定会话(可选)
+            limit: 返回数量限制
+            
+        Returns:
+            记忆列表,每条附加score(相关度,越大越相关)、snippet(命中片段)
+            与highlighted_content(全文,命中处以**标记)
+        """
+        query = (query or "").strip()
+        if not query:
+            return []
+        self.flush()
+        
+        fts_query = self._fts_query(query)
+        if fts_query is None:
+            return self._search_like(query, session_id, limit)
+        
+        sql = """
+            SELECT m.*,
+                   bm25(memories_fts) AS rank,
+                   snippet(memories_fts, 0, '**', '**', '…', 64) AS snippet,
+                   highlight(memories_fts, 0, '**', '**') AS highlighted
+            FROM memories_fts
+            JOIN memories m ON m.rowid = memories_fts.rowid
+            WHERE memories_fts MATCH ?
+        """
+        params: List[Any] = [fts_query]
+        if session_id:
+            sql += " AND m.session_id = ?"
+            params.append(session_id)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        
+        results = []
+        for row in self._conn().execute(sql, params).fetchall():
+            memory = self._row_to_dict(row)
+            # bm25()越小越相关,取反后越大越相关
+            memory["score"] = round(-row["rank"], 6)
+            memory["snippet"] = row["snippet"]
+            memory["highlighted_content"] = row["highlighted"]
+            results.append(memory)
+        return results
     
-    def get_unsynced_memories(self, limit: int = 100) -> List[Dict[str, Any]]:
+    def _search_like(self, query: str, session_id: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        """短词子串匹配(无相关度,按时间倒序)"""
+        terms = query.split()
+        escaped = [t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") for t in terms]
+        sql = "SELECT * FROM memories WHERE (" + " OR ".join(
+            ["fleet_text(content, content_codec) LIKE ? ESCAPE '\\'"] * len(terms)
+        ) + ")"
+        params: List[Any] = [f"%{t}%" for t in escaped]
+        if session_id:
+            sql += " AND session_id = ?"
+            params.append(session_id)
+        sql += " ORDER BY timestamp DESC LIMIT ?"
+        params.append(limit)
+        
+        results = []
+        for row in self._conn().execute(sql, params).fetchall():
+            memory = self._row_to_dict(row)
+            content = memory["content"]
+            highlighted = content
+            for term in terms:
+                highlighted = highlighted.replace(term, f"**{term}**")
+            index = min((content.find(t) for t in terms if t in content), default=0)
+            start = max(0, index - 32)
+            memory["score"] = None
+            memory["snippet"] = ("…" if start else "") + content[start:index + 64] + ("…" if index + 64 < len(content) else "")
+            memory["highlighted_content"] = highlighted
+            results.append(memory)
+        return results
+    
+    def _get_by_rowids(self, rowids: List[int]) -> Dict[int, Dict[str, Any]]:
+        if not rowids:
+            return {}
+        placeholders = ",".join("?" * len(rowids))
+        rows = self._conn().execute(
+            f"SELECT rowid AS row_id, * FROM memories WHERE rowid IN ({placeholders})", rowids
+        ).fetchall()
+        return {row["row_id"]: self._row_to_dict(row) for row in rows}
+    
+    @_instrumented("semantic_search")
+    def semantic_search(
+        self,
+        query: str,
+        session_id: Optional[str] = None,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
         """
-        获取未同步到Fleet API的记忆
+        语义检索记忆(向量余弦相似度)
         
         Args:
+            query: 查询文本
+            session_id: 只检索指定会话(可选)
             limit: 返回数量限制
             
         Returns:
-            未同步记忆列表
+            记忆列表,每条附加score(余弦相似度)
+            
+        Raises:
+            RuntimeError: 向量索引未启用(未安装numpy或FLEET_VECTOR_ENABLED=0)
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        if self.vectors is None:
+            raise RuntimeError("向量索引未启用")
+        query = (query or "").strip()
+        if not query:
+            return []
+        self.flush()
+        self.vectors.start()
+        self.vectors.wait_ready(timeout=FLEET_DB_BUSY_TIMEOUT)
         
-        cursor.execute("""
-            SELECT * FROM memories 
-            WHERE synced_to_fleet = 0
-            ORDER BY timestamp ASC
-            LIMIT ?
-        """, (limit,))
+        hits = self.vectors.search(query, limit=limit, session_id=session_id)
+        memories = self._get_by_rowids([rowid for rowid, _ in hits])
+        # 已删除的行不会出现在memories中
+        self.vectors.mark_deleted([rowid for rowid, _ in hits if rowid not in memories])
+        
+        results = []
+        for rowid, score in hits:
+            memory = memories.get(rowid)
+            if memory is not None:
+                memory["score"] = round(score, 6)
+                results.append(memory)
+        return results
+    
+    @_instrumented("hybrid_search")
+    def hybrid_search(
+        self,
+        query: str,
+        session_id: Optional[str] = None,
+        limit: int = 10,
+        rrf_k: int = 60
+    ) -> List[Dict[str, Any]]:
+        """
+        关键词(BM25)与语义(向量)混合检索,按倒数排名融合(RRF)合并两路结果
+        
+        向量索引未启用时等同于search_memories
+        
+        Args:
+            query: 查询文本
+            session_id: 只检索指定会话(可选)
+            limit: 返回数量限制
+            rrf_k: RRF平滑常数,越大两路排名差异的影响越小
+            
+        Returns:
+            记忆列表,每条附加score(融合得分)、keyword_rank、semantic_rank(未命中为None)与snippet
+        """
+        keyword = self.search_memories(query, session_id=session_id, limit=limit * 4)
+        if self.vectors is None:
+            return keyword[:limit]
+        semantic = self.semantic_search(query, session_id=session_id, limit=limit * 4)
+        return self.fuse_rankings(keyword, semantic, limit, rrf_k)
+    
+    @staticmethod
+    def fuse_rankings(
+        keyword: List[Dict[str, Any]],
+        semantic: List[Dict[str, Any]],
+        limit: int,
+        rrf_k: int = 60
+    ) -> List[Dict[str, Any]]:
+        """按倒数排名融合(RRF)合并关键词与语义两路检索结果"""
+        merged: Dict[str, Dict[str, Any]] = {}
+        for source, results in (("keyword_rank", keyword), ("semantic_rank", semantic)):
+            for rank, memory in enumerate(results, 1):
+                entry = merged.setdefault(memory["id"], {**memory, "score": 0.0, "keyword_rank": None, "semantic_rank": None})
+                entry[source] = rank
+                entry["score"] += 1.0 / (rrf_k + rank)
         
-        rows = cursor.fetchall()
-        conn.close()
+        results = sorted(merged.values(), key=lambda m: m["score"], reverse=True)[:limit]
+        for memory in results:
+            memory["score"] = round(memory["score"], 6)
+            if not memory.get("snippet"):
+                content = memory["content"]
+                memory["snippet"] = content[:160] + ("…" if len(content) > 160 else "")
+        return results
+    
+    @_instrumented("get_unsynced_memories")
+    def get_unsynced_memories(
+        self,
+        limit: int = 100,
+        after: Optional[Tuple[str, str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        获取未同步到Fleet API的记忆(按(timestamp, id)升序)
+        
+        Args:
+            limit: 返回数量限制
+            after: 上一页最后一条的(timestamp, id),从其后继续读取
+            
+        Returns:
+            未同步记忆列表
+        """
+        self.flush()
+        sql = "SELECT * FROM memories INDEXED BY idx_unsynced WHERE synced_to_fleet = 0"
+        params: List[Any] = []
+        if after is not None:
+            sql += " AND (timestamp, id) > (?, ?)"
+            params.extend(after)
+        sql += " ORDER BY timestamp ASC, id ASC LIMIT ?"
+        params.append(limit)
+        rows = self._conn().execute(sql, params).fetchall()
         
         return [self._row_to_dict(row) for row in rows]
     
+    def get_unsynced_count(self) -> int:
+        """未同步的记忆数(读取触发器维护的计数)"""
+        self.flush()
+        row = self._conn().execute("SELECT total - synced FROM memory_stats WHERE id = 1").fetchone()
+        return row[0] if row else 0
+    
+    @_instrumented("acknowledge_synced")
+    def acknowledge_synced(self, acks: List[Tuple[str, str]], delete: bool = True) -> int:
+        """
+        在一个事务中确认一批已同步的记忆(外发同步用,代替逐条mark_as_synced/delete_memory)
+        
+        Args:
+            acks: (本地记忆ID, Fleet API返回的记忆ID)列表
+            delete: 删除已同步的记忆(否则只标记为已同步)
+            
+        Returns:
+            确认的行数(不在本库中的ID不计)
+        """
+        if not acks:
+            return 0
+        self.flush()
+        conn = self._conn()
+        rowids: List[int] = []
+        with conn:
+            if delete:
+                # 保留内容哈希,之后再次写入相同内容时识别为已同步的重复
+                now = datetime.now().isoformat()
+                conn.executemany("""
+                    INSERT INTO synced_hashes (
+                        session_id, content_hash, memory_id, fleet_memory_id, occurrences, synced_at, updated_at
+                    )
+                    SELECT session_id, content_hash, id, ?, occurrences, ?, ?
+                    FROM memories WHERE id = ? AND content_hash IS NOT NULL
+                    ON CONFLICT(session_id, content_hash) DO UPDATE SET
+                        memory_id = excluded.memory_id,
+                        fleet_memory_id = excluded.fleet_memory_id,
+                        occurrences = synced_hashes.occurrences + excluded.occurrences,
+                        synced_at = excluded.synced_at,
+                        updated_at = excluded.updated_at
+                """, [(fleet_memory_id, now, now, memory_id) for memory_id, fleet_memory_id in acks])
+                for start in range(0, len(acks), 500):
+                    chunk = [memory_id for memory_id, _ in acks[start:start + 500]]
+                    rowids.extend(row[0] for row in conn.execute(
+                        f"SELECT rowid FROM memories WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                    ))
+                conn.executemany("DELETE FROM memories WHERE id = ?", [(memory_id,) for memory_id, _ in acks])
+                count = len(rowids)
+            else:
+                now = datetime.now().isoformat()
+                count = conn.executemany("""
+                    UPDATE memories 
+                    SET synced_to_fleet = 1,
+                        fleet_memory_id = ?,
+                        updated_at = ?
+                    WHERE id = ?
+                """, [(fleet_memory_id, now, memory_id) for memory_id, fleet_memory_id in acks]).rowcount
+        
+        if rowids and self.vectors is not None:
+            self.vectors.mark_deleted(rowids)
+        return count
+    
+    @_instrumented("mark_as_synced")
     def mark_as_synced(self, memory_id: str, fleet_memory_id: str):
         """
         标记记忆已同步到Fleet API
@@ -258,20 +1418,18 @@ class FleetMemoryDB:
             memory_id: 本地记忆ID
             fleet_memory_id: Fleet API返回的记忆ID
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE memories 
-            SET synced_to_fleet = 1,
-                fleet_memory_id = ?,
-                updated_at = ?
-            WHERE id = ?
-        """, (fleet_memory_id, datetime.now().isoformat(), memory_id))
-        
-        conn.commit()
-        conn.close()
+        self.flush()
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                UPDATE memories 
+                SET synced_to_fleet = 1,
+                    fleet_memory_id = ?,
+                    updated_at = ?
+                WHERE id = ?
+            """, (fleet_memory_id, datetime.now().isoformat(), memory_id))
     
+    @_instrumented("delete_memory")
     def delete_memory(self, memory_id: str) -> bool:
         """
         删除记忆
@@ -282,39 +1440,324 @@ class FleetMemoryDB:
         Returns:
             是否删除成功
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            DELETE FROM memories WHERE id = ?
-        """, (memory_id,))
+        self.flush()
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT rowid FROM memories WHERE id = ?", (memory_id,)).fetchone()
+            cursor = conn.execute("""
+                DELETE FROM memories WHERE id = ?
+            """, (memory_id,))
         
         deleted = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
+        if deleted and self.vectors is not None:
+            self.vectors.mark_deleted([row[0]])
         
         return deleted
     
     def get_storage_size(self) -> int:
         """
-        获取数据库文件大小(字节)
+        获取数据库占用的磁盘大小(字节)
+        
+        Returns:
+            数据库文件与WAL、共享内存文件的大小之和
+        """
+        return sum(self._file_sizes().values())
+    
+    def _file_sizes(self) -> Dict[str, int]:
+        sizes = {}
+        for key, suffix in (("db_bytes", ""), ("wal_bytes", "-wal"), ("shm_bytes", "-shm")):
+            try:
+                sizes[key] = os.path.getsize(self.db_path + suffix)
+            except OSError:
+                sizes[key] = 0
+        return sizes
+    
+    def get_storage_breakdown(self) -> Dict[str, Any]:
+        """
+        存储构成: 各文件大小、可回收的空闲页与内容压缩情况
+        
+        free_bytes是数据库文件内的空闲页(删除或重新压缩后留下),由整理任务的增量VACUUM归还给文件系统
+        """
+        conn = self._conn()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        breakdown: Dict[str, Any] = self._file_sizes()
+        breakdown.update({
+            "free_bytes": free_pages * page_size,
+            "page_size": page_size,
+            "auto_vacuum": _AUTO_VACUUM_MODES.get(auto_vacuum, str(auto_vacuum)),
+            "compression_codec": DEFAULT_CODEC,
+            # 本进程启动以来写入的内容
+            "compressed_rows": self.compressed_rows,
+            "content_raw_bytes": self.content_raw_bytes,
+            "content_stored_bytes": self.content_stored_bytes,
+            "compression_ratio": round(self.content_raw_bytes / self.content_stored_bytes, 2) if self.content_stored_bytes else None,
+            "cold_rows_total": self.cold_rows_total,
+            "cold_bytes_saved": self.cold_bytes_saved,
+            "dedup_merged_total": self.dedup_merged_total,
+            "last_maintenance": self.last_maintenance
+        })
+        return breakdown
+    
+    # ==================== 冷层与整理 ====================
+    
+    def _compact_cold_batch(self, cutoff: str) -> Tuple[int, int, int]:
+        """
+        把一批早于cutoff的已同步记忆转入冷层(以高压缩级别重新压缩)
         
         Returns:
-            数据库文件大小
+            (处理行数, 读取的内容字节数, 写入的内容字节数)
         """
+        conn = self._conn()
+        rows = conn.execute("""
+            SELECT rowid, content, content_codec FROM memories INDEXED BY idx_cold_candidates
+            WHERE tier = 0 AND synced_to_fleet = 1 AND timestamp < ?
+            LIMIT ?
+        """, (cutoff, FLEET_DB_COLD_BATCH)).fetchall()
+        if not rows:
+            return 0, 0, 0
+        
+        updates = []
+        bytes_read = bytes_written = 0
+        for rowid, value, codec in rows:
+            payload, new_codec = compress_text(decompress_text(value, codec), cold=True)
+            if new_codec is None or stored_size(payload) >= stored_size(value):
+                # 重新压缩没有收益,只标记层级
+                payload, new_codec = value, codec
+            bytes_read += stored_size(value)
+            bytes_written += stored_size(payload)
+            updates.append((payload, new_codec, rowid))
+        
+        with conn:
+            conn.executemany(
+                "UPDATE memories SET content = ?, content_codec = ?, tier = 1 WHERE rowid = ? AND tier = 0",
+                updates
+            )
+        return len(rows), bytes_read, bytes_written
+    
+    def _dedup_batch(self, after_rowid: int) -> Tuple[int, int, int, int]:
+        """
+        为一批尚无哈希的旧记忆回填content_hash,同一会话内容重复的合并到最早的一条
+        (累加occurrences,保留已同步状态),其余删除
+        
+        Returns:
+            (本批最后的rowid, 处理行数, 合并删除的行数, 读取的内容字节数)
+        """
+        conn = self._conn()
+        rows = conn.execute("""
+            SELECT rowid, session_id, content, content_codec, occurrences, synced_to_fleet, fleet_memory_id, updated_at
+            FROM memories INDEXED BY idx_unhashed
+            WHERE content_hash IS NULL AND rowid > ?
+            ORDER BY rowid
+            LIMIT ?
+        """, (after_rowid, FLEET_DB_COLD_BATCH)).fetchall()
+        if not rows:
+            return after_rowid, 0, 0, 0
+        
+        merged_rowids = []
+        bytes_read = 0
+        with conn:
+            for row in rows:
+                bytes_read += stored_size(row["content"])
+                digest = content_hash(decompress_text(row["content"], row["content_codec"]))
+                keeper = conn.execute(
+                    "SELECT rowid FROM memories WHERE session_id = ? AND content_hash = ?",
+                    (row["session_id"], digest)
+                ).fetchone()
+                if keeper is None:
+                    conn.execute("UPDATE memories SET content_hash = ? WHERE rowid = ?", (digest, row["rowid"]))
+                    continue
+                conn.execute("""
+                    UPDATE memories SET
+                        occurrences = occurrences + ?,
+                        updated_at = MAX(updated_at, ?),
+                        synced_to_fleet = MAX(synced_to_fleet, ?),
+                        fleet_memory_id = COALESCE(fleet_memory_id, ?)
+                    WHERE rowid = ?
+                """, (row["occurrences"], row["updated_at"], row["synced_to_fleet"], row["fleet_memory_id"], keeper[0]))
+                conn.execute("DELETE FROM memories WHERE rowid = ?", (row["rowid"],))
+                merged_rowids.append(row["rowid"])
+        
+        if merged_rowids and self.vectors is not None:
+            self.vectors.mark_deleted(merged_rowids)
+        return rows[-1]["rowid"], len(rows), len(merged_rowids), bytes_read
+    
+    @_instrumented("deduplicate")
+    def deduplicate(self, max_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """
+        一次性去重迁移: 为升级前写入的记忆回填哈希并合并重复内容(整理任务也会按预算逐步执行)
+        
+        Args:
+            max_seconds: 最长耗时(秒),不限制则处理完全部旧数据
+            
+        Returns:
+            {"processed": 处理行数, "merged": 合并删除的行数, "completed": 是否已全部回填}
+        """
+        self.flush()
+        started = time.monotonic()
+        last_rowid = processed = merged = 0
+        completed = False
+        while max_seconds is None or time.monotonic() - started < max_seconds:
+            last_rowid, rows, removed, _ = self._dedup_batch(last_rowid)
+            if not rows:
+                completed = True
+                break
+            processed += rows
+            merged += removed
+        self.dedup_merged_total += merged
+        if merged:
+            print(f"🧹 Fleet记忆去重: 处理{processed}条, 合并重复{merged}条")
+        return {
+            "processed": processed,
+            "merged": merged,
+            "completed": completed,
+            "duration_seconds": round(time.monotonic() - started, 2)
+        }
+    
+    @_instrumented("maintenance")
+    def run_maintenance(
+        self,
+        max_seconds: float = FLEET_DB_MAINTENANCE_MAX_SECONDS,
+        io_mb_per_sec: float = FLEET_DB_MAINTENANCE_IO_MB,
+        full_vacuum: bool = False
+    ) -> Dict[str, Any]:
+        """
+        整理数据库(由定时任务定期执行)
+        
+        0. 为升级前写入的记忆回填内容哈希并合并重复(一次性,完成后跳过)
+        1. 已同步且早于FLEET_DB_COLD_AFTER_DAYS天的记忆转入冷层,
+           清除早于FLEET_DB_SYNCED_HASH_DAYS天的已同步内容哈希
+        2. 增量VACUUM,把空闲页归还给文件系统
+        3. 检查点并截断WAL文件
+        
+        前三步按I/O预算限速、总耗时不超过max_seconds,未完成的部分留到下一次
+        
+        Args:
+            max_seconds: 最长耗时(秒)
+            io_mb_per_sec: I/O预算(MB/秒)
+            full_vacuum: 是否执行完整VACUUM(重写整个数据库,期间阻塞写入;
+                auto_vacuum为none的旧数据库需要执行一次才能使用增量VACUUM)
+            
+        Returns:
+            本次整理的结果
+            
+        Raises:
+            RuntimeError: 已有整理任务在运行
+        """
+        if not self._maintenance_lock.acquire(blocking=False):
+            raise RuntimeError("Fleet记忆库整理任务正在运行")
         try:
-            return os.path.getsize(self.db_path)
-        except:
-            return 0
+            return self._run_maintenance(max_seconds, io_mb_per_sec, full_vacuum)
+        finally:
+            self._maintenance_lock.release()
+    
+    def _run_maintenance(self, max_seconds: float, io_mb_per_sec: float, full_vacuum: bool) -> Dict[str, Any]:
+        self.flush()
+        conn = self._conn()
+        started = time.monotonic()
+        deadline = started + max_seconds
+        budget = max(io_mb_per_sec, 0.1) * 1024 * 1024
+        io_bytes = 0
+        size_before = self.get_storage_size()
+        
+        def throttle():
+            # 累计I/O超出预算时暂停,使平均速率不超过io_mb_per_sec
+            wait = io_bytes / budget - (time.monotonic() - started)
+            if wait > 0:
+                time.sleep(min(wait, max(0.0, deadline - time.monotonic())))
+        
+        # 0. 去重回填
+        dedup_rows = dedup_merged = last_rowid = 0
+        while time.monotonic() < deadline:
+            last_rowid, rows, removed, bytes_read = self._dedup_batch(last_rowid)
+            if not rows:
+                break
+            dedup_rows += rows
+            dedup_merged += removed
+            io_bytes += bytes_read
+            throttle()
+        self.dedup_merged_total += dedup_merged
+        
+        # 1. 冷层
+        cutoff = (datetime.now() - timedelta(days=FLEET_DB_COLD_AFTER_DAYS)).isoformat()
+        cold_rows = cold_read = cold_written = 0
+        while time.monotonic() < deadline:
+            rows, bytes_read, bytes_written = self._compact_cold_batch(cutoff)
+            if not rows:
+                break
+            cold_rows += rows
+            cold_read += bytes_read
+            cold_written += bytes_written
+            io_bytes += bytes_read + bytes_written
+            throttle()
+        self.cold_rows_total += cold_rows
+        self.cold_bytes_saved += cold_read - cold_written
+        
+        # 过期的已同步内容哈希(按synced_at索引删除,开销很小)
+        hash_cutoff = (datetime.now() - timedelta(days=FLEET_DB_SYNCED_HASH_DAYS)).isoformat()
+        with conn:
+            synced_hashes_pruned = conn.execute(
+                "DELETE FROM synced_hashes WHERE synced_at < ?", (hash_cutoff,)
+            ).rowcount
+        
+        # 2. 归还空闲页
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        vacuumed_pages = 0
+        if full_vacuum:
+            vacuumed_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute("VACUUM")
+        elif conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            # 每步约为一秒的I/O预算
+            step = max(1, int(budget // page_size))
+            while time.monotonic() < deadline:
+                free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if not free_pages:
+                    break
+                pages = min(free_pages, step)
+                # 每取一行释放一页,必须取完
+                conn.execute(f"PRAGMA incremental_vacuum({pages})").fetchall()
+                vacuumed_pages += pages
+                io_bytes += pages * page_size * 2
+                throttle()
+        
+        # 3. 截断WAL(有长读事务时可能只完成部分检查点)
+        busy, wal_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        
+        self._refresh_storage_size()
+        result = {
+            "timestamp": datetime.now().isoformat(),
+            "duration_seconds": round(time.monotonic() - started, 2),
+            "dedup_rows": dedup_rows,
+            "dedup_merged": dedup_merged,
+            "cold_rows": cold_rows,
+            "cold_bytes_saved": cold_read - cold_written,
+            "synced_hashes_pruned": synced_hashes_pruned,
+            "vacuumed_pages": vacuumed_pages,
+            "full_vacuum": full_vacuum,
+            "wal_checkpoint": {"busy": bool(busy), "frames": wal_frames, "checkpointed": checkpointed},
+            "storage_before_bytes": size_before,
+            "storage_after_bytes": self._storage_bytes,
+            "io_bytes": io_bytes,
+            "completed": time.monotonic() < deadline
+        }
+        self.last_maintenance = result
+        if dedup_merged or cold_rows or vacuumed_pages:
+            print(f"🧹 Fleet记忆库整理: 合并重复{dedup_merged}条, 冷层{cold_rows}条, 回收{vacuumed_pages}页, "
+                  f"{size_before / 1024 / 1024:.1f}MB → {self._storage_bytes / 1024 / 1024:.1f}MB")
+        return result
     
     def is_storage_full(self) -> bool:
         """
         检查存储是否已满
         
+        使用写入时累加的估算值(每FLEET_DB_SIZE_REFRESH_SECONDS秒以实际文件大小校准),
+        避免每次写入都stat数据库文件
+        
         Returns:
             是否超过存储限制
         """
-        return self.get_storage_size() >= self.MAX_STORAGE_BYTES
+        return self._storage_bytes >= self.MAX_STORAGE_BYTES
     
     def get_storage_usage_percent(self) -> float:
         """
@@ -323,8 +1766,9 @@ class FleetMemoryDB:
         Returns:
             使用率(百分比)
         """
-        return (self.get_storage_size() / self.MAX_STORAGE_BYTES) * 100
+        return (self._storage_bytes / self.MAX_STORAGE_BYTES) * 100
     
+    @_instrumented("get_stats")
     def get_stats(self) -> Dict[str, Any]:
         """
         获取统计信息
@@ -332,32 +1776,23 @@ class FleetMemoryDB:
         Returns:
             统计字典
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self.flush()
         
-        # 总记忆数
-        cursor.execute("SELECT COUNT(*) FROM memories")
-        total_count = cursor.fetchone()[0]
-        
-        # 已同步数
-        cursor.execute("SELECT COUNT(*) FROM memories WHERE synced_to_fleet = 1")
-        synced_count = cursor.fetchone()[0]
+        # 触发器维护的计数(单行读取,不扫描memories)
+        row = self._conn().execute(
+            "SELECT total, synced, sessions, latest_timestamp, reconciled_at FROM memory_stats WHERE id = 1"
+        ).fetchone()
+        total_count = row["total"]
+        synced_count = row["synced"]
         
         # 未同步数
         unsynced_count = total_count - synced_count
+        session_count = row["sessions"]
+        latest_timestamp = row["latest_timestamp"]
         
-        # 会话数
-        cursor.execute("SELECT COUNT(DISTINCT session_id) FROM memories")
-        session_count = cursor.fetchone()[0]
-        
-        # 最新记忆时间
-        cursor.execute("SELECT MAX(timestamp) FROM memories")
-        latest_timestamp = cursor.fetchone()[0]
-        
-        conn.close()
-        
-        # 存储大小
-        storage_size = self.get_storage_size()
+        # 存储大小(顺带校准写入估算值)
+        self._refresh_storage_size()
+        storage_size = self._storage_bytes
         storage_usage_percent = self.get_storage_usage_percent()
         
         return {
@@ -372,32 +1807,68 @@ class FleetMemoryDB:
             "storage_size_gb": round(storage_size / 1024 / 1024 / 1024, 2),
             "storage_limit_gb": 500,
             "storage_usage_percent": round(storage_usage_percent, 2),
-            "storage_is_full": self.is_storage_full()
+            "storage_is_full": self.is_storage_full(),
+            "storage": self.get_storage_breakdown(),
+            "stats_reconciled_at": row["reconciled_at"],
+            "write_queue": self.get_write_stats(),
+            "vector_index": self.vectors.get_stats() if self.vectors is not None else None
         }
     
-    def _row_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+    def get_session_memory_count(self, session_id: str) -> int:
+        """指定会话的记忆数(读取触发器维护的计数)"""
+        self.flush()
+        row = self._conn().execute(
+            "SELECT count FROM memory_session_counts WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else 0
+    
+    def _row_to_dict(self, row: sqlite3.Row, decode_metadata: bool = True) -> Dict[str, Any]:
         """
         将数据库行转换为字典
         
         Args:
             row: 数据库行
+            decode_metadata: 是否解析元数据JSON(否则以原始字符串放在metadata_json中,
+                由调用方按需用decode_metadata()解析)
             
         Returns:
             字典
         """
-        return {
+        memory = {
             "id": row["id"],
             "session_id": row["session_id"],
-            "content": row["content"],
-            "metadata": json.loads(row["metadata"]) if row["metadata"] else {},
+            "content": decompress_text(row["content"], row["content_codec"])
+        }
+        if decode_metadata:
+            memory["metadata"] = json.loads(row["metadata"]) if row["metadata"] else {}
+        else:
+            memory["metadata_json"] = row["metadata"] or "{}"
+        memory.update({
             "timestamp": row["timestamp"],
             "source": row["source"],
             "synced_to_fleet": bool(row["synced_to_fleet"]),
+            "occurrences": row["occurrences"],
             "fleet_memory_id": row["fleet_memory_id"],
             "created_at": row["created_at"],
             "updated_at": row["updated_at"]
-        }
+        })
+        return memory
+    
+    @staticmethod
+    def decode_metadata(memory: Dict[str, Any]) -> Dict[str, Any]:
+        """取记忆的元数据(未解析时解析并缓存到metadata字段)"""
+        if "metadata" not in memory:
+            memory["metadata"] = json.loads(memory.pop("metadata_json", None) or "{}")
+        return memory["metadata"]
+
+
+def _create_fleet_memory_db():
+    """按FLEET_DB_PARTITION创建全局实例: 单文件,或按月份/会话分区(接口相同)"""
+    if FLEET_DB_PARTITION == "none":
+        return FleetMemoryDB()
+    from app.core.fleet_partitions import PartitionedFleetMemoryDB
+    return PartitionedFleetMemoryDB()
 
 
 # 全局单例
-fleet_memory_db = FleetMemoryDB()
+fleet_memory_db = _create_fleet_memory_db()
@@ -0,0 +1,616 @@
+"""
+Fleet记忆分区存储
+把记忆分散到多个SQLite文件,每个分区是一个独立的FleetMemoryDB(各自的写入线程、
+全文索引、向量索引与统计),单个文件的备份、VACUUM与索引重建只涉及该分区
+
+- month: 按写入时间每月一个文件,旧月份可单独分离或归档
+- session: 按会话ID哈希分桶,同一会话的读写只涉及一个文件
+- 分区目录(catalog.db)记录各分区的文件与状态(active / detached / archived)
+- 涉及多个分区的查询由线程池并行执行后合并;接口与FleetMemoryDB相同
+- 内容去重在分区内进行(month方案下跨月份的相同内容各保留一行)
+"""
+import heapq
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.config import (
+    FLEET_DB_PATH,
+    FLEET_DB_PARTITION,
+    FLEET_DB_PARTITION_DIR,
+    FLEET_DB_SESSION_BUCKETS,
+    FLEET_DB_ARCHIVE_DIR,
+    FLEET_DB_PARTITION_WORKERS,
+    FLEET_DB_BUSY_TIMEOUT,
+    FLEET_DB_MAINTENANCE_MAX_SECONDS,
+    FLEET_DB_MAINTENANCE_IO_MB,
+)
+from app.core.fleet_memory_db import FleetMemoryDB
+
+SCHEME_MONTH = "month"
+SCHEME_SESSION = "session"
+# 启用分区前的单文件数据库
+SCHEME_LEGACY = "legacy"
+
+STATE_ACTIVE = "active"
+STATE_DETACHED = "detached"
+STATE_ARCHIVED = "archived"
+
+
+class PartitionedFleetMemoryDB:
+    """
+    分区的Fleet记忆数据库
+
+    Args:
+        scheme: 新写入的分区方式(month / session)
+        partition_dir: 分区文件与分区目录所在目录
+        buckets: session分区的分桶数
+        legacy_path: 启用分区前的单文件数据库,存在时登记为legacy分区
+        archive_dir: 归档目录
+    """
+
+    MAX_STORAGE_BYTES = FleetMemoryDB.MAX_STORAGE_BYTES
+
+    encode_cursor = staticmethod(FleetMemoryDB.encode_cursor)
+    decode_cursor = staticmethod(FleetMemoryDB.decode_cursor)
+    decode_metadata = staticmethod(FleetMemoryDB.decode_metadata)
+
+    def __init__(
+        self,
+        scheme: str = FLEET_DB_PARTITION,
+        partition_dir: str = FLEET_DB_PARTITION_DIR,
+        buckets: int = FLEET_DB_SESSION_BUCKETS,
+        legacy_path: Optional[str] = FLEET_DB_PATH,
+        archive_dir: str = FLEET_DB_ARCHIVE_DIR
+    ):
+        if scheme not in (SCHEME_MONTH, SCHEME_SESSION):
+            raise ValueError(f"未知的分区方式: {scheme}")
+        self.scheme = scheme
+        self.buckets = buckets
+        self.partition_dir = Path(partition_dir)
+        self.partition_dir.mkdir(parents=True, exist_ok=True)
+        self.archive_dir = Path(archive_dir)
+
+        # 分区目录(所有线程共用一个连接,由_lock保护)
+        self._lock = threading.RLock()
+        self._catalog_conn = sqlite3.connect(
+            str(self.partition_dir / "catalog.db"),
+            timeout=FLEET_DB_BUSY_TIMEOUT,
+            check_same_thread=False
+        )
+        self._catalog_conn.row_factory = sqlite3.Row
+        self._catalog: Dict[str, Dict[str, Any]] = {}
+        # {分区名: 已打开的FleetMemoryDB}
+        self._open: Dict[str, FleetMemoryDB] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=FLEET_DB_PARTITION_WORKERS, thread_name_prefix="fleet-partition"
+        )
+
+        self._init_catalog()
+        if legacy_path and SCHEME_LEGACY not in self._catalog and os.path.exists(legacy_path):
+            self._register(SCHEME_LEGACY, legacy_path, SCHEME_LEGACY)
+
+        # 打开所有活动分区(存储用量与跨分区查询都需要)
+        for name in self._active_names():
+            self._db(name)
+        print(f"✅ Fleet记忆库分区: {scheme}, 活动分区{len(self._open)}个 ({self.partition_dir})")
+
+    # ==================== 分区目录 ====================
+
+    def _init_catalog(self):
+        with self._lock, self._catalog_conn:
+            self._catalog_conn.execute("""
+                CREATE TABLE IF NOT EXISTS partitions (
+                    name TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    scheme TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'active',
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            rows = self._catalog_conn.execute("SELECT * FROM partitions").fetchall()
+        self._catalog = {row["name"]: dict(row) for row in rows}
+
+    def _register(self, name: str, path: str, scheme: str) -> Dict[str, Any]:
+        now = datetime.now().isoformat()
+        entry = {
+            "name": name, "path": path, "scheme": scheme, "state": STATE_ACTIVE,
+            "created_at": now, "updated_at": now
+        }
+        with self._lock, self._catalog_conn:
+            self._catalog_conn.execute("""
+                INSERT OR IGNORE INTO partitions (name, path, scheme, state, created_at, updated_at)
+                VALUES (:name, :path, :scheme, :state, :created_at, :updated_at)
+            """, entry)
+            self._catalog.setdefault(name, entry)
+        return self._catalog[name]
+
+    def _set_state(self, name: str, state: str, path: Optional[str] = None):
+        entry = self._catalog[name]
+        with self._lock, self._catalog_conn:
+            entry["state"] = state
+            entry["path"] = path or entry["path"]
+            entry["updated_at"] = datetime.now().isoformat()
+            self._catalog_conn.execute(
+                "UPDATE partitions SET state = ?, path = ?, updated_at = ? WHERE name = ?",
+                (entry["state"], entry["path"], entry["updated_at"], name)
+            )
+
+    def _active_names(self) -> List[str]:
+        return sorted(name for name, entry in self._catalog.items() if entry["state"] == STATE_ACTIVE)
+
+    def _db(self, name: str) -> FleetMemoryDB:
+        """打开分区(首次访问时建立并初始化表结构)"""
+        db = self._open.get(name)
+        if db is None:
+            with self._lock:
+                db = self._open.get(name)
+                if db is None:
+                    db = self._open[name] = FleetMemoryDB(self._catalog[name]["path"])
+        return db
+
+    def _bucket_name(self, session_id: str) -> str:
+        # crc32在进程间稳定(内置hash()对字符串加了随机盐)
+        return f"bucket-{zlib.crc32(session_id.encode('utf-8')) % self.buckets:02d}"
+
+    def _write_partition(self, session_id: str, timestamp: Optional[str] = None) -> FleetMemoryDB:
+        """
+        记忆所属的分区(不存在时创建)
+        
+        Args:
+            session_id: 会话ID
+            timestamp: 记忆时间(ISO格式,导入历史记忆时按其月份分区),默认为当前时间
+        """
+        if self.scheme == SCHEME_MONTH:
+            name = timestamp[:7] if timestamp else datetime.now().strftime("%Y-%m")
+        else:
+            name = self._bucket_name(session_id)
+        entry = self._catalog.get(name)
+        if entry is None:
+            filename = "fleet_" + name.replace("-", "_") + ".db"
+            entry = self._register(name, str(self.partition_dir / filename), self.scheme)
+        if entry["state"] != STATE_ACTIVE:
+            raise RuntimeError(f"写入分区 {name} 已{entry['state']},请先重新挂载")
+        return self._db(name)
+
+    def _read_partitions(self, session_id: Optional[str] = None) -> List[FleetMemoryDB]:
+        """查询涉及的分区: 按会话分桶时只查该会话的分桶(以及非分桶的分区)"""
+        names = self._active_names()
+        if session_id is not None and self.scheme == SCHEME_SESSION:
+            bucket = self._bucket_name(session_id)
+            names = [n for n in names if n == bucket or self._catalog[n]["scheme"] != SCHEME_SESSION]
+        return [self._db(name) for name in names]
+
+    def _map(self, func: Callable[[FleetMemoryDB], Any], dbs: List[FleetMemoryDB]) -> List[Any]:
+        """在各分区上执行func,涉及多个分区时并行"""
+        if len(dbs) <= 1:
+            return [func(db) for db in dbs]
+        return list(self._executor.map(func, dbs))
+
+    def _locate(self, memory_id: str) -> Optional[FleetMemoryDB]:
+        """记忆所在的分区"""
+        dbs = self._read_partitions()
+        found = self._map(lambda db: db.get_memory(memory_id) is not None, dbs)
+        return next((db for db, hit in zip(dbs, found) if hit), None)
+
+    def _is_write_target(self, name: str) -> bool:
+        entry = self._catalog[name]
+        if entry["scheme"] == SCHEME_SESSION:
+            return self.scheme == SCHEME_SESSION
+        return entry["scheme"] == SCHEME_MONTH and name == datetime.now().strftime("%Y-%m")
+
+    def list_partitions(self) -> List[Dict[str, Any]]:
+        """分区列表(含已分离与已归档的)"""
+        result = []
+        for name in sorted(self._catalog):
+            entry = dict(self._catalog[name])
+            db = self._open.get(name)
+            entry["open"] = db is not None
+            entry["storage_size_bytes"] = db.get_storage_size() if db is not None else (
+                os.path.getsize(entry["path"]) if os.path.exists(entry["path"]) else 0
+            )
+            result.append(entry)
+        return result
+
+    def detach_partition(self, name: str) -> Dict[str, Any]:
+        """
+        分离分区: 写完队列并关闭连接,之后的查询不再包含该分区(文件保留,可重新挂载)
+
+        Raises:
+            KeyError: 分区不存在
+            ValueError: 分区正在接收写入(当月分区或会话分桶)
+        """
+        if name not in self._catalog:
+            raise KeyError(f"分区不存在: {name}")
+        if self._is_write_target(name):
+            raise ValueError(f"分区 {name} 正在接收写入,不能分离")
+        with self._lock:
+            db = self._open.pop(name, None)
+            if db is not None:
+                db.close()
+            if self._catalog[name]["state"] == STATE_ACTIVE:
+                self._set_state(name, STATE_DETACHED)
+        print(f"📦 Fleet记忆分区已分离: {name}")
+        return dict(self._catalog[name])
+
+    def attach_partition(self, name: str) -> Dict[str, Any]:
+        """
+        重新挂载已分离或已归档的分区(归档的分区在归档目录中原地打开)
+
+        Raises:
+            KeyError: 分区不存在
+            FileNotFoundError: 分区文件已不存在
+        """
+        if name not in self._catalog:
+            raise KeyError(f"分区不存在: {name}")
+        path = self._catalog[name]["path"]
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"分区文件不存在: {path}")
+        with self._lock:
+            self._set_state(name, STATE_ACTIVE)
+            self._db(name)
+        print(f"📦 Fleet记忆分区已挂载: {name}")
+        return dict(self._catalog[name])
+
+    def archive_partition(self, name: str) -> Dict[str, Any]:
+        """
+        归档分区: 分离后以VACUUM INTO压实为单个文件(不含WAL)移入归档目录,删除原文件
+
+        Raises:
+            KeyError: 分区不存在
+            ValueError: 分区正在接收写入,或已归档
+        """
+        if name not in self._catalog:
+            raise KeyError(f"分区不存在: {name}")
+        if self._catalog[name]["state"] == STATE_ARCHIVED:
+            raise ValueError(f"分区 {name} 已归档")
+        self.detach_partition(name)
+
+        source = self._catalog[name]["path"]
+        target = self.archive_dir / Path(source).name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if target.exists():
+            target.unlink()
+        started = time.perf_counter()
+        conn = sqlite3.connect(source, timeout=FLEET_DB_BUSY_TIMEOUT)
+        try:
+            conn.execute("VACUUM INTO ?", (str(target),))
+        finally:
+            conn.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(source + suffix):
+                os.remove(source + suffix)
+        self._set_state(name, STATE_ARCHIVED, str(target))
+        print(f"📦 Fleet记忆分区已归档: {name} → {target} ({time.perf_counter() - started:.1f}s)")
+        return dict(self._catalog[name])
+
+    # ==================== 写入与生命周期 ====================
+
+    def add_memory(
+        self,
+        session_id: str,
+        content: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        memory_id: Optional[str] = None,
+        durable: bool = False
+    ) -> str:
+        """添加记忆(写入当月分区或会话所在分桶),参数与返回值同FleetMemoryDB.add_memory"""
+        if self.is_storage_full():
+            raise Exception(
+                f"Fleet记忆库存储已满! "
+                f"当前大小: {self._storage_bytes() / 1024 / 1024 / 1024:.2f}GB, "
+                f"限制: {self.MAX_STORAGE_BYTES / 1024 / 1024 / 1024:.0f}GB. "
+                f"请同步到Fleet API后删除本地数据。"
+            )
+        return self._write_partition(session_id).add_memory(
+            session_id, content, metadata=metadata, memory_id=memory_id, durable=durable
+        )
+
+    def bulk_import(self, rows: List[tuple], replace: bool = False) -> int:
+        """
+        批量写入(按各条记忆的时间或会话分组写入对应分区),参数与返回值同FleetMemoryDB.bulk_import
+        
+        id只在分区内去重
+        """
+        if self.is_storage_full():
+            raise Exception(f"Fleet记忆库存储已满 ({self._storage_bytes() / 1024 / 1024 / 1024:.2f}GB)")
+        groups: Dict[int, List[tuple]] = {}
+        targets: Dict[int, FleetMemoryDB] = {}
+        for row in rows:
+            db = self._write_partition(row[1], row[4])
+            groups.setdefault(id(db), []).append(row)
+            targets[id(db)] = db
+        return sum(targets[key].bulk_import(group, replace=replace) for key, group in groups.items())
+
+    def flush(self, timeout: Optional[float] = FLEET_DB_BUSY_TIMEOUT) -> bool:
+        """等待各分区已入队的写入全部提交"""
+        return all([db.flush(timeout) for db in list(self._open.values())])
+
+    def close(self):
+        """关闭所有分区(关闭服务时调用)"""
+        with self._lock:
+            for db in self._open.values():
+                db.close()
+            self._open.clear()
+
+    # ==================== 查询 ====================
+
+    def get_memory(self, memory_id: str) -> Optional[Dict[str, Any]]:
+        found = self._map(lambda db: db.get_memory(memory_id), self._read_partitions())
+        return next((memory for memory in found if memory is not None), None)
+
+    def get_synced_hash(self, session_id: str, content: str) -> Optional[Dict[str, Any]]:
+        found = self._map(lambda db: db.get_synced_hash(session_id, content), self._read_partitions(session_id))
+        return next((record for record in found if record is not None), None)
+
+    def _fetch_merged(
+        self,
+        limit: int,
+        after=None,
+        session_id: Optional[str] = None,
+        offset: int = 0,
+        decode_metadata: bool = True
+    ) -> List[Dict[str, Any]]:
+        """各分区取前limit+offset条,按(timestamp, id)倒序归并"""
+        def fetch(db: FleetMemoryDB):
+            db.flush()
+            rows = db._fetch_page(limit + offset, after=after, session_id=session_id)
+            return [db._row_to_dict(row, decode_metadata) for row in rows]
+
+        pages = self._map(fetch, self._read_partitions(session_id))
+        merged = heapq.merge(*pages, key=lambda m: (m["timestamp"], m["id"]), reverse=True)
+        return list(merged)[offset:offset + limit]
+
+    def list_memories_page(
+        self,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        session_id: Optional[str] = None,
+        decode_metadata: bool = True
+    ) -> Dict[str, Any]:
+        """键集分页列出记忆(跨分区归并),参数与返回值同FleetMemoryDB.list_memories_page"""
+        after = self.decode_cursor(cursor) if cursor else None
+        items = self._fetch_merged(limit, after=after, session_id=session_id, decode_metadata=decode_metadata)
+        next_cursor = None
+        if len(items) == limit:
+            next_cursor = self.encode_cursor(items[-1]["timestamp"], items[-1]["id"])
+        return {"items": items, "next_cursor": next_cursor}
+
+    def iter_memories(
+        self,
+        session_id: Optional[str] = None,
+        chunk_size: int = 1000,
+        cursor: Optional[str] = None,
+        decode_metadata: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """流式遍历记忆(最新在前),各分区分块读取后归并"""
+        streams = [
+            db.iter_memories(session_id=session_id, chunk_size=chunk_size, cursor=cursor, decode_metadata=decode_metadata)
+            for db in self._read_partitions(session_id)
+        ]
+        return heapq.merge(*streams, key=lambda m: (m["timestamp"], m["id"]), reverse=True)
+
+    def get_session_memories(self, session_id: str, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        return self._fetch_merged(limit, session_id=session_id, offset=offset)
+
+    def list_all_memories(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        return self._fetch_merged(limit, offset=offset)
+
+    def search_memories(self, query: str, session_id: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        全文检索(各分区分别按BM25排序后合并)
+
+        BM25的词频统计按分区计算,不同分区的得分只是近似可比
+        """
+        found = self._map(
+            lambda db: db.search_memories(query, session_id=session_id, limit=limit),
+            self._read_partitions(session_id)
+        )
+        results = [memory for memories in found for memory in memories]
+        if any(memory["score"] is None for memory in results):
+            # 短词子串匹配没有相关度,按时间倒序
+            results.sort(key=lambda m: m["timestamp"], reverse=True)
+        else:
+            results.sort(key=lambda m: m["score"], reverse=True)
+        return results[:limit]
+
+    @property
+    def vectors_enabled(self) -> bool:
+        dbs = list(self._open.values())
+        return bool(dbs) and all(db.vectors is not None for db in dbs)
+
+    def semantic_search(self, query: str, session_id: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        语义检索(各分区的余弦相似度可直接比较)
+
+        Raises:
+            RuntimeError: 向量索引未启用
+        """
+        if not self.vectors_enabled:
+            raise RuntimeError("向量索引未启用")
+        found = self._map(
+            lambda db: db.semantic_search(query, session_id=session_id, limit=limit),
+            self._read_partitions(session_id)
+        )
+        results = [memory for memories in found for memory in memories]
+        results.sort(key=lambda m: m["score"], reverse=True)
+        return results[:limit]
+
+    def hybrid_search(
+        self,
+        query: str,
+        session_id: Optional[str] = None,
+        limit: int = 10,
+        rrf_k: int = 60
+    ) -> List[Dict[str, Any]]:
+        """关键词与语义混合检索,先各自跨分区合并再做RRF融合"""
+        keyword = self.search_memories(query, session_id=session_id, limit=limit * 4)
+        if not self.vectors_enabled:
+            return keyword[:limit]
+        semantic = self.semantic_search(query, session_id=session_id, limit=limit * 4)
+        return FleetMemoryDB.fuse_rankings(keyword, semantic, limit, rrf_k)
+
+    def get_unsynced_memories(self, limit: int = 100, after: Optional[Tuple[str, str]] = None) -> List[Dict[str, Any]]:
+        """未同步的记忆(按(timestamp, id)升序)"""
+        found = self._map(lambda db: db.get_unsynced_memories(limit=limit, after=after), self._read_partitions())
+        return list(heapq.merge(*found, key=lambda m: (m["timestamp"], m["id"])))[:limit]
+
+    def get_unsynced_count(self) -> int:
+        return sum(self._map(lambda db: db.get_unsynced_count(), self._read_partitions()))
+
+    def acknowledge_synced(self, acks: List[Tuple[str, str]], delete: bool = True) -> int:
+        """在各分区中确认一批已同步的记忆(每个分区一个事务,不在该分区的ID不计)"""
+        if not acks:
+            return 0
+        return sum(self._map(lambda db: db.acknowledge_synced(acks, delete=delete), self._read_partitions()))
+
+    def mark_as_synced(self, memory_id: str, fleet_memory_id: str):
+        db = self._locate(memory_id)
+        if db is not None:
+            db.mark_as_synced(memory_id, fleet_memory_id)
+
+    def delete_memory(self, memory_id: str) -> bool:
+        db = self._locate(memory_id)
+        return db.delete_memory(memory_id) if db is not None else False
+
+    def get_session_memory_count(self, session_id: str) -> int:
+        return sum(self._map(lambda db: db.get_session_memory_count(session_id), self._read_partitions(session_id)))
+
+    # ==================== 存储与统计 ====================
+
+    def _storage_bytes(self) -> int:
+        return sum(db._storage_bytes for db in list(self._open.values()))
+
+    def get_storage_size(self) -> int:
+        """活动分区的磁盘占用之和"""
+        return sum(db.get_storage_size() for db in list(self._open.values()))
+
+    def is_storage_full(self) -> bool:
+        return self._storage_bytes() >= self.MAX_STORAGE_BYTES
+
+    def get_storage_usage_percent(self) -> float:
+        return (self._storage_bytes() / self.MAX_STORAGE_BYTES) * 100
+
+    def _count_sessions(self, names: List[str], dbs: List[FleetMemoryDB], stats: List[Dict[str, Any]]) -> int:
+        if all(self._catalog[name]["scheme"] == SCHEME_SESSION for name in names):
+            # 分桶之间会话不重叠
+            return sum(s["total_sessions"] for s in stats)
+        # 按月分区时同一会话可能跨多个分区
+        session_sets = self._map(
+            lambda db: {row[0] for row in db._conn().execute("SELECT session_id FROM memory_session_counts")},
+            dbs
+        )
+        return len(set().union(*session_sets))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各分区统计的汇总,partitions中为各分区的明细"""
+        names = self._active_names()
+        dbs = [self._db(name) for name in names]
+        stats = self._map(lambda db: db.get_stats(), dbs)
+
+        total_count = sum(s["total_memories"] for s in stats)
+        synced_count = sum(s["synced_memories"] for s in stats)
+        latest = max((s["latest_memory_timestamp"] for s in stats if s["latest_memory_timestamp"]), default=None)
+        storage_size = sum(s["storage_size_bytes"] for s in stats)
+        write_keys = ("queued", "group_commits", "rows_committed", "write_errors")
+
+        return {
+            "total_memories": total_count,
+            "synced_memories": synced_count,
+            "unsynced_memories": total_count - synced_count,
+            "total_sessions": self._count_sessions(names, dbs, stats),
+            "latest_memory_timestamp": latest,
+            "sync_rate": f"{synced_count / total_count * 100:.1f}%" if total_count > 0 else "0%",
+            "storage_size_bytes": storage_size,
+            "storage_size_mb": round(storage_size / 1024 / 1024, 2),
+            "storage_size_gb": round(storage_size / 1024 / 1024 / 1024, 2),
+            "storage_limit_gb": 500,
+            "storage_usage_percent": round(self.get_storage_usage_percent(), 2),
+            "storage_is_full": self.is_storage_full(),
+            "write_queue": {key: sum(s["write_queue"][key] for s in stats) for key in write_keys},
+            "partition_scheme": self.scheme,
+            "partitions": [
+                {
+                    "name": name,
+                    "path": self._catalog[name]["path"],
+                    "total_memories": s["total_memories"],
+                    "unsynced_memories": s["unsynced_memories"],
+                    "storage_size_bytes": s["storage_size_bytes"],
+                    "latest_memory_timestamp": s["latest_memory_timestamp"],
+                    "storage": s["storage"],
+                    "vector_index": s["vector_index"]
+                }
+                for name, s in zip(names, stats)
+            ],
+            "inactive_partitions": [name for name in sorted(self._catalog) if name not in names]
+        }
+
+    def get_write_stats(self) -> Dict[str, Any]:
+        return {name: db.get_write_stats() for name, db in list(self._open.items())}
+
+    def get_connection_stats(self) -> Dict[str, Any]:
+        return {name: db.get_connection_stats() for name, db in list(self._open.items())}
+
+    def reconcile_stats(self) -> Dict[str, Any]:
+        """逐个分区校准统计计数"""
+        started = time.perf_counter()
+        results = self._map(lambda db: db.reconcile_stats(), self._read_partitions())
+        return {
+            "total_memories": sum(r["total_memories"] for r in results),
+            "drift": {
+                key: sum(r["drift"][key] for r in results) for key in ("total", "synced", "sessions")
+            },
+            "partitions": len(results),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def deduplicate(self, max_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """逐个分区执行去重迁移(并行),返回合计结果"""
+        results = self._map(lambda db: db.deduplicate(max_seconds=max_seconds), self._read_partitions())
+        return {
+            "processed": sum(r["processed"] for r in results),
+            "merged": sum(r["merged"] for r in results),
+            "completed": all(r["completed"] for r in results),
+            "partitions": len(results)
+        }
+
+    def run_maintenance(
+        self,
+        max_seconds: float = FLEET_DB_MAINTENANCE_MAX_SECONDS,
+        io_mb_per_sec: float = FLEET_DB_MAINTENANCE_IO_MB,
+        full_vacuum: bool = False
+    ) -> Dict[str, Any]:
+        """
+        逐个分区整理(依次执行,共用时间与I/O预算)
+
+        Raises:
+            RuntimeError: 已有整理任务在运行
+        """
+        started = time.monotonic()
+        results: Dict[str, Dict[str, Any]] = {}
+        for name in self._active_names():
+            remaining = max_seconds - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            results[name] = self._db(name).run_maintenance(
+                max_seconds=remaining, io_mb_per_sec=io_mb_per_sec, full_vacuum=full_vacuum
+            )
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "duration_seconds": round(time.monotonic() - started, 2),
+            "dedup_rows": sum(r["dedup_rows"] for r in results.values()),
+            "dedup_merged": sum(r["dedup_merged"] for r in results.values()),
+            "cold_rows": sum(r["cold_rows"] for r in results.values()),
+            "cold_bytes_saved": sum(r["cold_bytes_saved"] for r in results.values()),
+            "synced_hashes_pruned": sum(r["synced_hashes_pruned"] for r in results.values()),
+            "vacuumed_pages": sum(r["vacuumed_pages"] for r in results.values()),
+            "completed": len(results) == len(self._active_names()) and all(r["completed"] for r in results.values()),
+            "partitions": results
+        }
@@ -0,0 +1,104 @@
+"""
+LLM调用指标
+以LangChain回调的形式挂载到ChatOpenAI上,记录首token延迟(TTFT)、解码速度与token用量
+"""
+import time
+from typing import Any, Dict, List
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.core.run_context import push_activity, pop_activity
+from app.core.metrics import (
+    llm_requests_total,
+    llm_ttft_seconds,
+    llm_request_duration_seconds,
+    llm_tokens_per_second,
+    llm_tokens_total,
+)
+
+
+def usage_from_result(response: Any) -> Dict[str, int]:
+    """从LLMResult中提取token用量(兼容usage_metadata与OpenAI的token_usage)"""
+    try:
+        message = response.generations[0][0].message
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            return {
+                "input": usage.get("input_tokens", 0),
+                "output": usage.get("output_tokens", 0)
+            }
+    except (AttributeError, IndexError, TypeError):
+        pass
+
+    token_usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+    return {
+        "input": token_usage.get("prompt_tokens", 0),
+        "output": token_usage.get("completion_tokens", 0)
+    }
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    LLM指标回调
+
+    流式调用(stream/astream_events)时记录TTFT,解码速度按首token之后的时长计算;
+    非流式调用只能按总耗时估算解码速度
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        # {run_id: [start_time, first_token_time, streamed_chunks, activity]}
+        self._runs: Dict[UUID, List[Any]] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(serialized, run_id)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(serialized, run_id)
+
+    def _start(self, serialized: Dict[str, Any], run_id: UUID):
+        # 登记到执行线程的活动栈(供事件循环看门狗标注)
+        name = ((serialized or {}).get("kwargs") or {}).get("model_name") or (serialized or {}).get("name") or "llm"
+        self._runs[run_id] = [time.perf_counter(), None, 0, push_activity("llm", name)]
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        if run[1] is None:
+            run[1] = time.perf_counter()
+            llm_ttft_seconds.observe(run[1] - run[0])
+        run[2] += 1
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        started_at, first_token_at, chunks, activity = run
+        pop_activity(activity)
+        now = time.perf_counter()
+        llm_requests_total.labels(status="ok").inc()
+        llm_request_duration_seconds.observe(now - started_at)
+
+        usage = usage_from_result(response)
+        output_tokens = usage["output"] or chunks
+        if usage["input"]:
+            llm_tokens_total.labels(kind="input").inc(usage["input"])
+        if output_tokens:
+            llm_tokens_total.labels(kind="output").inc(output_tokens)
+            decode_seconds = now - (first_token_at or started_at)
+            if decode_seconds > 0:
+                llm_tokens_per_second.observe(output_tokens / decode_seconds)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        llm_requests_total.labels(status="error").inc()
+        if run is not None:
+            pop_activity(run[3])
+            llm_request_duration_seconds.observe(time.perf_counter() - run[0])
+
+
+# 全局LLM指标回调
+llm_metrics_callback = LLMMetricsCallback()
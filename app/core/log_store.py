@@ -0,0 +1,365 @@
+"""
+持久化日志存储
+把应用日志异步写入本地SQLite,支持按时间、级别、来源、thread_id检索
+
+- 发送端: logging.handlers.QueueHandler,只做入队,不阻塞业务线程
+- 写入端: 后台线程批量落盘(一次事务写入一批),并定期执行保留策略
+- 查询端: 生成器分块读取,配合StreamingResponse按需输出,内存占用恒定
+"""
+import logging
+import logging.handlers
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from app.config import (
+    LOG_STORE_PATH,
+    LOG_STORE_RETENTION_DAYS,
+    LOG_STORE_MAX_ROWS,
+)
+from app.core.run_context import current_thread_id, current_run_id
+
+
+class RunContextFilter(logging.Filter):
+    """在发出日志的线程中补充thread_id/run_id(已通过extra指定时保持不变)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "thread_id", None) is None:
+            record.thread_id = current_thread_id.get()
+        if getattr(record, "run_id", None) is None:
+            record.run_id = current_run_id.get()
+        return True
+
+
+class LogStore:
+    """SQLite日志存储"""
+
+    # 每批最多写入的记录数
+    BATCH_SIZE = 500
+    # 批次最长等待时间(秒)
+    BATCH_INTERVAL = 0.5
+    # 保留策略执行间隔(秒)
+    RETENTION_INTERVAL = 600
+    # 单次保留策略最多删除的行数(分批删除,避免长时间持有写锁)
+    RETENTION_CHUNK = 50000
+    # 查询时每次从数据库读取的行数
+    QUERY_CHUNK = 500
+
+    def __init__(
+        self,
+        db_path: Union[str, Path] = LOG_STORE_PATH,
+        retention_days: float = LOG_STORE_RETENTION_DAYS,
+        max_rows: int = LOG_STORE_MAX_ROWS
+    ):
+        self.db_path = str(db_path)
+        self.retention_days = retention_days
+        self.max_rows = max_rows
+
+        self.queue: queue.Queue = queue.Queue(maxsize=100000)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_retention = 0.0
+
+        # 统计
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._init_database()
+
+    # ==================== 连接与表结构 ====================
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_database(self):
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                level TEXT NOT NULL,
+                level_no INTEGER NOT NULL,
+                source TEXT,
+                thread_id TEXT,
+                run_id TEXT,
+                message TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_logs_ts ON logs(ts);
+            CREATE INDEX IF NOT EXISTS idx_logs_level_ts ON logs(level_no, ts);
+            CREATE INDEX IF NOT EXISTS idx_logs_source_ts ON logs(source, ts);
+            CREATE INDEX IF NOT EXISTS idx_logs_thread_ts ON logs(thread_id, ts);
+        """)
+        conn.commit()
+        conn.close()
+
+    # ==================== 写入 ====================
+
+    def create_handler(self) -> logging.Handler:
+        """创建供logger挂载的QueueHandler(只入队,不做IO)"""
+        handler = _NonBlockingQueueHandler(self)
+        handler.addFilter(RunContextFilter())
+        return handler
+
+    def start(self):
+        """启动后台写入线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._writer_loop, name="log-store-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """停止写入线程(退出前写完队列中剩余的日志)"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _writer_loop(self):
+        conn = self._connect()
+        try:
+            while not (self._stop.is_set() and self.queue.empty()):
+                batch = self._next_batch()
+                if batch:
+                    self._write_batch(conn, batch)
+                if time.time() - self._last_retention >= self.RETENTION_INTERVAL:
+                    self._apply_retention(conn)
+        finally:
+            conn.close()
+
+    def _next_batch(self) -> List[logging.LogRecord]:
+        """收集一批记录: 攒满BATCH_SIZE或等待满BATCH_INTERVAL即返回"""
+        batch: List[logging.LogRecord] = []
+        deadline = time.monotonic() + self.BATCH_INTERVAL
+        while len(batch) < self.BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[logging.LogRecord]):
+        rows = [
+            (
+                record.created,
+                record.levelname,
+                record.levelno,
+                record.name,
+                getattr(record, "thread_id", None),
+                getattr(record, "run_id", None),
+                record.getMessage()
+            )
+            for record in batch
+        ]
+        try:
+            conn.executemany(
+                "INSERT INTO logs (ts, level, level_no, source, thread_id, run_id, message) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.commit()
+            self.written += len(rows)
+        except sqlite3.Error:
+            self.write_errors += 1
+            conn.rollback()
+
+    def _apply_retention(self, conn: sqlite3.Connection):
+        """按保留天数与最大行数清理旧日志"""
+        self._last_retention = time.time()
+        try:
+            if self.retention_days:
+                cutoff = time.time() - self.retention_days * 86400
+                conn.execute(
+                    "DELETE FROM logs WHERE id IN (SELECT id FROM logs WHERE ts < ? LIMIT ?)",
+                    (cutoff, self.RETENTION_CHUNK)
+                )
+            if self.max_rows:
+                row = conn.execute("SELECT MIN(id), MAX(id) FROM logs").fetchone()
+                if row[0] is not None and row[1] - row[0] + 1 > self.max_rows:
+                    # id自增连续(仅头部被删除),用id区间近似行数,避免COUNT(*)全表扫描
+                    conn.execute(
+                        "DELETE FROM logs WHERE id < ? AND id < ?",
+                        (row[1] - self.max_rows + 1, row[0] + self.RETENTION_CHUNK)
+                    )
+            conn.commit()
+        except sqlite3.Error:
+            self.write_errors += 1
+            conn.rollback()
+
+    # ==================== 查询 ====================
+
+    def query(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        level: Optional[List[str]] = None,
+        min_level_no: Optional[int] = None,
+        source: Optional[str] = None,
+        thread_id: Optional[str] = None,
+        run_id: Optional[str] = None,
+        contains: Optional[str] = None,
+        limit: Optional[int] = 1000,
+        newest_first: bool = True
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        检索日志(生成器,分块读取)
+
+        Args:
+            start/end: 时间范围(Unix时间戳)
+            level: 精确匹配的级别列表
+            min_level_no: 最低级别数值(logging.WARNING等)
+            source: 来源前缀
+            thread_id/run_id: 精确匹配
+            contains: 消息包含的子串
+            limit: 最多返回条数(None表示不限)
+            newest_first: 是否按时间倒序
+        """
+        conditions = []
+        params: List[Any] = []
+        if start is not None:
+            conditions.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("ts <= ?")
+            params.append(end)
+        if level:
+            conditions.append(f"level IN ({','.join('?' * len(level))})")
+            params.extend(lvl.upper() for lvl in level)
+        if min_level_no:
+            conditions.append("level_no >= ?")
+            params.append(min_level_no)
+        if source:
+            # 前缀匹配,可利用(source, ts)索引
+            conditions.append("source >= ? AND source < ?")
+            params.extend([source, source + "\uffff"])
+        if thread_id:
+            conditions.append("thread_id = ?")
+            params.append(thread_id)
+        if run_id:
+            conditions.append("run_id = ?")
+            params.append(run_id)
+        if contains:
+            conditions.append("instr(message, ?) > 0")
+            params.append(contains)
+
+        order = "DESC" if newest_first else "ASC"
+        cursor_op = "<" if newest_first else ">"
+
+        # 每块使用独立的短连接并在产出前关闭: 生成器的各次迭代可能在不同线程中执行
+        # (Starlette在线程池中迭代同步生成器),连接不能跨越yield
+        remaining = limit
+        last_key = None
+        while remaining is None or remaining > 0:
+            chunk = self.QUERY_CHUNK if remaining is None else min(self.QUERY_CHUNK, remaining)
+            where = list(conditions)
+            chunk_params = list(params)
+            if last_key is not None:
+                # 按(ts, id)做键集分页
+                where.append(f"(ts, id) {cursor_op} (?, ?)")
+                chunk_params.extend(last_key)
+            sql = (
+                "SELECT id, ts, level, source, thread_id, run_id, message FROM logs"
+                + (f" WHERE {' AND '.join(where)}" if where else "")
+                + f" ORDER BY ts {order}, id {order} LIMIT ?"
+            )
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=10)
+            try:
+                rows = conn.execute(sql, chunk_params + [chunk]).fetchall()
+            finally:
+                conn.close()
+            if not rows:
+                break
+            for row in rows:
+                yield {
+                    "id": row[0],
+                    "timestamp": datetime.fromtimestamp(row[1]).isoformat(),
+                    "level": row[2],
+                    "source": row[3],
+                    "thread_id": row[4],
+                    "run_id": row[5],
+                    "message": row[6]
+                }
+            last_key = (rows[-1][1], rows[-1][0])
+            if remaining is not None:
+                remaining -= len(rows)
+            if len(rows) < chunk:
+                break
+
+    def get_stats(self) -> Dict[str, Any]:
+        """存储统计"""
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=10)
+        try:
+            row = conn.execute("SELECT MIN(id), MAX(id), MIN(ts), MAX(ts) FROM logs").fetchone()
+        finally:
+            conn.close()
+
+        size = 0
+        for suffix in ("", "-wal", "-shm"):
+            path = Path(self.db_path + suffix)
+            if path.exists():
+                size += path.stat().st_size
+
+        return {
+            "db_path": self.db_path,
+            "approx_rows": (row[1] - row[0] + 1) if row[0] is not None else 0,
+            "oldest": datetime.fromtimestamp(row[2]).isoformat() if row[2] else None,
+            "newest": datetime.fromtimestamp(row[3]).isoformat() if row[3] else None,
+            "size_mb": round(size / 1024 / 1024, 2),
+            "retention_days": self.retention_days,
+            "max_rows": self.max_rows,
+            "queue_depth": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+            "writer_running": self._thread is not None and self._thread.is_alive()
+        }
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志并计数,而不是阻塞业务线程"""
+
+    def __init__(self, store: LogStore):
+        super().__init__(store.queue)
+        self.store = store
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.store.dropped += 1
+
+
+# 全局日志存储
+log_store = LogStore()
+
+_installed = False
+
+
+def install_log_store():
+    """把root logger与stdout logger接入持久化存储并启动写入线程(幂等)"""
+    global _installed
+    if _installed:
+        return
+
+    handler = log_store.create_handler()
+    logging.getLogger().addHandler(handler)
+
+    # stdout logger不向root传播,需要单独挂载
+    stdout_logger = logging.getLogger("stdout")
+    if not stdout_logger.propagate:
+        stdout_logger.addHandler(handler)
+
+    log_store.start()
+    _installed = True
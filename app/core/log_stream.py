@@ -0,0 +1,288 @@
+"""
+日志流模块
+把Python logging与print输出汇入带序号的环形缓冲区,并以事件通知的方式唤醒订阅者
+
+- LogRingBuffer: 带单调递增序号的环形缓冲区,订阅者按序号续传,缓冲区写满后依然能发现新日志
+- RingBufferHandler: logging.Handler,把日志记录写入环形缓冲区
+- StdoutCapture: 包装sys.stdout,把print输出按行转为日志记录(源为"stdout")
+"""
+import asyncio
+import logging
+import sys
+import threading
+from collections import deque
+from itertools import islice
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.config import LOG_BUFFER_SIZE, LOG_FORMAT, LOG_LEVEL
+
+
+# 日志级别排序(用于min_level过滤)
+LEVEL_ORDER = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL,
+}
+
+
+class LogFilter:
+    """
+    服务端日志过滤条件
+
+    Args:
+        levels: 精确匹配的级别列表(如 ["ERROR", "WARNING"])
+        min_level: 最低级别(如 "WARNING" 表示WARNING及以上)
+        source: 来源前缀(如 "app.api" 匹配 "app.api.chat")
+    """
+
+    def __init__(
+        self,
+        levels: Optional[Iterable[str]] = None,
+        min_level: Optional[str] = None,
+        source: Optional[str] = None
+    ):
+        self.levels = {lvl.strip().upper() for lvl in levels if lvl.strip()} if levels else None
+        self.min_level_no = LEVEL_ORDER.get(min_level.upper(), 0) if min_level else 0
+        self.source = source or None
+
+    def match(self, entry: Dict[str, Any]) -> bool:
+        level = entry.get("level", "")
+        if self.levels and level not in self.levels:
+            return False
+        if self.min_level_no and LEVEL_ORDER.get(level, 0) < self.min_level_no:
+            return False
+        if self.source and not (entry.get("source") or "").startswith(self.source):
+            return False
+        return True
+
+
+class LogRingBuffer:
+    """带序号的日志环形缓冲区(线程安全)"""
+
+    def __init__(self, maxlen: int = LOG_BUFFER_SIZE):
+        self._entries: deque = deque(maxlen=maxlen)
+        self._seq = 0
+        self._lock = threading.Lock()
+        # 订阅者 {(event_loop, asyncio.Event)}
+        self._waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    @property
+    def maxlen(self) -> int:
+        return self._entries.maxlen
+
+    @property
+    def last_seq(self) -> int:
+        """最新一条日志的序号(没有日志时为0)"""
+        return self._seq
+
+    @property
+    def first_seq(self) -> int:
+        """缓冲区中最早一条日志的序号(没有日志时为last_seq+1)"""
+        with self._lock:
+            return self._entries[0]["seq"] if self._entries else self._seq + 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def append(
+        self,
+        level: str,
+        message: str,
+        source: str = "system",
+        timestamp: Optional[str] = None,
+        **extra: Any
+    ) -> Dict[str, Any]:
+        """追加一条日志并通知订阅者"""
+        with self._lock:
+            self._seq += 1
+            entry = {
+                "seq": self._seq,
+                "timestamp": timestamp or datetime.now().isoformat(),
+                "level": level,
+                "message": message,
+                "source": source,
+            }
+            if extra:
+                entry.update(extra)
+            self._entries.append(entry)
+            waiters = list(self._waiters)
+
+        for loop, event in waiters:
+            if not event.is_set():
+                try:
+                    loop.call_soon_threadsafe(event.set)
+                except RuntimeError:
+                    # 事件循环已关闭
+                    self._waiters.discard((loop, event))
+        return entry
+
+    def since(
+        self,
+        after_seq: int,
+        log_filter: Optional[LogFilter] = None,
+        limit: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], int, int]:
+        """
+        获取序号大于after_seq的日志
+
+        Returns:
+            (日志列表, 因缓冲区覆盖而丢失的条数, 本次读取覆盖到的最大序号)
+            订阅者应以第三项作为下次调用的after_seq,过滤掉的日志不会被重复读取
+        """
+        with self._lock:
+            last_seq = self._seq
+            if not self._entries or after_seq >= last_seq:
+                return [], 0, last_seq
+            first = self._entries[0]["seq"]
+            missed = max(0, first - after_seq - 1)
+            # 序号连续,可直接按偏移切片
+            start = max(0, after_seq - first + 1)
+            entries = list(islice(self._entries, start, None))
+
+        if log_filter is not None:
+            entries = [e for e in entries if log_filter.match(e)]
+        if limit is not None:
+            entries = entries[-limit:]
+        return entries, missed, last_seq
+
+    def recent(self, limit: int = 100, log_filter: Optional[LogFilter] = None) -> List[Dict[str, Any]]:
+        """获取最近的日志(先过滤再截取)"""
+        with self._lock:
+            entries = list(self._entries)
+        if log_filter is not None:
+            entries = [e for e in entries if log_filter.match(e)]
+        return entries[-limit:] if limit else entries
+
+    def clear(self):
+        """清空缓冲区(序号继续递增,不会回退)"""
+        with self._lock:
+            self._entries.clear()
+
+    def subscribe(self) -> asyncio.Event:
+        """在当前事件循环中注册一个订阅者,有新日志时该Event会被置位"""
+        event = asyncio.Event()
+        self._waiters.add((asyncio.get_running_loop(), event))
+        return event
+
+    def unsubscribe(self, event: asyncio.Event):
+        """注销订阅者"""
+        for waiter in [w for w in self._waiters if w[1] is event]:
+            self._waiters.discard(waiter)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._waiters)
+
+
+class RingBufferHandler(logging.Handler):
+    """把logging记录写入环形缓冲区"""
+
+    def __init__(self, buffer: LogRingBuffer, level: int = logging.NOTSET):
+        super().__init__(level)
+        self.buffer = buffer
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            message = record.getMessage()
+            if record.exc_info:
+                message = f"{message}\n{logging.Formatter().formatException(record.exc_info)}"
+            self.buffer.append(
+                record.levelname,
+                message,
+                source=record.name,
+                timestamp=datetime.fromtimestamp(record.created).isoformat()
+            )
+        except Exception:
+            self.handleError(record)
+
+
+class StdoutCapture:
+    """
+    sys.stdout包装器
+
+    原样输出到真实stdout的同时,把完整的行转为"stdout"日志记录;
+    根据项目中print的惯用前缀推断级别(❌/ERROR → ERROR, ⚠️ → WARNING)
+    """
+
+    def __init__(self, stream, logger_name: str = "stdout"):
+        self._stream = stream
+        self._logger = logging.getLogger(logger_name)
+        # 每个线程各自的busy标记与未完成的行(不同线程的print不会拼到同一行)
+        self._local = threading.local()
+
+    def write(self, data: str) -> int:
+        written = self._stream.write(data)
+        if getattr(self._local, "busy", False):
+            # 日志处理器自身向stdout输出时不再回灌,避免递归
+            return written
+
+        self._local.busy = True
+        try:
+            lines = (getattr(self._local, "partial", "") + data).split("\n")
+            self._local.partial = lines.pop()
+            for line in lines:
+                if line.strip():
+                    self._logger.log(self._guess_level(line), line)
+        finally:
+            self._local.busy = False
+        return written
+
+    def flush(self):
+        self._stream.flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self._stream, name)
+
+    @staticmethod
+    def _guess_level(line: str) -> int:
+        stripped = line.lstrip()
+        if stripped.startswith(("❌", "ERROR")):
+            return logging.ERROR
+        if stripped.startswith(("⚠", "WARNING")):
+            return logging.WARNING
+        return logging.INFO
+
+
+# 全局日志缓冲区
+log_ring = LogRingBuffer()
+
+_installed = False
+
+
+def install_log_capture():
+    """
+    把应用日志接入全局缓冲区(幂等)
+
+    - root logger挂载RingBufferHandler,级别取自LOG_LEVEL
+    - root logger没有处理器时补一个stderr输出,保持容器日志可见
+    - sys.stdout替换为StdoutCapture,print输出也进入缓冲区
+    """
+    global _installed
+    if _installed:
+        return
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+
+    if not root.handlers:
+        stderr_handler = logging.StreamHandler(sys.__stderr__)
+        stderr_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(stderr_handler)
+
+    root.addHandler(RingBufferHandler(log_ring))
+
+    # stdout日志仅进入缓冲区,不再经stderr重复输出
+    stdout_logger = logging.getLogger("stdout")
+    stdout_logger.setLevel(logging.INFO)
+    stdout_logger.propagate = False
+    for handler in root.handlers:
+        if isinstance(handler, RingBufferHandler):
+            stdout_logger.addHandler(handler)
+
+    if not isinstance(sys.stdout, StdoutCapture):
+        sys.stdout = StdoutCapture(sys.stdout)
+
+    _installed = True
@@ -0,0 +1,244 @@
+"""
+事件循环看门狗
+事件循环中的心跳任务定期打点,独立的监视线程检查心跳间隔;
+心跳延迟超过阈值时通过sys._current_frames抓取事件循环线程的调用栈,
+并标注当时的run_id、thread_id与正在执行的工具,把"服务卡住了"定位到具体代码
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.config import LOOP_STALL_THRESHOLD_MS, LOOP_STALL_BUFFER_SIZE
+from app.core.metrics import registry
+from app.core.run_context import get_activities, get_task_run
+
+logger = logging.getLogger(__name__)
+
+# 项目根目录(用于在调用栈中定位项目自身的代码)
+PROJECT_ROOT = str(Path(__file__).resolve().parents[2])
+
+loop_stalls_total = registry.counter("event_loop_stalls", "事件循环阻塞次数")
+loop_stall_duration_seconds = registry.histogram(
+    "event_loop_stall_duration_seconds", "事件循环阻塞时长",
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300))
+
+
+def _is_project_frame(filename: str) -> bool:
+    return filename.startswith(PROJECT_ROOT) and "site-packages" not in filename
+
+
+class LoopWatchdog:
+    """事件循环阻塞检测"""
+
+    # 心跳间隔(秒)
+    HEARTBEAT_INTERVAL = 0.05
+    # 监视线程检查间隔(秒)
+    CHECK_INTERVAL = 0.05
+    # 每条记录保留的最大栈帧数(保留最内层)
+    MAX_STACK_FRAMES = 40
+
+    def __init__(
+        self,
+        threshold_ms: float = LOOP_STALL_THRESHOLD_MS,
+        buffer_size: int = LOOP_STALL_BUFFER_SIZE
+    ):
+        self.threshold_ms = threshold_ms
+        self.stalls: deque = deque(maxlen=buffer_size)
+        self.total_stalls = 0
+        self.running = False
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_ident: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # 进行中的阻塞记录及其开始时的心跳时间
+        self._current: Optional[Dict[str, Any]] = None
+        self._current_beat = 0.0
+        self._next_id = 1
+
+    async def start(self):
+        """在当前事件循环上启动看门狗"""
+        if self.running:
+            print("⚠️  LoopWatchdog已在运行")
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._loop_ident = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        self.running = True
+        print(f"✅ LoopWatchdog启动成功 (阈值: {self.threshold_ms}ms)")
+
+    async def stop(self):
+        """停止看门狗"""
+        self.running = False
+        self._stop.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+        print("🛑 LoopWatchdog已停止")
+
+    async def _heartbeat(self):
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL)
+
+    # ==================== 监视线程 ====================
+
+    def _watch(self):
+        while not self._stop.wait(self.CHECK_INTERVAL):
+            last_beat = self._last_beat
+            lag_ms = (time.monotonic() - last_beat - self.HEARTBEAT_INTERVAL) * 1000
+            try:
+                if lag_ms >= self.threshold_ms:
+                    if self._current is None:
+                        self._begin_stall(lag_ms, last_beat)
+                    else:
+                        self._current["duration_ms"] = round(lag_ms, 1)
+                elif self._current is not None:
+                    self._end_stall(last_beat)
+            except Exception as e:
+                logger.error(f"❌ 事件循环看门狗异常: {e}")
+
+    def _begin_stall(self, lag_ms: float, last_beat: float):
+        """阻塞开始: 抓取事件循环线程当前的调用栈"""
+        frame = sys._current_frames().get(self._loop_ident)
+        stack = traceback.extract_stack(frame)[-self.MAX_STACK_FRAMES:] if frame is not None else []
+        del frame
+
+        # 阻塞点: 最内层的项目代码帧(没有则取最内层帧)
+        culprit = next((f for f in reversed(stack) if _is_project_frame(f.filename)), None)
+        innermost = stack[-1] if stack else None
+
+        # 事件循环当前正在执行的任务(只读访问,跨线程安全)
+        task = asyncio.current_task(self._loop) if self._loop else None
+        thread_id, run_id = get_task_run(task)
+
+        # 事件循环线程上登记的活动(工具/LLM),只取属于当前任务或同步登记的
+        activities = [
+            a for a in get_activities(self._loop_ident)
+            if a["task"] is None or a["task"] is task
+        ]
+        activity = activities[-1] if activities else None
+        if activity:
+            thread_id = activity["thread_id"] or thread_id
+            run_id = activity["run_id"] or run_id
+
+        self._current = {
+            "id": self._next_id,
+            "started_at": datetime.now().isoformat(),
+            "duration_ms": round(lag_ms, 1),
+            "ongoing": True,
+            "thread_id": thread_id,
+            "run_id": run_id,
+            "tool": activity["name"] if activity and activity["kind"] == "tool" else None,
+            "activity": {"kind": activity["kind"], "name": activity["name"]} if activity else None,
+            "task": self._describe_task(task),
+            "culprit": self._describe_frame(culprit),
+            "innermost": self._describe_frame(innermost),
+            "stack": [
+                {
+                    "file": f.filename,
+                    "line": f.lineno,
+                    "function": f.name,
+                    "code": f.line,
+                    "project": _is_project_frame(f.filename)
+                }
+                for f in stack
+            ]
+        }
+        self._current["summary"] = self._summarize(self._current)
+        self._current_beat = last_beat
+        self._next_id += 1
+        self.stalls.append(self._current)
+        self.total_stalls += 1
+
+    def _end_stall(self, resumed_beat: float):
+        """心跳恢复: 计算最终阻塞时长并输出告警"""
+        stall = self._current
+        self._current = None
+        duration_ms = max(stall["duration_ms"], (resumed_beat - self._current_beat - self.HEARTBEAT_INTERVAL) * 1000)
+        stall["duration_ms"] = round(duration_ms, 1)
+        stall["ongoing"] = False
+        stall["summary"] = self._summarize(stall)
+
+        loop_stalls_total.inc()
+        loop_stall_duration_seconds.observe(duration_ms / 1000)
+        logger.warning(f"⚠️ 事件循环阻塞: {stall['summary']}")
+
+    # ==================== 描述 ====================
+
+    @staticmethod
+    def _describe_frame(frame: Optional[traceback.FrameSummary]) -> Optional[Dict[str, Any]]:
+        if frame is None:
+            return None
+        filename = frame.filename
+        if filename.startswith(PROJECT_ROOT):
+            filename = filename[len(PROJECT_ROOT):].lstrip("/\\")
+        return {"file": filename, "line": frame.lineno, "function": frame.name}
+
+    @staticmethod
+    def _describe_task(task: Optional[asyncio.Task]) -> Optional[str]:
+        if task is None:
+            return None
+        coro = task.get_coro()
+        return f"{task.get_name()} ({getattr(coro, '__qualname__', type(coro).__name__)})"
+
+    @staticmethod
+    def _summarize(stall: Dict[str, Any]) -> str:
+        """如: speech_recognition 阻塞事件循环 14.2s, 位于 transcribe() (app/tools/speech_recognition_tool.py:88)"""
+        who = stall["tool"] or (stall["activity"] or {}).get("name") or stall["task"] or "未知任务"
+        where = stall["culprit"] or stall["innermost"]
+        location = f", 位于 {where['function']}() ({where['file']}:{where['line']})" if where else ""
+        innermost = stall["innermost"]
+        if innermost and where is not innermost:
+            # 阻塞点在第三方库中时补充最内层函数(如 whisper 的 transcribe())
+            location += f" → {innermost['function']}()"
+        return f"{who} 阻塞事件循环 {stall['duration_ms'] / 1000:.1f}s{location}"
+
+    # ==================== 查询 ====================
+
+    def get_stalls(self, limit: int = 50, include_stack: bool = True) -> List[Dict[str, Any]]:
+        """最近的阻塞记录(最新在前)"""
+        stalls = list(self.stalls)[-limit:][::-1]
+        if include_stack:
+            return stalls
+        return [{k: v for k, v in s.items() if k != "stack"} for s in stalls]
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "threshold_ms": self.threshold_ms,
+            "heartbeat_interval_ms": self.HEARTBEAT_INTERVAL * 1000,
+            "current_lag_ms": round(max(0.0, (time.monotonic() - self._last_beat - self.HEARTBEAT_INTERVAL) * 1000), 1)
+            if self.running else None,
+            "total_stalls": self.total_stalls,
+            "buffered": len(self.stalls),
+            "ongoing": self._current is not None
+        }
+
+    def clear(self):
+        self.stalls.clear()
+
+
+# 全局看门狗
+loop_watchdog = LoopWatchdog()
@@ -0,0 +1,100 @@
+"""
+Fleet记忆内容压缩
+超过阈值的记忆内容压缩后以BLOB存储,读取时透明解压
+
+- 优先使用zstd(需要zstandard),未安装时回退到标准库zlib
+- 编码名存入content_codec列(NULL为未压缩的原文),每行按各自的编码解压
+- 热数据使用低压缩级别(写入路径上不明显增加延迟),冷数据以高压缩级别重新压缩
+"""
+import threading
+import zlib
+from typing import Optional, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 可选依赖
+    zstandard = None
+
+from app.config import FLEET_DB_COMPRESS_MIN_BYTES, FLEET_DB_COMPRESS_MIN_SAVING
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+
+# 新写入使用的编码
+DEFAULT_CODEC = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+# (热数据, 冷数据)压缩级别
+_LEVELS = {CODEC_ZSTD: (3, 19), CODEC_ZLIB: (6, 9)}
+
+# zstd压缩/解压对象不是线程安全的,每个线程各自持有
+_local = threading.local()
+
+
+def _zstd_compressor(level: int):
+    compressors = getattr(_local, "compressors", None)
+    if compressors is None:
+        compressors = _local.compressors = {}
+    compressor = compressors.get(level)
+    if compressor is None:
+        compressor = compressors[level] = zstandard.ZstdCompressor(level=level)
+    return compressor
+
+
+def _zstd_decompressor():
+    decompressor = getattr(_local, "decompressor", None)
+    if decompressor is None:
+        decompressor = _local.decompressor = zstandard.ZstdDecompressor()
+    return decompressor
+
+
+def compress_text(text: str, cold: bool = False) -> Tuple[Union[str, bytes], Optional[str]]:
+    """
+    按需压缩记忆内容
+
+    短于FLEET_DB_COMPRESS_MIN_BYTES或压缩收益不足FLEET_DB_COMPRESS_MIN_SAVING的内容原样返回
+
+    Args:
+        text: 原文
+        cold: 是否使用冷数据的高压缩级别
+
+    Returns:
+        (存储值, 编码名),未压缩时编码名为None
+    """
+    raw = text.encode("utf-8")
+    if len(raw) < FLEET_DB_COMPRESS_MIN_BYTES:
+        return text, None
+    level = _LEVELS[DEFAULT_CODEC][1 if cold else 0]
+    if DEFAULT_CODEC == CODEC_ZSTD:
+        payload = _zstd_compressor(level).compress(raw)
+    else:
+        payload = zlib.compress(raw, level)
+    if len(payload) > len(raw) * (1 - FLEET_DB_COMPRESS_MIN_SAVING):
+        return text, None
+    return payload, DEFAULT_CODEC
+
+
+def decompress_text(value: Union[str, bytes, None], codec: Optional[str]) -> Optional[str]:
+    """
+    还原记忆内容
+
+    Raises:
+        ValueError: 未知编码,或数据以zstd压缩但未安装zstandard
+    """
+    if codec is None or value is None:
+        return value
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("记忆内容以zstd压缩,但未安装zstandard")
+        return _zstd_decompressor().decompress(value).decode("utf-8")
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(value).decode("utf-8")
+    raise ValueError(f"未知的记忆内容编码: {codec}")
+
+
+def stored_size(value: Union[str, bytes, None]) -> int:
+    """存储值的字节数"""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return len(value.encode("utf-8"))
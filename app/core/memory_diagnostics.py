@@ -0,0 +1,453 @@
+"""
+内存增长诊断
+- tracemalloc: 按需开启,打带标签的快照,按文件/行号比较两个快照之间的增长
+- 结构体报告: 遍历已知的全局容器(checkpointer、消息历史、会话、工具统计等),
+  给出条目数与近似字节数,定位"RSS持续上涨"具体涨在哪里
+"""
+import asyncio
+import sys
+import threading
+import tracemalloc
+import types
+from collections import OrderedDict, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import TRACEMALLOC_FRAMES, MEMORY_SNAPSHOT_LIMIT, MEMORY_WALK_MAX_OBJECTS
+
+# 项目根目录(项目内文件显示相对路径)
+PROJECT_ROOT = str(Path(__file__).resolve().parents[2])
+
+# 快照比较支持的分组方式
+GROUP_BY = ("filename", "lineno", "traceback")
+
+# 快照中排除的分配(tracemalloc自身与导入机制)
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+# 遍历时不深入的对象(类型、模块、函数、帧、锁、事件循环等共享对象)
+_OPAQUE_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+    types.CodeType,
+    types.FrameType,
+    type(threading.Lock()),
+    threading.Thread,
+    asyncio.AbstractEventLoop,
+    asyncio.Future,
+)
+_ATOMIC_TYPES = (str, bytes, bytearray, int, float, bool, type(None), complex)
+
+
+def approx_size(obj: Any, max_objects: int = MEMORY_WALK_MAX_OBJECTS) -> Tuple[int, bool]:
+    """
+    近似深度大小(字节)
+
+    沿容器与对象属性遍历并累加sys.getsizeof,共享对象只计一次;
+    超过max_objects时停止,返回(已统计的字节数, True);
+    容器可能正被其他线程修改,复制失败时重试,仍失败则跳过其子对象并视为截断
+    """
+    seen = set()
+    truncated = False
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _OPAQUE_TYPES):
+            continue
+        seen.add(id(o))
+        if len(seen) > max_objects:
+            return total, True
+        total += sys.getsizeof(o, 0)
+        if isinstance(o, _ATOMIC_TYPES):
+            continue
+        if isinstance(o, dict):
+            items = _snapshot(o.items)
+            if items is None:
+                truncated = True
+                continue
+            for key, value in items:
+                stack.append(key)
+                stack.append(value)
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            children = _snapshot(lambda: o)
+            if children is None:
+                truncated = True
+                continue
+            stack.extend(children)
+        else:
+            attributes = getattr(o, "__dict__", None)
+            if attributes is not None:
+                stack.append(attributes)
+            for cls in type(o).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    if isinstance(slot, str) and slot not in ("__dict__", "__weakref__"):
+                        value = getattr(o, slot, None)
+                        if value is not None:
+                            stack.append(value)
+    return total, truncated
+
+
+def _snapshot(source: Callable[[], Any], attempts: int = 3) -> Optional[list]:
+    """复制容器内容;遍历期间被并发修改(RuntimeError)时重试,仍失败返回None"""
+    for _ in range(attempts):
+        try:
+            return list(source())
+        except RuntimeError:
+            continue
+    return None
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(PROJECT_ROOT):
+        return filename[len(PROJECT_ROOT):].lstrip("/\\")
+    return filename
+
+
+def _format_stat(stat: Any, group_by: str) -> Dict[str, Any]:
+    """格式化tracemalloc的Statistic/StatisticDiff"""
+    frame = stat.traceback[0]
+    result = {
+        "file": _short_path(frame.filename),
+        "line": frame.lineno if group_by != "filename" else None,
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count
+    }
+    if hasattr(stat, "size_diff"):
+        result["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+        result["count_diff"] = stat.count_diff
+    if group_by == "traceback":
+        result["traceback"] = [f"{_short_path(f.filename)}:{f.lineno}" for f in stat.traceback]
+    return result
+
+
+class MemoryDiagnostics:
+    """tracemalloc快照管理"""
+
+    def __init__(self, max_snapshots: int = MEMORY_SNAPSHOT_LIMIT):
+        self.max_snapshots = max_snapshots
+        # {label: {"snapshot", "taken_at", "traced_bytes"}}
+        self.snapshots: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def start(self, frames: int = TRACEMALLOC_FRAMES) -> Dict[str, Any]:
+        """开始追踪内存分配(已在追踪时保持原栈深度)"""
+        if not 1 <= frames <= 100:
+            raise ValueError("frames必须在 [1, 100] 之间")
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            print(f"✅ tracemalloc已启动 (栈深度: {frames})")
+        return self.get_status()
+
+    def stop(self) -> Dict[str, Any]:
+        """停止追踪(已有快照保留,仍可比较)"""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            print("🛑 tracemalloc已停止")
+        return self.get_status()
+
+    def take_snapshot(self, label: Optional[str] = None) -> Dict[str, Any]:
+        """
+        打一个带标签的快照(耗时与存活分配数成正比,应在工作线程中调用)
+
+        Raises:
+            RuntimeError: tracemalloc未启动
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc未启动,请先调用start")
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        with self._lock:
+            self._counter += 1
+            label = label or f"snapshot_{self._counter}"
+            self.snapshots.pop(label, None)
+            self.snapshots[label] = {
+                "snapshot": snapshot,
+                "taken_at": datetime.now().isoformat(),
+                "traced_bytes": sum(trace.size for trace in snapshot.traces)
+            }
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+        return self._describe(label)
+
+    def delete_snapshot(self, label: str) -> bool:
+        with self._lock:
+            return self.snapshots.pop(label, None) is not None
+
+    def _get_snapshot(self, label: Optional[str]) -> tracemalloc.Snapshot:
+        """label为空时取当前的临时快照(不保存)"""
+        if label is None:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc未启动,无法获取当前快照")
+            return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        entry = self.snapshots.get(label)
+        if entry is None:
+            raise ValueError(f"快照不存在: {label}")
+        return entry["snapshot"]
+
+    def diff(
+        self,
+        base: str,
+        target: Optional[str] = None,
+        group_by: str = "lineno",
+        limit: int = 20
+    ) -> Dict[str, Any]:
+        """
+        比较两个快照,按增长量降序返回前N项
+
+        Args:
+            base: 基准快照标签
+            target: 目标快照标签,为空时与当前内存比较
+            group_by: filename / lineno / traceback
+            limit: 返回条数
+        """
+        if group_by not in GROUP_BY:
+            raise ValueError(f"不支持的分组方式: {group_by},可选: {', '.join(GROUP_BY)}")
+        base_snapshot = self._get_snapshot(base)
+        target_snapshot = self._get_snapshot(target)
+        stats = target_snapshot.compare_to(base_snapshot, group_by)
+        return {
+            "base": base,
+            "target": target or "current",
+            "group_by": group_by,
+            "total_size_diff_kb": round(sum(stat.size_diff for stat in stats) / 1024, 1),
+            "total_count_diff": sum(stat.count_diff for stat in stats),
+            "top": [_format_stat(stat, group_by) for stat in stats[:limit]]
+        }
+
+    def top(self, label: Optional[str] = None, group_by: str = "lineno", limit: int = 20) -> Dict[str, Any]:
+        """单个快照中占用最多的分配点"""
+        if group_by not in GROUP_BY:
+            raise ValueError(f"不支持的分组方式: {group_by},可选: {', '.join(GROUP_BY)}")
+        snapshot = self._get_snapshot(label)
+        stats = snapshot.statistics(group_by)
+        return {
+            "snapshot": label or "current",
+            "group_by": group_by,
+            "total_size_kb": round(sum(stat.size for stat in stats) / 1024, 1),
+            "top": [_format_stat(stat, group_by) for stat in stats[:limit]]
+        }
+
+    def _describe(self, label: str) -> Dict[str, Any]:
+        entry = self.snapshots[label]
+        return {
+            "label": label,
+            "taken_at": entry["taken_at"],
+            "traced_mb": round(entry["traced_bytes"] / 1024 / 1024, 2),
+            "traces": len(entry["snapshot"].traces)
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else None,
+            "traced_mb": round(current / 1024 / 1024, 2),
+            "peak_mb": round(peak / 1024 / 1024, 2),
+            "overhead_mb": round(tracemalloc.get_tracemalloc_memory() / 1024 / 1024, 2),
+            "snapshots": [self._describe(label) for label in list(self.snapshots)]
+        }
+
+
+# ==================== 全局容器报告 ====================
+
+def _checkpointer() -> Optional[Dict[str, Any]]:
+    from app.state import state_manager
+
+    saver = getattr(state_manager.app_graph, "checkpointer", None)
+    storage = getattr(saver, "storage", None)
+    if storage is None:
+        return None
+    checkpoints = sum(len(by_id) for namespaces in list(storage.values()) for by_id in list(namespaces.values()))
+    return {
+        "object": saver,
+        "entries": len(storage),
+        "unit": "threads",
+        "details": {
+            "checkpoints": checkpoints,
+            "pending_writes": sum(len(w) for w in list(getattr(saver, "writes", {}).values())),
+            "blobs": len(getattr(saver, "blobs", {}))
+        }
+    }
+
+
+def _message_history() -> Dict[str, Any]:
+    from app.core.unified_messenger import unified_messenger
+
+    history = unified_messenger.message_history
+    return {
+        "object": history,
+        "entries": len(history),
+        "unit": "threads",
+        "details": {
+            "messages": sum(len(messages) for messages in list(history.values())),
+            "max_per_thread": unified_messenger.max_history_per_thread
+        }
+    }
+
+
+def _messenger_connections() -> Dict[str, Any]:
+    from app.core.unified_messenger import unified_messenger
+
+    # 连接对象引用整个应用,不统计字节数
+    return {
+        "object": None,
+        "entries": len(unified_messenger.connections),
+        "unit": "threads",
+        "details": {
+            "connections": sum(len(conns) for conns in list(unified_messenger.connections.values())),
+            "encodings": len(unified_messenger.connection_encodings)
+        }
+    }
+
+
+def _chat_sessions() -> Dict[str, Any]:
+    from app.state import state_manager
+
+    sessions = state_manager.chat_sessions
+    return {
+        "object": sessions,
+        "entries": len(sessions),
+        "unit": "sessions",
+        "details": {
+            "temp_sessions": sum(1 for thread_id in list(sessions) if str(thread_id).startswith("temp_")),
+            "messages": sum(len(s.get("messages", [])) for s in list(sessions.values()) if isinstance(s, dict))
+        }
+    }
+
+
+def _tool_usage_stats() -> Dict[str, Any]:
+    from app.core.tool_metrics import tool_metrics, tool_metrics_callback
+
+    return {
+        "object": (tool_metrics.tools, tool_metrics.threads),
+        "entries": len(tool_metrics.tools),
+        "unit": "tools",
+        "details": {
+            "threads": len(tool_metrics.threads),
+            "in_flight_callbacks": len(tool_metrics_callback._runs)
+        }
+    }
+
+
+def _log_ring() -> Dict[str, Any]:
+    from app.core.log_stream import log_ring
+
+    return {"object": log_ring._entries, "entries": len(log_ring), "unit": "entries", "details": {}}
+
+
+def _traces() -> Dict[str, Any]:
+    from app.core.tracing import tracer
+
+    return {
+        "object": tracer._traces,
+        "entries": len(tracer._traces),
+        "unit": "runs",
+        "details": {
+            "threads": len(tracer._threads),
+            "pending_callbacks": len(tracer.callback._runs)
+        }
+    }
+
+
+def _llm_callbacks() -> Dict[str, Any]:
+    from app.core.llm_metrics import llm_metrics_callback
+
+    return {"object": llm_metrics_callback._runs, "entries": len(llm_metrics_callback._runs), "unit": "runs", "details": {}}
+
+
+def _resource_samples() -> Dict[str, Any]:
+    from app.services.resource_sampler import resource_sampler
+
+    return {
+        "object": resource_sampler.buffers,
+        "entries": sum(len(buffer) for buffer in list(resource_sampler.buffers.values())),
+        "unit": "points",
+        "details": {name: len(buffer) for name, buffer in list(resource_sampler.buffers.items())}
+    }
+
+
+def _loop_stalls() -> Dict[str, Any]:
+    from app.core.loop_watchdog import loop_watchdog
+
+    return {"object": loop_watchdog.stalls, "entries": len(loop_watchdog.stalls), "unit": "stalls", "details": {}}
+
+
+# {名称: (说明, 获取函数)}
+KNOWN_STRUCTURES: Dict[str, Tuple[str, Callable[[], Optional[Dict[str, Any]]]]] = {
+    "checkpointer": ("LangGraph MemorySaver(按线程保存全部checkpoint,无淘汰)", _checkpointer),
+    "messenger.message_history": ("统一消息总线的历史缓冲区", _message_history),
+    "messenger.connections": ("统一消息总线的WebSocket连接", _messenger_connections),
+    "state.chat_sessions": ("LangGraph Cloud兼容API的会话(含/runs/stream创建的temp_线程)", _chat_sessions),
+    "tool_usage_stats": ("工具调用统计(按工具与会话线程)", _tool_usage_stats),
+    "log_ring": ("内存日志环形缓冲区", _log_ring),
+    "traces": ("运行追踪索引", _traces),
+    "llm_metrics.in_flight": ("进行中的LLM调用回调记录", _llm_callbacks),
+    "resource_samples": ("进程资源采样环形缓冲区", _resource_samples),
+    "loop_stalls": ("事件循环阻塞记录", _loop_stalls),
+}
+
+
+def _retry_on_mutation(func: Callable[[], Any], attempts: int = 3) -> Any:
+    """容器在统计途中被其他线程修改时重试,最后一次的RuntimeError原样抛出"""
+    for attempt in range(attempts):
+        try:
+            return func()
+        except RuntimeError:
+            if attempt == attempts - 1:
+                raise
+
+
+def structure_report(include_bytes: bool = True, max_objects: int = MEMORY_WALK_MAX_OBJECTS) -> Dict[str, Any]:
+    """
+    已知全局容器的条目数与近似字节数(按字节数降序)
+
+    在工作线程中执行(见/api/diagnostics),遍历期间事件循环仍在修改这些容器:
+    容器内容先复制再遍历,复制时遇到"changed size during iteration"会重试,
+    多次失败的条目记录error后继续,结果只是近似值
+    """
+    structures: List[Dict[str, Any]] = []
+    for name, (description, getter) in KNOWN_STRUCTURES.items():
+        item: Dict[str, Any] = {"name": name, "description": description}
+        try:
+            info = _retry_on_mutation(getter)
+        except Exception as e:
+            item["error"] = str(e)
+            structures.append(item)
+            continue
+        if info is None:
+            item["available"] = False
+            structures.append(item)
+            continue
+
+        item.update(entries=info["entries"], unit=info["unit"], details=info["details"])
+        if include_bytes and info["object"] is not None:
+            try:
+                size, truncated = _retry_on_mutation(lambda: approx_size(info["object"], max_objects))
+            except RuntimeError as e:
+                item["error"] = str(e)
+                structures.append(item)
+                continue
+            item["approx_kb"] = round(size / 1024, 1)
+            item["truncated"] = truncated
+        structures.append(item)
+
+    structures.sort(key=lambda s: s.get("approx_kb", 0), reverse=True)
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "total_approx_mb": round(sum(s.get("approx_kb", 0) for s in structures) / 1024, 2),
+        "structures": structures
+    }
+
+
+# 全局内存诊断
+memory_diagnostics = MemoryDiagnostics()
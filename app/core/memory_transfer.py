@@ -0,0 +1,346 @@
+"""
+Fleet记忆批量导出/导入
+用于迁移、回填与离线分析,按块流式读写,内存占用与总行数无关
+
+- NDJSON: 每行一条记忆(metadata为JSON对象)
+- Parquet: 每块为一个row group,metadata列为JSON字符串(需要pyarrow)
+- 导入按FLEET_IMPORT_BATCH_ROWS行一个事务批量写入,按id去重(已存在时跳过或覆盖),
+  同一会话内容相同而id不同的记录合并到已有记忆(累加occurrences)
+
+    python -m app.core.memory_transfer export --format parquet --output memories.parquet
+    python -m app.core.memory_transfer import --input memories.ndjson --on-conflict replace
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Union
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pyarrow_parquet
+except ImportError:  # pragma: no cover - 可选依赖
+    pyarrow = None
+    pyarrow_parquet = None
+
+from app.config import FLEET_EXPORT_CHUNK_ROWS, FLEET_IMPORT_BATCH_ROWS
+from app.core.codec import dumps_bytes, loads
+
+FORMAT_NDJSON = "ndjson"
+FORMAT_PARQUET = "parquet"
+
+# 导出的字段(顺序即NDJSON键顺序与Parquet列顺序)
+FIELDS = (
+    "id", "session_id", "content", "metadata", "timestamp", "source",
+    "synced_to_fleet", "fleet_memory_id", "created_at", "updated_at", "occurrences"
+)
+
+
+def parquet_available() -> bool:
+    """是否可用Parquet格式"""
+    return pyarrow is not None
+
+
+def _parquet_schema():
+    string = pyarrow.string()
+    return pyarrow.schema([
+        ("id", string), ("session_id", string), ("content", string), ("metadata", string),
+        ("timestamp", string), ("source", string), ("synced_to_fleet", pyarrow.bool_()),
+        ("fleet_memory_id", string), ("created_at", string), ("updated_at", string),
+        ("occurrences", pyarrow.int64())
+    ])
+
+
+# ==================== 导出 ====================
+
+def _ndjson_line(memory: Dict[str, Any]) -> bytes:
+    record = {field: memory[field] for field in FIELDS if field != "metadata"}
+    # 元数据在库中已是JSON,直接拼接,不做解析再序列化
+    metadata = (memory.get("metadata_json") or "{}").encode("utf-8")
+    return dumps_bytes(record)[:-1] + b',"metadata":' + metadata + b"}\n"
+
+
+def export_ndjson(db, session_id: Optional[str] = None, chunk_size: int = FLEET_EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """
+    以NDJSON流式导出记忆(最新在前),每产出一块包含chunk_size行
+
+    Args:
+        db: FleetMemoryDB或分区库
+        session_id: 只导出指定会话(可选)
+        chunk_size: 每块行数
+    """
+    lines: List[bytes] = []
+    for memory in db.iter_memories(session_id=session_id, chunk_size=chunk_size):
+        lines.append(_ndjson_line(memory))
+        if len(lines) >= chunk_size:
+            yield b"".join(lines)
+            lines = []
+    if lines:
+        yield b"".join(lines)
+
+
+class _ChunkSink:
+    """ParquetWriter的输出目标: 缓存写入的字节,由调用方逐块取走"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def export_parquet(
+    db,
+    session_id: Optional[str] = None,
+    chunk_size: int = FLEET_EXPORT_CHUNK_ROWS,
+    compression: str = "zstd"
+) -> Iterator[bytes]:
+    """
+    以Parquet流式导出记忆,每chunk_size行写出一个row group并产出已编码的字节
+
+    Raises:
+        RuntimeError: 未安装pyarrow
+    """
+    if pyarrow is None:
+        raise RuntimeError("Parquet导出需要安装pyarrow")
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    writer = pyarrow_parquet.ParquetWriter(sink, schema, compression=compression)
+    columns: Dict[str, List[Any]] = {field: [] for field in FIELDS}
+
+    def write_group():
+        writer.write_table(pyarrow.Table.from_pydict(columns, schema=schema))
+        for values in columns.values():
+            values.clear()
+
+    try:
+        for memory in db.iter_memories(session_id=session_id, chunk_size=chunk_size):
+            for field in FIELDS:
+                columns[field].append((memory.get("metadata_json") or "{}") if field == "metadata" else memory[field])
+            if len(columns["id"]) >= chunk_size:
+                write_group()
+                yield sink.drain()
+        if columns["id"]:
+            write_group()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_memories(db, output: BinaryIO, file_format: str = FORMAT_NDJSON, session_id: Optional[str] = None) -> int:
+    """导出到文件,返回写入的字节数"""
+    chunks = export_parquet(db, session_id) if file_format == FORMAT_PARQUET else export_ndjson(db, session_id)
+    written = 0
+    for chunk in chunks:
+        output.write(chunk)
+        written += len(chunk)
+    return written
+
+
+# ==================== 导入 ====================
+
+def _normalize(record: Dict[str, Any]) -> tuple:
+    """
+    把导入的记录转换为FleetMemoryDB.bulk_import的行元组
+
+    Raises:
+        ValueError: 缺少id/session_id/content,或时间格式无效
+    """
+    if not record.get("id") or not record.get("session_id") or record.get("content") is None:
+        raise ValueError("缺少id、session_id或content")
+    metadata = record.get("metadata")
+    if metadata is None:
+        metadata = "{}"
+    elif not isinstance(metadata, str):
+        metadata = json.dumps(metadata, ensure_ascii=False)
+    now = datetime.now().isoformat()
+    # 统一为isoformat,保证与库内时间的排序与分区一致
+    timestamp = datetime.fromisoformat(record["timestamp"]).isoformat() if record.get("timestamp") else now
+    return (
+        str(record["id"]),
+        str(record["session_id"]),
+        str(record["content"]),
+        metadata,
+        timestamp,
+        record.get("source") or "import",
+        1 if record.get("synced_to_fleet") else 0,
+        record.get("fleet_memory_id"),
+        record.get("created_at") or timestamp,
+        record.get("updated_at") or now,
+        int(record.get("occurrences") or 1)
+    )
+
+
+class MemoryImporter:
+    """
+    批量导入: feed()逐条接收记录并凑批,write()在一个事务中写入一批
+
+    同步与异步调用方共用(异步调用方在线程中执行write)
+
+    Args:
+        db: FleetMemoryDB或分区库
+        batch_size: 每个事务的行数
+        replace: id已存在时覆盖(否则跳过)
+    """
+
+    def __init__(self, db, batch_size: int = FLEET_IMPORT_BATCH_ROWS, replace: bool = False):
+        self.db = db
+        self.batch_size = batch_size
+        self.replace = replace
+        self._batch: List[tuple] = []
+        self.started = time.perf_counter()
+        self.read = 0
+        self.written = 0
+        self.invalid = 0
+        self.batches = 0
+        self.errors: List[str] = []
+
+    def feed(self, record: Optional[Dict[str, Any]]) -> Optional[List[tuple]]:
+        """接收一条记录(None表示无法解析的行),凑满一批时返回该批"""
+        self.read += 1
+        try:
+            self._batch.append(_normalize(record))
+        except (ValueError, TypeError, AttributeError) as e:
+            self.invalid += 1
+            if len(self.errors) < 10:
+                self.errors.append(f"第{self.read}条: {e}")
+            return None
+        if len(self._batch) >= self.batch_size:
+            return self.take()
+        return None
+
+    def take(self) -> List[tuple]:
+        """取走未满一批的剩余记录"""
+        batch, self._batch = self._batch, []
+        return batch
+
+    def write(self, batch: List[tuple]):
+        if batch:
+            self.written += self.db.bulk_import(batch, replace=self.replace)
+            self.batches += 1
+
+    def get_result(self) -> Dict[str, Any]:
+        duration = time.perf_counter() - self.started
+        return {
+            "read": self.read,
+            "written": self.written,
+            # id已存在而跳过的(合并到相同内容记忆的计入written)
+            "skipped": self.read - self.invalid - self.written if not self.replace else 0,
+            "invalid": self.invalid,
+            "batches": self.batches,
+            "duration_seconds": round(duration, 2),
+            "rows_per_second": round(self.read / duration, 1) if duration else None,
+            "errors": self.errors
+        }
+
+
+def read_ndjson(lines: Iterable[Union[bytes, str]]) -> Iterator[Optional[Dict[str, Any]]]:
+    """逐行解析NDJSON(跳过空行,无法解析的行产出None)"""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield loads(line)
+        except ValueError:
+            yield None
+
+
+def read_parquet(source, batch_size: int = FLEET_IMPORT_BATCH_ROWS) -> Iterator[Dict[str, Any]]:
+    """
+    按row group分批读取Parquet
+
+    Raises:
+        RuntimeError: 未安装pyarrow
+    """
+    if pyarrow is None:
+        raise RuntimeError("Parquet导入需要安装pyarrow")
+    parquet_file = pyarrow_parquet.ParquetFile(source)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+def import_memories(
+    db,
+    records: Iterable[Optional[Dict[str, Any]]],
+    batch_size: int = FLEET_IMPORT_BATCH_ROWS,
+    replace: bool = False
+) -> Dict[str, Any]:
+    """导入记录流,返回导入结果"""
+    importer = MemoryImporter(db, batch_size=batch_size, replace=replace)
+    for record in records:
+        batch = importer.feed(record)
+        if batch:
+            importer.write(batch)
+    importer.write(importer.take())
+    return importer.get_result()
+
+
+# ==================== 命令行 ====================
+
+def main():
+    parser = argparse.ArgumentParser(description="Fleet记忆批量导出/导入")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="导出记忆")
+    export_parser.add_argument("--format", choices=(FORMAT_NDJSON, FORMAT_PARQUET), default=FORMAT_NDJSON)
+    export_parser.add_argument("--output", default="-", help="输出文件(默认标准输出)")
+    export_parser.add_argument("--session-id", help="只导出指定会话")
+
+    import_parser = commands.add_parser("import", help="导入记忆")
+    import_parser.add_argument("--input", required=True, help="输入文件(NDJSON可用-表示标准输入)")
+    import_parser.add_argument("--format", choices=(FORMAT_NDJSON, FORMAT_PARQUET),
+                               help="默认按扩展名判断(.parquet为Parquet,其余为NDJSON)")
+    import_parser.add_argument("--on-conflict", choices=("skip", "replace"), default="skip")
+    import_parser.add_argument("--batch-size", type=int, default=FLEET_IMPORT_BATCH_ROWS)
+    args = parser.parse_args()
+
+    from app.core.fleet_memory_db import fleet_memory_db
+
+    started = time.perf_counter()
+    try:
+        if args.command == "export":
+            if args.output == "-":
+                written = export_memories(fleet_memory_db, sys.stdout.buffer, args.format, args.session_id)
+            else:
+                with open(args.output, "wb") as output:
+                    written = export_memories(fleet_memory_db, output, args.format, args.session_id)
+            print(f"✅ 导出完成: {written / 1024 / 1024:.1f}MB, 耗时{time.perf_counter() - started:.1f}s", file=sys.stderr)
+        else:
+            file_format = args.format or (FORMAT_PARQUET if args.input.endswith(".parquet") else FORMAT_NDJSON)
+            if file_format == FORMAT_PARQUET:
+                records = read_parquet(args.input, args.batch_size)
+                result = import_memories(fleet_memory_db, records, args.batch_size, args.on_conflict == "replace")
+            elif args.input == "-":
+                result = import_memories(fleet_memory_db, read_ndjson(sys.stdin.buffer), args.batch_size,
+                                         args.on_conflict == "replace")
+            else:
+                with open(args.input, "rb") as source:
+                    result = import_memories(fleet_memory_db, read_ndjson(source), args.batch_size,
+                                             args.on_conflict == "replace")
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+    finally:
+        fleet_memory_db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+"""
+Fleet记忆向量索引
+为记忆内容计算嵌入向量,支持离线、纯CPU的语义检索
+
+- 嵌入模型可插拔: 默认使用零依赖的特征哈希模型(字符n-gram),
+  配置 FLEET_EMBEDDING_MODEL=st:<模型名或本地路径> 可改用本地sentence-transformers模型,
+  也可通过register_embedder注册自定义模型
+- 后台线程为尚无向量的记忆批量计算嵌入,以float16 BLOB存入memory_embeddings表;
+  启动时按rowid完整扫描一遍(补齐缺失向量、模型变更后重算),之后只扫描已处理位置之后的新行
+- 检索时在内存中的float16矩阵上做NumPy向量化点积;行数超过阈值后构建IVF(k-means分桶)
+  近似索引,只扫描与查询最接近的若干个桶
+"""
+import re
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - 可选依赖
+    np = None
+
+# 向量索引依赖numpy
+VECTORS_AVAILABLE = np is not None
+
+from app.config import (
+    FLEET_EMBEDDING_MODEL,
+    FLEET_EMBEDDING_DIM,
+    FLEET_EMBEDDING_BATCH,
+    FLEET_VECTOR_ANN_THRESHOLD,
+    FLEET_VECTOR_ANN_NPROBE,
+)
+
+
+# ==================== 嵌入模型 ====================
+
+# ASCII词与非ASCII字符串(中文等)
+_SEGMENT = re.compile(r"[a-z0-9]+|[^\x00-\x7f\s]+")
+
+
+class HashingEmbedder:
+    """
+    特征哈希嵌入(无需模型文件)
+
+    英文按词及词内字符三元组、中文等按单字与相邻双字提取特征,哈希到固定维度后L2归一化。
+    能匹配词形变化与部分重叠的表述,语义泛化能力弱于神经网络模型
+    """
+
+    def __init__(self, dim: int = FLEET_EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> Dict[str, float]:
+        features: Dict[str, float] = {}
+        for segment in _SEGMENT.findall(text.lower()):
+            if segment.isascii():
+                features["w:" + segment] = features.get("w:" + segment, 0.0) + 1.0
+                padded = f"#{segment}#"
+                for i in range(len(padded) - 2):
+                    key = "t:" + padded[i:i + 3]
+                    features[key] = features.get(key, 0.0) + 0.5
+            else:
+                for i, char in enumerate(segment):
+                    features["c:" + char] = features.get("c:" + char, 0.0) + 0.5
+                    if i + 1 < len(segment):
+                        key = "b:" + segment[i:i + 2]
+                        features[key] = features.get(key, 0.0) + 1.0
+        return features
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text or "").items():
+                h = zlib.crc32(feature.encode("utf-8"))
+                # 高位决定符号,减少哈希冲突带来的偏差
+                vectors[row, h % self.dim] += (1.0 if h & 0x80000000 else -1.0) * np.log1p(weight)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class SentenceTransformerEmbedder:
+    """本地sentence-transformers模型(CPU推理,模型需已下载到本地缓存或指定本地路径)"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"st:{model_name}"
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        vectors = self.model.encode(
+            texts,
+            batch_size=32,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return vectors.astype(np.float32)
+
+
+# {名称: 无参工厂函数}
+_EMBEDDERS: Dict[str, Callable[[], Any]] = {
+    "hashing": HashingEmbedder,
+}
+
+
+def register_embedder(name: str, factory: Callable[[], Any]):
+    """
+    注册自定义嵌入模型
+
+    工厂返回的对象需有name(写入数据库,变更后会重新计算全部向量)、dim属性,
+    以及embed(texts) -> float32数组(每行L2归一化)方法
+    """
+    _EMBEDDERS[name] = factory
+
+
+def create_embedder(spec: str = FLEET_EMBEDDING_MODEL):
+    """按配置创建嵌入模型,加载失败时回退到特征哈希模型"""
+    try:
+        if spec in _EMBEDDERS:
+            return _EMBEDDERS[spec]()
+        if spec.startswith("st:"):
+            return SentenceTransformerEmbedder(spec[3:])
+        raise ValueError(f"未知的嵌入模型: {spec}")
+    except Exception as e:
+        print(f"⚠️  嵌入模型 {spec} 加载失败,使用特征哈希模型: {e}")
+        return HashingEmbedder()
+
+
+# ==================== 向量索引 ====================
+
+class VectorIndex:
+    """
+    记忆向量索引
+
+    Args:
+        db: FleetMemoryDB实例(向量存放在其memory_embeddings表中)
+        embedder_spec: 嵌入模型配置
+    """
+
+    # 精确检索时每次参与点积的行数(限制float16转float32的临时内存)
+    SCORE_CHUNK = 65536
+    # 新增行数超过IVF构建时的该比例后重建
+    ANN_REBUILD_GROWTH = 0.2
+    # 有效行占比低于该值时压缩内存矩阵(丢弃已删除的行并重建IVF)
+    COMPACT_ALIVE_RATIO = 0.7
+    # 行数少于该值时不压缩
+    COMPACT_MIN_ROWS = 1024
+
+    def __init__(self, db, embedder_spec: str = FLEET_EMBEDDING_MODEL):
+        self.db = db
+        self.embedder_spec = embedder_spec
+        self.embedder = None
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+        # 行数据: 前_count行有效
+        self._count = 0
+        self._matrix: Optional["np.ndarray"] = None
+        self._rowids: Optional["np.ndarray"] = None
+        self._session_codes: Optional["np.ndarray"] = None
+        self._alive: Optional["np.ndarray"] = None
+        self._session_ids: Dict[str, int] = {}
+
+        # 已检查到的memories.rowid(之前的行都已有当前模型的向量),
+        # 回退(删除导致rowid可能被复用、导入覆盖内容)时递增_scan_generation,进行中的批次不再推进该位置
+        self._high_water = 0
+        self._scan_generation = 0
+
+        # IVF近似索引
+        self._centroids: Optional["np.ndarray"] = None
+        self._lists: List["np.ndarray"] = []
+        self._ann_rows = 0
+
+        # 统计
+        self.embedded_total = 0
+        self.embed_seconds = 0.0
+        self.searches = 0
+        self.compactions = 0
+        self.last_error: Optional[str] = None
+
+    # ==================== 后台计算 ====================
+
+    def start(self):
+        """启动嵌入计算线程(加载已有向量并补算缺失的向量)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._worker_loop, name="fleet-embedder", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def notify(self):
+        """有新记忆写入"""
+        self._wakeup.set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """等待已有向量加载完成"""
+        return self._ready.wait(timeout)
+
+    def _worker_loop(self):
+        try:
+            self.embedder = create_embedder(self.embedder_spec)
+            self._load()
+        except Exception as e:
+            self.last_error = f"加载向量失败: {e}"
+            print(f"❌ Fleet记忆向量索引加载失败: {e}")
+        finally:
+            self._ready.set()
+
+        while not self._stop.is_set():
+            try:
+                while not self._stop.is_set() and self._embed_pending():
+                    pass
+                self._maybe_compact()
+                self._maybe_build_ann()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ Fleet记忆向量计算失败: {e}")
+            self._wakeup.wait(timeout=30)
+            self._wakeup.clear()
+
+    def _load(self):
+        """从数据库加载当前模型的全部向量"""
+        cursor = self.db._conn().execute("""
+            SELECT e.rowid, m.session_id, e.vector
+            FROM memory_embeddings e
+            JOIN memories m ON m.rowid = e.rowid
+            WHERE e.model = ?
+        """, (self.embedder.name,))
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            vectors = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.float16)
+            self._append(
+                [row[0] for row in rows],
+                [row[1] for row in rows],
+                vectors.reshape(len(rows), self.embedder.dim)
+            )
+
+    def rescan(self):
+        """从头检查一遍(内容在原rowid上被覆盖后,如按id覆盖导入)"""
+        with self._lock:
+            self._lower_high_water_locked(0)
+        self._wakeup.set()
+
+    def _embed_pending(self) -> bool:
+        """
+        为已处理位置之后一批尚无向量(或模型已变更)的记忆计算向量,返回是否还有待处理的
+
+        按rowid分页,每批只从上次的位置往后查找,整遍扫描的总代价与行数成线性
+        """
+        conn = self.db._conn()
+        with self._lock:
+            after, generation = self._high_water, self._scan_generation
+        # 先取上界: 之后写入的行rowid更大(删除后复用rowid的情况由mark_deleted回退位置)
+        top = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM memories").fetchone()[0]
+        rows = conn.execute("""
+            SELECT m.rowid, m.session_id, fleet_text(m.content, m.content_codec)
+            FROM memories m
+            LEFT JOIN memory_embeddings e ON e.rowid = m.rowid
+            WHERE m.rowid > ? AND m.rowid <= ? AND (e.rowid IS NULL OR e.model != ?)
+            ORDER BY m.rowid
+            LIMIT ?
+        """, (after, top, self.embedder.name, FLEET_EMBEDDING_BATCH)).fetchall()
+        more = len(rows) == FLEET_EMBEDDING_BATCH
+        if not rows:
+            # 期间位置被回退时需要重新检查
+            return not self._advance_high_water(top, generation)
+
+        started = time.perf_counter()
+        vectors = self.embedder.embed([row[2] for row in rows]).astype(np.float16)
+        self.embed_seconds += time.perf_counter() - started
+
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO memory_embeddings (rowid, model, dim, vector) VALUES (?, ?, ?, ?)",
+                [(row[0], self.embedder.name, self.embedder.dim, vectors[i].tobytes()) for i, row in enumerate(rows)]
+            )
+        # 内容变更的行在内存中可能还有旧向量(行仍存在,不回退已处理位置)
+        with self._lock:
+            self._mark_dead([row[0] for row in rows])
+        self._append([row[0] for row in rows], [row[1] for row in rows], vectors)
+        self.embedded_total += len(rows)
+        advanced = self._advance_high_water(rows[-1][0] if more else top, generation)
+        return more or not advanced
+
+    def _advance_high_water(self, rowid: int, generation: int) -> bool:
+        """推进已处理位置,期间被回退过(generation已变化)时不推进,返回是否推进"""
+        with self._lock:
+            if generation != self._scan_generation:
+                return False
+            self._high_water = max(self._high_water, rowid)
+            return True
+
+    def _append(self, rowids: List[int], sessions: List[str], vectors: "np.ndarray"):
+        with self._lock:
+            needed = self._count + len(rowids)
+            if self._matrix is None or needed > len(self._matrix):
+                capacity = max(1024, needed, (len(self._matrix) if self._matrix is not None else 0) * 2)
+                matrix = np.zeros((capacity, self.embedder.dim), dtype=np.float16)
+                row_ids = np.zeros(capacity, dtype=np.int64)
+                codes = np.zeros(capacity, dtype=np.int32)
+                alive = np.zeros(capacity, dtype=bool)
+                if self._matrix is not None:
+                    matrix[:self._count] = self._matrix[:self._count]
+                    row_ids[:self._count] = self._rowids[:self._count]
+                    codes[:self._count] = self._session_codes[:self._count]
+                    alive[:self._count] = self._alive[:self._count]
+                self._matrix, self._rowids, self._session_codes, self._alive = matrix, row_ids, codes, alive
+
+            end = self._count + len(rowids)
+            self._matrix[self._count:end] = vectors
+            self._rowids[self._count:end] = rowids
+            self._session_codes[self._count:end] = [
+                self._session_ids.setdefault(session, len(self._session_ids)) for session in sessions
+            ]
+            self._alive[self._count:end] = True
+            self._count = end
+
+    def mark_deleted(self, rowids: List[int]):
+        """
+        标记已删除(或内容已变更)的行,检索时跳过
+
+        删除了rowid最大的行时,之后的新行可能复用这些rowid,
+        已处理位置回退到剩余最大的有效rowid,使复用的行仍会被计算向量
+        """
+        if not rowids or self._count == 0:
+            return
+        with self._lock:
+            self._mark_dead(rowids)
+            live = self._rowids[:self._count][self._alive[:self._count]]
+            self._lower_high_water_locked(int(live.max()) if len(live) else 0)
+
+    def _mark_dead(self, rowids: List[int]):
+        if self._count:
+            self._alive[:self._count][np.isin(self._rowids[:self._count], rowids)] = False
+
+    def _lower_high_water_locked(self, rowid: int):
+        if rowid < self._high_water:
+            self._high_water = rowid
+            self._scan_generation += 1
+
+    def _maybe_compact(self):
+        """已删除的行占比过高时压缩内存矩阵,丢弃已删除的行(IVF分桶随之失效,之后重建)"""
+        with self._lock:
+            count = self._count
+            if count < self.COMPACT_MIN_ROWS:
+                return
+            keep = np.flatnonzero(self._alive[:count])
+            if len(keep) >= count * self.COMPACT_ALIVE_RATIO:
+                return
+            capacity = max(1024, len(keep) * 2)
+            matrix = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float16)
+            row_ids = np.zeros(capacity, dtype=np.int64)
+            codes = np.zeros(capacity, dtype=np.int32)
+            alive = np.zeros(capacity, dtype=bool)
+            matrix[:len(keep)] = self._matrix[keep]
+            row_ids[:len(keep)] = self._rowids[keep]
+            codes[:len(keep)] = self._session_codes[keep]
+            alive[:len(keep)] = True
+            # 检索方持有旧数组的引用,替换而不是原地修改
+            self._matrix, self._rowids, self._session_codes, self._alive = matrix, row_ids, codes, alive
+            self._count = len(keep)
+            self._centroids, self._lists, self._ann_rows = None, [], 0
+            self.compactions += 1
+        print(f"🧹 Fleet记忆向量已压缩: {count} -> {len(keep)}行")
+
+    # ==================== IVF近似索引 ====================
+
+    def _maybe_build_ann(self):
+        count = self._count
+        if count < FLEET_VECTOR_ANN_THRESHOLD:
+            return
+        if self._centroids is not None and count < self._ann_rows * (1 + self.ANN_REBUILD_GROWTH):
+            return
+        self._build_ann(count)
+
+    def _build_ann(self, count: int, iterations: int = 10):
+        """在前count行上训练k-means中心并分桶(桶数约为sqrt(行数))"""
+        started = time.perf_counter()
+        matrix = self._matrix[:count]
+        nlist = max(1, int(np.sqrt(count)))
+        rng = np.random.default_rng(0)
+
+        # 在样本上训练,控制构建耗时
+        sample = matrix[rng.choice(count, size=min(count, nlist * 64), replace=False)].astype(np.float32)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+        assign = np.empty(count, dtype=np.int32)
+        for start in range(0, count, self.SCORE_CHUNK):
+            chunk = matrix[start:start + self.SCORE_CHUNK].astype(np.float32)
+            assign[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+        lists = [order[bounds[c]:bounds[c + 1]] for c in range(nlist)]
+
+        with self._lock:
+            self._centroids, self._lists, self._ann_rows = centroids, lists, count
+        print(f"📊 Fleet记忆IVF索引已构建: {count}行, {nlist}个桶, 耗时{time.perf_counter() - started:.1f}s")
+
+    # ==================== 检索 ====================
+
+    def search(self, query: str, limit: int = 10, session_id: Optional[str] = None) -> List[Tuple[int, float]]:
+        """
+        语义检索,返回[(memories.rowid, 余弦相似度)],按相似度降序(只含相似度为正的行)
+
+        指定session_id时精确扫描该会话的行;否则行数超过阈值且IVF已构建时只扫描最近的若干个桶
+        """
+        if self.embedder is None or self._count == 0:
+            return []
+        self.searches += 1
+        q = self.embedder.embed([query])[0]
+
+        with self._lock:
+            count = self._count
+            matrix, rowids, codes, alive = self._matrix, self._rowids, self._session_codes, self._alive
+            centroids, lists, ann_rows = self._centroids, self._lists, self._ann_rows
+
+        if session_id is not None:
+            code = self._session_ids.get(session_id)
+            if code is None:
+                return []
+            candidates = np.flatnonzero((codes[:count] == code) & alive[:count])
+        elif centroids is not None:
+            probes = np.argsort(-(centroids @ q))[:FLEET_VECTOR_ANN_NPROBE]
+            # IVF构建之后新增的行全部参与
+            candidates = np.concatenate([lists[c] for c in probes] + [np.arange(ann_rows, count)])
+            candidates = candidates[alive[candidates]]
+        else:
+            candidates = None
+
+        if candidates is None:
+            scores = np.empty(count, dtype=np.float32)
+            for start in range(0, count, self.SCORE_CHUNK):
+                chunk = matrix[start:min(start + self.SCORE_CHUNK, count)].astype(np.float32)
+                scores[start:start + len(chunk)] = chunk @ q
+            scores[~alive[:count]] = -np.inf
+            index = np.arange(count)
+        else:
+            if len(candidates) == 0:
+                return []
+            scores = matrix[candidates].astype(np.float32) @ q
+            index = candidates
+
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        # 不相关(相似度不为正)的行不返回
+        return [(int(rowids[index[i]]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        alive = int(self._alive[:self._count].sum()) if self._count else 0
+        return {
+            "model": self.embedder.name if self.embedder else self.embedder_spec,
+            "dim": self.embedder.dim if self.embedder else None,
+            "ready": self._ready.is_set(),
+            "vectors": alive,
+            "memory_mb": round(self._matrix.nbytes / 1024 / 1024, 2) if self._matrix is not None else 0,
+            "ann_index": {"lists": len(self._lists), "rows": self._ann_rows} if self._centroids is not None else None,
+            "rows": self._count,
+            "compactions": self.compactions,
+            "embedded_total": self.embedded_total,
+            "embed_rows_per_second": round(self.embedded_total / self.embed_seconds, 1) if self.embed_seconds else None,
+            "searches": self.searches,
+            "last_error": self.last_error
+        }
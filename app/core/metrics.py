@@ -0,0 +1,505 @@
+"""
+指标基础组件
+- Histogram: 预分配桶的直方图,记录开销为一次二分查找加几次整数累加,可放在热路径上
+- MetricsRegistry: Counter/Gauge/Histogram注册表,以OpenMetrics文本格式输出(GET /metrics)
+"""
+import time
+from bisect import bisect_left
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+# 默认延迟桶(毫秒): 覆盖1ms ~ 5分钟
+DEFAULT_LATENCY_BUCKETS_MS = (
+    1, 2, 3, 5, 7.5, 10, 15, 20, 30, 50, 75, 100, 150, 200, 300, 500, 750,
+    1000, 1500, 2000, 3000, 5000, 7500, 10000, 15000, 20000, 30000, 60000, 120000, 300000
+)
+
+
+class Histogram:
+    """
+    固定桶直方图
+
+    counts[i]为落在 (bounds[i-1], bounds[i]] 区间的样本数,最后一个桶为 +Inf
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum", "min", "max")
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_LATENCY_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.counts: List[int] = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float):
+        """记录一个样本"""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram"):
+        """合并另一个相同桶配置的直方图"""
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        估算分位数(桶内线性插值,结果限制在[min, max]内)
+
+        Args:
+            q: 分位点,0-100
+        """
+        if self.count == 0:
+            return None
+
+        rank = q / 100 * self.count
+        cumulative = 0
+        for i, c in enumerate(self.counts):
+            if c == 0:
+                continue
+            if cumulative + c >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                value = lower + (upper - lower) * ((rank - cumulative) / c)
+                return min(max(value, self.min), self.max)
+            cumulative += c
+        return self.max
+
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def buckets(self) -> Dict[str, int]:
+        """累积桶计数 {上界: 小于等于该上界的样本数}"""
+        result = {}
+        cumulative = 0
+        for bound, c in zip(list(self.bounds) + ["+Inf"], self.counts):
+            cumulative += c
+            result[str(bound)] = cumulative
+        return result
+
+    def summary(self, ndigits: int = 2) -> Dict[str, Optional[float]]:
+        """常用统计量"""
+        def _round(v):
+            return round(v, ndigits) if v is not None else None
+
+        return {
+            "count": self.count,
+            "mean": _round(self.mean()),
+            "min": _round(self.min),
+            "max": _round(self.max),
+            "p50": _round(self.percentile(50)),
+            "p95": _round(self.percentile(95)),
+            "p99": _round(self.percentile(99)),
+        }
+
+
+# ==================== OpenMetrics指标注册表 ====================
+#
+# 记录路径不加锁: 子指标在首次使用时创建,之后只做属性累加,
+# 依赖GIL保证单次累加的原子性(极端并发下允许极少量计数误差),换取热路径上的零锁开销
+
+# 默认延迟桶(秒),用于HTTP/LLM等Prometheus直方图
+DEFAULT_LATENCY_BUCKETS_SECONDS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300
+)
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    # 文本格式要求的特殊值写法
+    if value != value:
+        return "NaN"
+    if value == float("inf"):
+        return "+Inf"
+    if value == float("-inf"):
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """指标基类: 管理标签子指标"""
+
+    type_name = "unknown"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: Any, **kwargs: Any):
+        """获取(必要时创建)指定标签值的子指标"""
+        if kwargs:
+            values = tuple(str(kwargs[name]) for name in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            # dict.setdefault在CPython中是原子操作,并发创建时只会保留一个
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        return self._children[()]
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """单调递增计数器(名称不含_total后缀,输出时自动追加)"""
+
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield "_total", dict(zip(self.labelnames, values)), child.value
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """采集时调用function取值(适合读取已有数据结构的大小)"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return float("nan")
+        return self.value
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default().dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default().set_function(function)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield "", dict(zip(self.labelnames, values)), child.get()
+
+
+class HistogramMetric(_Metric):
+    """Prometheus直方图(子指标为预分配桶的Histogram)"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS_SECONDS
+    ):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return Histogram(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values))
+            yield from histogram_samples(child, labels)
+
+
+def histogram_samples(
+    histogram: Histogram,
+    labels: Dict[str, str],
+    scale: float = 1.0
+) -> Iterator[Tuple[str, Dict[str, str], float]]:
+    """
+    把Histogram展开为 _bucket/_count/_sum 样本
+
+    Args:
+        scale: 桶边界与总和的换算系数(如毫秒直方图以秒输出时为0.001)
+    """
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        yield "_bucket", {**labels, "le": _format_value(round(float(bound) * scale, 9))}, cumulative
+    yield "_bucket", {**labels, "le": "+Inf"}, histogram.count
+    yield "_count", labels, histogram.count
+    yield "_sum", labels, histogram.sum * scale
+
+
+class MetricFamily:
+    """采集时动态生成的指标族(由collector返回)"""
+
+    def __init__(self, name: str, type_name: str, documentation: str):
+        self.name = name
+        self.type_name = type_name
+        self.documentation = documentation
+        self._samples: List[Tuple[str, Dict[str, str], float]] = []
+
+    def add(self, value: float, suffix: str = "", **labels: Any):
+        self._samples.append((suffix, {k: str(v) for k, v in labels.items()}, value))
+        return self
+
+    def add_histogram(self, histogram: Histogram, scale: float = 1.0, **labels: Any):
+        self._samples.extend(histogram_samples(histogram, {k: str(v) for k, v in labels.items()}, scale))
+        return self
+
+    def samples(self):
+        return iter(self._samples)
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self, prefix: str = "agent6_"):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        metric.name = self.prefix + metric.name
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS_SECONDS
+    ) -> HistogramMetric:
+        return self._register(HistogramMetric(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]):
+        """注册采集回调: 每次抓取时调用,返回MetricFamily列表(名称无需前缀)"""
+        self._collectors.append(collector)
+
+    def collect(self) -> Iterator[Any]:
+        yield from list(self._metrics.values())
+        for collector in list(self._collectors):
+            try:
+                for family in collector():
+                    family.name = self.prefix + family.name
+                    yield family
+            except Exception:
+                # 单个采集器失败不影响整体输出
+                continue
+
+    def render(self, openmetrics: bool = True) -> str:
+        """
+        输出文本格式
+
+        Args:
+            openmetrics: True输出OpenMetrics 1.0格式,False输出Prometheus 0.0.4文本格式
+        """
+        lines: List[str] = []
+        for metric in self.collect():
+            type_name = metric.type_name
+            header_name = metric.name
+            if type_name == "counter" and not openmetrics:
+                header_name = metric.name + "_total"
+            if type_name == "unknown" and not openmetrics:
+                # Prometheus文本格式中未声明类型为untyped
+                type_name = "untyped"
+            lines.append(f"# HELP {header_name} {metric.documentation}")
+            lines.append(f"# TYPE {header_name} {type_name}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+# 全局注册表
+registry = MetricsRegistry()
+
+# HTTP请求
+http_requests_total = registry.counter(
+    "http_requests", "HTTP请求数", ("method", "route", "status"))
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP请求耗时(流式响应为整个流的时长)", ("method", "route"))
+http_requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "处理中的HTTP请求数")
+
+# LangGraph运行
+graph_runs_in_flight = registry.gauge(
+    "graph_runs_in_flight", "运行中的LangGraph工作流", ("endpoint",))
+graph_runs_total = registry.counter(
+    "graph_runs", "LangGraph工作流运行次数", ("endpoint", "status"))
+graph_run_duration_seconds = registry.histogram(
+    "graph_run_duration_seconds", "LangGraph工作流单次运行耗时", ("endpoint",))
+
+# LLM
+llm_requests_total = registry.counter(
+    "llm_requests", "LLM调用次数", ("status",))
+llm_ttft_seconds = registry.histogram(
+    "llm_ttft_seconds", "LLM首token延迟(仅流式调用)")
+llm_request_duration_seconds = registry.histogram(
+    "llm_request_duration_seconds", "LLM调用总耗时")
+llm_tokens_per_second = registry.histogram(
+    "llm_tokens_per_second", "LLM解码速度(输出tokens/秒)",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 40, 50, 75, 100, 150, 200, 300, 500))
+llm_tokens_total = registry.counter(
+    "llm_tokens", "LLM token用量", ("kind",))
+
+# Fleet记忆库
+fleet_db_operations_total = registry.counter(
+    "fleet_db_operations", "FleetMemoryDB操作次数", ("op", "status"))
+fleet_db_operation_duration_seconds = registry.histogram(
+    "fleet_db_operation_duration_seconds", "FleetMemoryDB操作耗时", ("op",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+
+# Fleet外发同步
+fleet_sync_requests_total = registry.counter(
+    "fleet_sync_requests", "Fleet API同步请求数", ("mode", "status"))
+fleet_sync_request_duration_seconds = registry.histogram(
+    "fleet_sync_request_duration_seconds", "Fleet API同步请求耗时", ("mode",))
+fleet_sync_memories_total = registry.counter(
+    "fleet_sync_memories", "外发同步的记忆条数", ("status",))
+fleet_sync_backlog = registry.gauge(
+    "fleet_sync_backlog", "未同步到Fleet API的记忆数")
+
+
+class track_duration:
+    """
+    计时上下文管理器(同步/异步均可用)
+
+    with track_duration(fleet_db_operation_duration_seconds.labels(op="add")):
+        ...
+    """
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+
+class track_graph_run:
+    """
+    统计一次LangGraph运行(运行中数量、结果、耗时)
+
+    with track_graph_run("chat_stream"):
+        async for event in app_graph.astream_events(...):
+            ...
+    """
+
+    __slots__ = ("endpoint", "start")
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        graph_runs_in_flight.labels(endpoint=self.endpoint).inc()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        graph_runs_in_flight.labels(endpoint=self.endpoint).dec()
+        graph_run_duration_seconds.labels(endpoint=self.endpoint).observe(time.perf_counter() - self.start)
+        if exc_type is None:
+            status = "ok"
+        elif exc_type.__name__ in ("CancelledError", "GeneratorExit"):
+            status = "cancelled"
+        else:
+            status = "error"
+        graph_runs_total.labels(endpoint=self.endpoint, status=status).inc()
+        return False
+
+
+async def track_graph_stream(endpoint: str, stream: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """包装astream/astream_events,在迭代期间计入运行中的工作流"""
+    with track_graph_run(endpoint):
+        async for item in stream:
+            yield item
@@ -0,0 +1,229 @@
+"""
+按需采样分析器
+在独立线程中按固定频率通过sys._current_frames抓取所有线程(事件循环、Playwright、
+工具执行线程池等)的调用栈,聚合为折叠栈(collapsed stack)格式,
+可直接交给 flamegraph.pl / speedscope / inferno 渲染火焰图
+
+单次采样的耗时超出开销预算时自动拉长采样间隔,在高负载实例上触发也不会拖垮服务
+"""
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import PROFILER_DEFAULT_RATE, PROFILER_MAX_RATE, PROFILER_MAX_SECONDS, PROFILER_MAX_OVERHEAD
+
+# 项目根目录(项目内文件显示相对路径)
+PROJECT_ROOT = str(Path(__file__).resolve().parents[2])
+
+# 空闲等待的叶子帧(文件名, 函数名),默认不计入采样
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("socketserver.py", "serve_forever"),
+    ("socket.py", "accept"),
+}
+
+# 线程池线程名的序号后缀(ThreadPoolExecutor-0_3、asyncio_2),合并同一线程池时去掉
+_THREAD_SUFFIX = re.compile(r"[_-]\d+$")
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(PROJECT_ROOT):
+        return filename[len(PROJECT_ROOT):].lstrip("/\\")
+    marker = "site-packages"
+    index = filename.rfind(marker)
+    if index >= 0:
+        return filename[index + len(marker):].lstrip("/\\")
+    return Path(filename).name
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (Path(code.co_filename).name, code.co_name) in IDLE_FRAMES
+
+
+class SamplingProfiler:
+    """进程内采样分析器(同一时间只允许一次采样)"""
+
+    # 每个栈最多保留的帧数(保留最内层)
+    MAX_DEPTH = 128
+
+    def __init__(self, max_overhead: float = PROFILER_MAX_OVERHEAD):
+        self.max_overhead = max_overhead
+        self.last_result: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._progress: Optional[Dict[str, Any]] = None
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def profile(
+        self,
+        seconds: float,
+        rate: int = PROFILER_DEFAULT_RATE,
+        include_idle: bool = False,
+        include_lines: bool = False,
+        group_threads: bool = True
+    ) -> Dict[str, Any]:
+        """
+        阻塞执行一次采样(应在工作线程中调用,如asyncio.to_thread)
+
+        Args:
+            seconds: 采样时长
+            rate: 目标采样频率(Hz),开销超出预算时实际频率会更低
+            include_idle: 是否包含空闲等待的线程栈(锁等待、select、队列get等)
+            include_lines: 帧标签是否带行号(默认按函数聚合)
+            group_threads: 是否合并同一线程池的线程(去掉线程名的序号后缀)
+
+        Raises:
+            ValueError: 参数超出范围
+            RuntimeError: 已有采样在进行中
+        """
+        if not 0 < seconds <= PROFILER_MAX_SECONDS:
+            raise ValueError(f"采样时长必须在 (0, {PROFILER_MAX_SECONDS}] 秒之间")
+        if not 1 <= rate <= PROFILER_MAX_RATE:
+            raise ValueError(f"采样频率必须在 [1, {PROFILER_MAX_RATE}] Hz之间")
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("已有采样在进行中")
+        try:
+            result = self._sample(seconds, rate, include_idle, include_lines, group_threads)
+            self.last_result = result
+            return result
+        finally:
+            self._progress = None
+            self._lock.release()
+
+    def _sample(self, seconds: float, rate: int, include_idle: bool, include_lines: bool, group_threads: bool) -> Dict[str, Any]:
+        own_ident = threading.get_ident()
+        interval = 1.0 / rate
+        stacks: Counter = Counter()
+        labels: Dict[Tuple[Any, int], str] = {}
+        thread_names: Dict[int, str] = {}
+        threads_seen = set()
+        samples = idle_stacks = truncated_stacks = throttled = 0
+        sample_cost = 0.0
+
+        started_at = datetime.now().isoformat()
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_names_refresh = 0.0
+        next_at = started
+        self._progress = {"started_at": started_at, "seconds": seconds, "rate": rate, "samples": 0}
+
+        while True:
+            now = time.perf_counter()
+            if next_at > now:
+                time.sleep(next_at - now)
+            t0 = time.perf_counter()
+            if t0 >= deadline:
+                break
+
+            if t0 >= next_names_refresh:
+                thread_names = {t.ident: t.name for t in threading.enumerate()}
+                next_names_refresh = t0 + 1.0
+
+            frames = sys._current_frames()
+            frame = f = None
+            for ident, frame in frames.items():
+                if ident == own_ident:
+                    continue
+                if not include_idle and _is_idle(frame):
+                    idle_stacks += 1
+                    continue
+
+                name = thread_names.get(ident, f"thread-{ident}")
+                if group_threads:
+                    name = _THREAD_SUFFIX.sub("", name)
+                threads_seen.add(name)
+
+                stack: List[str] = []
+                f = frame
+                while f is not None and len(stack) < self.MAX_DEPTH:
+                    code = f.f_code
+                    key = (code, f.f_lineno if include_lines else 0)
+                    label = labels.get(key)
+                    if label is None:
+                        func = getattr(code, "co_qualname", code.co_name)
+                        location = _short_path(code.co_filename)
+                        if include_lines:
+                            location = f"{location}:{f.f_lineno}"
+                        label = f"{func} ({location})".replace(";", ":")
+                        labels[key] = label
+                    stack.append(label)
+                    f = f.f_back
+                if f is not None:
+                    stack.append("…")
+                    truncated_stacks += 1
+                stack.append(name.replace(";", ":").replace(" ", "_"))
+                stacks[";".join(reversed(stack))] += 1
+            # 及时释放帧引用,避免延长被采样线程局部变量的生命周期
+            frames = frame = f = None
+
+            cost = time.perf_counter() - t0
+            sample_cost += cost
+            samples += 1
+            self._progress["samples"] = samples
+
+            # 开销控制: 采样耗时占采样间隔的比例不超过预算
+            effective_interval = max(interval, cost / self.max_overhead)
+            if effective_interval > interval:
+                throttled += 1
+            next_at = t0 + effective_interval
+
+        duration = time.perf_counter() - started
+        return {
+            "started_at": started_at,
+            "duration_seconds": round(duration, 3),
+            "requested_rate": rate,
+            "effective_rate": round(samples / duration, 1) if duration > 0 else 0,
+            "samples": samples,
+            "throttled_samples": throttled,
+            "overhead_percent": round(sample_cost / duration * 100, 2) if duration > 0 else 0,
+            "mean_sample_ms": round(sample_cost / samples * 1000, 3) if samples else 0,
+            "idle_stacks": idle_stacks,
+            "truncated_stacks": truncated_stacks,
+            "threads": sorted(threads_seen),
+            "stacks": dict(stacks)
+        }
+
+    # ==================== 输出 ====================
+
+    @staticmethod
+    def collapsed(result: Dict[str, Any]) -> str:
+        """折叠栈文本: 每行 "线程;外层帧;...;内层帧 次数",按次数降序"""
+        lines = [f"{stack} {count}" for stack, count in sorted(result["stacks"].items(), key=lambda item: -item[1])]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    @staticmethod
+    def top_frames(result: Dict[str, Any], limit: int = 20) -> List[Dict[str, Any]]:
+        """按自身采样数(叶子帧)排序的热点函数"""
+        self_counts: Counter = Counter()
+        total = sum(result["stacks"].values()) or 1
+        for stack, count in result["stacks"].items():
+            self_counts[stack.rsplit(";", 1)[-1]] += count
+        return [
+            {"frame": frame, "samples": count, "percent": round(count / total * 100, 2)}
+            for frame, count in self_counts.most_common(limit)
+        ]
+
+    def get_status(self) -> Dict[str, Any]:
+        last = self.last_result
+        return {
+            "running": self.running,
+            "progress": dict(self._progress) if self._progress else None,
+            "max_overhead_percent": self.max_overhead * 100,
+            "last": {k: v for k, v in last.items() if k != "stacks"} if last else None
+        }
+
+
+# 全局采样分析器
+sampling_profiler = SamplingProfiler()
@@ -0,0 +1,108 @@
+"""
+运行上下文模块
+用contextvars记录当前请求所属的thread_id与run_id,
+供日志、监控等横切模块在不改动调用链的情况下获取
+
+contextvars只能在所属线程/任务内读取,因此另外维护两张可跨线程查询的表:
+- 任务 -> (thread_id, run_id): 由bind_run在事件循环任务中登记
+- 线程 -> 活动栈: 工具/LLM回调在执行线程中登记正在做的事情(如 tool: speech_recognition)
+供事件循环看门狗等在其他线程中定位"是谁阻塞了循环"
+"""
+import asyncio
+import threading
+import time
+import weakref
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+
+current_thread_id: ContextVar[Optional[str]] = ContextVar("current_thread_id", default=None)
+current_run_id: ContextVar[Optional[str]] = ContextVar("current_run_id", default=None)
+
+# {asyncio.Task: (thread_id, run_id)},任务结束后自动移除
+_task_runs: "weakref.WeakKeyDictionary[asyncio.Task, Tuple[Optional[str], Optional[str]]]" = weakref.WeakKeyDictionary()
+# {线程ident: [活动, ...]},支持嵌套(工具内部调用LLM等)
+_activities: Dict[int, List[Dict[str, Any]]] = {}
+
+
+def _current_task() -> Optional[asyncio.Task]:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        # 当前线程没有运行中的事件循环
+        return None
+
+
+def new_run_id() -> str:
+    """生成run_id(精确到微秒,如 run_20250101120000123456)"""
+    return f"run_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+
+
+def bind_run(thread_id: Optional[str], run_id: Optional[str] = None):
+    """绑定当前上下文的thread_id与run_id"""
+    current_thread_id.set(thread_id)
+    current_run_id.set(run_id)
+    task = _current_task()
+    if task is not None:
+        _task_runs[task] = (thread_id, run_id)
+
+
+def get_run_context() -> Dict[str, Any]:
+    """获取当前上下文"""
+    return {
+        "thread_id": current_thread_id.get(),
+        "run_id": current_run_id.get()
+    }
+
+
+def get_task_run(task: Optional[asyncio.Task]) -> Tuple[Optional[str], Optional[str]]:
+    """查询任务绑定的(thread_id, run_id),可在其他线程调用"""
+    if task is None:
+        return None, None
+    return _task_runs.get(task, (None, None))
+
+
+def push_activity(kind: str, name: str, thread_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    登记当前线程正在进行的活动
+
+    Args:
+        kind: 活动类型(tool / llm)
+        name: 名称(工具名、模型名)
+        thread_id: 会话线程(默认取当前上下文)
+
+    Returns:
+        活动记录,结束时传给pop_activity
+    """
+    ident = threading.get_ident()
+    activity = {
+        "ident": ident,
+        "kind": kind,
+        "name": name,
+        "thread_id": thread_id or current_thread_id.get(),
+        "run_id": current_run_id.get(),
+        "task": _current_task(),
+        "since": time.time()
+    }
+    _activities.setdefault(ident, []).append(activity)
+    return activity
+
+
+def pop_activity(activity: Dict[str, Any]):
+    """结束活动(按身份移除,回调乱序或在其他线程结束时也能正确清理)"""
+    ident = activity["ident"]
+    stack = _activities.get(ident)
+    if not stack:
+        return
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i] is activity:
+            del stack[i]
+            break
+    if not stack:
+        _activities.pop(ident, None)
+
+
+def get_activities(ident: int) -> List[Dict[str, Any]]:
+    """获取指定线程当前的活动栈(副本,可在其他线程调用)"""
+    return list(_activities.get(ident, ()))
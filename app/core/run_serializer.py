@@ -0,0 +1,181 @@
+"""
+按会话线程串行化运行
+多个角色同时向同一thread_id发消息时,各自启动astream会在同一checkpoint上竞争,
+且每条消息都要一次LLM调用。串行化后同一线程同时只有一个运行:
+运行期间到达的消息排队,运行结束后把排队的消息合并为下一轮的一次运行,
+该轮的事件广播给所有被合并的请求方。提供merge_key时只合并键相同的相邻条目
+"""
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional
+
+from app.config import RUN_MERGE_MAX_MESSAGES, RUN_QUEUE_MAX_PER_THREAD
+from app.core.metrics import registry
+
+serializer_turns_total = registry.counter("run_serializer_turns", "串行化后实际执行的运行数")
+serializer_messages_total = registry.counter("run_serializer_messages", "提交到串行化队列的消息数")
+serializer_merged_total = registry.counter("run_serializer_merged_messages", "被合并进其他请求运行的消息数")
+
+# 参与者事件流结束标记
+_DONE = object()
+
+
+class QueueFullError(Exception):
+    """线程的等待队列已满"""
+
+
+class _Participant:
+    """一个等待结果的请求方"""
+
+    __slots__ = ("item", "queue", "cancelled", "done")
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.cancelled = False
+        self.done = False
+
+
+class _ThreadState:
+    """单个线程的排队状态"""
+
+    __slots__ = ("pending", "batch", "worker", "run_task")
+
+    def __init__(self):
+        self.pending: List[_Participant] = []
+        self.batch: List[_Participant] = []
+        self.worker: Optional[asyncio.Task] = None
+        self.run_task: Optional[asyncio.Task] = None
+
+
+class ThreadRunSerializer:
+    """
+    按线程串行执行runner
+
+    Args:
+        runner: 接收一批条目(按到达顺序)并产出事件字典的异步生成器函数
+        max_merge: 每轮最多合并的条目数,其余留到下一轮
+        max_queue: 每个线程最多排队的条目数
+        merge_key: 条目的合并键,只有键相同的相邻条目才合并为一轮(为空则不区分)
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[List[Any]], AsyncIterator[Dict[str, Any]]],
+        max_merge: int = RUN_MERGE_MAX_MESSAGES,
+        max_queue: int = RUN_QUEUE_MAX_PER_THREAD,
+        merge_key: Optional[Callable[[Any], Hashable]] = None
+    ):
+        self.runner = runner
+        self.max_merge = max_merge
+        self.max_queue = max_queue
+        self.merge_key = merge_key
+        self._threads: Dict[str, _ThreadState] = {}
+        self.turns_total = 0
+        self.messages_total = 0
+        self.merged_total = 0
+        self.rejected_total = 0
+
+    async def submit(self, thread_id: str, item: Any) -> AsyncIterator[Dict[str, Any]]:
+        """
+        提交条目并迭代其所在轮次的事件
+
+        线程空闲时立即执行;有运行进行中时先产出 {"type": "queued", "position": n},
+        轮到时与其他排队条目合并执行。迭代方中途退出(取消、断开)时从队列移除,
+        若该轮所有请求方都已退出则取消该轮运行
+
+        Raises:
+            QueueFullError: 线程的等待队列已满
+        """
+        state = self._threads.get(thread_id)
+        if state is None:
+            state = self._threads[thread_id] = _ThreadState()
+        if len(state.pending) >= self.max_queue:
+            self.rejected_total += 1
+            raise QueueFullError(f"线程 {thread_id} 的等待队列已满 ({self.max_queue})")
+
+        participant = _Participant(item)
+        state.pending.append(participant)
+        self.messages_total += 1
+        serializer_messages_total.inc()
+        if state.worker is None:
+            state.worker = asyncio.create_task(self._drain(thread_id, state))
+        else:
+            participant.queue.put_nowait({"type": "queued", "position": len(state.pending)})
+
+        try:
+            while True:
+                event = await participant.queue.get()
+                if event is _DONE:
+                    return
+                yield event
+        finally:
+            if not participant.done:
+                self._abandon(state, participant)
+
+    def _abandon(self, state: _ThreadState, participant: _Participant):
+        participant.cancelled = True
+        if participant in state.pending:
+            state.pending.remove(participant)
+        elif participant in state.batch and all(p.cancelled for p in state.batch):
+            if state.run_task is not None:
+                state.run_task.cancel()
+
+    async def _drain(self, thread_id: str, state: _ThreadState):
+        """逐轮执行排队条目,直到队列为空"""
+        try:
+            while state.pending:
+                batch = self._next_batch(state.pending)
+                del state.pending[:len(batch)]
+                state.batch = batch
+                self.turns_total += 1
+                serializer_turns_total.inc()
+                if len(batch) > 1:
+                    self.merged_total += len(batch) - 1
+                    serializer_merged_total.inc(len(batch) - 1)
+
+                state.run_task = asyncio.create_task(self._run_batch(batch))
+                await asyncio.wait({state.run_task})
+                if not state.run_task.cancelled() and state.run_task.exception() is not None:
+                    error = {"type": "error", "message": f"运行失败: {state.run_task.exception()}"}
+                    for p in batch:
+                        p.queue.put_nowait(error)
+                for p in batch:
+                    p.done = True
+                    p.queue.put_nowait(_DONE)
+        finally:
+            state.worker = None
+            state.run_task = None
+            state.batch = []
+            if not state.pending and self._threads.get(thread_id) is state:
+                del self._threads[thread_id]
+
+    def _next_batch(self, pending: List[_Participant]) -> List[_Participant]:
+        """从队首取下一轮的条目: 最多max_merge条,且与队首合并键相同(保持到达顺序,不跳过中间条目)"""
+        batch = pending[:self.max_merge]
+        if self.merge_key is None:
+            return batch
+        key = self.merge_key(batch[0].item)
+        for index, participant in enumerate(batch[1:], start=1):
+            if self.merge_key(participant.item) != key:
+                return batch[:index]
+        return batch
+
+    async def _run_batch(self, batch: List[_Participant]):
+        async for event in self.runner([p.item for p in batch]):
+            for p in batch:
+                if not p.cancelled:
+                    p.queue.put_nowait(event)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "busy_threads": sum(1 for state in self._threads.values() if state.worker is not None),
+            "queued_messages": sum(len(state.pending) for state in self._threads.values()),
+            "turns_total": self.turns_total,
+            "messages_total": self.messages_total,
+            "merged_messages_total": self.merged_total,
+            "rejected_total": self.rejected_total,
+            # 合并节省的运行数占比
+            "merge_ratio": round(self.merged_total / self.messages_total, 3) if self.messages_total else 0,
+            "max_merge": self.max_merge,
+            "max_queue": self.max_queue
+        }
@@ -0,0 +1,343 @@
+"""
+会话生命周期管理
+按thread_id记录最近活动时间,对分散在三处的会话状态统一做淘汰:
+- LangGraph checkpointer(MemorySaver,按线程保存全部checkpoint)
+- 统一消息总线的消息历史(UnifiedMessenger.message_history)
+- LangGraph Cloud兼容API的会话表(state_manager.chat_sessions)
+
+空闲超过TTL的会话被清除;全部会话的估算内存超出预算或会话数超出上限时按最久未活动淘汰。
+有运行中的run或WebSocket连接的会话视为活跃,不会被淘汰
+"""
+import asyncio
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import (
+    SESSION_IDLE_TTL,
+    SESSION_TEMP_TTL,
+    SESSION_TEMP_PREFIX,
+    SESSION_MEMORY_BUDGET_MB,
+    SESSION_MAX_THREADS,
+    SESSION_SWEEP_INTERVAL,
+)
+
+# 单条历史消息(字典)除内容外的估算开销
+_MESSAGE_OVERHEAD = 600
+
+
+def _payload_len(value: Any, depth: int = 0) -> int:
+    """MemorySaver中序列化值的字节数(值为bytes或嵌套的(type, bytes)元组)"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, tuple) and depth < 3:
+        return sum(_payload_len(item, depth + 1) for item in value)
+    return 0
+
+
+class SessionManager:
+    """会话生命周期管理器"""
+
+    def __init__(
+        self,
+        idle_ttl: int = SESSION_IDLE_TTL,
+        temp_ttl: int = SESSION_TEMP_TTL,
+        memory_budget_mb: int = SESSION_MEMORY_BUDGET_MB,
+        max_threads: int = SESSION_MAX_THREADS,
+        sweep_interval: int = SESSION_SWEEP_INTERVAL
+    ):
+        self.idle_ttl = idle_ttl
+        self.temp_ttl = temp_ttl
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.max_threads = max_threads
+        self.sweep_interval = sweep_interval
+        self.running = False
+        self._task: Optional[asyncio.Task] = None
+
+        # {thread_id: 最近活动时间},按活动先后排列(最久未活动在前)
+        self._last_active: "OrderedDict[str, float]" = OrderedDict()
+        # {thread_id: 运行中的run数}
+        self._active_runs: Dict[str, int] = {}
+        # {thread_id: (测量时的最近活动时间, 会话对象id, 近似字节数)},会话有新活动后才重新遍历
+        self._session_sizes: Dict[str, Tuple[float, int, int]] = {}
+        # 估算在工作线程中进行(清理与会话列表可能同时估算),读写_session_sizes需持锁
+        self._sizes_lock = threading.Lock()
+        self.evicted_total = 0
+        self.evicted_by_reason: Dict[str, int] = {"idle": 0, "budget": 0, "max_threads": 0, "manual": 0}
+        self.last_sweep: Optional[Dict[str, Any]] = None
+
+    async def start(self):
+        """启动定期清理"""
+        if self.running:
+            print("⚠️  SessionManager已在运行")
+            return
+        self.running = True
+        self._task = asyncio.create_task(self._sweep_loop())
+        print(f"✅ SessionManager启动成功 (空闲TTL: {self.idle_ttl}s, 内存预算: {self.memory_budget // 1024 // 1024}MB)")
+
+    async def stop(self):
+        """停止定期清理"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        print("🛑 SessionManager已停止")
+
+    async def _sweep_loop(self):
+        while self.running:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep_async()
+            except Exception as e:
+                print(f"❌ 会话清理失败: {e}")
+
+    # ==================== 活动登记 ====================
+
+    def touch(self, thread_id: Optional[str]):
+        """登记会话活动"""
+        if not thread_id:
+            return
+        self._last_active[thread_id] = time.time()
+        self._last_active.move_to_end(thread_id)
+
+    def active_count(self) -> int:
+        """跟踪中的会话数"""
+        return len(self._last_active)
+
+    def begin_run(self, thread_id: Optional[str]):
+        """run开始: 运行期间会话不会被淘汰"""
+        if not thread_id:
+            return
+        self._active_runs[thread_id] = self._active_runs.get(thread_id, 0) + 1
+        self.touch(thread_id)
+
+    def end_run(self, thread_id: Optional[str]):
+        if not thread_id:
+            return
+        remaining = self._active_runs.get(thread_id, 0) - 1
+        if remaining > 0:
+            self._active_runs[thread_id] = remaining
+        else:
+            self._active_runs.pop(thread_id, None)
+        self.touch(thread_id)
+
+    # ==================== 会话存储 ====================
+
+    @staticmethod
+    def _stores():
+        """(checkpointer或None, 消息总线, 会话表)"""
+        from app.state import state_manager
+        from app.core.unified_messenger import unified_messenger
+
+        saver = getattr(state_manager.app_graph, "checkpointer", None)
+        if getattr(saver, "storage", None) is None:
+            saver = None
+        return saver, unified_messenger, state_manager.chat_sessions
+
+    def _is_pinned(self, thread_id: str, messenger) -> bool:
+        return bool(self._active_runs.get(thread_id) or messenger.connections.get(thread_id))
+
+    def is_pinned(self, thread_id: str) -> bool:
+        """会话是否有运行中的run或WebSocket连接"""
+        return self._is_pinned(thread_id, self._stores()[1])
+
+    def _estimate_bytes(self, saver, messenger, sessions) -> Dict[str, int]:
+        """按线程估算会话状态占用的字节数"""
+        from app.core.memory_diagnostics import approx_size
+
+        sizes: Dict[str, int] = {}
+        if saver is not None:
+            for thread_id, namespaces in list(saver.storage.items()):
+                sizes[thread_id] = sizes.get(thread_id, 0) + sum(
+                    _payload_len(saved) for by_id in list(namespaces.values()) for saved in list(by_id.values())
+                )
+            for key, writes in list(getattr(saver, "writes", {}).items()):
+                sizes[key[0]] = sizes.get(key[0], 0) + sum(_payload_len(w) for w in list(writes.values()))
+            for key, blob in list(getattr(saver, "blobs", {}).items()):
+                sizes[key[0]] = sizes.get(key[0], 0) + _payload_len(blob)
+
+        for thread_id, history in list(messenger.message_history.items()):
+            sizes[thread_id] = sizes.get(thread_id, 0) + sum(
+                sys.getsizeof(message.get("content") or "") + _MESSAGE_OVERHEAD for message in list(history)
+            )
+
+        for thread_id, session in list(sessions.items()):
+            stamp = self._last_active.get(thread_id)
+            with self._sizes_lock:
+                cached = self._session_sizes.get(thread_id)
+            if cached is not None and cached[0] == stamp and cached[1] == id(session):
+                size = cached[2]
+            else:
+                size = approx_size(session, max_objects=20000)[0]
+                with self._sizes_lock:
+                    self._session_sizes[thread_id] = (stamp, id(session), size)
+            sizes[thread_id] = sizes.get(thread_id, 0) + size
+        return sizes
+
+    def _known_threads(self, saver, messenger, sessions) -> set:
+        threads = set(messenger.message_history) | set(messenger.connections) | set(sessions)
+        if saver is not None:
+            threads |= set(saver.storage)
+        return threads
+
+    def evict(self, thread_id: str, reason: str = "manual") -> Dict[str, Any]:
+        """从全部存储中清除会话,返回各处清除的条目数"""
+        saver, messenger, sessions = self._stores()
+        removed = {"checkpoints": 0, "messages": 0, "session": False}
+
+        if saver is not None:
+            removed["checkpoints"] = sum(len(by_id) for by_id in saver.storage.get(thread_id, {}).values())
+            if hasattr(saver, "delete_thread"):
+                saver.delete_thread(thread_id)
+            else:
+                saver.storage.pop(thread_id, None)
+                for store in (getattr(saver, "writes", {}), getattr(saver, "blobs", {})):
+                    for key in [k for k in store if k[0] == thread_id]:
+                        store.pop(key, None)
+
+        history = messenger.message_history.pop(thread_id, None)
+        removed["messages"] = len(history) if history else 0
+        removed["session"] = sessions.pop(thread_id, None) is not None
+
+        tracked = self._last_active.pop(thread_id, None) is not None
+        with self._sizes_lock:
+            self._session_sizes.pop(thread_id, None)
+        if tracked or removed["checkpoints"] or removed["messages"] or removed["session"]:
+            self.evicted_total += 1
+            self.evicted_by_reason[reason] = self.evicted_by_reason.get(reason, 0) + 1
+        return removed
+
+    # ==================== 清理 ====================
+
+    def _ttl(self, thread_id: str) -> int:
+        return self.temp_ttl if thread_id.startswith(SESSION_TEMP_PREFIX) else self.idle_ttl
+
+    async def sweep_async(self) -> Dict[str, Any]:
+        """
+        执行一次清理,内存估算在线程池中完成,只有淘汰步骤回到事件循环
+
+        估算期间新建的会话按0字节计,下一轮清理再计入
+        """
+        sizes = await asyncio.to_thread(self._estimate_bytes, *self._stores())
+        return self.sweep(sizes)
+
+    def sweep(self, sizes: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        执行一次清理(在事件循环中调用,遍历期间各存储不会被其他协程修改)
+
+        1. 登记各存储中尚未跟踪的会话(以当前时间为起点计算空闲)
+        2. 淘汰空闲超过TTL的会话
+        3. 会话数或估算内存超出上限时,按最久未活动继续淘汰
+
+        Args:
+            sizes: 预先估算的各会话字节数(为空则在此同步估算)
+        """
+        started = time.perf_counter()
+        now = time.time()
+        saver, messenger, sessions = self._stores()
+
+        known = self._known_threads(saver, messenger, sessions)
+        for thread_id in known:
+            if thread_id not in self._last_active or self._is_pinned(thread_id, messenger):
+                self.touch(thread_id)
+        # 各处均已不存在的会话不再跟踪
+        for thread_id in [t for t in self._last_active if t not in known and not self._active_runs.get(t)]:
+            self._last_active.pop(thread_id, None)
+        with self._sizes_lock:
+            for thread_id in [t for t in self._session_sizes if t not in sessions]:
+                self._session_sizes.pop(thread_id, None)
+
+        evicted = {"idle": 0, "max_threads": 0, "budget": 0}
+        for thread_id, last_active in list(self._last_active.items()):
+            if now - last_active > self._ttl(thread_id) and not self._is_pinned(thread_id, messenger):
+                self.evict(thread_id, "idle")
+                evicted["idle"] += 1
+
+        candidates = [t for t in self._last_active if not self._is_pinned(t, messenger)]
+        while len(self._last_active) > self.max_threads and candidates:
+            self.evict(candidates.pop(0), "max_threads")
+            evicted["max_threads"] += 1
+
+        if sizes is None:
+            sizes = self._estimate_bytes(saver, messenger, sessions)
+        # 只统计仍在跟踪的会话(已被前两步淘汰的不再计入)
+        sizes = {t: size for t, size in sizes.items() if t in self._last_active}
+        total_bytes = sum(sizes.values())
+        while total_bytes > self.memory_budget and candidates:
+            thread_id = candidates.pop(0)
+            total_bytes -= sizes.pop(thread_id, 0)
+            self.evict(thread_id, "budget")
+            evicted["budget"] += 1
+
+        self.last_sweep = {
+            "timestamp": now,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            "sessions": len(self._last_active),
+            "estimated_bytes": total_bytes,
+            "estimated_mb": round(total_bytes / 1024 / 1024, 2),
+            "evicted": evicted
+        }
+        if any(evicted.values()):
+            print(f"🧹 会话清理: 空闲{evicted['idle']}个, 超出数量上限{evicted['max_threads']}个, 超出内存预算{evicted['budget']}个")
+        return self.last_sweep
+
+    # ==================== 查询 ====================
+
+    def list_sessions(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        会话列表(最近活动在前)
+
+        需要估算内存,接口中应通过asyncio.to_thread调用;已缓存的会话大小不会重新遍历
+        """
+        saver, messenger, sessions = self._stores()
+        sizes = self._estimate_bytes(saver, messenger, sessions)
+        now = time.time()
+        result = []
+        for thread_id in reversed(list(self._last_active)):
+            last_active = self._last_active.get(thread_id)
+            if last_active is None:
+                continue
+            history = messenger.message_history.get(thread_id)
+            result.append({
+                "thread_id": thread_id,
+                "last_active": last_active,
+                "idle_seconds": round(now - last_active, 1),
+                "ttl_seconds": self._ttl(thread_id),
+                "active_runs": self._active_runs.get(thread_id, 0),
+                "connections": len(messenger.connections.get(thread_id, ())),
+                "checkpoints": sum(len(by_id) for by_id in list(saver.storage.get(thread_id, {}).values())) if saver else 0,
+                "messages": len(history) if history else 0,
+                "has_chat_session": thread_id in sessions,
+                "estimated_kb": round(sizes.get(thread_id, 0) / 1024, 1)
+            })
+            if len(result) >= limit:
+                break
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        from app.core.unified_messenger import unified_messenger
+
+        pinned = sum(1 for t in list(self._last_active) if self._is_pinned(t, unified_messenger))
+        return {
+            "running": self.running,
+            "active_sessions": len(self._last_active),
+            "pinned_sessions": pinned,
+            "running_runs": sum(self._active_runs.values()),
+            "evicted_total": self.evicted_total,
+            "evicted_by_reason": dict(self.evicted_by_reason),
+            "idle_ttl_seconds": self.idle_ttl,
+            "temp_ttl_seconds": self.temp_ttl,
+            "memory_budget_mb": self.memory_budget // 1024 // 1024,
+            "max_threads": self.max_threads,
+            "last_sweep": self.last_sweep
+        }
+
+
+# 全局会话管理器
+session_manager = SessionManager()
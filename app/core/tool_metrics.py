@@ -0,0 +1,288 @@
+"""
+工具调用指标
+以LangChain回调的形式挂载到每个工具上,记录调用次数、错误、延迟分布、输入输出大小以及冷/热启动耗时
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.core.metrics import Histogram
+from app.core.run_context import current_thread_id, push_activity, pop_activity
+
+
+# 工具空闲超过该时间(秒)后的下一次调用视为冷启动(模型/浏览器等资源可能已被换出)
+COLD_IDLE_SECONDS = 600
+# 按线程统计时最多保留的线程数(LRU淘汰)
+MAX_TRACKED_THREADS = 1000
+
+
+def _payload_size(value: Any) -> int:
+    """估算输入/输出的字节数"""
+    if value is None:
+        return 0
+    content = getattr(value, "content", value)
+    if isinstance(content, bytes):
+        return len(content)
+    return len(str(content).encode("utf-8", errors="replace"))
+
+
+def _error_from_output(output: Any) -> Optional[str]:
+    """
+    从工具输出中识别错误
+
+    项目中的工具大多捕获异常后返回错误文本(如 "Error performing web search: ...")
+    或 {"success": false, ...} 的JSON,而不是抛出异常,这里按这些约定识别
+    """
+    content = getattr(output, "content", output)
+    if getattr(output, "status", None) == "error":
+        return str(content)[:500]
+    if not isinstance(content, str):
+        return None
+    head = content.lstrip()[:200]
+    if head.startswith(("Error", "错误", "❌")):
+        return head
+    if head.startswith("{") and ('"success": false' in head or '"success":false' in head):
+        return head
+    return None
+
+
+class ToolStats:
+    """单个工具的统计"""
+
+    def __init__(self, tool_name: str):
+        self.tool_name = tool_name
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.cold_calls = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.latency = Histogram()
+        self.cold_latency = Histogram()
+        self.warm_latency = Histogram()
+        self.last_used: Optional[str] = None
+        self.last_finished_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.lock = threading.Lock()
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "tool_name": self.tool_name,
+                "usage_count": self.calls,
+                "error_count": self.errors,
+                "error_rate": round(self.errors / self.calls * 100, 2) if self.calls else 0,
+                "in_flight": self.in_flight,
+                "last_used": self.last_used,
+                "last_error": self.last_error,
+                "latency_ms": self.latency.summary(),
+                "cold_latency_ms": self.cold_latency.summary(),
+                "warm_latency_ms": self.warm_latency.summary(),
+                "cold_calls": self.cold_calls,
+                "input_bytes_total": self.input_bytes,
+                "output_bytes_total": self.output_bytes,
+                "input_bytes_avg": round(self.input_bytes / self.calls) if self.calls else 0,
+                "output_bytes_avg": round(self.output_bytes / self.calls) if self.calls else 0,
+            }
+
+
+class ToolMetrics:
+    """全部工具的调用指标"""
+
+    def __init__(self):
+        self.tools: Dict[str, ToolStats] = {}
+        # {thread_id: {tool_name: {"calls", "errors", "total_ms", "max_ms"}}}
+        self.threads: "OrderedDict[str, Dict[str, Dict[str, float]]]" = OrderedDict()
+        self.since = datetime.now()
+        self._lock = threading.Lock()
+
+    def _get(self, tool_name: str) -> ToolStats:
+        stats = self.tools.get(tool_name)
+        if stats is None:
+            with self._lock:
+                stats = self.tools.setdefault(tool_name, ToolStats(tool_name))
+        return stats
+
+    def start(self, tool_name: str):
+        """标记一次调用开始"""
+        stats = self._get(tool_name)
+        with stats.lock:
+            stats.in_flight += 1
+
+    def record(
+        self,
+        tool_name: str,
+        duration_ms: float,
+        error: Optional[str] = None,
+        input_bytes: int = 0,
+        output_bytes: int = 0,
+        thread_id: Optional[str] = None,
+        started: bool = False
+    ):
+        """
+        记录一次工具调用
+
+        Args:
+            tool_name: 工具名
+            duration_ms: 耗时(毫秒)
+            error: 错误信息(成功时为None)
+            input_bytes/output_bytes: 输入输出大小
+            thread_id: 所属会话线程
+            started: 调用开始时是否已通过start()登记(用于维护in_flight)
+        """
+        stats = self._get(tool_name)
+        now = time.time()
+        with stats.lock:
+            if started:
+                stats.in_flight = max(0, stats.in_flight - 1)
+            cold = stats.last_finished_at is None or now - stats.last_finished_at > COLD_IDLE_SECONDS
+            stats.calls += 1
+            stats.latency.observe(duration_ms)
+            if cold:
+                stats.cold_calls += 1
+                stats.cold_latency.observe(duration_ms)
+            else:
+                stats.warm_latency.observe(duration_ms)
+            if error is not None:
+                stats.errors += 1
+                stats.last_error = error[:500]
+            stats.input_bytes += input_bytes
+            stats.output_bytes += output_bytes
+            stats.last_used = datetime.now().isoformat()
+            stats.last_finished_at = now
+
+        if thread_id:
+            self._record_thread(thread_id, tool_name, duration_ms, error is not None)
+
+    def _record_thread(self, thread_id: str, tool_name: str, duration_ms: float, failed: bool):
+        with self._lock:
+            per_thread = self.threads.get(thread_id)
+            if per_thread is None:
+                per_thread = self.threads[thread_id] = {}
+                while len(self.threads) > MAX_TRACKED_THREADS:
+                    self.threads.popitem(last=False)
+            else:
+                self.threads.move_to_end(thread_id)
+
+            entry = per_thread.setdefault(tool_name, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["calls"] += 1
+            entry["errors"] += 1 if failed else 0
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+
+    def get_all(self) -> List[Dict[str, Any]]:
+        """所有工具的统计(按调用次数降序)"""
+        stats = [s.to_dict() for s in list(self.tools.values())]
+        stats.sort(key=lambda x: x["usage_count"], reverse=True)
+        return stats
+
+    def get_thread_breakdown(self, thread_id: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """
+        按线程的工具耗时分布
+
+        Args:
+            thread_id: 指定线程,为None时返回最近活跃的limit个线程
+        """
+        with self._lock:
+            if thread_id is not None:
+                items = [(thread_id, self.threads.get(thread_id, {}))]
+            else:
+                items = list(self.threads.items())[-limit:][::-1]
+            snapshot = {tid: {name: dict(v) for name, v in tools.items()} for tid, tools in items}
+
+        result = {}
+        for tid, tools in snapshot.items():
+            total_ms = sum(v["total_ms"] for v in tools.values())
+            for v in tools.values():
+                v["total_ms"] = round(v["total_ms"], 2)
+                v["max_ms"] = round(v["max_ms"], 2)
+                v["share_percent"] = round(v["total_ms"] / total_ms * 100, 2) if total_ms else 0
+            result[tid] = {
+                "total_tool_ms": round(total_ms, 2),
+                "dominant_tool": max(tools, key=lambda name: tools[name]["total_ms"]) if tools else None,
+                "tools": tools
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self.tools.clear()
+            self.threads.clear()
+            self.since = datetime.now()
+
+
+class ToolMetricsCallback(BaseCallbackHandler):
+    """
+    工具指标回调
+
+    挂载到BaseTool.callbacks上,对同步/异步调用均生效;
+    run_inline保证回调在工具所在线程同步执行,不额外占用线程池
+    """
+
+    run_inline = True
+
+    def __init__(self, metrics: ToolMetrics):
+        self.metrics = metrics
+        # {run_id: (tool_name, start_time, input_bytes, thread_id, activity)}
+        self._runs: Dict[UUID, tuple] = {}
+
+    def on_tool_start(
+        self,
+        serialized: Dict[str, Any],
+        input_str: str,
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> None:
+        tool_name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        thread_id = (metadata or {}).get("thread_id") or current_thread_id.get()
+        # 登记到执行线程的活动栈,事件循环被阻塞时据此标注是哪个工具
+        activity = push_activity("tool", tool_name, thread_id)
+        self._runs[run_id] = (tool_name, time.perf_counter(), _payload_size(input_str), thread_id, activity)
+        self.metrics.start(tool_name)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, output=output, error=_error_from_output(output))
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, error=f"{type(error).__name__}: {error}")
+
+    def _finish(self, run_id: UUID, output: Any = None, error: Optional[str] = None):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        tool_name, started_at, input_bytes, thread_id, activity = run
+        pop_activity(activity)
+        self.metrics.record(
+            tool_name,
+            duration_ms=(time.perf_counter() - started_at) * 1000,
+            error=error,
+            input_bytes=input_bytes,
+            output_bytes=_payload_size(output),
+            thread_id=thread_id,
+            started=True
+        )
+
+
+# 全局工具指标
+tool_metrics = ToolMetrics()
+tool_metrics_callback = ToolMetricsCallback(tool_metrics)
+
+
+def instrument_tool(tool):
+    """为工具挂载指标回调(重复调用不会重复挂载)"""
+    callbacks = tool.callbacks
+    if callbacks is None:
+        tool.callbacks = [tool_metrics_callback]
+    elif isinstance(callbacks, list):
+        if tool_metrics_callback not in callbacks:
+            tool.callbacks = callbacks + [tool_metrics_callback]
+    elif tool_metrics_callback not in callbacks.handlers:
+        callbacks.add_handler(tool_metrics_callback, inherit=False)
+    return tool
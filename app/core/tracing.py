@@ -0,0 +1,625 @@
+"""
+运行级链路追踪
+每次对话运行(run)记录一棵span树: 运行 → 图 → 节点 → LLM调用/工具调用,
+外加检查点读写与消息广播,用于回答"这次回复慢在预填充、生成、抓取还是消息推送";
+追踪保存在有界的内存索引中(可按run_id与会话线程查询),可选导出为JSONL或OTLP JSON文件
+"""
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.config import (
+    TRACE_MAX_RUNS,
+    TRACE_MAX_SPANS_PER_RUN,
+    TRACE_RUNS_PER_THREAD,
+    TRACE_EXPORT_PATH,
+    TRACE_EXPORT_FORMAT,
+)
+from app.core.llm_metrics import usage_from_result
+from app.core.run_context import bind_run, current_run_id
+from app.core.session_manager import session_manager
+
+logger = logging.getLogger(__name__)
+
+# 参与耗时分解的span类型
+BREAKDOWN_KINDS = ("llm", "tool", "checkpoint", "messenger")
+
+
+class Span:
+    """一个计时区间"""
+
+    __slots__ = ("span_id", "parent_id", "name", "kind", "start", "end", "attributes", "status", "error")
+
+    def __init__(self, name: str, kind: str, parent_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes = attributes or {}
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end is None:
+            return None
+        return round((self.end - self.start) * 1000, 2)
+
+    def finish(self, status: Optional[str] = None, error: Optional[BaseException] = None, **attributes: Any):
+        """结束span(重复调用无效)"""
+        if self.end is not None:
+            return
+        self.end = time.time()
+        if error is not None:
+            self.status = "cancelled" if isinstance(error, asyncio.CancelledError) else "error"
+            self.error = str(error)[:500] or type(error).__name__
+        elif status:
+            self.status = status
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": self.duration_ms,
+            "status": self.status if self.end is not None else "running",
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+
+class Trace:
+    """一次运行的span集合,根span即运行本身"""
+
+    def __init__(self, run_id: str, thread_id: Optional[str], name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.run_id = run_id
+        self.thread_id = thread_id
+        self.trace_id = uuid.uuid4().hex
+        self.root = Span(name, "run", attributes=dict(attributes or {}, run_id=run_id, thread_id=thread_id))
+        self.spans: List[Span] = [self.root]
+        self.dropped_spans = 0
+        # 没有回调父级的span(检查点、消息广播)挂在此span下,图开始执行后指向图span
+        self.default_parent = self.root.span_id
+
+    @property
+    def finished(self) -> bool:
+        return self.root.end is not None
+
+    def add(self, span: Span) -> bool:
+        if len(self.spans) >= TRACE_MAX_SPANS_PER_RUN:
+            self.dropped_spans += 1
+            return False
+        self.spans.append(span)
+        return True
+
+    def summary(self) -> Dict[str, Any]:
+        """运行概要: 总耗时、按类型的耗时分解与LLM的token/预填充/生成统计"""
+        breakdown = {kind: 0.0 for kind in BREAKDOWN_KINDS}
+        llm = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "prefill_ms": 0.0, "generation_ms": 0.0}
+        tools: Dict[str, float] = {}
+        for span in self.spans:
+            duration = span.duration_ms or 0.0
+            if span.kind in breakdown:
+                breakdown[span.kind] += duration
+            if span.kind == "llm":
+                llm["calls"] += 1
+                for key in ("input_tokens", "output_tokens", "prefill_ms", "generation_ms"):
+                    llm[key] += span.attributes.get(key) or 0
+            elif span.kind == "tool":
+                tools[span.name] = tools.get(span.name, 0.0) + duration
+
+        return {
+            "run_id": self.run_id,
+            "thread_id": self.thread_id,
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "started_at": datetime.fromtimestamp(self.root.start).isoformat(),
+            "duration_ms": self.root.duration_ms,
+            "status": self.root.status if self.finished else "running",
+            "error": self.root.error,
+            "span_count": len(self.spans),
+            "dropped_spans": self.dropped_spans,
+            "breakdown_ms": {kind: round(value, 2) for kind, value in breakdown.items()},
+            "llm": {key: round(value, 2) if isinstance(value, float) else value for key, value in llm.items()},
+            "tools_ms": {name: round(value, 2) for name, value in tools.items()}
+        }
+
+    def to_dict(self, tree: bool = True) -> Dict[str, Any]:
+        """完整追踪,tree=True时spans为嵌套树(children),否则为按开始时间排列的扁平列表"""
+        result = self.summary()
+        spans = [span.to_dict() for span in self.spans]
+        if not tree:
+            result["spans"] = spans
+            return result
+
+        by_id = {span["span_id"]: span for span in spans}
+        for span in spans:
+            span["children"] = []
+        roots = []
+        for span in spans:
+            parent = by_id.get(span["parent_id"])
+            (parent["children"] if parent is not None else roots).append(span)
+        result["spans"] = roots
+        return result
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": "" if value is None else str(value)}
+
+
+def to_otlp(trace: Trace) -> Dict[str, Any]:
+    """转换为OTLP JSON(ExportTraceServiceRequest),可由OpenTelemetry Collector的otlpjsonfile接收器读取"""
+    spans = []
+    for span in trace.spans:
+        attributes = [{"key": "agent6.span.kind", "value": _otlp_value(span.kind)}]
+        attributes.extend({"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items())
+        if span.status == "error":
+            status = {"code": 2, "message": span.error or ""}
+        elif span.status == "ok":
+            status = {"code": 1}
+        else:
+            status = {"code": 0, "message": span.status}
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(int(span.start * 1e9)),
+            "endTimeUnixNano": str(int((span.end or span.start) * 1e9)),
+            "attributes": attributes,
+            "status": status
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "agent6"}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}]
+        }]
+    }
+
+
+class TraceExporter:
+    """
+    追踪文件导出器
+    完成的追踪进入队列,由后台线程逐行追加写入,不阻塞事件循环;队列满时丢弃并计数
+    """
+
+    QUEUE_SIZE = 1000
+
+    def __init__(self, path: str, fmt: str = "jsonl"):
+        if fmt not in ("jsonl", "otlp"):
+            raise ValueError(f"不支持的追踪导出格式: {fmt},可选: jsonl, otlp")
+        self.path = Path(path)
+        self.format = fmt
+        self.exported = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            trace = self._queue.get()
+            record = to_otlp(trace) if self.format == "otlp" else trace.to_dict(tree=False)
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                self.exported += 1
+            except OSError as e:
+                self.dropped += 1
+                logger.error(f"❌ 追踪导出失败: {e}")
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "format": self.format,
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize()
+        }
+
+
+class TracingCallback(BaseCallbackHandler):
+    """
+    追踪回调
+    通过运行配置的callbacks挂到整个图上,LangChain的run_id/parent_run_id天然构成调用树:
+    图根节点、各图节点、LLM调用与工具调用各记为一个span;条件边、通道写入、重试包装等
+    内部可运行对象不单独成span,其子步骤挂到最近的父span下
+    """
+
+    run_inline = True
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+        # {LangChain run_id: (追踪的run_id, span或None, 子步骤的父span_id)}
+        self._runs: Dict[UUID, Tuple[str, Optional[Span], str]] = {}
+        # {LLM run_id: [首token时间, 流式块数]}
+        self._streams: Dict[UUID, List[Any]] = {}
+
+    def _parent(self, parent_run_id: Optional[UUID], metadata: Optional[Dict[str, Any]]) -> Optional[Tuple[str, str]]:
+        entry = self._runs.get(parent_run_id) if parent_run_id is not None else None
+        if entry is not None:
+            return entry[0], entry[2]
+        trace_run_id = (metadata or {}).get("trace_run_id") or current_run_id.get()
+        trace = self.tracer.get_trace(trace_run_id) if trace_run_id else None
+        if trace is None or trace.finished:
+            return None
+        return trace_run_id, trace.default_parent
+
+    def _open(
+        self,
+        run_id: UUID,
+        parent_run_id: Optional[UUID],
+        metadata: Optional[Dict[str, Any]],
+        name: str,
+        kind: str,
+        **attributes: Any
+    ) -> Optional[Span]:
+        parent = self._parent(parent_run_id, metadata)
+        if parent is None:
+            return None
+        trace_run_id, parent_span_id = parent
+        span = self.tracer.start_span(trace_run_id, name, kind, parent_id=parent_span_id, **attributes)
+        self._runs[run_id] = (trace_run_id, span, span.span_id if span is not None else parent_span_id)
+        return span
+
+    def _close(self, run_id: UUID, error: Optional[BaseException] = None, **attributes: Any):
+        entry = self._runs.pop(run_id, None)
+        if entry is None or entry[1] is None:
+            return
+        span = entry[1]
+        span.finish(error=error, **attributes)
+        if span.kind == "graph":
+            # 图结束后的span(如运行收尾的消息广播)重新挂到根span下
+            trace = self.tracer.get_trace(entry[0])
+            if trace is not None and trace.default_parent == span.span_id:
+                trace.default_parent = trace.root.span_id
+
+    def forget(self, trace_run_id: str):
+        """运行结束时清理未收到结束回调的条目(如被取消的运行)"""
+        for run_id in [key for key, entry in self._runs.items() if entry[0] == trace_run_id]:
+            self._runs.pop(run_id, None)
+            self._streams.pop(run_id, None)
+
+    # ==================== 图/节点 ====================
+
+    def on_chain_start(
+        self,
+        serialized: Dict[str, Any],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name") or "chain"
+        metadata = metadata or {}
+        if parent_run_id is None:
+            span = self._open(run_id, None, metadata, name, "graph")
+            if span is not None:
+                trace = self.tracer.get_trace(self._runs[run_id][0])
+                if trace is not None:
+                    trace.default_parent = span.span_id
+        elif metadata.get("langgraph_node") == name and parent_run_id in self._runs:
+            self._open(run_id, parent_run_id, metadata, name, "node", step=metadata.get("langgraph_step"))
+        else:
+            parent = self._parent(parent_run_id, metadata)
+            if parent is not None:
+                self._runs[run_id] = (parent[0], None, parent[1])
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._close(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._close(run_id, error=error)
+
+    # ==================== LLM ====================
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[Any]],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> None:
+        self._open_llm(serialized, run_id, parent_run_id, metadata, kwargs, messages=len(messages[0]) if messages else 0)
+
+    def on_llm_start(
+        self,
+        serialized: Dict[str, Any],
+        prompts: List[str],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> None:
+        self._open_llm(serialized, run_id, parent_run_id, metadata, kwargs, prompts=len(prompts))
+
+    def _open_llm(self, serialized, run_id, parent_run_id, metadata, kwargs, **attributes):
+        params = kwargs.get("invocation_params") or {}
+        model = (
+            params.get("model") or params.get("model_name")
+            or ((serialized or {}).get("kwargs") or {}).get("model_name") or "llm"
+        )
+        self._open(run_id, parent_run_id, metadata, model, "llm", model=model, **attributes)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        stream = self._streams.get(run_id)
+        if stream is None:
+            if run_id not in self._runs:
+                return
+            self._streams[run_id] = [time.time(), 1]
+        else:
+            stream[1] += 1
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        stream = self._streams.pop(run_id, None)
+        entry = self._runs.get(run_id)
+        if entry is None or entry[1] is None:
+            self._runs.pop(run_id, None)
+            return
+        span = entry[1]
+        now = time.time()
+        usage = usage_from_result(response)
+        attributes: Dict[str, Any] = {
+            "input_tokens": usage["input"],
+            "output_tokens": usage["output"] or (stream[1] if stream else 0),
+            "streamed": stream is not None
+        }
+        if stream is not None:
+            # 流式调用: 首token之前为预填充(含排队与网络),之后为生成
+            attributes["prefill_ms"] = round((stream[0] - span.start) * 1000, 2)
+            attributes["generation_ms"] = round((now - stream[0]) * 1000, 2)
+        else:
+            attributes["generation_ms"] = round((now - span.start) * 1000, 2)
+        if attributes["output_tokens"] and attributes["generation_ms"] > 0:
+            attributes["tokens_per_second"] = round(attributes["output_tokens"] / attributes["generation_ms"] * 1000, 2)
+        try:
+            tool_calls = getattr(response.generations[0][0].message, "tool_calls", None)
+            if tool_calls:
+                attributes["tool_calls"] = ",".join(call.get("name", "") for call in tool_calls)
+        except (AttributeError, IndexError, TypeError):
+            pass
+        self._close(run_id, **attributes)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._streams.pop(run_id, None)
+        self._close(run_id, error=error)
+
+    # ==================== 工具 ====================
+
+    def on_tool_start(
+        self,
+        serialized: Dict[str, Any],
+        input_str: str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        self._open(run_id, parent_run_id, metadata, name, "tool", input_chars=len(input_str or ""))
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        content = getattr(output, "content", output)
+        self._close(run_id, output_chars=len(content if isinstance(content, str) else str(content)))
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._close(run_id, error=error)
+
+
+class Tracer:
+    """追踪索引: 按run_id保存最近的追踪,并按会话线程建立索引"""
+
+    def __init__(
+        self,
+        max_runs: int = TRACE_MAX_RUNS,
+        runs_per_thread: int = TRACE_RUNS_PER_THREAD,
+        exporter: Optional[TraceExporter] = None
+    ):
+        self.max_runs = max_runs
+        self.runs_per_thread = runs_per_thread
+        self.exporter = exporter
+        self.total_traces = 0
+        self.callback = TracingCallback(self)
+
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+        self._threads: Dict[str, Deque[str]] = {}
+        self._lock = threading.Lock()
+
+    # ==================== 运行 ====================
+
+    def start_trace(self, run_id: str, thread_id: Optional[str], name: str, **attributes: Any) -> Trace:
+        """开始记录一次运行"""
+        trace = Trace(run_id, thread_id, name, attributes)
+        with self._lock:
+            previous = self._traces.pop(run_id, None)
+            if previous is not None:
+                self._unindex(previous)
+            self._traces[run_id] = trace
+            self._threads.setdefault(thread_id or "", deque(maxlen=self.runs_per_thread)).append(run_id)
+            while len(self._traces) > self.max_runs:
+                _, evicted = self._traces.popitem(last=False)
+                self._unindex(evicted)
+            self.total_traces += 1
+        return trace
+
+    def _unindex(self, trace: Trace):
+        key = trace.thread_id or ""
+        runs = self._threads.get(key)
+        if runs is None:
+            return
+        try:
+            runs.remove(trace.run_id)
+        except ValueError:
+            pass
+        if not runs:
+            del self._threads[key]
+
+    def fail(self, run_id: str, error: Any):
+        """标记运行失败(端点捕获异常后改为推送错误事件时使用)"""
+        trace = self._traces.get(run_id)
+        if trace is not None and not trace.finished:
+            trace.root.status = "error"
+            trace.root.error = str(error)[:500]
+
+    def end_trace(self, run_id: str, status: str = "ok", error: Optional[BaseException] = None):
+        """结束运行: 关闭未结束的span并导出"""
+        trace = self._traces.get(run_id)
+        if trace is None or trace.finished:
+            return
+        for span in trace.spans[1:]:
+            span.finish(status="unfinished")
+        if trace.root.status == "error" and error is None:
+            status = "error"
+        trace.root.finish(status=status, error=error)
+        self.callback.forget(run_id)
+        if self.exporter is not None:
+            self.exporter.export(trace)
+
+    # ==================== span ====================
+
+    def start_span(self, run_id: Optional[str], name: str, kind: str, parent_id: Optional[str] = None, **attributes: Any) -> Optional[Span]:
+        """在运行中开始一个span,运行不存在或已结束时返回None"""
+        trace = self._traces.get(run_id) if run_id else None
+        if trace is None or trace.finished:
+            return None
+        span = Span(name, kind, parent_id or trace.default_parent, attributes)
+        return span if trace.add(span) else None
+
+    @contextmanager
+    def span(self, name: str, kind: str, run_id: Optional[str] = None, **attributes: Any) -> Iterator[Optional[Span]]:
+        """
+        记录一个代码块,默认归属当前上下文的运行;不在运行中时为空操作
+
+            with tracer.span("checkpoint.put", "checkpoint", step=3):
+                ...
+        """
+        span = self.start_span(run_id or current_run_id.get(), name, kind, **attributes)
+        if span is None:
+            yield None
+            return
+        try:
+            yield span
+        except BaseException as e:
+            span.finish(error=e)
+            raise
+        else:
+            span.finish()
+
+    # ==================== 查询 ====================
+
+    def get_trace(self, run_id: str) -> Optional[Trace]:
+        return self._traces.get(run_id)
+
+    def list_traces(self, thread_id: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """最近的运行概要(最新在前),可按会话线程过滤"""
+        with self._lock:
+            if thread_id is not None:
+                run_ids = list(self._threads.get(thread_id, ()))
+            else:
+                run_ids = list(self._traces)
+        summaries = []
+        for run_id in reversed(run_ids):
+            trace = self._traces.get(run_id)
+            if trace is not None:
+                summaries.append(trace.summary())
+                if len(summaries) >= limit:
+                    break
+        return summaries
+
+    def get_threads(self) -> Dict[str, int]:
+        """有追踪记录的会话线程及其运行数"""
+        with self._lock:
+            return {thread_id: len(runs) for thread_id, runs in self._threads.items()}
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "traces": len(self._traces),
+            "capacity": self.max_runs,
+            "threads": len(self._threads),
+            "total_traces": self.total_traces,
+            "running": sum(1 for trace in list(self._traces.values()) if not trace.finished),
+            "exporter": self.exporter.get_status() if self.exporter else None
+        }
+
+
+def tracing_config(run_id: str) -> Dict[str, Any]:
+    """运行配置中的追踪部分,与configurable合并后传给astream/astream_events"""
+    return {
+        "callbacks": [tracer.callback],
+        "metadata": {"trace_run_id": run_id}
+    }
+
+
+async def traced_stream(
+    run_id: str,
+    thread_id: Optional[str],
+    name: str,
+    stream: AsyncIterator[Any],
+    **attributes: Any
+) -> AsyncIterator[Any]:
+    """包装一次运行的事件流: 绑定运行上下文,登记会话活动(运行期间会话不被淘汰),迭代期间记录根span"""
+    bind_run(thread_id, run_id)
+    session_manager.begin_run(thread_id)
+    tracer.start_trace(run_id, thread_id, name, **attributes)
+    status, error = "ok", None
+    try:
+        async for item in stream:
+            yield item
+    except (asyncio.CancelledError, GeneratorExit):
+        status = "cancelled"
+        raise
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        tracer.end_trace(run_id, status, error)
+        session_manager.end_run(thread_id)
+
+
+# 全局追踪器
+tracer = Tracer(
+    exporter=TraceExporter(TRACE_EXPORT_PATH, TRACE_EXPORT_FORMAT) if TRACE_EXPORT_PATH else None
+)
@@ -9,6 +9,10 @@ from collections import deque
 import json
 import logging
 
+from app.core.codec import ENCODING_JSON, encode_frame, send_frame
+from app.core.tracing import tracer
+from app.core.session_manager import session_manager
+
 logger = logging.getLogger(__name__)
 
 
@@ -57,6 +61,9 @@ class UnifiedMessenger:
         # WebSocket连接池 {thread_id: set of websocket connections}
         self.connections: Dict[str, Set] = {}
         
+        # 每个连接协商的帧编码 {websocket: "json"/"msgpack"}
+        self.connection_encodings: Dict[Any, str] = {}
+        
         # 消息历史缓冲区 {thread_id: deque of messages}
         self.message_history: Dict[str, deque] = {}
         
@@ -68,18 +75,21 @@ class UnifiedMessenger:
         
         logger.info("✅ 统一消息总线已初始化")
     
-    def register_connection(self, thread_id: str, websocket):
+    def register_connection(self, thread_id: str, websocket, encoding: str = ENCODING_JSON):
         """注册WebSocket连接"""
         if thread_id not in self.connections:
             self.connections[thread_id] = set()
         
         self.connections[thread_id].add(websocket)
+        self.connection_encodings[websocket] = encoding
+        session_manager.touch(thread_id)
         logger.info(f"📡 新连接注册到线程 {thread_id}, 当前连接数: {len(self.connections[thread_id])}")
     
     def unregister_connection(self, thread_id: str, websocket):
         """注销WebSocket连接"""
         if thread_id in self.connections:
             self.connections[thread_id].discard(websocket)
+            self.connection_encodings.pop(websocket, None)
             logger.info(f"📡 连接从线程 {thread_id} 注销, 剩余连接数: {len(self.connections[thread_id])}")
             
             # 如果没有连接了，清理
@@ -103,23 +113,33 @@ class UnifiedMessenger:
             logger.debug(f"线程 {thread_id} 没有活跃连接，消息已保存到历史")
             return
         
-        # 广播到所有连接
-        message_dict = message.to_dict()
-        disconnected = set()
+        # 广播到所有连接(每种编码只序列化一次),耗时计入当前运行的追踪
+        with tracer.span(
+            "messenger.broadcast", "messenger",
+            message_type=message.message_type,
+            connections=len(self.connections[thread_id])
+        ):
+            payload = {
+                "type": "message",
+                "data": message.to_dict()
+            }
+            frames: Dict[str, Any] = {}
+            disconnected = set()
         
-        for websocket in self.connections[thread_id]:
-            try:
-                await websocket.send_json({
-                    "type": "message",
-                    "data": message_dict
-                })
-            except Exception as e:
-                logger.error(f"发送消息到WebSocket失败: {e}")
-                disconnected.add(websocket)
+            for websocket in list(self.connections[thread_id]):
+                encoding = self.connection_encodings.get(websocket, ENCODING_JSON)
+                if encoding not in frames:
+                    frames[encoding] = encode_frame(payload, encoding)
+                try:
+                    await send_frame(websocket, frames[encoding])
+                except Exception as e:
+                    logger.error(f"发送消息到WebSocket失败: {e}")
+                    disconnected.add(websocket)
         
-        # 清理断开的连接
-        for ws in disconnected:
-            self.unregister_connection(thread_id, ws)
+            # 清理断开的连接
+            for ws in disconnected:
+                self.unregister_connection(thread_id, ws)
+    
     
     def _save_to_history(self, thread_id: str, message: Message):
         """保存消息到历史缓冲区"""
@@ -127,6 +147,7 @@ class UnifiedMessenger:
             self.message_history[thread_id] = deque(maxlen=self.max_history_per_thread)
         
         self.message_history[thread_id].append(message.to_dict())
+        session_manager.touch(thread_id)
     
     def get_history(self, thread_id: str, limit: int = 100) -> List[Dict[str, Any]]:
         """
@@ -276,9 +297,14 @@ class UnifiedMessenger:
         total_connections = sum(len(conns) for conns in self.connections.values())
         total_messages = sum(len(hist) for hist in self.message_history.values())
         
+        encodings: Dict[str, int] = {}
+        for encoding in self.connection_encodings.values():
+            encodings[encoding] = encodings.get(encoding, 0) + 1
+        
         return {
             "active_threads": len(self.connections),
             "total_connections": total_connections,
+            "connections_by_encoding": encodings,
             "threads_with_history": len(self.message_history),
             "total_messages": total_messages,
             "threads": {
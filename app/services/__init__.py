@@ -3,5 +3,7 @@
 """
 from app.services.monitor import system_monitor
 from app.services.scheduler import task_scheduler
+from app.services.resource_sampler import resource_sampler
+from app.services.fleet_sync import fleet_sync_service
 
-__all__ = ["system_monitor", "task_scheduler"]
+__all__ = ["system_monitor", "task_scheduler", "resource_sampler", "fleet_sync_service"]
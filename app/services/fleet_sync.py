@@ -0,0 +1,540 @@
+"""
+Fleet外发同步服务
+后台把本地Fleet记忆库中未同步的记忆上传到Fleet API(发件箱模式):
+
+- 按(timestamp, id)顺序分轮读取未同步的记忆,bulk模式每个请求上传一批,服务端不支持时回退为逐条上传
+- 共用一个连接池,同时进行的请求数不超过FLEET_SYNC_CONCURRENCY
+- 网络错误、429与5xx按指数退避加全抖动重试(遵守Retry-After);整轮失败时轮间等待从轮询间隔起翻倍
+- 其余4xx视为该记忆被拒绝,暂停重传一段时间(再次被拒绝时翻倍),不在每一轮重复发送
+- 每轮的确认结果在一个事务中提交(删除或标记为已同步),不再每条记忆单独提交
+- 每条记忆带client_id(本地ID),确认提交前进程退出导致的重复上传由服务端按client_id去重
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.config import (
+    FLEET_API_BASE_URL,
+    FLEET_API_KEY,
+    FLEET_SYNC_ENABLED,
+    FLEET_SYNC_MODE,
+    FLEET_SYNC_INTERVAL,
+    FLEET_SYNC_BATCH_SIZE,
+    FLEET_SYNC_CONCURRENCY,
+    FLEET_SYNC_ROUND_ROWS,
+    FLEET_SYNC_TIMEOUT,
+    FLEET_SYNC_MAX_RETRIES,
+    FLEET_SYNC_BACKOFF_BASE,
+    FLEET_SYNC_BACKOFF_MAX,
+    FLEET_SYNC_FAILURE_BACKOFF_MAX,
+    FLEET_SYNC_REJECT_PARK_SECONDS,
+    FLEET_SYNC_DELETE_SYNCED,
+)
+from app.core.fleet_memory_db import fleet_memory_db
+from app.core.metrics import (
+    fleet_sync_requests_total,
+    fleet_sync_request_duration_seconds,
+    fleet_sync_memories_total,
+    fleet_sync_backlog,
+)
+
+MODE_BULK = "bulk"
+MODE_SINGLE = "single"
+
+# 可重试的HTTP状态码
+_RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# 与具体记忆无关的4xx(认证、权限、接口不存在),不据此暂停记忆
+_SERVICE_STATUS = {401, 403, 404, 405}
+# 被拒绝的记忆暂停重传的最长时长(秒)
+_PARK_MAX_SECONDS = 86400
+# 吞吐统计窗口(秒)
+_THROUGHPUT_WINDOW = 60
+
+
+class FleetSyncError(Exception):
+    """请求在重试后仍失败或被服务端拒绝"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def rejected(self) -> bool:
+        """请求内容被服务端拒绝(不可重试的4xx),重发相同内容不会成功"""
+        return self.status is not None and 400 <= self.status < 500 and self.status not in _SERVICE_STATUS
+
+
+class FleetSyncService:
+    """
+    Fleet外发同步服务
+
+    Args:
+        db: FleetMemoryDB或分区库(默认全局fleet_memory_db)
+        base_url/api_key: Fleet API地址与令牌
+        mode: bulk / single
+        batch_size: bulk模式每个请求的条数
+        concurrency: 同时进行的请求数
+        interval: 积压清空后的轮询间隔(秒)
+        delete_synced: 同步成功后删除本地记忆(否则只标记为已同步)
+    """
+
+    def __init__(
+        self,
+        db=None,
+        base_url: str = FLEET_API_BASE_URL,
+        api_key: str = FLEET_API_KEY,
+        mode: str = FLEET_SYNC_MODE,
+        batch_size: int = FLEET_SYNC_BATCH_SIZE,
+        concurrency: int = FLEET_SYNC_CONCURRENCY,
+        interval: float = FLEET_SYNC_INTERVAL,
+        delete_synced: bool = FLEET_SYNC_DELETE_SYNCED
+    ):
+        self.db = db if db is not None else fleet_memory_db
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.mode = mode if mode in (MODE_BULK, MODE_SINGLE) else MODE_BULK
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.round_rows = max(FLEET_SYNC_ROUND_ROWS, self.batch_size)
+        self.interval = interval
+        self.delete_synced = delete_synced
+
+        self.running = False
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        # 服务端不支持批量接口时回退为逐条上传
+        self._bulk_supported = True
+        # 本遍读取到的位置(timestamp, id): 被拒绝的记忆不会阻塞后面的记忆,读到末尾后从头开始下一遍
+        self._cursor: Optional[Tuple[str, str]] = None
+
+        # 统计
+        self.rounds = 0
+        self.synced_total = 0
+        self.failed_total = 0
+        self.requests_total = 0
+        self.request_errors = 0
+        self.retries = 0
+        self.backlog: Optional[int] = None
+        self.last_round: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+        self.last_success_at: Optional[str] = None
+        self._consecutive_failures = 0
+        # 被拒绝的记忆 {本地ID: (暂停到的monotonic时间, 被拒绝次数)},进程重启后清空(重启后各重试一次)
+        self._parked: Dict[str, Tuple[float, int]] = {}
+        self.rejected_total = 0
+        # (monotonic时间, 本轮同步条数),用于计算最近一分钟的吞吐
+        self._recent: Deque[Tuple[float, int]] = deque()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.base_url and self.api_key)
+
+    def _make_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            timeout=FLEET_SYNC_TIMEOUT,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        )
+
+    async def start(self):
+        """启动后台同步"""
+        if self.running:
+            print("⚠️  FleetSyncService已在运行")
+            return
+        if not FLEET_SYNC_ENABLED or not self.configured:
+            print("⚠️  Fleet API未配置或外发同步已禁用,FleetSyncService未启动")
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._client = self._make_client()
+        self.running = True
+        self._task = asyncio.create_task(self._sync_loop())
+        print(f"✅ FleetSyncService启动成功 (模式: {self.mode}, 并发: {self.concurrency}, 间隔: {self.interval}s)")
+
+    async def stop(self, timeout: float = 5.0):
+        """停止后台同步: 等待进行中的一轮完成,超时则取消(未确认的记忆下次启动后重新上传)"""
+        self.running = False
+        if self._task:
+            self.wake()
+            try:
+                await asyncio.wait_for(self._task, timeout=timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+            self._task = None
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+        self._loop = None
+        print("🛑 FleetSyncService已停止")
+
+    def wake(self):
+        """有新记忆待同步时提前唤醒后台同步(可从任意线程调用)"""
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _sync_loop(self):
+        while self.running:
+            delay = self.interval
+            try:
+                result = await self.sync_round()
+                if result["attempted"] and not result["synced"]:
+                    # 整轮失败(服务端不可用等): 按连续失败次数退避
+                    self._consecutive_failures += 1
+                    delay = self._failure_delay(self._consecutive_failures)
+                else:
+                    self._consecutive_failures = 0
+                    if self._cursor is not None:
+                        # 本遍尚未读到末尾: 立即继续
+                        delay = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                self._consecutive_failures += 1
+                delay = self._failure_delay(self._consecutive_failures)
+                print(f"❌ Fleet外发同步失败: {e}")
+
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    # ==================== 同步一轮 ====================
+
+    async def sync_round(self, limit: Optional[int] = None, client: Optional[httpx.AsyncClient] = None) -> Dict[str, Any]:
+        """
+        读取一轮未同步的记忆并上传,在一个事务中提交确认结果
+
+        Args:
+            limit: 本轮最多读取的条数(默认FLEET_SYNC_ROUND_ROWS)
+            client: 使用的HTTP客户端(默认后台服务的连接池)
+
+        Returns:
+            本轮结果
+        """
+        limit = limit or self.round_rows
+        client = client or self._client
+        started = time.perf_counter()
+        memories = await asyncio.to_thread(self.db.get_unsynced_memories, limit, self._cursor)
+        # 读到末尾时下一轮从头开始(重试此前失败的记忆)
+        self._cursor = (memories[-1]["timestamp"], memories[-1]["id"]) if len(memories) >= limit else None
+        fetched = len(memories)
+        memories = self._unparked(memories)
+
+        acks: List[Tuple[str, str]] = []
+        if memories:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            if self.mode == MODE_BULK and self._bulk_supported:
+                batches = [memories[i:i + self.batch_size] for i in range(0, len(memories), self.batch_size)]
+                results = await asyncio.gather(
+                    *(self._upload_bulk(client, semaphore, batch) for batch in batches), return_exceptions=True
+                )
+            else:
+                results = await asyncio.gather(
+                    *(self._upload_single(client, semaphore, m) for m in memories), return_exceptions=True
+                )
+            acks = self._collect_acks(results)
+            for memory_id, _ in acks:
+                self._parked.pop(memory_id, None)
+
+        acknowledged = 0
+        if acks:
+            acknowledged = await asyncio.to_thread(self.db.acknowledge_synced, acks, self.delete_synced)
+
+        failed = len(memories) - len(acks)
+        duration = time.perf_counter() - started
+        self.rounds += 1
+        self.synced_total += len(acks)
+        self.failed_total += failed
+        fleet_sync_memories_total.labels(status="synced").inc(len(acks))
+        fleet_sync_memories_total.labels(status="failed").inc(failed)
+        if acks:
+            self.last_success_at = datetime.now().isoformat()
+            now = time.monotonic()
+            self._recent.append((now, len(acks)))
+        self.backlog = await asyncio.to_thread(self.db.get_unsynced_count)
+        fleet_sync_backlog.set(self.backlog)
+        self.last_round = {
+            "timestamp": datetime.now().isoformat(),
+            "fetched": fetched,
+            "attempted": len(memories),
+            "parked": fetched - len(memories),
+            "synced": len(acks),
+            "acknowledged": acknowledged,
+            "failed": failed,
+            "backlog": self.backlog,
+            "duration_seconds": round(duration, 3),
+            "rows_per_second": round(len(acks) / duration, 1) if duration and acks else 0
+        }
+        if failed:
+            print(f"⚠️  Fleet外发同步: 本轮{len(memories)}条, 成功{len(acks)}条, 失败{failed}条")
+        return self.last_round
+
+    async def sync_once(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        在后台服务之外执行一轮同步(使用临时连接池)
+
+        Raises:
+            FleetSyncError: Fleet API未配置
+        """
+        if not self.configured:
+            raise FleetSyncError("Fleet API未配置")
+        async with self._make_client() as client:
+            return await self.sync_round(limit, client=client)
+
+    def request_sync(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        供同步调用方(如工具)触发同步: 后台服务运行中时只唤醒它,否则在独立线程中执行一轮
+
+        Raises:
+            FleetSyncError: Fleet API未配置
+        """
+        if self.running:
+            self.wake()
+            return {"scheduled": True, **self.get_stats(), "backlog": self.db.get_unsynced_count()}
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, self.sync_once(limit)).result()
+
+    # ==================== 上传 ====================
+
+    @staticmethod
+    def _payload(memory: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "client_id": memory["id"],
+            "session_id": memory["session_id"],
+            "content": memory["content"],
+            "metadata": memory["metadata"],
+            "timestamp": memory["timestamp"],
+            "source": memory["source"]
+        }
+
+    async def _upload_bulk(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        batch: List[Dict[str, Any]]
+    ) -> List[Tuple[str, str]]:
+        """批量上传一批,返回成功的(本地ID, Fleet记忆ID)"""
+        if not self._bulk_supported:
+            return await self._upload_each(client, semaphore, batch)
+        try:
+            response = await self._post(client, semaphore, "/memory/sync/bulk",
+                                        {"memories": [self._payload(m) for m in batch]}, MODE_BULK)
+        except FleetSyncError as e:
+            self.last_error = str(e)
+            if e.rejected and len(batch) > 1:
+                # 整批被拒绝(如请求体过大或个别记忆不合法): 逐条上传,只暂停真正被拒绝的记忆
+                return await self._upload_each(client, semaphore, batch)
+            if e.rejected:
+                self._park(batch[0]["id"])
+            return []
+        if response.status_code in (404, 405):
+            if self._bulk_supported:
+                self._bulk_supported = False
+                print("⚠️  Fleet API不支持批量同步接口,回退为逐条上传")
+            return await self._upload_each(client, semaphore, batch)
+
+        body = self._json_body(response)
+        if body is None:
+            return []
+        results = body.get("results")
+        acked = {}
+        for result in results if isinstance(results, list) else []:
+            if not isinstance(result, dict) or not result.get("client_id"):
+                continue
+            if result.get("error"):
+                self.last_error = f"{result['client_id']}: {result['error']}"
+                self._park(result["client_id"])
+            else:
+                acked[result["client_id"]] = result.get("memory_id") or result["client_id"]
+        return [(m["id"], acked[m["id"]]) for m in batch if m["id"] in acked]
+
+    async def _upload_each(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        batch: List[Dict[str, Any]]
+    ) -> List[Tuple[str, str]]:
+        results = await asyncio.gather(
+            *(self._upload_single(client, semaphore, m) for m in batch), return_exceptions=True
+        )
+        return self._collect_acks(results)
+
+    def _collect_acks(self, results: List[Any]) -> List[Tuple[str, str]]:
+        """合并各批的确认结果;某批抛出异常只记录错误,不影响其他批已成功的确认"""
+        acks: List[Tuple[str, str]] = []
+        for result in results:
+            if isinstance(result, BaseException):
+                if isinstance(result, asyncio.CancelledError):
+                    raise result
+                self.last_error = f"{type(result).__name__}: {result}"
+                print(f"❌ Fleet外发同步上传异常: {self.last_error}")
+                continue
+            acks.extend(result)
+        return acks
+
+    def _json_body(self, response: httpx.Response) -> Optional[Dict[str, Any]]:
+        """解析响应体JSON对象,无法解析或不是对象时记录错误并返回None"""
+        try:
+            body = response.json()
+        except ValueError as e:
+            self.last_error = f"HTTP {response.status_code}: 响应不是JSON ({e}): {response.text[:200]}"
+            return None
+        if not isinstance(body, dict):
+            self.last_error = f"HTTP {response.status_code}: 响应不是JSON对象: {response.text[:200]}"
+            return None
+        return body
+
+    async def _upload_single(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        memory: Dict[str, Any]
+    ) -> List[Tuple[str, str]]:
+        """上传一条,成功时返回[(本地ID, Fleet记忆ID)]"""
+        try:
+            response = await self._post(client, semaphore, "/memory/sync", self._payload(memory), MODE_SINGLE)
+        except FleetSyncError as e:
+            self.last_error = str(e)
+            if e.rejected:
+                self._park(memory["id"])
+            return []
+        if response.status_code != 200:
+            self.last_error = f"HTTP {response.status_code}: {response.text[:200]}"
+            return []
+        body = self._json_body(response)
+        if body is None:
+            return []
+        return [(memory["id"], body.get("memory_id") or memory["id"])]
+
+    async def _post(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        path: str,
+        payload: Dict[str, Any],
+        mode: str
+    ) -> httpx.Response:
+        """
+        发送请求,网络错误与可重试的状态码按退避重试(等待期间不占用并发名额)
+
+        Returns:
+            成功或不可重试的响应(404/405由调用方处理)
+
+        Raises:
+            FleetSyncError: 重试次数用尽或请求被拒绝
+        """
+        error = ""
+        for attempt in range(FLEET_SYNC_MAX_RETRIES + 1):
+            retry_after = None
+            async with semaphore:
+                started = time.perf_counter()
+                self.requests_total += 1
+                try:
+                    response = await client.post(path, json=payload)
+                except httpx.HTTPError as e:
+                    response = None
+                    error = f"{type(e).__name__}: {e}"
+                fleet_sync_request_duration_seconds.labels(mode=mode).observe(time.perf_counter() - started)
+
+            status = "error" if response is None else str(response.status_code)
+            fleet_sync_requests_total.labels(mode=mode, status=status).inc()
+            if response is not None:
+                if response.status_code < 400 or response.status_code in (404, 405):
+                    return response
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code not in _RETRY_STATUS:
+                    self.request_errors += 1
+                    raise FleetSyncError(error, response.status_code)
+                retry_after = self._retry_after(response)
+
+            self.request_errors += 1
+            if attempt == FLEET_SYNC_MAX_RETRIES:
+                break
+            self.retries += 1
+            await asyncio.sleep(max(self._backoff(attempt), retry_after or 0))
+        raise FleetSyncError(error)
+
+    def _failure_delay(self, failures: int) -> float:
+        """
+        整轮失败后的轮间等待: 上限为 轮询间隔 × 2^连续失败次数(不超过FLEET_SYNC_FAILURE_BACKOFF_MAX),
+        在[上限的一半, 上限)内随机,多个实例不会同时恢复请求;第一次失败后至少等待一个轮询间隔
+        """
+        ceiling = min(FLEET_SYNC_FAILURE_BACKOFF_MAX, max(self.interval, 1) * 2 ** min(failures, 30))
+        return random.uniform(ceiling / 2, ceiling)
+
+    # ==================== 被拒绝的记忆 ====================
+
+    def _park(self, memory_id: str):
+        """记忆被服务端拒绝: 暂停重传,再次被拒绝时暂停时长翻倍"""
+        rejections = self._parked.get(memory_id, (0.0, 0))[1] + 1
+        seconds = min(_PARK_MAX_SECONDS, FLEET_SYNC_REJECT_PARK_SECONDS * 2 ** (rejections - 1))
+        self._parked[memory_id] = (time.monotonic() + seconds, rejections)
+        self.rejected_total += 1
+        fleet_sync_memories_total.labels(status="rejected").inc()
+
+    def _unparked(self, memories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """去掉仍在暂停期内的记忆"""
+        if not self._parked:
+            return memories
+        now = time.monotonic()
+        # 暂停期早已结束且未再被拒绝的(已同步、已删除或不再出现)不再记录
+        for memory_id in [k for k, (until, _) in self._parked.items() if until + _PARK_MAX_SECONDS < now]:
+            del self._parked[memory_id]
+        return [m for m in memories if self._parked.get(m["id"], (0.0, 0))[0] <= now]
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """指数退避加全抖动: [0, min(上限, 基数 × 2^attempt))内随机"""
+        return random.uniform(0, min(FLEET_SYNC_BACKOFF_MAX, FLEET_SYNC_BACKOFF_BASE * 2 ** attempt))
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        try:
+            return min(float(response.headers["Retry-After"]), FLEET_SYNC_BACKOFF_MAX)
+        except (KeyError, ValueError):
+            return None
+
+    # ==================== 统计 ====================
+
+    def get_stats(self) -> Dict[str, Any]:
+        """同步状态、积压与吞吐"""
+        now = time.monotonic()
+        while self._recent and now - self._recent[0][0] > _THROUGHPUT_WINDOW:
+            self._recent.popleft()
+        return {
+            "running": self.running,
+            "configured": self.configured,
+            "mode": self.mode if self._bulk_supported else MODE_SINGLE,
+            "concurrency": self.concurrency,
+            "batch_size": self.batch_size,
+            "backlog": self.backlog,
+            "rounds": self.rounds,
+            "synced_total": self.synced_total,
+            "failed_total": self.failed_total,
+            "requests_total": self.requests_total,
+            "request_errors": self.request_errors,
+            "retries": self.retries,
+            "rejected_total": self.rejected_total,
+            "parked": len(self._parked),
+            "rows_per_second_1m": round(sum(count for _, count in self._recent) / _THROUGHPUT_WINDOW, 2),
+            "last_round": self.last_round,
+            "last_success_at": self.last_success_at,
+            "last_error": self.last_error
+        }
+
+
+# 全局实例
+fleet_sync_service = FleetSyncService()
@@ -0,0 +1,422 @@
+"""
+LLM性能基准测试
+直接以流式请求压测配置的OpenAI兼容后端,测量首token延迟(TTFT)、解码速度与端到端延迟,
+按提示词长度分档 × 并发档位(1/2/4/8)扫描,结果保存为历史记录并写入性能面板
+
+    python -m app.services.llm_benchmark --mock     # 针对内置的模拟服务运行
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+import httpx
+
+from app.config import (
+    BENCHMARK_CONCURRENCY_LEVELS,
+    BENCHMARK_PROMPT_BUCKETS,
+    BENCHMARK_MAX_TOKENS,
+    BENCHMARK_REQUESTS_PER_WORKER,
+    BENCHMARK_REQUEST_TIMEOUT,
+    BENCHMARK_HISTORY_SIZE,
+    BENCHMARK_HISTORY_PATH,
+)
+from app.state import state_manager
+
+
+# 构造提示词的填充句(约每词一个token)
+_FILLER = (
+    "The quick brown fox jumps over the lazy dog while the benchmark "
+    "measures how fast the model reads this context and starts to answer "
+)
+
+
+def build_prompt(approx_tokens: int) -> str:
+    """构造约approx_tokens个token的提示词"""
+    words = _FILLER.split()
+    body = " ".join(words[i % len(words)] for i in range(max(0, approx_tokens - 12)))
+    return f"{body}\n\nIgnore the text above and write a short story about a lighthouse keeper."
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def _stats(values: List[float]) -> Dict[str, Optional[float]]:
+    def _round(v):
+        return round(v, 2) if v is not None else None
+
+    return {
+        "mean": _round(sum(values) / len(values)) if values else None,
+        "p50": _round(_percentile(values, 50)),
+        "p95": _round(_percentile(values, 95)),
+        "min": _round(min(values)) if values else None,
+        "max": _round(max(values)) if values else None,
+    }
+
+
+class LLMBenchmark:
+    """LLM基准测试运行器"""
+
+    def __init__(
+        self,
+        history_size: int = BENCHMARK_HISTORY_SIZE,
+        history_path: Optional[Path] = BENCHMARK_HISTORY_PATH
+    ):
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+        self.history_path = Path(history_path) if history_path else None
+        self.current: Optional[Dict[str, Any]] = None
+        self._lock = asyncio.Lock()
+        self._load_history()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    @staticmethod
+    def default_base_url() -> str:
+        return f"http://{state_manager.config.MODEL_HOST}:{state_manager.config.MODEL_PORT}/v1"
+
+    # ==================== 单个请求 ====================
+
+    async def _measure_request(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        model: str,
+        prompt: str,
+        max_tokens: int
+    ) -> Dict[str, Any]:
+        """
+        发送一个流式请求并测量
+
+        Returns:
+            {ttft_ms, e2e_ms, decode_tps, output_tokens, prompt_tokens, error}
+        """
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": 0,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+        started = time.perf_counter()
+        first_token_at = None
+        last_token_at = None
+        chunks = 0
+        usage: Dict[str, Any] = {}
+
+        try:
+            async with client.stream("POST", url, json=payload) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode("utf-8", errors="replace")
+                    return {"error": f"HTTP {response.status_code}: {body[:200]}"}
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    if event.get("usage"):
+                        usage = event["usage"]
+                    for choice in event.get("choices") or []:
+                        if (choice.get("delta") or {}).get("content"):
+                            now = time.perf_counter()
+                            if first_token_at is None:
+                                first_token_at = now
+                            last_token_at = now
+                            chunks += 1
+        except (httpx.HTTPError, json.JSONDecodeError) as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+
+        finished = time.perf_counter()
+        if first_token_at is None:
+            return {"error": "没有收到任何输出token"}
+
+        # 后端未返回usage时按内容块数近似token数
+        output_tokens = usage.get("completion_tokens") or chunks
+        decode_seconds = last_token_at - first_token_at
+        return {
+            "ttft_ms": (first_token_at - started) * 1000,
+            "e2e_ms": (finished - started) * 1000,
+            # 首token之后的解码速度;只有一个token时无法计算
+            "decode_tps": (output_tokens - 1) / decode_seconds if output_tokens > 1 and decode_seconds > 0 else None,
+            "output_tokens": output_tokens,
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "error": None
+        }
+
+    # ==================== 扫描 ====================
+
+    async def _run_level(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        model: str,
+        prompt: str,
+        concurrency: int,
+        requests_per_worker: int,
+        max_tokens: int
+    ) -> Dict[str, Any]:
+        """在指定并发下运行: concurrency个worker各自连续发送requests_per_worker个请求"""
+        samples: List[Dict[str, Any]] = []
+
+        async def worker():
+            for _ in range(requests_per_worker):
+                samples.append(await self._measure_request(client, url, model, prompt, max_tokens))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall_seconds = time.perf_counter() - started
+
+        ok = [s for s in samples if not s["error"]]
+        total_output = sum(s["output_tokens"] for s in ok)
+        prompt_tokens = [s["prompt_tokens"] for s in ok if s.get("prompt_tokens")]
+        return {
+            "concurrency": concurrency,
+            "requests": len(samples),
+            "errors": len(samples) - len(ok),
+            "error_samples": list({s["error"] for s in samples if s["error"]})[:3],
+            "prompt_tokens": round(sum(prompt_tokens) / len(prompt_tokens)) if prompt_tokens else None,
+            "ttft_ms": _stats([s["ttft_ms"] for s in ok]),
+            "decode_tokens_per_second": _stats([s["decode_tps"] for s in ok if s["decode_tps"]]),
+            "e2e_ms": _stats([s["e2e_ms"] for s in ok]),
+            # 整体吞吐: 该档位所有请求的输出tokens / 墙钟时间
+            "throughput_tokens_per_second": round(total_output / wall_seconds, 2) if wall_seconds > 0 else None,
+            "wall_ms": round(wall_seconds * 1000, 2)
+        }
+
+    async def run(
+        self,
+        base_url: Optional[str] = None,
+        model: Optional[str] = None,
+        concurrency_levels: Sequence[int] = BENCHMARK_CONCURRENCY_LEVELS,
+        prompt_buckets: Optional[Dict[str, int]] = None,
+        requests_per_worker: int = BENCHMARK_REQUESTS_PER_WORKER,
+        max_tokens: int = BENCHMARK_MAX_TOKENS,
+        timeout: float = BENCHMARK_REQUEST_TIMEOUT,
+        trigger: str = "manual"
+    ) -> Dict[str, Any]:
+        """
+        运行一次完整的基准测试(同一时间只允许一个)
+
+        Args:
+            base_url: OpenAI兼容API地址(默认取配置的模型服务)
+            model: 模型名(默认取当前检测到的模型)
+            concurrency_levels: 并发档位
+            prompt_buckets: 提示词分档 {名称: 约tokens}
+            requests_per_worker: 每个worker连续发送的请求数
+            max_tokens: 每个请求的最大输出tokens
+            timeout: 单个请求超时(秒)
+            trigger: 触发来源(manual / scheduler)
+
+        Returns:
+            基准测试结果
+        """
+        if self._lock.locked():
+            raise RuntimeError("已有基准测试在运行")
+
+        async with self._lock:
+            base_url = (base_url or self.default_base_url()).rstrip("/")
+            model = model or state_manager.current_model or "local-model"
+            prompt_buckets = prompt_buckets or BENCHMARK_PROMPT_BUCKETS
+            started_at = datetime.now()
+            result: Dict[str, Any] = {
+                "id": f"bench_{started_at.strftime('%Y%m%d%H%M%S%f')}",
+                "trigger": trigger,
+                "started_at": started_at.isoformat(),
+                "base_url": base_url,
+                "model": model,
+                "config": {
+                    "concurrency_levels": list(concurrency_levels),
+                    "prompt_buckets": dict(prompt_buckets),
+                    "requests_per_worker": requests_per_worker,
+                    "max_tokens": max_tokens
+                },
+                "results": [],
+                "status": "running"
+            }
+            self.current = result
+            print(f"📊 LLM基准测试开始: {base_url} ({model})")
+
+            url = f"{base_url}/chat/completions"
+            limits = httpx.Limits(max_connections=max(concurrency_levels), max_keepalive_connections=max(concurrency_levels))
+            try:
+                async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+                    for bucket, approx_tokens in prompt_buckets.items():
+                        prompt = build_prompt(approx_tokens)
+                        for concurrency in concurrency_levels:
+                            level = await self._run_level(
+                                client, url, model, prompt, concurrency, requests_per_worker, max_tokens
+                            )
+                            level["prompt_bucket"] = bucket
+                            level["prompt_tokens_target"] = approx_tokens
+                            result["results"].append(level)
+                            print(
+                                f"   - {bucket}×{concurrency}: TTFT p50 {level['ttft_ms']['p50']}ms, "
+                                f"解码 {level['decode_tokens_per_second']['mean']} tok/s, "
+                                f"吞吐 {level['throughput_tokens_per_second']} tok/s, 错误 {level['errors']}"
+                            )
+                result["status"] = "completed"
+            except Exception as e:
+                result["status"] = "failed"
+                result["error"] = f"{type(e).__name__}: {e}"
+                print(f"❌ LLM基准测试失败: {e}")
+            finally:
+                finished_at = datetime.now()
+                result["finished_at"] = finished_at.isoformat()
+                result["duration_ms"] = round((finished_at - started_at).total_seconds() * 1000, 2)
+                result["summary"] = self._summarize(result["results"])
+                self.current = None
+                # 历史文件的写入(及定期截断)放到线程池,不阻塞事件循环
+                await asyncio.to_thread(self._append_history, result)
+                self._publish(result)
+
+            print(f"✅ LLM基准测试完成: {result['summary']}")
+            return result
+
+    @staticmethod
+    def _summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        面板展示用的摘要
+
+        单请求指标取最短提示词、并发1的档位(反映空载时的交互体验),
+        峰值吞吐取所有档位中的最大值
+        """
+        baseline = next(
+            (r for r in results if r["concurrency"] == 1 and r["ttft_ms"]["p50"] is not None),
+            None
+        )
+        throughputs = [r["throughput_tokens_per_second"] for r in results if r["throughput_tokens_per_second"]]
+        best = max(results, key=lambda r: r["throughput_tokens_per_second"] or 0) if results else None
+        return {
+            "tokens_per_second": baseline["decode_tokens_per_second"]["mean"] if baseline else 0,
+            "ttft_ms": baseline["ttft_ms"]["p50"] if baseline else 0,
+            "total_latency_ms": baseline["e2e_ms"]["p50"] if baseline else 0,
+            "peak_throughput_tokens_per_second": max(throughputs) if throughputs else 0,
+            "peak_throughput_concurrency": best["concurrency"] if best else None,
+            "error_count": sum(r["errors"] for r in results)
+        }
+
+    @staticmethod
+    def _publish(result: Dict[str, Any]):
+        """把摘要写入状态管理器(管理面板的性能卡片读取model_performance)"""
+        state_manager.performance_data = {
+            **state_manager.performance_data,
+            "model_performance": result["summary"],
+            "benchmark_id": result["id"],
+            "benchmark_status": result["status"],
+            "benchmark_model": result["model"],
+            "last_check": result["finished_at"]
+        }
+        state_manager.performance_last_check = datetime.now()
+
+    # ==================== 历史 ====================
+
+    def _load_history(self):
+        if not self.history_path or not self.history_path.exists():
+            return
+        try:
+            with open(self.history_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self.history.append(json.loads(line))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️  加载基准测试历史失败: {e}")
+
+    def _append_history(self, result: Dict[str, Any]):
+        self.history.append(result)
+        if not self.history_path:
+            return
+        try:
+            self.history_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.history_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            # 文件超过保留条数的2倍时重写,避免无限增长
+            with open(self.history_path, "r", encoding="utf-8") as f:
+                line_count = sum(1 for _ in f)
+            if line_count > 2 * self.history.maxlen:
+                with open(self.history_path, "w", encoding="utf-8") as f:
+                    for item in self.history:
+                        f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"⚠️  保存基准测试历史失败: {e}")
+
+    def record_failure(self, error: BaseException, trigger: str = "manual") -> Dict[str, Any]:
+        """记录一次未能正常产出结果的基准测试(如后台任务异常退出)"""
+        now = datetime.now()
+        result = {
+            "id": f"bench_{now.strftime('%Y%m%d%H%M%S%f')}",
+            "trigger": trigger,
+            "started_at": now.isoformat(),
+            "finished_at": now.isoformat(),
+            "duration_ms": 0,
+            "results": [],
+            "status": "failed",
+            "error": f"{type(error).__name__}: {error}",
+            "summary": self._summarize([])
+        }
+        self._append_history(result)
+        return result
+
+    def get_history(self, limit: int = 20, include_results: bool = False) -> List[Dict[str, Any]]:
+        """最近的基准测试(最新在前)"""
+        items = list(self.history)[-limit:][::-1]
+        if include_results:
+            return items
+        return [{k: v for k, v in item.items() if k != "results"} for item in items]
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        return self.history[-1] if self.history else None
+
+
+# 创建全局实例
+llm_benchmark = LLMBenchmark()
+
+
+async def _main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="LLM性能基准测试")
+    parser.add_argument("--base-url", help="OpenAI兼容API地址(默认取配置的模型服务)")
+    parser.add_argument("--model", help="模型名")
+    parser.add_argument("--mock", action="store_true", help="启动内置的模拟服务并对其测试")
+    parser.add_argument("--concurrency", default=",".join(map(str, BENCHMARK_CONCURRENCY_LEVELS)))
+    parser.add_argument("--max-tokens", type=int, default=BENCHMARK_MAX_TOKENS)
+    parser.add_argument("--requests-per-worker", type=int, default=BENCHMARK_REQUESTS_PER_WORKER)
+    args = parser.parse_args()
+
+    benchmark = LLMBenchmark(history_path=None)
+    mock = None
+    base_url = args.base_url
+    if args.mock:
+        from app.testing.mock_openai_server import MockOpenAIServer
+        mock = MockOpenAIServer()
+        base_url = mock.start()
+    try:
+        result = await benchmark.run(
+            base_url=base_url,
+            model=args.model,
+            concurrency_levels=[int(c) for c in args.concurrency.split(",")],
+            requests_per_worker=args.requests_per_worker,
+            max_tokens=args.max_tokens
+        )
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    finally:
+        if mock:
+            mock.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
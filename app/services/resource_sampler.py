@@ -0,0 +1,296 @@
+"""
+进程资源采样服务
+后台按固定间隔采集CPU、内存、线程数、文件描述符、GC与事件循环延迟,
+写入1秒/1分钟/1小时三级环形缓冲区,健康检查接口直接读取最新样本而不再阻塞事件循环
+"""
+import asyncio
+import gc
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+import psutil
+
+from app.config import (
+    RESOURCE_SAMPLE_INTERVAL,
+    RESOURCE_SAMPLES_1S,
+    RESOURCE_SAMPLES_1M,
+    RESOURCE_SAMPLES_1H,
+)
+
+
+# 样本字段(顺序即存储顺序)
+FIELDS = (
+    "cpu_percent",            # 本进程CPU占用(%),多核可超过100
+    "system_cpu_percent",     # 整机CPU占用(%)
+    "rss_mb",                 # 常驻内存(MB)
+    "system_memory_percent",  # 整机内存占用(%)
+    "threads",                # 线程数
+    "open_fds",               # 打开的文件描述符数
+    "gc_gen0",                # 各代待回收对象计数(gc.get_count)
+    "gc_gen1",
+    "gc_gen2",
+    "gc_collections",         # 本采样周期内的GC次数
+    "gc_pause_ms",            # 本采样周期内GC暂停总时长
+    "loop_lag_ms",            # 事件循环调度延迟
+)
+# 降采样时额外保留最大值的字段(输出为 <field>_max)
+MAX_FIELDS = ("cpu_percent", "rss_mb", "gc_pause_ms", "loop_lag_ms")
+ALL_FIELDS = FIELDS + tuple(f"{name}_max" for name in MAX_FIELDS)
+_MAX_INDEX = tuple(FIELDS.index(name) for name in MAX_FIELDS)
+
+# 分辨率 -> 周期(秒)
+RESOLUTIONS = {"1s": 1, "1m": 60, "1h": 3600}
+
+Point = Tuple[float, ...]  # (timestamp, *ALL_FIELDS)
+
+
+class _Downsampler:
+    """把高分辨率的点按周期聚合为一个点(字段取均值,*_max取最大值)"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self._bucket_start: Optional[float] = None
+        self._sums = [0.0] * len(FIELDS)
+        self._maxes = [0.0] * len(MAX_FIELDS)
+        self._count = 0
+
+    def add(self, point: Point) -> Optional[Point]:
+        """加入一个点,跨越周期边界时返回上一个周期的聚合点"""
+        bucket_start = point[0] - point[0] % self.period
+        flushed = None
+        if self._bucket_start is not None and bucket_start != self._bucket_start:
+            flushed = self.flush()
+
+        if self._count == 0:
+            self._bucket_start = bucket_start
+        values = point[1:]
+        for i in range(len(FIELDS)):
+            self._sums[i] += values[i]
+        for i in range(len(MAX_FIELDS)):
+            # 输入点自带 *_max 列,聚合时取其最大值
+            self._maxes[i] = max(self._maxes[i], values[len(FIELDS) + i])
+        self._count += 1
+        return flushed
+
+    def partial(self) -> Optional[Point]:
+        """当前周期(尚未结束)的聚合点"""
+        if self._count == 0:
+            return None
+        return (self._bucket_start,) + tuple(s / self._count for s in self._sums) + tuple(self._maxes)
+
+    def flush(self) -> Optional[Point]:
+        point = self.partial()
+        if point is None:
+            return None
+        self._sums = [0.0] * len(FIELDS)
+        self._maxes = [0.0] * len(MAX_FIELDS)
+        self._count = 0
+        return point
+
+
+class ResourceSampler:
+    """进程资源采样服务"""
+
+    def __init__(self, interval: float = RESOURCE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.running = False
+        self._task: Optional[asyncio.Task] = None
+
+        self.buffers: Dict[str, Deque[Point]] = {
+            "1s": deque(maxlen=RESOURCE_SAMPLES_1S),
+            "1m": deque(maxlen=RESOURCE_SAMPLES_1M),
+            "1h": deque(maxlen=RESOURCE_SAMPLES_1H),
+        }
+        self._minute = _Downsampler(RESOLUTIONS["1m"])
+        self._hour = _Downsampler(RESOLUTIONS["1h"])
+
+        self._process = psutil.Process(os.getpid())
+        self._last_gc_collections = 0
+        # GC暂停统计(由gc.callbacks在GC发生的线程中更新)
+        self._gc_started_at: Optional[float] = None
+        self._gc_pause_ms = 0.0
+
+    async def start(self):
+        """启动采样"""
+        if self.running:
+            print("⚠️  ResourceSampler已在运行")
+            return
+
+        # 首次调用cpu_percent(None)只用于建立基准,返回值无意义
+        self._process.cpu_percent(None)
+        psutil.cpu_percent(None)
+        self._last_gc_collections = self._gc_collections()
+        gc.callbacks.append(self._on_gc)
+
+        self.running = True
+        self._task = asyncio.create_task(self._sample_loop())
+        print(f"✅ ResourceSampler启动成功 (间隔: {self.interval}s)")
+
+    async def stop(self):
+        """停止采样"""
+        self.running = False
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        print("🛑 ResourceSampler已停止")
+
+    # ==================== 采样 ====================
+
+    async def _sample_loop(self):
+        """
+        固定节拍采样
+
+        事件循环延迟 = 实际唤醒时间 - 计划唤醒时间,反映循环被同步代码阻塞的程度
+        """
+        next_tick = time.monotonic() + self.interval
+        while self.running:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            lag = max(0.0, time.monotonic() - next_tick)
+            try:
+                self._record(self._sample(lag * 1000))
+            except Exception as e:
+                print(f"❌ 资源采样失败: {e}")
+
+            next_tick += self.interval
+            if time.monotonic() > next_tick:
+                # 落后超过一个周期(循环被长时间阻塞)时重新对齐,避免连续补采
+                next_tick = time.monotonic() + self.interval
+
+    def _sample(self, loop_lag_ms: float) -> Point:
+        process = self._process
+        with process.oneshot():
+            cpu_percent = process.cpu_percent(None)
+            rss_mb = process.memory_info().rss / 1024 / 1024
+            threads = process.num_threads()
+            try:
+                open_fds = process.num_fds()
+            except (AttributeError, psutil.Error):
+                # Windows没有num_fds
+                open_fds = 0
+
+        collections = self._gc_collections()
+        gc_collections = collections - self._last_gc_collections
+        self._last_gc_collections = collections
+        gc_pause_ms, self._gc_pause_ms = self._gc_pause_ms, 0.0
+        gen0, gen1, gen2 = gc.get_count()
+
+        values = (
+            cpu_percent,
+            psutil.cpu_percent(None),
+            rss_mb,
+            psutil.virtual_memory().percent,
+            threads,
+            open_fds,
+            gen0,
+            gen1,
+            gen2,
+            gc_collections,
+            gc_pause_ms,
+            loop_lag_ms,
+        )
+        return (time.time(),) + values + tuple(values[i] for i in _MAX_INDEX)
+
+    def _record(self, point: Point):
+        self.buffers["1s"].append(point)
+        minute_point = self._minute.add(point)
+        if minute_point is not None:
+            self.buffers["1m"].append(minute_point)
+            hour_point = self._hour.add(minute_point)
+            if hour_point is not None:
+                self.buffers["1h"].append(hour_point)
+
+    @staticmethod
+    def _gc_collections() -> int:
+        return sum(stat.get("collections", 0) for stat in gc.get_stats())
+
+    def _on_gc(self, phase: str, info: Dict[str, Any]):
+        if phase == "start":
+            self._gc_started_at = time.perf_counter()
+        elif self._gc_started_at is not None:
+            self._gc_pause_ms += (time.perf_counter() - self._gc_started_at) * 1000
+            self._gc_started_at = None
+
+    # ==================== 查询 ====================
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """最新一个1秒样本(尚未采样时返回None)"""
+        buffer = self.buffers["1s"]
+        if not buffer:
+            return None
+        point = buffer[-1]
+        sample = {"timestamp": point[0]}
+        sample.update({name: round(value, 2) for name, value in zip(FIELDS, point[1:])})
+        sample["age_seconds"] = round(time.time() - point[0], 2)
+        return sample
+
+    def series(
+        self,
+        resolution: str = "1s",
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        fields: Optional[Sequence[str]] = None,
+        limit: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        时间序列(列式输出,便于前端直接绘图)
+
+        Args:
+            resolution: "1s" / "1m" / "1h"
+            start/end: 时间范围(Unix时间戳)
+            fields: 需要的字段,默认全部
+            limit: 最多返回最近的点数
+        """
+        if resolution not in self.buffers:
+            raise ValueError(f"不支持的分辨率: {resolution},可选: {', '.join(RESOLUTIONS)}")
+        fields = list(fields) if fields else list(ALL_FIELDS)
+        unknown = [name for name in fields if name not in ALL_FIELDS]
+        if unknown:
+            raise ValueError(f"未知字段: {', '.join(unknown)}")
+
+        points: List[Point] = list(self.buffers[resolution])
+        # 附上尚未结束的当前周期,保证图表右端是最新数据
+        pending = {"1m": self._minute, "1h": self._hour}.get(resolution)
+        partial = pending.partial() if pending is not None else None
+        if partial is not None:
+            points.append(partial)
+
+        if start is not None:
+            points = [p for p in points if p[0] >= start]
+        if end is not None:
+            points = [p for p in points if p[0] <= end]
+        if limit:
+            points = points[-limit:]
+
+        indexes = [ALL_FIELDS.index(name) + 1 for name in fields]
+        return {
+            "resolution": resolution,
+            "interval_seconds": RESOLUTIONS[resolution] if resolution != "1s" else self.interval,
+            "count": len(points),
+            "timestamps": [p[0] for p in points],
+            "series": {
+                name: [round(p[i], 2) for p in points]
+                for name, i in zip(fields, indexes)
+            }
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        """采样服务状态"""
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "points": {name: len(buffer) for name, buffer in self.buffers.items()},
+            "capacity": {name: buffer.maxlen for name, buffer in self.buffers.items()},
+            "fields": list(ALL_FIELDS)
+        }
+
+
+# 创建全局实例
+resource_sampler = ResourceSampler()
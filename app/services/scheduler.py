@@ -13,11 +13,16 @@ from app.config import (
     BROWSER_POOL_PRELOAD_DELAY,
     BROWSER_POOL_CHECK_INTERVAL,
     PERFORMANCE_CHECK_DELAY,
-    PERFORMANCE_CHECK_INTERVAL
+    PERFORMANCE_CHECK_INTERVAL,
+    BENCHMARK_PROMPT_BUCKETS,
+    BENCHMARK_SCHEDULED_SWEEP,
+    FLEET_DB_STATS_RECONCILE_INTERVAL,
+    FLEET_DB_MAINTENANCE_INTERVAL
 )
 from app.state import state_manager
 from app.core.model_pool import model_pool
 from app.services.model_monitor import model_monitor
+from app.services.llm_benchmark import llm_benchmark
 
 
 class TaskScheduler:
@@ -94,6 +99,20 @@ class TaskScheduler:
             id='model_info_recurring'
         )
         
+        # 任务6: Fleet记忆统计计数校准(每6小时)
+        self.scheduler.add_job(
+            self._reconcile_fleet_stats,
+            trigger=IntervalTrigger(seconds=FLEET_DB_STATS_RECONCILE_INTERVAL),
+            id='fleet_stats_reconcile'
+        )
+        
+        # 任务7: Fleet记忆库整理(冷层压缩、增量VACUUM、WAL截断,每小时)
+        self.scheduler.add_job(
+            self._maintain_fleet_db,
+            trigger=IntervalTrigger(seconds=FLEET_DB_MAINTENANCE_INTERVAL),
+            id='fleet_db_maintenance'
+        )
+        
         self.scheduler.start()
         self.started = True
         print("✅ TaskScheduler启动成功")
@@ -101,6 +120,8 @@ class TaskScheduler:
         print(f"   - 模型池预加载: {TOOL_POOL_PRELOAD_DELAY//60}分钟后")
         print(f"   - 性能检测: {PERFORMANCE_CHECK_DELAY//60}分钟后")
         print(f"   - 模型信息监控: 1分钟后首次执行,之后每5分钟")
+        print(f"   - Fleet记忆统计校准: 每{FLEET_DB_STATS_RECONCILE_INTERVAL//3600}小时")
+        print(f"   - Fleet记忆库整理: 每{FLEET_DB_MAINTENANCE_INTERVAL//60}分钟")
     
     async def stop(self):
         """停止调度器"""
@@ -115,6 +136,7 @@ class TaskScheduler:
         try:
             from app.tools import load_all_tools
             from langchain_openai import ChatOpenAI
+            from app.core.llm_metrics import llm_metrics_callback
             
             # 加载工具池
             tools, tool_errors = load_all_tools()
@@ -127,7 +149,8 @@ class TaskScheduler:
                 base_url=f"http://{state_manager.config.MODEL_HOST}:{state_manager.config.MODEL_PORT}/v1",
                 model="local-model",
                 temperature=0.7,
-                api_key="not-needed"
+                api_key="not-needed",
+                callbacks=[llm_metrics_callback]
             )
             llm_with_tools = llm.bind_tools(tools)
             state_manager.app_state["llm_with_tools"] = llm_with_tools
@@ -185,6 +208,7 @@ class TaskScheduler:
         try:
             from app.tools import load_all_tools
             from langchain_openai import ChatOpenAI
+            from app.core.llm_metrics import llm_metrics_callback
             
             # 重新加载所有工具
             print("🔄 重新加载工具池...")
@@ -199,7 +223,8 @@ class TaskScheduler:
                 base_url=f"http://{state_manager.config.MODEL_HOST}:{state_manager.config.MODEL_PORT}/v1",
                 model="local-model",
                 temperature=0.7,
-                api_key="not-needed"
+                api_key="not-needed",
+                callbacks=[llm_metrics_callback]
             )
             llm_with_tools = llm.bind_tools(tools)
             state_manager.app_state["llm_with_tools"] = llm_with_tools
@@ -244,7 +269,7 @@ class TaskScheduler:
             traceback.print_exc()
     
     async def _performance_check(self):
-        """性能检测"""
+        """性能检测(系统状态 + LLM基准测试)"""
         print("📊 开始性能检测...")
         try:
             # 获取系统状态
@@ -252,12 +277,27 @@ class TaskScheduler:
             
             # 更新性能数据
             state_manager.performance_data = {
+                **state_manager.performance_data,
                 "uptime": status["uptime"],
                 "tools_loaded": status["loaded_tools_count"],
                 "last_check": datetime.now().isoformat()
             }
             state_manager.performance_last_check = datetime.now()
             
+            # LLM基准测试(结果由基准测试写入performance_data.model_performance)
+            # 默认只做单请求的轻量探测,避免每轮检测都对模型服务施加一次压测
+            if llm_benchmark.running:
+                print("⚠️  已有基准测试在运行,跳过本次LLM基准测试")
+            elif BENCHMARK_SCHEDULED_SWEEP:
+                await llm_benchmark.run(trigger="scheduler")
+            else:
+                await llm_benchmark.run(
+                    concurrency_levels=(1,),
+                    prompt_buckets={"short": BENCHMARK_PROMPT_BUCKETS["short"]},
+                    requests_per_worker=1,
+                    trigger="scheduler"
+                )
+            
             print(f"✅ 性能检测完成: 运行时间 {status['uptime']}")
         except Exception as e:
             print(f"❌ 性能检测失败: {e}")
@@ -269,6 +309,25 @@ class TaskScheduler:
         except Exception as e:
             print(f"❌ 模型信息更新失败: {e}")
 
+    
+    async def _reconcile_fleet_stats(self):
+        """校准Fleet记忆统计计数(全表扫描,在线程中执行)"""
+        try:
+            from app.core.fleet_memory_db import fleet_memory_db
+            result = await asyncio.to_thread(fleet_memory_db.reconcile_stats)
+            print(f"✅ Fleet记忆统计校准完成: {result['total_memories']}条, 耗时{result['duration_ms']}ms")
+        except Exception as e:
+            print(f"❌ Fleet记忆统计校准失败: {e}")
+    
+    async def _maintain_fleet_db(self):
+        """整理Fleet记忆库(按I/O预算限速,在线程中执行)"""
+        try:
+            from app.core.fleet_memory_db import fleet_memory_db
+            result = await asyncio.to_thread(fleet_memory_db.run_maintenance)
+            print(f"✅ Fleet记忆库整理完成: 冷层{result['cold_rows']}条, 回收{result['vacuumed_pages']}页, 耗时{result['duration_seconds']}s")
+        except Exception as e:
+            print(f"❌ Fleet记忆库整理失败: {e}")
+
 
 # 创建全局实例
 task_scheduler = TaskScheduler()
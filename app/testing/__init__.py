@@ -0,0 +1,4 @@
+"""
+测试辅助模块
+提供可在本地/CI中替代外部依赖的模拟服务
+"""
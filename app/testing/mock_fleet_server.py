@@ -0,0 +1,270 @@
+"""
+模拟的Fleet API服务
+只依赖标准库,支持记忆同步(单条/批量)、检索、列表、删除与健康检查,
+可配置响应延迟、随机失败率(503,带Retry-After)与是否支持批量接口,
+用于在没有真实Fleet API时联调外发同步并测量吞吐
+
+    python -m app.testing.mock_fleet_server --port 18100 --latency-ms 50 --failure-rate 0.1
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+class MockFleetServer:
+    """
+    模拟Fleet API
+
+    Args:
+        host/port: 监听地址(port=0表示自动分配)
+        api_key: 要求的Bearer令牌(为空则不校验)
+        latency_ms: 每个请求的固定延迟
+        per_item_ms: 批量请求中每条记忆增加的耗时
+        failure_rate: 同步请求随机返回503的比例
+        retry_after: 503响应的Retry-After(秒)
+        bulk: 是否支持 /memory/sync/bulk(否则返回404,用于测试回退)
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        api_key: str = "",
+        latency_ms: float = 20,
+        per_item_ms: float = 0.2,
+        failure_rate: float = 0.0,
+        retry_after: float = 0,
+        bulk: bool = True
+    ):
+        self.api_key = api_key
+        self.latency_ms = latency_ms
+        self.per_item_ms = per_item_ms
+        self.failure_rate = failure_rate
+        self.retry_after = retry_after
+        self.bulk = bulk
+
+        # client_id -> 记忆(同一client_id重复上传返回同一memory_id,重试不会产生重复)
+        self.memories: Dict[str, Dict[str, Any]] = {}
+        self.active = 0
+        self.max_active = 0
+        self.total_requests = 0
+        self.failed_requests = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        """在后台线程中启动,返回base_url"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-fleet", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def __enter__(self) -> "MockFleetServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "memories": len(self.memories),
+                "total_requests": self.total_requests,
+                "failed_requests": self.failed_requests,
+                "max_active": self.max_active
+            }
+
+    # ==================== 模拟存储 ====================
+
+    def _store(self, memory: Dict[str, Any]) -> str:
+        """保存一条记忆,返回Fleet记忆ID"""
+        client_id = memory.get("client_id")
+        with self._lock:
+            if client_id and client_id in self.memories:
+                return self.memories[client_id]["memory_id"]
+            self._next_id += 1
+            stored = dict(memory, memory_id=f"fleet-{self._next_id}")
+            self.memories[client_id or stored["memory_id"]] = stored
+            return stored["memory_id"]
+
+    def _find(self, session_id: Optional[str] = None, memory_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                m for m in self.memories.values()
+                if (session_id is None or m.get("session_id") == session_id)
+                and (memory_id is None or m["memory_id"] == memory_id)
+            ]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头与响应体分两次写出,关闭Nagle避免keep-alive连接上的确认延迟拖慢吞吐测量
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _authorized(self) -> bool:
+                if server.api_key and self.headers.get("Authorization") != f"Bearer {server.api_key}":
+                    self._send_json(401, {"error": "无效的API Key"})
+                    return False
+                return True
+
+            def _read_json(self) -> Optional[Any]:
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    return json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": "请求体不是合法JSON"})
+                    return None
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if url.path == "/health":
+                    self._send_json(200, {"status": "ok"})
+                elif not self._authorized():
+                    return
+                elif url.path == "/memory/retrieve":
+                    self._send_json(200, server._find(query.get("session_id"), query.get("memory_id")))
+                elif url.path == "/memory/list":
+                    offset = int(query.get("offset", 0))
+                    limit = int(query.get("limit", 100))
+                    self._send_json(200, server._find()[offset:offset + limit])
+                else:
+                    self._send_json(404, {"error": f"未知路径: {url.path}"})
+
+            def do_DELETE(self):
+                if not self._authorized():
+                    return
+                path = urlparse(self.path).path
+                if not path.startswith("/memory/"):
+                    self._send_json(404, {"error": f"未知路径: {path}"})
+                    return
+                memory_id = path[len("/memory/"):]
+                with server._lock:
+                    keys = [key for key, m in server.memories.items() if m["memory_id"] == memory_id]
+                    for key in keys:
+                        del server.memories[key]
+                if keys:
+                    self._send_json(200, {"deleted": memory_id})
+                else:
+                    self._send_json(404, {"error": "记忆不存在"})
+
+            def do_POST(self):
+                # 先读完请求体,提前返回的错误响应也不会破坏keep-alive连接
+                body = self._read_json()
+                if body is None:
+                    return
+                path = urlparse(self.path).path
+                if path not in ("/memory/sync", "/memory/sync/bulk") or (path == "/memory/sync/bulk" and not server.bulk):
+                    self._send_json(404, {"error": f"未知路径: {path}"})
+                    return
+                if not self._authorized():
+                    return
+
+                with server._lock:
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                    server.total_requests += 1
+                try:
+                    self._sync(path, body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+            def _sync(self, path: str, body: Dict[str, Any]):
+                memories = body.get("memories", []) if path == "/memory/sync/bulk" else [body]
+                time.sleep((server.latency_ms + server.per_item_ms * len(memories)) / 1000)
+
+                if random.random() < server.failure_rate:
+                    with server._lock:
+                        server.failed_requests += 1
+                    headers = {"Retry-After": str(server.retry_after)} if server.retry_after else None
+                    self._send_json(503, {"error": "模拟的服务不可用"}, headers)
+                    return
+
+                results = []
+                for memory in memories:
+                    if not memory.get("session_id") or not memory.get("content"):
+                        results.append({"client_id": memory.get("client_id"), "error": "session_id and content are required"})
+                    else:
+                        results.append({"client_id": memory.get("client_id"), "memory_id": server._store(memory)})
+
+                if path == "/memory/sync/bulk":
+                    self._send_json(200, {"results": results})
+                elif "error" in results[0]:
+                    self._send_json(400, results[0])
+                else:
+                    self._send_json(200, results[0])
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟的Fleet API服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18100)
+    parser.add_argument("--api-key", default="")
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--per-item-ms", type=float, default=0.2)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0)
+    parser.add_argument("--no-bulk", action="store_true", help="不支持批量同步接口")
+    args = parser.parse_args()
+
+    server = MockFleetServer(
+        host=args.host,
+        port=args.port,
+        api_key=args.api_key,
+        latency_ms=args.latency_ms,
+        per_item_ms=args.per_item_ms,
+        failure_rate=args.failure_rate,
+        retry_after=args.retry_after,
+        bulk=not args.no_bulk
+    )
+    print(f"🧪 模拟Fleet API已启动: {server.base_url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+模拟的OpenAI兼容LLM服务
+只依赖标准库,支持 /v1/models 与 /v1/chat/completions(流式/非流式),
+可配置首token延迟、按提示词长度增加的预填充耗时、token间隔与并发争用,
+用于在没有真实模型后端时运行基准测试与联调
+
+    python -m app.testing.mock_openai_server --port 18000 --ttft-ms 200 --token-interval-ms 20
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+
+class MockOpenAIServer:
+    """
+    模拟LLM服务
+
+    Args:
+        host/port: 监听地址(port=0表示自动分配)
+        ttft_ms: 基础首token延迟
+        prefill_ms_per_1k: 每1000个提示词token增加的预填充耗时
+        token_interval_ms: 单个请求的token间隔
+        output_tokens: 默认输出token数(请求中的max_tokens更小时以其为准)
+        contention: 并发争用系数,token间隔 = token_interval_ms × (1 + contention × (并发数 - 1))
+        model: /v1/models返回的模型名
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ttft_ms: float = 100,
+        prefill_ms_per_1k: float = 50,
+        token_interval_ms: float = 10,
+        output_tokens: int = 64,
+        contention: float = 0.25,
+        model: str = "mock-model"
+    ):
+        self.ttft_ms = ttft_ms
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        self.token_interval_ms = token_interval_ms
+        self.output_tokens = output_tokens
+        self.contention = contention
+        self.model = model
+
+        self.active = 0
+        self.total_requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        """在后台线程中启动,返回base_url"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def __enter__(self) -> "MockOpenAIServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ==================== 模拟生成 ====================
+
+    @staticmethod
+    def _prompt_tokens(body: Dict[str, Any]) -> int:
+        """按空白分词近似提示词token数"""
+        total = 0
+        for message in body.get("messages", []):
+            content = message.get("content") or ""
+            if isinstance(content, list):
+                content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+            total += len(str(content).split())
+        return total
+
+    def _token_interval(self) -> float:
+        with self._lock:
+            active = self.active
+        return self.token_interval_ms * (1 + self.contention * max(0, active - 1)) / 1000
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/v1/models":
+                    self._send_json(200, {
+                        "object": "list",
+                        "data": [{"id": server.model, "object": "model", "owned_by": "mock"}]
+                    })
+                else:
+                    self._send_json(404, {"error": {"message": f"未知路径: {self.path}"}})
+
+            def do_POST(self):
+                if self.path.rstrip("/") != "/v1/chat/completions":
+                    self._send_json(404, {"error": {"message": f"未知路径: {self.path}"}})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": {"message": "请求体不是合法JSON"}})
+                    return
+
+                with server._lock:
+                    server.active += 1
+                    server.total_requests += 1
+                try:
+                    self._complete(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+            def _complete(self, body: Dict[str, Any]):
+                prompt_tokens = server._prompt_tokens(body)
+                max_tokens = body.get("max_tokens") or server.output_tokens
+                output_tokens = max(1, min(server.output_tokens, max_tokens))
+                completion_id = f"chatcmpl-mock-{int(time.time() * 1000)}"
+                created = int(time.time())
+                model = body.get("model") or server.model
+
+                # 预填充: 基础TTFT + 按提示词长度增长的部分
+                time.sleep((server.ttft_ms + server.prefill_ms_per_1k * prompt_tokens / 1000) / 1000)
+
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": output_tokens,
+                    "total_tokens": prompt_tokens + output_tokens
+                }
+
+                if not body.get("stream"):
+                    for _ in range(output_tokens - 1):
+                        time.sleep(server._token_interval())
+                    self._send_json(200, {
+                        "id": completion_id,
+                        "object": "chat.completion",
+                        "created": created,
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": " ".join(["tok"] * output_tokens)},
+                            "finish_reason": "stop"
+                        }],
+                        "usage": usage
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+                def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra):
+                    payload = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                        **extra
+                    }
+                    self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                chunk({"role": "assistant", "content": ""})
+                for i in range(output_tokens):
+                    if i:
+                        time.sleep(server._token_interval())
+                    chunk({"content": "tok "})
+                chunk({}, finish_reason="stop")
+
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    payload = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [],
+                        "usage": usage
+                    }
+                    self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟的OpenAI兼容LLM服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--ttft-ms", type=float, default=100)
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=50)
+    parser.add_argument("--token-interval-ms", type=float, default=10)
+    parser.add_argument("--output-tokens", type=int, default=64)
+    parser.add_argument("--contention", type=float, default=0.25)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        host=args.host,
+        port=args.port,
+        ttft_ms=args.ttft_ms,
+        prefill_ms_per_1k=args.prefill_ms_per_1k,
+        token_interval_ms=args.token_interval_ms,
+        output_tokens=args.output_tokens,
+        contention=args.contention
+    )
+    print(f"🧪 模拟LLM服务已启动: {server.base_url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,7 @@ from .speech_recognition_tool import SpeechRecognitionTool
 from .rpa_tool import RPATool
 from .file_sync_tool import FileSyncTool
 from .fleet_api_tool_v2 import FleetAPIToolV2
+from app.core.tool_metrics import instrument_tool
 
 def load_all_tools():
     """
@@ -47,7 +48,8 @@ def load_all_tools():
     for tool_class in tool_classes:
         try:
             tool = tool_class()
-            tools.append(tool)
+            # 挂载调用指标(次数/错误/延迟分布/输入输出大小)
+            tools.append(instrument_tool(tool))
             print(f"  ✅ {tool.name}")
         except Exception as e:
             tool_name = tool_class.__name__
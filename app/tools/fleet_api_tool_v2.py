@@ -6,11 +6,14 @@ from langchain_core.tools import BaseTool
 from pydantic import Field
 import requests
 import json
+import asyncio
 import os
 from typing import Dict, Any, Optional
 from datetime import datetime
 
+from app.config import FLEET_SYNC_DELETE_SYNCED
 from app.core.fleet_memory_db import fleet_memory_db
+from app.services.fleet_sync import fleet_sync_service
 
 
 class FleetAPIToolV2(BaseTool):
@@ -20,6 +23,8 @@ class FleetAPIToolV2(BaseTool):
     支持的操作:
     - sync_memory: 同步当前对话记忆(优先Fleet API,降级到本地SQLite)
     - retrieve_memory: 检索历史记忆(优先Fleet API,降级到本地SQLite)
+    - search: 检索本地记忆,只返回最相关的几条(带命中片段)
+      mode: hybrid(默认,关键词+语义融合) / keyword(BM25) / semantic(向量相似度)
     - list_memories: 列出所有记忆(优先Fleet API,降级到本地SQLite)
     - delete_memory: 删除指定记忆(优先Fleet API,降级到本地SQLite)
     - get_stats: 获取记忆统计信息
@@ -29,8 +34,11 @@ class FleetAPIToolV2(BaseTool):
     name: str = "fleet_api"
     description: str = """Sync conversation memory with D5 Fleet API or local SQLite database.
     Input should be a JSON string with 'action' and optional parameters.
-    Actions: sync_memory, retrieve_memory, list_memories, delete_memory, get_stats, sync_to_fleet
-    Example: {"action": "sync_memory", "session_id": "session_123", "content": "Important conversation context"}"""
+    Actions: sync_memory, retrieve_memory, search, list_memories, delete_memory, get_stats, sync_to_fleet
+    Use 'search' with a 'query' (and optional 'session_id', 'limit', 'mode': hybrid|keyword|semantic)
+    to find the few memories relevant to a topic instead of retrieving a whole session.
+    Example: {"action": "sync_memory", "session_id": "session_123", "content": "Important conversation context"}
+    Example: {"action": "search", "query": "database migration decision", "limit": 5}"""
     
     fleet_api_base_url: str = Field(
         default_factory=lambda: os.getenv("FLEET_API_BASE_URL", "")
@@ -62,6 +70,8 @@ class FleetAPIToolV2(BaseTool):
                 result = self._sync_memory(params)
             elif action == "retrieve_memory":
                 result = self._retrieve_memory(params)
+            elif action == "search":
+                result = self._search(params)
             elif action == "list_memories":
                 result = self._list_memories(params)
             elif action == "delete_memory":
@@ -81,8 +91,8 @@ class FleetAPIToolV2(BaseTool):
             return json.dumps({"success": False, "error": str(e)})
     
     async def _arun(self, query: str) -> str:
-        """异步执行 (当前使用同步实现)"""
-        return self._run(query)
+        """异步执行 (同步实现放到线程池中,本地记忆库读写与HTTP请求不阻塞事件循环)"""
+        return await asyncio.to_thread(self._run, query)
     
     def _is_fleet_api_available(self) -> bool:
         """检查Fleet API是否可用"""
@@ -128,14 +138,44 @@ class FleetAPIToolV2(BaseTool):
                     "error": "session_id and content are required"
                 }
             
-            # 1. 先保存到本地SQLite
+            # 1. 先保存到本地SQLite(等待提交,并发调用合并为一次提交)
             memory_id = fleet_memory_db.add_memory(
                 session_id=session_id,
                 content=content,
-                metadata=metadata
+                metadata=metadata,
+                durable=True
             )
             
-            # 2. 尝试同步到Fleet API
+            # 同一会话的相同内容已同步过: 本地只累加了计数,不再重复推送
+            # (同步后已从本地删除的,计数累加在保留的内容哈希上)
+            memory = fleet_memory_db.get_memory(memory_id)
+            if memory is None:
+                memory = fleet_memory_db.get_synced_hash(session_id, content)
+                if memory:
+                    memory["synced_to_fleet"] = 1
+            if memory and memory["occurrences"] > 1 and memory["synced_to_fleet"]:
+                return {
+                    "success": True,
+                    "message": "Duplicate memory, already synced to Fleet API",
+                    "storage": "fleet_api",
+                    "memory_id": memory_id,
+                    "fleet_memory_id": memory["fleet_memory_id"],
+                    "occurrences": memory["occurrences"],
+                    "fleet_sync_status": "deduplicated"
+                }
+            
+            # 2. 后台外发同步运行中: 交给它批量上传
+            if fleet_sync_service.running:
+                fleet_sync_service.wake()
+                return {
+                    "success": True,
+                    "message": "Memory saved locally, queued for Fleet API sync",
+                    "storage": "local_sqlite",
+                    "memory_id": memory_id,
+                    "fleet_sync_status": "queued"
+                }
+            
+            # 3. 尝试同步到Fleet API
             if self._is_fleet_api_available():
                 try:
                     payload = {
@@ -157,11 +197,10 @@ class FleetAPIToolV2(BaseTool):
                         fleet_data = response.json()
                         fleet_memory_id = fleet_data.get("memory_id", memory_id)
                         
-                        # 标记为已同步
-                        fleet_memory_db.mark_as_synced(memory_id, fleet_memory_id)
-                        
-                        # 同步成功后删除本地数据(节省存储空间)
-                        fleet_memory_db.delete_memory(memory_id)
+                        # 标记为已同步,删除模式下同时删除本地数据(节省存储空间,保留内容哈希用于去重)
+                        fleet_memory_db.acknowledge_synced(
+                            [(memory_id, fleet_memory_id)], delete=FLEET_SYNC_DELETE_SYNCED
+                        )
                         
                         return {
                             "success": True,
@@ -271,12 +310,70 @@ class FleetAPIToolV2(BaseTool):
                 "error": f"Retrieve failed: {str(e)}"
             }
     
+    def _search(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        全文检索本地记忆
+        
+        Args:
+            params: 包含query,可选session_id, limit, mode(hybrid/keyword/semantic)
+            
+        Returns:
+            按相关度排序的记忆(只含片段,避免整段内容进入上下文)
+        """
+        try:
+            query = params.get("query")
+            if not query:
+                return {
+                    "success": False,
+                    "error": "query is required"
+                }
+            
+            limit = min(int(params.get("limit", 5)), 50)
+            mode = params.get("mode", "hybrid")
+            search = {
+                "hybrid": fleet_memory_db.hybrid_search,
+                "keyword": fleet_memory_db.search_memories,
+                "semantic": fleet_memory_db.semantic_search
+            }.get(mode)
+            if search is None:
+                return {
+                    "success": False,
+                    "error": f"Unknown search mode: {mode}"
+                }
+            
+            memories = search(
+                query,
+                session_id=params.get("session_id"),
+                limit=limit
+            )
+            return {
+                "success": True,
+                "message": f"Found {len(memories)} relevant memories in local SQLite ({mode})",
+                "storage": "local_sqlite",
+                "data": [
+                    {
+                        "id": memory["id"],
+                        "session_id": memory["session_id"],
+                        "timestamp": memory["timestamp"],
+                        "score": memory["score"],
+                        "snippet": memory.get("snippet") or memory["content"][:160]
+                    }
+                    for memory in memories
+                ]
+            }
+                
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Search failed: {str(e)}"
+            }
+    
     def _list_memories(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """
         列出所有记忆(优先Fleet API,降级到本地SQLite)
         
         Args:
-            params: 可选参数(limit, offset)
+            params: 可选参数(limit, cursor, offset),翻页优先使用上次返回的next_cursor
             
         Returns:
             记忆列表
@@ -284,6 +381,7 @@ class FleetAPIToolV2(BaseTool):
         try:
             limit = params.get("limit", 100)
             offset = params.get("offset", 0)
+            cursor = params.get("cursor")
             
             # 1. 尝试从Fleet API列出
             if self._is_fleet_api_available():
@@ -305,13 +403,19 @@ class FleetAPIToolV2(BaseTool):
                 except Exception as e:
                     pass  # 降级到本地
             
-            # 2. 从本地SQLite列出
-            memories = fleet_memory_db.list_all_memories(limit=limit, offset=offset)
+            # 2. 从本地SQLite列出(游标分页,兼容旧的offset参数)
+            if offset and not cursor:
+                memories = fleet_memory_db.list_all_memories(limit=limit, offset=offset)
+                next_cursor = None
+            else:
+                page = fleet_memory_db.list_memories_page(limit=limit, cursor=cursor)
+                memories, next_cursor = page["items"], page["next_cursor"]
             return {
                 "success": True,
                 "message": f"Listed {len(memories)} memories from local SQLite",
                 "storage": "local_sqlite",
-                "data": memories
+                "data": memories,
+                "next_cursor": next_cursor
             }
                 
         except Exception as e:
@@ -398,7 +502,7 @@ class FleetAPIToolV2(BaseTool):
     
     def _sync_to_fleet(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """
-        手动同步本地记忆到Fleet API
+        手动同步本地记忆到Fleet API(由外发同步服务批量、并发上传)
         
         Args:
             params: 可选参数(limit)
@@ -407,64 +511,27 @@ class FleetAPIToolV2(BaseTool):
             同步结果
         """
         try:
-            if not self._is_fleet_api_available():
+            if not fleet_sync_service.running and not self._is_fleet_api_available():
                 return {
                     "success": False,
                     "error": "Fleet API is not available"
                 }
             
-            limit = params.get("limit", 100)
-            
-            # 获取未同步的记忆
-            unsynced_memories = fleet_memory_db.get_unsynced_memories(limit=limit)
-            
-            if not unsynced_memories:
+            result = fleet_sync_service.request_sync(limit=params.get("limit", 100))
+            if result.get("scheduled"):
                 return {
                     "success": True,
-                    "message": "No unsynced memories found",
-                    "synced_count": 0
+                    "message": f"Background sync triggered, {result['backlog']} memories pending",
+                    "total_unsynced": result["backlog"],
+                    "data": result
                 }
             
-            synced_count = 0
-            failed_count = 0
-            
-            for memory in unsynced_memories:
-                try:
-                    payload = {
-                        "session_id": memory["session_id"],
-                        "content": memory["content"],
-                        "metadata": memory["metadata"],
-                        "timestamp": memory["timestamp"],
-                        "source": memory["source"]
-                    }
-                    
-                    response = requests.post(
-                        f"{self.fleet_api_base_url}/memory/sync",
-                        headers=self._get_headers(),
-                        json=payload,
-                        timeout=30
-                    )
-                    
-                    if response.status_code == 200:
-                        fleet_data = response.json()
-                        fleet_memory_id = fleet_data.get("memory_id", memory["id"])
-                        fleet_memory_db.mark_as_synced(memory["id"], fleet_memory_id)
-                        
-                        # 同步成功后删除本地数据
-                        fleet_memory_db.delete_memory(memory["id"])
-                        
-                        synced_count += 1
-                    else:
-                        failed_count += 1
-                except Exception as e:
-                    failed_count += 1
-            
             return {
                 "success": True,
-                "message": f"Synced {synced_count} memories, {failed_count} failed",
-                "synced_count": synced_count,
-                "failed_count": failed_count,
-                "total_unsynced": len(unsynced_memories)
+                "message": f"Synced {result['synced']} memories, {result['failed']} failed",
+                "synced_count": result["synced"],
+                "failed_count": result["failed"],
+                "total_unsynced": result["backlog"]
             }
                 
         except Exception as e:
@@ -12,6 +12,7 @@ from langgraph.prebuilt import ToolNode
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage
 
 from app.config import LANGGRAPH_RECURSION_LIMIT
+from app.core.tracing import tracer
 from app.state import state_manager
 
 
@@ -91,7 +92,7 @@ def should_continue(state: MessagesState) -> Literal["tools", END]:
     return END
 
 
-def tool_node_with_error_handling(state: MessagesState) -> MessagesState:
+def tool_node_with_error_handling(state: MessagesState, config: dict) -> MessagesState:
     """工具节点（带错误处理）"""
     messages = state["messages"]
     last_message = messages[-1]
@@ -109,7 +110,7 @@ def tool_node_with_error_handling(state: MessagesState) -> MessagesState:
     
     try:
         # 调用工具节点
-        return tool_node.invoke(state)
+        return tool_node.invoke(state, config=config)
     except Exception as e:
         error_message = f"工具调用失败: {e}"
         print(f"ERROR: {error_message}")
@@ -117,6 +118,25 @@ def tool_node_with_error_handling(state: MessagesState) -> MessagesState:
         return {"messages": [ToolMessage(content=error_message, tool_call_id=tool_invocations[0]["id"])]}
 
 
+class TracedMemorySaver(MemorySaver):
+    """
+    记录读写span的内存checkpointer
+    异步接口(aget_tuple/aput/aput_writes)内部调用同步实现,因此只需包装同步方法
+    """
+
+    def get_tuple(self, config):
+        with tracer.span("checkpoint.get", "checkpoint"):
+            return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with tracer.span("checkpoint.put", "checkpoint", step=(metadata or {}).get("step")):
+            return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, *args, **kwargs):
+        with tracer.span("checkpoint.put_writes", "checkpoint", writes=len(writes)):
+            return super().put_writes(config, writes, task_id, *args, **kwargs)
+
+
 def create_agent_graph():
     """创建并编译LangGraph工作流"""
     print("🔧 正在创建LangGraph工作流...")
@@ -137,7 +157,7 @@ def create_agent_graph():
     workflow.add_edge("tools", "agent")
     
     # 创建checkpointer
-    checkpointer = MemorySaver()
+    checkpointer = TracedMemorySaver()
     
     # 编译工作流
     app_graph = workflow.compile(checkpointer=checkpointer)
@@ -27,6 +27,12 @@ from app.state import state_manager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
+    # 把logging与print输出接入日志缓冲区(供监控API实时推送)
+    from app.core.log_stream import install_log_capture
+    from app.core.log_store import install_log_store, log_store
+    install_log_capture()
+    install_log_store()
+    
     print("=" * 60)
     print(f"🚀 {AGENT_VERSION} 启动中...")
     print(f"   时区: {TIMEZONE}")
@@ -36,13 +42,15 @@ async def lifespan(app: FastAPI):
     # Phase 2: 初始化LLM和LangGraph(工具池将在5分钟后加载)
     from app.workflow import create_agent_graph
     from langchain_openai import ChatOpenAI
+    from app.core.llm_metrics import llm_metrics_callback
     
     # 初始化LLM
     llm = ChatOpenAI(
         base_url=f"http://{state_manager.config.MODEL_HOST}:{state_manager.config.MODEL_PORT}/v1",
         model="local-model",
         temperature=0.7,
-        api_key="not-needed"
+        api_key="not-needed",
+        callbacks=[llm_metrics_callback]
     )
     
     # 暂不加载工具,等待定时任务在5分钟后加载
@@ -53,7 +61,18 @@ async def lifespan(app: FastAPI):
     state_manager.set_app_graph(app_graph)
     
     # Phase 4: 启动后台服务
-    from app.services import system_monitor, task_scheduler
+    from app.services import system_monitor, task_scheduler, resource_sampler, fleet_sync_service
+    
+    # 启动进程资源采样(健康检查与时序图表读取其样本)
+    await resource_sampler.start()
+    
+    # 启动事件循环阻塞检测
+    from app.core.loop_watchdog import loop_watchdog
+    await loop_watchdog.start()
+    
+    # 启动会话生命周期管理(空闲/超预算会话统一淘汰)
+    from app.core.session_manager import session_manager
+    await session_manager.start()
     
     # 启动系统监控服务
     await system_monitor.start()
@@ -61,6 +80,9 @@ async def lifespan(app: FastAPI):
     # 启动定时任务调度服务
     await task_scheduler.start()
     
+    # 启动Fleet外发同步(未配置Fleet API时跳过)
+    await fleet_sync_service.start()
+    
     print(f"✅ {AGENT_VERSION} 启动完成")
     print(f"   管理面板: http://localhost:{API_PORT}/dashboard")
     print(f"   聊天室: http://localhost:{API_PORT}/chatroom")
@@ -71,6 +93,18 @@ async def lifespan(app: FastAPI):
     
     # 关闭时执行的清理任务
     print(f"🛑 {AGENT_VERSION} 关闭中...")
+    
+    await resource_sampler.stop()
+    await loop_watchdog.stop()
+    await session_manager.stop()
+    await fleet_sync_service.stop()
+    
+    # 关闭Fleet记忆库的线程连接
+    from app.core.fleet_memory_db import fleet_memory_db
+    fleet_memory_db.close()
+    
+    # 写完队列中剩余的日志
+    log_store.stop()
 
 
 # 创建FastAPI应用
@@ -91,6 +125,10 @@ if ENABLE_CORS:
         allow_headers=["*"],
     )
 
+# 按路由统计请求数与耗时(供/metrics输出)
+from app.api.metrics import MetricsMiddleware
+app.add_middleware(MetricsMiddleware)
+
 # ==================== 基础路由 ====================
 
 @app.get("/")
@@ -161,6 +199,18 @@ app.include_router(context_monitor_router, tags=["Context Monitor"])
 from app.api.fleet_stats import router as fleet_stats_router
 app.include_router(fleet_stats_router, tags=["Fleet Stats"])
 
+# Fleet记忆批量导出/导入API
+from app.api.fleet_transfer import router as fleet_transfer_router
+app.include_router(fleet_transfer_router, tags=["Fleet Stats"])
+
+# Phase 11: 挂载Prometheus/OpenMetrics指标API
+from app.api.metrics import router as metrics_router
+app.include_router(metrics_router, tags=["Metrics"])
+
+# Phase 12: 挂载运行时诊断API
+from app.api.diagnostics import router as diagnostics_router
+app.include_router(diagnostics_router, tags=["Diagnostics"])
+
 
 # ==================== 静态文件和UI路由 ====================
 # 挂载管理面板静态文件
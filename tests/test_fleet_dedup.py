@@ -0,0 +1,34 @@
+import asyncio
+
+from app.config import FLEET_SYNC_DELETE_SYNCED
+from app.core.fleet_memory_db import FleetMemoryDB
+from app.services.fleet_sync import FleetSyncService
+from app.testing.mock_fleet_server import MockFleetServer
+
+
+def test_duplicate_of_synced_and_deleted_memory_is_not_pushed_again(tmp_path):
+    # 默认配置: 同步成功后删除本地记忆
+    assert FLEET_SYNC_DELETE_SYNCED
+    db = FleetMemoryDB(str(tmp_path / "fleet.db"))
+    try:
+        with MockFleetServer(api_key="test-key", latency_ms=0) as server:
+            service = FleetSyncService(db=db, base_url=server.base_url, api_key="test-key")
+            first_id = db.add_memory("s1", "daily summary", durable=True)
+            assert asyncio.run(service.sync_once())["synced"] == 1
+            assert db.get_memory(first_id) is None
+
+            assert db.add_memory("s1", "daily summary", durable=True) == first_id
+            assert db.get_memory(first_id) is None
+            synced = db.get_synced_hash("s1", "daily summary")
+            assert synced["memory_id"] == first_id
+            assert synced["occurrences"] == 2
+            assert db.get_unsynced_count() == 0
+
+            assert asyncio.run(service.sync_once())["fetched"] == 0
+            assert server.get_stats()["memories"] == 1
+
+            # 其他会话的相同内容不受影响
+            assert db.add_memory("s2", "daily summary", durable=True) != first_id
+            assert db.get_unsynced_count() == 1
+    finally:
+        db.close()
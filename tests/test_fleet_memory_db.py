@@ -0,0 +1,59 @@
+import sqlite3
+
+from app.core.fleet_memory_db import FleetMemoryDB
+
+
+def test_rapid_adds_in_one_session_are_all_stored(tmp_path):
+    db = FleetMemoryDB(str(tmp_path / "fleet.db"))
+    try:
+        ids = [db.add_memory("s1", f"memory {i}") for i in range(300)]
+        assert db.flush()
+
+        assert len(set(ids)) == 300
+        assert db.write_errors == 0
+        assert db.get_stats()["total_memories"] == 300
+    finally:
+        db.close()
+
+
+def test_plain_connection_can_modify_indexed_memories(tmp_path):
+    path = str(tmp_path / "fleet.db")
+    db = FleetMemoryDB(path)
+    try:
+        compressed_id = db.add_memory("s1", "needle " + "lorem ipsum dolor sit amet " * 200)
+        short_id = db.add_memory("s1", "needle in a short memory")
+        assert db.flush()
+        assert {m["id"] for m in db.search_memories("needle")} == {compressed_id, short_id}
+
+        # 未注册fleet_text()的普通连接
+        plain = sqlite3.connect(path)
+        with plain:
+            plain.execute("DELETE FROM memories WHERE id = ?", (short_id,))
+            plain.execute(
+                "UPDATE memories SET content = ?, content_codec = NULL, content_hash = ? WHERE id = ?",
+                ("replacement text", "edited", compressed_id)
+            )
+        plain.close()
+
+        assert db.search_memories("needle") == []
+        assert [m["id"] for m in db.search_memories("replacement")] == [compressed_id]
+    finally:
+        db.close()
+
+
+def test_bulk_import_indexes_compressed_content_once(tmp_path):
+    db = FleetMemoryDB(str(tmp_path / "fleet.db"))
+    try:
+        now = "2026-01-01T00:00:00"
+        row = ("m1", "s1", "haystack " * 500, "{}", now, "import", 0, None, now, now, 1)
+        assert db.bulk_import([row]) == 1
+        assert db.bulk_import([row], replace=True) == 1
+        assert [m["id"] for m in db.search_memories("haystack")] == ["m1"]
+
+        edited = row[:2] + ("straw " * 500,) + row[3:]
+        db.bulk_import([edited], replace=True)
+        assert db.search_memories("haystack") == []
+        assert [m["id"] for m in db.search_memories("straw")] == ["m1"]
+        assert db._conn().execute("SELECT COUNT(*) FROM memories_fts").fetchone()[0] == 1
+    finally:
+        db.close()
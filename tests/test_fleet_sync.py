@@ -0,0 +1,96 @@
+import asyncio
+
+import httpx
+
+from app.config import FLEET_SYNC_FAILURE_BACKOFF_MAX
+from app.core.fleet_memory_db import FleetMemoryDB
+from app.services import fleet_sync as fleet_sync_module
+from app.services.fleet_sync import FleetSyncService
+from app.testing.mock_fleet_server import MockFleetServer
+
+
+def test_delay_between_failed_rounds_grows_from_the_interval(monkeypatch):
+    service = FleetSyncService(db=object(), base_url="http://fleet.invalid", api_key="key", interval=30)
+    delays = []
+
+    async def failed_round(*args, **kwargs):
+        return {"fetched": 10, "attempted": 10, "synced": 0}
+
+    async def fake_wait_for(awaitable, timeout):
+        awaitable.close()
+        delays.append(timeout)
+        if len(delays) == 8:
+            service.running = False
+        raise asyncio.TimeoutError
+
+    monkeypatch.setattr(service, "sync_round", failed_round)
+    monkeypatch.setattr(fleet_sync_module.asyncio, "wait_for", fake_wait_for)
+    # 取抖动区间的下界,便于比较
+    monkeypatch.setattr(fleet_sync_module.random, "uniform", lambda low, high: low)
+
+    async def run():
+        service._wake = asyncio.Event()
+        service.running = True
+        await service._sync_loop()
+
+    asyncio.run(run())
+
+    assert delays[0] >= service.interval
+    assert all(later >= earlier for earlier, later in zip(delays, delays[1:]))
+    assert delays[3] > delays[0]
+    assert max(delays) <= FLEET_SYNC_FAILURE_BACKOFF_MAX
+
+
+def test_rejected_memory_is_parked_instead_of_resent(tmp_path):
+    db = FleetMemoryDB(str(tmp_path / "fleet.db"))
+    try:
+        with MockFleetServer(api_key="test-key", latency_ms=0) as server:
+            service = FleetSyncService(db=db, base_url=server.base_url, api_key="test-key")
+            # 模拟服务端按内容校验拒绝(内容为空)
+            rejected_id = db.add_memory("s1", "", durable=True)
+            db.add_memory("s1", "valid memory", durable=True)
+
+            first = asyncio.run(service.sync_once())
+            assert (first["attempted"], first["synced"]) == (2, 1)
+            assert service.get_stats()["parked"] == 1
+
+            db.add_memory("s1", "another memory", durable=True)
+            requests_before = server.get_stats()["total_requests"]
+            second = asyncio.run(service.sync_once())
+            assert (second["fetched"], second["attempted"], second["parked"]) == (2, 1, 1)
+            assert second["synced"] == 1
+            assert server.get_stats()["total_requests"] == requests_before + 1
+            assert db.get_memory(rejected_id) is not None
+    finally:
+        db.close()
+
+
+def test_unreadable_bulk_response_does_not_drop_other_batches(tmp_path, monkeypatch):
+    db = FleetMemoryDB(str(tmp_path / "fleet.db"))
+    try:
+        with MockFleetServer(api_key="test-key", latency_ms=0) as server:
+            service = FleetSyncService(db=db, base_url=server.base_url, api_key="test-key", batch_size=2)
+            ids = [db.add_memory("s1", f"memory {i}", durable=True) for i in range(6)]
+            real_post = service._post
+            broken = set()
+
+            async def flaky_post(client, semaphore, path, payload, mode):
+                response = await real_post(client, semaphore, path, payload, mode)
+                client_ids = {m["client_id"] for m in payload["memories"]}
+                if ids[0] in client_ids:
+                    broken.update(client_ids)
+                    return httpx.Response(200, text="<html>proxy error</html>")
+                if ids[2] in client_ids:
+                    broken.update(client_ids)
+                    return httpx.Response(200, json=["not", "an", "object"])
+                return response
+
+            monkeypatch.setattr(service, "_post", flaky_post)
+            result = asyncio.run(service.sync_once())
+
+            assert (result["attempted"], result["synced"], result["failed"]) == (6, 2, 4)
+            assert "JSON" in service.last_error
+            assert db.get_unsynced_count() == 4
+            assert {m["id"] for m in db.get_unsynced_memories(10)} == broken
+    finally:
+        db.close()
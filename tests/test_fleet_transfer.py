@@ -0,0 +1,60 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import fleet_transfer
+from app.core.fleet_memory_db import FleetMemoryDB
+
+
+def _client(monkeypatch, db):
+    monkeypatch.setattr(fleet_transfer, "fleet_memory_db", db)
+    api = FastAPI()
+    api.include_router(fleet_transfer.router)
+    return TestClient(api)
+
+
+def _chunks(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _round_trip(tmp_path, monkeypatch, file_format):
+    source = FleetMemoryDB(str(tmp_path / "source.db"))
+    target = FleetMemoryDB(str(tmp_path / "target.db"))
+    try:
+        for i in range(30):
+            source.add_memory(f"s{i % 3}", f"memory {i} " + "x" * (i * 100), metadata={"index": i})
+        assert source.flush()
+
+        with _client(monkeypatch, source) as client:
+            exported = client.get("/api/monitoring/fleet/export", params={"format": file_format}).content
+        with _client(monkeypatch, target) as client:
+            # 小块上传,记录跨越多个块
+            first = client.post(
+                "/api/monitoring/fleet/import", params={"format": file_format},
+                content=_chunks(exported, 777)
+            ).json()
+            again = client.post(
+                "/api/monitoring/fleet/import", params={"format": file_format},
+                content=_chunks(exported, 777)
+            ).json()
+
+        assert first["read"] == 30 and first["written"] == 30 and first["invalid"] == 0
+        assert again["read"] == 30 and again["written"] == 0 and again["skipped"] == 30
+        assert target.get_stats()["total_memories"] == 30
+        for memory in source.list_memories_page(limit=30)["items"]:
+            copied = target.get_memory(memory["id"])
+            assert copied["content"] == memory["content"]
+            assert copied["metadata"] == memory["metadata"]
+    finally:
+        source.close()
+        target.close()
+
+
+def test_ndjson_round_trip_and_reimport_dedup(tmp_path, monkeypatch):
+    _round_trip(tmp_path, monkeypatch, "ndjson")
+
+
+def test_parquet_round_trip_and_reimport_dedup(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    _round_trip(tmp_path, monkeypatch, "parquet")
@@ -0,0 +1,28 @@
+import asyncio
+
+from app.services.llm_benchmark import LLMBenchmark
+from app.testing.mock_openai_server import MockOpenAIServer
+
+
+def test_concurrency_sweep_against_mock_server(tmp_path):
+    benchmark = LLMBenchmark(history_path=tmp_path / "benchmarks.jsonl")
+    with MockOpenAIServer(ttft_ms=20, token_interval_ms=2, output_tokens=16) as server:
+        result = asyncio.run(benchmark.run(
+            base_url=server.base_url,
+            model="mock-model",
+            concurrency_levels=(1, 2, 4),
+            prompt_buckets={"short": 64},
+            requests_per_worker=1,
+            max_tokens=16,
+            trigger="test"
+        ))
+
+    assert result["status"] == "completed"
+    assert [level["concurrency"] for level in result["results"]] == [1, 2, 4]
+    for level in result["results"]:
+        assert level["errors"] == 0
+        assert level["ttft_ms"]["p50"] > 0
+        assert level["decode_tokens_per_second"]["mean"] > 0
+        assert level["throughput_tokens_per_second"] > 0
+    assert benchmark.latest()["id"] == result["id"]
+    assert (tmp_path / "benchmarks.jsonl").read_text(encoding="utf-8").count("\n") == 1
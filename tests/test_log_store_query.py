@@ -0,0 +1,62 @@
+"""
+持久化日志检索: 结果跨越多个查询块时,StreamingResponse在线程池中迭代生成器也能完整输出
+"""
+import json
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.api.monitoring as monitoring
+from app.core.log_store import LogStore
+
+
+def _records(count):
+    for i in range(count):
+        record = logging.LogRecord("app.test", logging.INFO, __file__, 0, f"日志{i}", None, None)
+        record.created = 1_700_000_000 + i
+        yield record
+
+
+def test_query_streams_more_than_one_chunk(tmp_path, monkeypatch):
+    store = LogStore(db_path=tmp_path / "logs.db")
+    conn = store._connect()
+    store._write_batch(conn, list(_records(LogStore.QUERY_CHUNK * 2 + 37)))
+    conn.close()
+    monkeypatch.setattr(monitoring, "log_store", store)
+
+    api = FastAPI()
+    api.include_router(monitoring.router)
+    with TestClient(api) as client:
+        response = client.get("/api/monitoring/logs/query", params={"limit": 100000, "order": "asc"})
+
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == LogStore.QUERY_CHUNK * 2 + 37
+    assert [row["message"] for row in rows[:2]] == ["日志0", "日志1"]
+    assert len({row["id"] for row in rows}) == len(rows)
+
+
+def test_query_generator_can_be_resumed_from_other_threads(tmp_path):
+    """Starlette每次取下一项都可能落在不同的线程池线程上"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    store = LogStore(db_path=tmp_path / "logs.db")
+    conn = store._connect()
+    store._write_batch(conn, list(_records(LogStore.QUERY_CHUNK + 10)))
+    conn.close()
+
+    rows = store.query(limit=None)
+    # 三个线程轮流取: 第二块的查询不会落在打开连接的线程上
+    pools = [ThreadPoolExecutor(max_workers=1) for _ in range(3)]
+    try:
+        items = []
+        while True:
+            item = pools[len(items) % 3].submit(next, rows, None).result()
+            if item is None:
+                break
+            items.append(item)
+    finally:
+        for pool in pools:
+            pool.shutdown()
+    assert len(items) == LogStore.QUERY_CHUNK + 10
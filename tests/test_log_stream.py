@@ -0,0 +1,49 @@
+import io
+import logging
+import threading
+
+from app.core.log_stream import StdoutCapture
+
+
+class _Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(record.getMessage())
+
+
+def test_partial_lines_are_kept_per_thread():
+    capture = StdoutCapture(io.StringIO(), logger_name="test_stdout_capture")
+    logger = logging.getLogger("test_stdout_capture")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = _Collect()
+    logger.addHandler(handler)
+    steps = [threading.Event() for _ in range(3)]
+
+    def first():
+        capture.write("alpha ")
+        steps[0].set()
+        steps[1].wait(5)
+        capture.write("one\n")
+        steps[2].set()
+
+    def second():
+        steps[0].wait(5)
+        capture.write("beta ")
+        steps[1].set()
+        steps[2].wait(5)
+        capture.write("two\n")
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+    finally:
+        logger.removeHandler(handler)
+
+    assert handler.lines == ["alpha one", "beta two"]
@@ -0,0 +1,29 @@
+from app.core.memory_diagnostics import approx_size
+
+
+class _Mutating(dict):
+    """items()复制时抛出"changed size during iteration",模拟其他线程并发修改"""
+
+    def __init__(self, failures, *args):
+        super().__init__(*args)
+        self.failures = failures
+
+    def items(self):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("dictionary changed size during iteration")
+        return super().items()
+
+
+def test_walk_retries_a_container_mutated_mid_copy():
+    size, truncated = approx_size(_Mutating(1, {"a": "x" * 1000}))
+
+    assert size > 1000
+    assert truncated is False
+
+
+def test_walk_skips_a_container_that_keeps_changing():
+    size, truncated = approx_size([_Mutating(100, {"a": "x" * 1000}), "y" * 500])
+
+    assert 500 < size < 1000
+    assert truncated is True
@@ -0,0 +1,86 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.core import fleet_memory_db as fleet_module
+from app.core.memory_vectors import VectorIndex, create_embedder
+
+
+@pytest.fixture
+def db_and_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(fleet_module, "FLEET_VECTOR_ENABLED", False)
+    db = fleet_module.FleetMemoryDB(str(tmp_path / "fleet.db"))
+    index = VectorIndex(db)
+    # 测试中同步驱动,不启动后台线程
+    index.start = lambda: None
+    index.embedder = create_embedder("hashing")
+    db.vectors = index
+    yield db, index
+    db.vectors = None
+    db.close()
+
+
+def _embed_all(index):
+    while index._embed_pending():
+        pass
+
+
+def _missing_embeddings(db):
+    return db._conn().execute("""
+        SELECT COUNT(*) FROM memories m
+        LEFT JOIN memory_embeddings e ON e.rowid = m.rowid
+        WHERE e.rowid IS NULL
+    """).fetchone()[0]
+
+
+def test_incremental_pass_resumes_after_high_water(db_and_index):
+    db, index = db_and_index
+    for i in range(150):
+        db.add_memory("s1", f"note {i}")
+    db.flush()
+    _embed_all(index)
+    top = db._conn().execute("SELECT MAX(rowid) FROM memories").fetchone()[0]
+    assert index._high_water == top
+
+    for i in range(10):
+        db.add_memory("s1", f"later note {i}")
+    db.flush()
+    embedded = index.embedded_total
+    _embed_all(index)
+    assert index.embedded_total - embedded == 10
+    assert _missing_embeddings(db) == 0
+
+
+def test_reused_rowids_are_embedded_after_deleting_the_newest_rows(db_and_index):
+    db, index = db_and_index
+    for i in range(100):
+        db.add_memory("s1", f"note {i}")
+    db.flush()
+    _embed_all(index)
+
+    newest = [row[0] for row in db._conn().execute("SELECT id FROM memories ORDER BY rowid DESC LIMIT 5")]
+    for memory_id in newest:
+        assert db.delete_memory(memory_id)
+    for i in range(5):
+        db.add_memory("s1", f"replacement {i}")
+    db.flush()
+    _embed_all(index)
+
+    assert _missing_embeddings(db) == 0
+    assert index.get_stats()["vectors"] == 100
+
+
+def test_compacts_when_most_rows_are_deleted(db_and_index):
+    db, index = db_and_index
+    ids = [db.add_memory("s1", f"topic {i} alpha") for i in range(1200)]
+    survivor = db.add_memory("s1", "the surviving memory about zebras")
+    db.flush()
+    _embed_all(index)
+
+    db.acknowledge_synced([(memory_id, "fleet") for memory_id in ids[:900]], delete=True)
+    index._maybe_compact()
+
+    assert index.compactions == 1
+    assert index._count == 301
+    rowid = db._conn().execute("SELECT rowid FROM memories WHERE id = ?", (survivor,)).fetchone()[0]
+    assert index.search("zebras", limit=1)[0][0] == rowid
@@ -0,0 +1,29 @@
+from app.core.metrics import MetricFamily, MetricsRegistry
+
+
+def _registry():
+    registry = MetricsRegistry(prefix="test_")
+    registry.add_collector(lambda: [
+        MetricFamily("special", "unknown", "特殊值")
+        .add(float("nan"), kind="nan")
+        .add(float("inf"), kind="pos")
+        .add(float("-inf"), kind="neg")
+    ])
+    return registry
+
+
+def test_openmetrics_renders_special_values_and_unknown_type():
+    text = _registry().render(openmetrics=True)
+
+    assert "# TYPE test_special unknown" in text
+    assert 'test_special{kind="nan"} NaN' in text
+    assert 'test_special{kind="pos"} +Inf' in text
+    assert 'test_special{kind="neg"} -Inf' in text
+    assert text.endswith("# EOF\n")
+
+
+def test_prometheus_text_uses_untyped():
+    text = _registry().render(openmetrics=False)
+
+    assert "# TYPE test_special untyped" in text
+    assert 'test_special{kind="nan"} NaN' in text
@@ -0,0 +1,33 @@
+import asyncio
+
+from app.core.run_serializer import ThreadRunSerializer
+
+
+def test_only_items_with_the_same_merge_key_share_a_turn():
+    batches = []
+    release = asyncio.Event()
+
+    async def runner(items):
+        batches.append(items)
+        if len(batches) == 1:
+            await release.wait()
+        yield {"type": "end"}
+
+    async def consume(serializer, item):
+        return [event async for event in serializer.submit("thread", item)]
+
+    async def main():
+        serializer = ThreadRunSerializer(runner, max_merge=10, merge_key=lambda item: item[0])
+        first = asyncio.create_task(consume(serializer, ("room-a", 0)))
+        await asyncio.sleep(0)
+        queued = [
+            asyncio.create_task(consume(serializer, item))
+            for item in [("room-a", 1), ("room-a", 2), ("room-b", 3), ("room-a", 4)]
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, *queued)
+
+    asyncio.run(main())
+
+    assert [[index for _, index in batch] for batch in batches] == [[0], [1, 2], [3], [4]]
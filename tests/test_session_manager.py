@@ -0,0 +1,101 @@
+import asyncio
+from collections import deque
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import monitoring
+from app.core import memory_diagnostics
+from app.core.session_manager import SessionManager
+
+
+class _Messenger:
+    def __init__(self):
+        self.message_history = {}
+        self.connections = {}
+
+
+def _manager(monkeypatch, sessions, budget_mb=512):
+    manager = SessionManager(memory_budget_mb=budget_mb)
+    messenger = _Messenger()
+    monkeypatch.setattr(manager, "_stores", lambda: (None, messenger, sessions))
+    return manager
+
+
+def _count_walks(monkeypatch):
+    calls = []
+    real = memory_diagnostics.approx_size
+
+    def counting(obj, max_objects=20000):
+        calls.append(obj)
+        return real(obj, max_objects=max_objects)
+
+    monkeypatch.setattr(memory_diagnostics, "approx_size", counting)
+    return calls
+
+
+def test_session_size_is_cached_until_touched(monkeypatch):
+    sessions = {f"t{i}": {"messages": deque(["x" * 100] * 10)} for i in range(5)}
+    manager = _manager(monkeypatch, sessions)
+    calls = _count_walks(monkeypatch)
+
+    manager.sweep()
+    assert len(calls) == 5
+    manager.sweep()
+    assert len(calls) == 5
+
+    manager.touch("t3")
+    manager.sweep()
+    assert calls[5:] == [sessions["t3"]]
+
+
+def test_sweep_async_evicts_over_budget(monkeypatch):
+    sessions = {f"t{i}": {"blob": "x" * 400 * 1024} for i in range(4)}
+    manager = _manager(monkeypatch, sessions, budget_mb=1)
+    for thread_id in sessions:
+        manager.touch(thread_id)
+
+    result = asyncio.run(manager.sweep_async())
+
+    assert result["evicted"]["budget"] == 2
+    assert sorted(sessions) == ["t2", "t3"]
+    assert set(manager._session_sizes) == {"t2", "t3"}
+
+
+def test_list_sessions_reuses_cached_sizes(monkeypatch):
+    sessions = {f"t{i}": {"blob": "x" * (i + 1) * 1024} for i in range(3)}
+    manager = _manager(monkeypatch, sessions)
+    for thread_id in sessions:
+        manager.touch(thread_id)
+    calls = _count_walks(monkeypatch)
+
+    listed = manager.list_sessions(limit=2)
+    assert [s["thread_id"] for s in listed] == ["t2", "t1"]
+    assert listed[0]["estimated_kb"] > listed[1]["estimated_kb"] >= 2
+    assert listed[0]["has_chat_session"] is True
+
+    manager.sweep()
+    manager.list_sessions()
+    assert len(calls) == 3
+
+
+def test_sessions_endpoints_list_and_sweep(monkeypatch):
+    sessions = {f"t{i}": {"blob": "x" * 400 * 1024} for i in range(4)}
+    manager = _manager(monkeypatch, sessions, budget_mb=1)
+    for thread_id in sessions:
+        manager.touch(thread_id)
+    monkeypatch.setattr(monitoring, "session_manager", manager)
+    api = FastAPI()
+    api.include_router(monitoring.router)
+
+    with TestClient(api) as client:
+        listed = client.get("/api/monitoring/sessions", params={"limit": 10}).json()
+        assert [s["thread_id"] for s in listed["sessions"]] == ["t3", "t2", "t1", "t0"]
+        assert listed["stats"]["active_sessions"] == 4
+
+        swept = client.post("/api/monitoring/sessions/sweep").json()
+        assert swept["evicted"]["budget"] == 2
+
+        listed = client.get("/api/monitoring/sessions").json()
+        assert [s["thread_id"] for s in listed["sessions"]] == ["t3", "t2"]
+        assert listed["stats"]["last_sweep"]["sessions"] == 2